@@ -1,5 +1,5 @@
 from rest_framework import viewsets
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from django.conf import settings
@@ -9,6 +9,7 @@ from django.utils import timezone
 from apps.catalog.models import Book, Category, Author
 from apps.orders.models import Order
 from apps.crm.models import Customer, Courier
+from apps.crm.services.recommendations import related_books
 from .serializers import (
     AuthorSerializer,
     BookSerializer,
@@ -36,6 +37,12 @@ class BookViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = BookSerializer
     permission_classes = [IsAdminUser]
 
+    @action(detail=True)
+    def related(self, request, pk=None):
+        """Frequently bought together (precomputed by build_recommendations)."""
+        book = self.get_object()
+        return Response(self.get_serializer(related_books(book.id), many=True).data)
+
 
 class OrderViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Order.objects.prefetch_related("items__book").all()
@@ -0,0 +1,245 @@
+"""Resized WebP/JPEG derivatives of uploaded catalog images (covers, author photos, banners)."""
+import hashlib
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger("django")
+
+# Files are named by content hash (derived/<kind>/<hash>-<width>.<ext>): a URL never changes meaning,
+# so the web server can serve them with far-future cache headers.
+DERIVED_DIR = "derived"
+# Target widths per kind; sources are never upscaled.
+BUCKETS = {
+    "cover": (160, 320, 640),
+    "photo": (96, 192),
+    "banner": (640, 1200, 1920),
+}
+FORMATS = (
+    ("webp", "WEBP", {"quality": 80, "method": 4}),
+    ("jpeg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+)
+
+# model label -> (image field, variants field, bucket kind)
+IMAGE_FIELDS = {
+    "catalog.Book": ("cover_image", "cover_variants", "cover"),
+    "catalog.Author": ("photo", "photo_variants", "photo"),
+    "catalog.Banner": ("image", "image_variants", "banner"),
+}
+
+
+def _widths(kind, source_width):
+    buckets = BUCKETS[kind]
+    widths = [width for width in buckets if width < source_width]
+    if source_width <= buckets[-1] and source_width not in widths:
+        widths.append(source_width)
+    return widths or [buckets[0]]
+
+
+def render_variants(name, kind, overwrite=False):
+    """
+    Render every bucket of one stored image and return its variants map. Touches only storage, never
+    the database, so it is safe to run in a worker process. Files already rendered for the same bytes
+    (same hash) are reused unless overwrite is set.
+    """
+    with default_storage.open(name, "rb") as handle:
+        data = handle.read()
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    with Image.open(BytesIO(data)) as opened:
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+    source_width, source_height = image.size
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+    flat = image
+    if image.mode == "RGBA":
+        # JPEG has no alpha: flatten onto white once.
+        flat = Image.new("RGB", image.size, (255, 255, 255))
+        flat.paste(image, mask=image.getchannel("A"))
+
+    variants = {"source": name, "hash": digest, "width": source_width, "height": source_height}
+    for key, _format, _options in FORMATS:
+        variants[key] = {}
+    for width in _widths(kind, source_width):
+        height = max(round(source_height * width / source_width), 1)
+        resized = {}
+        for key, pil_format, options in FORMATS:
+            path = f"{DERIVED_DIR}/{kind}/{digest[:2]}/{digest}-{width}.{key}"
+            if overwrite and default_storage.exists(path):
+                default_storage.delete(path)
+            if not default_storage.exists(path):
+                base = image if key == "webp" else flat
+                if key not in resized:
+                    resized[key] = base if base.size == (width, height) else base.resize((width, height), Image.LANCZOS)
+                buffer = BytesIO()
+                resized[key].save(buffer, pil_format, **options)
+                path = default_storage.save(path, ContentFile(buffer.getvalue()))
+            variants[key][str(width)] = path
+    return variants
+
+
+def _invalidate(label, instance_id):
+    from . import signals
+
+    if label == "catalog.Book":
+        category_id = apps.get_model(label).objects.filter(id=instance_id).values_list("category_id", flat=True).first()
+        signals.invalidate_book_list_caches([category_id])
+    elif label == "catalog.Author":
+        signals.invalidate_author_caches(sender=None, instance=None)
+    elif label == "catalog.Banner":
+        signals.invalidate_banner_caches(sender=None, instance=None)
+
+
+def store_variants(label, instance_id, name, variants):
+    """Save a rendered map unless the image was replaced meanwhile (a newer render is already on its way)."""
+    field, variants_field, _kind = IMAGE_FIELDS[label]
+    updated = apps.get_model(label).objects.filter(id=instance_id, **{field: name}).update(**{variants_field: variants})
+    if updated:
+        _invalidate(label, instance_id)
+    return bool(updated)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# (label, id, name) renders queued in this process; Book.save saves twice on create.
+_pending = set()
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forked children must not inherit the parent's DB sockets.
+            connections.close_all()
+            _pool = ProcessPoolExecutor(max_workers=getattr(settings, "IMAGE_VARIANT_WORKERS", 2))
+        return _pool
+
+
+def _store_result(label, instance_id, name, future):
+    try:
+        store_variants(label, instance_id, name, future.result())
+    except Exception:
+        logger.exception("Image variants for %s #%s (%s) failed", label, instance_id, name)
+    finally:
+        _pending.discard((label, instance_id, name))
+        # Runs on the pool's callback thread; don't leave its connection open.
+        connections.close_all()
+
+
+def schedule_variants(instance):
+    """
+    After commit, render the instance's image in the background pool (or inline when
+    IMAGE_VARIANTS_ASYNC is off). Does nothing when the stored map already matches the file.
+    """
+    label = instance._meta.label
+    field, variants_field, kind = IMAGE_FIELDS[label]
+    if instance.get_deferred_fields() & {field, variants_field}:
+        # Partial loads (.only()) never change the image; don't query just to find that out.
+        return
+    image = getattr(instance, field)
+    current = getattr(instance, variants_field) or {}
+    if not image:
+        if current:
+            type(instance).objects.filter(id=instance.id).update(**{variants_field: {}})
+        return
+    if current.get("source") == image.name:
+        return
+    instance_id, name = instance.id, image.name
+    key = (label, instance_id, name)
+    if key in _pending:
+        return
+    _pending.add(key)
+
+    def submit():
+        if getattr(settings, "IMAGE_VARIANTS_ASYNC", True):
+            future = _executor().submit(render_variants, name, kind)
+            future.add_done_callback(lambda done: _store_result(label, instance_id, name, done))
+            return
+        try:
+            store_variants(label, instance_id, name, render_variants(name, kind))
+        except Exception:
+            logger.exception("Image variants for %s #%s (%s) failed", label, instance_id, name)
+        finally:
+            _pending.discard(key)
+
+    transaction.on_commit(submit)
+
+
+def stale_images(force=False):
+    """(label, id, name, kind) for every stored image whose variants are missing or outdated (all with force)."""
+    for label, (field, variants_field, kind) in IMAGE_FIELDS.items():
+        rows = (
+            apps.get_model(label)
+            .objects.exclude(**{field: ""})
+            .exclude(**{f"{field}__isnull": True})
+            .order_by("id")
+            .values_list("id", field, variants_field)
+        )
+        for instance_id, name, variants in rows.iterator():
+            if force or (variants or {}).get("source") != name:
+                yield label, instance_id, name, kind
+
+
+def backfill_variants(workers=None, force=False, progress=None):
+    """
+    Render variants for existing media across a process pool; results are written from this process.
+    progress(label, id, name, error) is called per image. Returns (rendered, failed).
+    """
+    if workers is None:
+        workers = getattr(settings, "IMAGE_VARIANT_WORKERS", 2)
+    items = list(stale_images(force))
+    rendered = failed = 0
+
+    def finish(item, variants=None, error=None):
+        nonlocal rendered, failed
+        label, instance_id, name, _kind = item
+        if error is None:
+            store_variants(label, instance_id, name, variants)
+            rendered += 1
+        else:
+            failed += 1
+        if progress:
+            progress(label, instance_id, name, error)
+
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            try:
+                variants = render_variants(item[2], item[3], overwrite=force)
+            except Exception as exc:
+                finish(item, error=exc)
+            else:
+                finish(item, variants)
+        return rendered, failed
+
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_variants, item[2], item[3], force): item for item in items}
+        for future in as_completed(futures):
+            try:
+                variants = future.result()
+            except Exception as exc:
+                finish(futures[future], error=exc)
+            else:
+                finish(futures[future], variants)
+    return rendered, failed
+
+
+def variants_for(image):
+    """The variants map for a FieldFile, or None when missing or stale (rendered from another file)."""
+    if not image:
+        return None
+    spec = IMAGE_FIELDS.get(image.instance._meta.label)
+    if spec is None or spec[0] != image.field.name:
+        return None
+    variants = getattr(image.instance, spec[1], None) or {}
+    if variants.get("source") != image.name:
+        return None
+    return variants
@@ -8,6 +8,8 @@ class Author(models.Model):
     bio = models.TextField("Tarjimai hol", blank=True)
     is_featured = models.BooleanField("Asosiy sahifada ko‘rsatish", default=False)
     photo = models.ImageField("Rasm", upload_to="authors/", blank=True, null=True)
+    # Resized WebP/JPEG copies of photo, see apps.catalog.images.
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         ordering = ["name"]
@@ -74,6 +76,8 @@ class Book(models.Model):
     sale_price = models.DecimalField("Sotish narxi", max_digits=8, decimal_places=2)
     description = models.TextField("Tavsif", blank=True)
     cover_image = models.ImageField("Muqova", upload_to="covers/", blank=True, null=True)
+    # Resized WebP/JPEG copies of cover_image, see apps.catalog.images.
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False)
     book_format = models.CharField("Format", max_length=10, choices=FORMAT_CHOICES, blank=True)
     pages = models.PositiveIntegerField("Betlar soni", blank=True, null=True)
     barcode = models.CharField("Shtrix-kod", max_length=64, blank=True, unique=True, null=True)
@@ -126,6 +130,7 @@ class Book(models.Model):
 class Banner(models.Model):
     title = models.CharField(max_length=255, blank=True)
     image = models.ImageField(upload_to="banners/")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     link = models.URLField(blank=True)
     order = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
@@ -4,6 +4,7 @@ from django.core.cache import cache
 from django.utils.translation import get_language
 from django.conf import settings
 
+from .images import schedule_variants
 from .models import Book, Category, Author, Banner, FeaturedCategory
 from .cache_keys import (
     language_codes,
@@ -88,13 +89,34 @@ def invalidate_featured_category_caches(sender, instance, **kwargs):
     _invalidate_keys(keys)
 
 
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Banner)
+def render_image_variants(sender, instance, **kwargs):
+    """
+    New or replaced images get resized WebP/JPEG copies in a background process after commit,
+    so listing pages stop shipping full-size uploads.
+    """
+    schedule_variants(instance)
+
+
 @receiver([post_save, post_delete], sender=Book)
 def invalidate_book_caches(sender, instance, **kwargs):
     """
     Book changes affect multiple public pages (home lists, bestsellers, recommended, category strips).
     Invalidate targeted keys instead of clearing the whole cache.
     """
+    invalidate_book_list_caches([instance.category_id])
+
+
+def invalidate_book_list_caches(category_ids):
+    """
+    Shared by the Book signal and bulk writers (bulk_update skips signals): one delete_many
+    for the book lists and the featured strips of the given categories.
+    """
+    category_ids = {cid for cid in category_ids if cid}
     langs = language_codes()
+    cfgs = list(FeaturedCategory.objects.filter(is_active=True, category_id__in=category_ids)) if category_ids else []
     keys = []
     for lang in langs:
         keys += [
@@ -104,8 +126,7 @@ def invalidate_book_caches(sender, instance, **kwargs):
             best_selling_list_key(lang),
             recommended_list_key(lang),
         ]
-        # Featured strips for this book's category (limit varies per config)
-        cfgs = FeaturedCategory.objects.filter(is_active=True, category_id=instance.category_id)
+        # Featured strips for these categories (limit varies per config)
         for cfg in cfgs:
             limit = cfg.limit or 10
             keys.append(home_featured_books_key(cfg.category_id, limit, lang))
@@ -0,0 +1,39 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from apps.catalog.images import variants_for
+
+register = template.Library()
+
+
+def _srcset(paths):
+    ordered = sorted(paths.items(), key=lambda item: int(item[0]))
+    return ", ".join(f"{default_storage.url(path)} {width}w" for width, path in ordered)
+
+
+@register.simple_tag
+def responsive_image(image, sizes="100vw", **attrs):
+    """
+    <picture> with WebP and JPEG srcsets from the image's derivatives; the plain upload until they exist.
+    `width` (the rendered CSS width) picks the JPEG fallback src. Other keyword arguments become <img> attributes.
+    """
+    extra = format_html_join("", ' {}="{}"', ((name.replace("_", "-"), value) for name, value in attrs.items()))
+    variants = variants_for(image)
+    if not variants or not variants.get("jpeg"):
+        return format_html('<img src="{}"{}>', image.url, extra)
+    jpeg = variants["jpeg"]
+    wanted = int(attrs.get("width") or 0)
+    widths = sorted(int(width) for width in jpeg)
+    fallback = next((width for width in widths if width >= wanted), widths[-1])
+    webp = ""
+    if variants.get("webp"):
+        webp = format_html('<source type="image/webp" srcset="{}" sizes="{}">', _srcset(variants["webp"]), sizes)
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        webp,
+        default_storage.url(jpeg[str(fallback)]),
+        _srcset(jpeg),
+        sizes,
+        extra,
+    )
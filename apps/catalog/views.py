@@ -7,6 +7,7 @@ from django.core.cache import cache
 from django.views.decorators.cache import cache_page
 from django.conf import settings
 from django.utils.translation import get_language
+from apps.crm.services.recommendations import related_books
 from .models import Category, Book, Author, Banner, FeaturedCategory
 
 
@@ -227,7 +228,11 @@ def book_detail(request, id, slug):
     Book.objects.filter(id=book.id).update(views=F("views") + 1)
     favorites = request.session.get("favorites", [])
     in_favorites = str(book.id) in favorites
-    return render(request, "book_detail.html", {"book": book, "in_favorites": in_favorites})
+    return render(
+        request,
+        "book_detail.html",
+        {"book": book, "in_favorites": in_favorites, "related_books": related_books(book.id)},
+    )
 
 
 def search(request):
@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.http import StreamingHttpResponse
 
-from .models import Courier, Customer, InventoryLog, Expense, Debt
+from .models import CatalogImport, Courier, Customer, InventoryLog, Expense, Debt, ExportJob, OfflineSale, StockSnapshot, Stocktake
+from .services.labels import label_stream, restock_labels
 
 
 @admin.register(Customer)
@@ -31,6 +33,35 @@ class InventoryLogAdmin(admin.ModelAdmin):
     list_display = ("book", "delta", "reason", "related_order", "created_at")
     list_filter = ("reason",)
     search_fields = ("book__title", "note")
+    actions = ("print_restock_labels",)
+
+    @admin.action(description="Kirim yorliqlari (A4 PDF)")
+    def print_restock_labels(self, request, queryset):
+        labels, _skipped = restock_labels(queryset)
+        response = StreamingHttpResponse(label_stream(labels, "pdf", "a4"), content_type="application/pdf")
+        response["Content-Disposition"] = 'attachment; filename="restock-labels.pdf"'
+        return response
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("book", "taken_at", "quantity", "unit_cost", "value", "is_opening")
+    list_filter = ("is_opening", "taken_at")
+    search_fields = ("book__title", "book__barcode")
+
+
+@admin.register(OfflineSale)
+class OfflineSaleAdmin(admin.ModelAdmin):
+    list_display = ("sale_id", "order", "unmatched", "seq", "created_at")
+    search_fields = ("sale_id",)
+    readonly_fields = ("sale_id", "seq", "order", "unmatched", "created_at")
+
+
+@admin.register(Stocktake)
+class StocktakeAdmin(admin.ModelAdmin):
+    list_display = ("id", "source_name", "status", "created_by", "created_at", "applied_at")
+    list_filter = ("status",)
+    readonly_fields = ("counts", "errors", "summary")
 
 
 @admin.register(Expense)
@@ -45,3 +76,17 @@ class DebtAdmin(admin.ModelAdmin):
     list_display = ("full_name", "phone", "amount", "is_paid", "created_at")
     list_filter = ("is_paid",)
     search_fields = ("full_name", "phone", "note")
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "status", "progress", "requested_by", "created_at", "finished_at", "expires_at")
+    list_filter = ("status",)
+    readonly_fields = ("fingerprint",)
+
+
+@admin.register(CatalogImport)
+class CatalogImportAdmin(admin.ModelAdmin):
+    list_display = ("id", "source_name", "status", "rows_done", "created_count", "error_count", "created_at")
+    list_filter = ("status",)
+    readonly_fields = ("rows_done", "created_count", "skipped_count", "error_count", "errors")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from apps.catalog.images import backfill_variants
+
+
+class Command(BaseCommand):
+    help = "Render WebP/JPEG size variants for existing book covers, author photos and banners."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Processes (default: IMAGE_VARIANT_WORKERS).")
+        parser.add_argument("--force", action="store_true", help="Re-render every image, overwriting existing files.")
+
+    def handle(self, *args, **options):
+        def progress(label, instance_id, name, error):
+            if error is not None:
+                self.stdout.write(self.style.ERROR(f"{label} #{instance_id} ({name}): {error}"))
+            elif options["verbosity"] > 1:
+                self.stdout.write(f"{label} #{instance_id}: {name}")
+
+        rendered, failed = backfill_variants(workers=options["workers"], force=options["force"], progress=progress)
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(f"Rasmlar tayyorlandi: {rendered}, xato: {failed}"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from apps.crm.services.recommendations import build_recommendations
+
+
+class Command(BaseCommand):
+    help = "Fold new orders into co-purchase counts and refresh the related-books lists (run nightly)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recount every order (drops canceled ones) and recompute all books.",
+        )
+
+    def handle(self, *args, **options):
+        result = build_recommendations(full=options["full"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"O'xshash kitoblar yangilandi: {result['orders']} ta buyurtma, {result['pairs']} ta juftlik, "
+                f"{result['books']} ta kitob."
+            )
+        )
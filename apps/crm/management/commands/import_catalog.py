@@ -0,0 +1,64 @@
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.crm.models import CatalogImport
+from apps.crm.services.catalog_import import CHUNK_SIZE, claim_next_import, run_import
+
+
+class Command(BaseCommand):
+    help = "Bulk-load books from a supplier CSV/XLSX catalog in chunks (resumable), or process queued imports."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", help="CSV or XLSX file with a header row.")
+        parser.add_argument("--resume", type=int, help="Continue an interrupted import by id.")
+        parser.add_argument("--queue", action="store_true", help="Process imports uploaded from the CRM and exit.")
+        parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="Rows per transaction.")
+
+    def handle(self, *args, **options):
+        chunk = max(options["chunk"], 1)
+        if options["queue"]:
+            job = claim_next_import()
+            while job:
+                self._run(job, chunk)
+                job = claim_next_import()
+            return
+        if options["resume"]:
+            job = CatalogImport.objects.filter(id=options["resume"]).first()
+            if job is None:
+                raise CommandError(f"Import #{options['resume']} topilmadi.")
+            if job.status == "done":
+                raise CommandError(f"Import #{job.id} allaqachon tugagan.")
+            self._run(job, chunk)
+            return
+        if not options["path"]:
+            raise CommandError("Fayl yo'li, --resume yoki --queue kerak.")
+        name = os.path.basename(options["path"])
+        with open(options["path"], "rb") as handle:
+            job = CatalogImport(source_name=name[:255])
+            job.file.save(name, File(handle), save=False)
+        job.save()
+        self._run(job, chunk)
+
+    def _run(self, job, chunk):
+        self.stdout.write(f"Import #{job.id}: {job.source_name}" + (f" ({job.rows_done} qatordan)" if job.rows_done else ""))
+
+        def progress(current):
+            self.stdout.write(
+                f"  {current.rows_done} qator: +{current.created_count}, "
+                f"o'tkazildi {current.skipped_count}, xato {current.error_count}"
+            )
+
+        job = run_import(job, chunk_size=chunk, progress=progress)
+        if job.status == "done":
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Import #{job.id}: {job.created_count} ta qo'shildi, {job.skipped_count} ta bor edi, "
+                    f"{job.error_count} ta xato."
+                )
+            )
+        else:
+            self.stdout.write(self.style.ERROR(f"Import #{job.id}: {job.error} (davom ettirish: --resume {job.id})"))
+        for row_no, message in job.errors[:20]:
+            self.stdout.write(f"  {row_no}-qator: {message}")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from apps.crm.services.offline_sales import BATCH_SIZE, import_offline_sales
+
+
+class Command(BaseCommand):
+    help = "Turn newly synced offline till sales into POS orders with inventory movements (run from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Rescan every synced sale (imported ones are skipped).")
+        parser.add_argument(
+            "--backfill",
+            action="store_true",
+            help="Import sales synced before the cutover as orders, without stock or inventory movements.",
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Sales imported per transaction.")
+
+    def handle(self, *args, **options):
+        stats = import_offline_sales(full=options["full"], backfill=options["backfill"], batch_size=max(options["batch_size"], 1))
+        message = f"Offline sotuvlar: {stats['orders']} ta buyurtma, {stats['items']} ta qator."
+        if stats["unmatched"]:
+            message += f" Kitobga mos kelmagan qatorlar: {stats['unmatched']} (shtrix-kodni tekshiring)."
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.crm.models import Customer, Debt
+from apps.crm.services.customers import backfill_normalized_phones, merge_duplicate_customers
+from apps.orders.models import Order
+
+
+class Command(BaseCommand):
+    help = "Backfill normalized (E.164) phones on customers, orders and debts and merge duplicate customers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only list the customers that would be merged.")
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        with transaction.atomic():
+            merged = merge_duplicate_customers(dry_run=dry_run)
+            if not dry_run:
+                orders = backfill_normalized_phones(Order)
+                debts = backfill_normalized_phones(Debt)
+        for phone, ids in merged.items():
+            self.stdout.write(f"{phone}: {len(ids)} ta dublikat ({', '.join(map(str, ids))})")
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f"Birlashtiriladi: {len(merged)} ta raqam (--dry-run)."))
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Birlashtirildi: {len(merged)} ta raqam. Yangilandi: {orders} buyurtma, {debts} qarz. "
+                f"Mijozlar: {Customer.objects.count()}."
+            )
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.crm.services.search import ENTITY_BY_KEY, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the CRM search documents (all entity types or the ones given). Run once after deploying: until a full rebuild, search reads the live tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("types", nargs="*", help=f"Entity types: {', '.join(ENTITY_BY_KEY)}")
+
+    def handle(self, *args, **options):
+        unknown = [key for key in options["types"] if key not in ENTITY_BY_KEY]
+        if unknown:
+            raise CommandError(f"Noma'lum tur: {', '.join(unknown)}")
+        with transaction.atomic():
+            counts = rebuild_search_index(options["types"] or None)
+        for key, count in counts.items():
+            self.stdout.write(f"{key}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Qidiruv indeksi yangilandi: {sum(counts.values())} ta hujjat."))
@@ -0,0 +1,74 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+
+from apps.crm.models import Customer
+from apps.orders.models import Order
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Compare customer metrics with a full re-aggregation of orders and report (or fix) drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--apply", action="store_true", help="Write the recomputed values back.")
+        parser.add_argument("--limit", type=int, default=50, help="How many drifted customers to print.")
+
+    def handle(self, *args, **options):
+        # One grouped query for every phone instead of one aggregate per customer; rows that differ
+        # only in how the phone was typed fold into their normalized number.
+        expected = {}
+        rows = (
+            Order.objects.exclude(status="canceled")
+            .exclude(phone="")
+            .values("phone_normalized", "phone")
+            .annotate(count=Count("id"), total=Sum("total_price"), last=Max("created_at"))
+            .order_by()
+        )
+        for row in rows:
+            key = row["phone_normalized"] or row["phone"]
+            acc = expected.setdefault(key, {"count": 0, "total": Decimal("0"), "last": None})
+            acc["count"] += row["count"]
+            acc["total"] += row["total"] or Decimal("0")
+            if row["last"] and (acc["last"] is None or row["last"] > acc["last"]):
+                acc["last"] = row["last"]
+
+        drifted = []
+        customers = Customer.objects.only("id", "phone", "phone_normalized", "orders_count", "total_spent", "last_order_at")
+        for customer in customers.iterator(chunk_size=2000):
+            row = expected.get(customer.phone_normalized or customer.phone) or {}
+            count = row.get("count") or 0
+            total = row.get("total") or Decimal("0")
+            last = row.get("last") or customer.last_order_at
+            if customer.orders_count != count or customer.total_spent != total or customer.last_order_at != last:
+                drifted.append((customer, count, total, last))
+
+        for customer, count, total, _last in drifted[: options["limit"]]:
+            self.stdout.write(
+                f"{customer.phone}: buyurtmalar {customer.orders_count} -> {count}, "
+                f"sarf {customer.total_spent} -> {total}"
+            )
+        if len(drifted) > options["limit"]:
+            self.stdout.write(f"... va yana {len(drifted) - options['limit']} ta")
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Farq topilmadi."))
+            return
+        if not options["apply"]:
+            self.stdout.write(self.style.WARNING(f"Farq: {len(drifted)} ta mijoz. Tuzatish uchun --apply bilan ishga tushiring."))
+            return
+
+        updated = []
+        for customer, count, total, last in drifted:
+            customer.orders_count = count
+            customer.total_spent = total
+            customer.last_order_at = last
+            updated.append(customer)
+        with transaction.atomic():
+            Customer.objects.bulk_update(
+                updated, ["orders_count", "total_spent", "last_order_at"], batch_size=BATCH_SIZE
+            )
+        self.stdout.write(self.style.SUCCESS(f"Tuzatildi: {len(updated)} ta mijoz."))
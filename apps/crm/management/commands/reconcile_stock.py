@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from apps.crm.services.ledger import reconcile_stock
+
+
+class Command(BaseCommand):
+    help = "List books whose stock_quantity disagrees with the stock ledger (snapshot + inventory log)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=100, help="How many mismatches to print.")
+
+    def handle(self, *args, **options):
+        drifted = reconcile_stock()
+        for book, ledger_qty in drifted[: options["limit"]]:
+            self.stdout.write(
+                f"#{book.id} {book.title} [{book.barcode or '-'}]: ombor {book.stock_quantity}, "
+                f"jurnal {ledger_qty} (farq {book.stock_quantity - ledger_qty:+d})"
+            )
+        if drifted:
+            self.stdout.write(self.style.WARNING(f"Mos kelmaydi: {len(drifted)} ta kitob."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Ombor jurnal bilan mos."))
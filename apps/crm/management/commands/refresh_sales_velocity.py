@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from apps.crm.services.forecast import refresh_sales_days, velocity_stats
+
+
+class Command(BaseCommand):
+    help = "Refresh daily sales buckets and the cached per-book sales velocity used by the reorder report."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Rebuild the whole history window (picks up back-dated edits and cancellations of old orders).",
+        )
+
+    def handle(self, *args, **options):
+        written = refresh_sales_days(full=options["full"])
+        stats = velocity_stats()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Kunlik savdo yangilandi: {written} ta yozuv, {len(stats['book_ids'])} ta kitob "
+                f"({stats['days']} kun)."
+            )
+        )
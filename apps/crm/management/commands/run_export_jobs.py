@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.crm.services.export_jobs import claim_next_job, purge_expired_exports, run_export_job
+
+
+class Command(BaseCommand):
+    help = "Process queued CRM export jobs (render reports in a process pool, store artifacts in MEDIA_ROOT)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit (cron mode).")
+        parser.add_argument("--workers", type=int, default=None, help="Processes per job (default: EXPORT_JOB_WORKERS).")
+        parser.add_argument("--sleep", type=float, default=3.0, help="Seconds to wait when the queue is empty.")
+
+    def handle(self, *args, **options):
+        once = options["once"]
+        workers = options["workers"]
+        while True:
+            purged = purge_expired_exports()
+            if purged:
+                self.stdout.write(f"Muddati o'tgan eksportlar o'chirildi: {purged}")
+            job = claim_next_job()
+            while job:
+                self.stdout.write(f"Eksport #{job.id}: {', '.join(job.reports)}")
+                job = run_export_job(job, workers=workers)
+                style = self.style.SUCCESS if job.status == "done" else self.style.ERROR
+                self.stdout.write(style(f"Eksport #{job.id}: {job.get_status_display()}"))
+                job = claim_next_job()
+            if once:
+                return
+            time.sleep(options["sleep"])
@@ -0,0 +1,26 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from apps.crm.services.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Write per-book stock ledger snapshots (run periodically, e.g. nightly from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Snapshot at the end of this day (YYYY-MM-DD) instead of now.")
+
+    def handle(self, *args, **options):
+        at = None
+        if options["date"]:
+            try:
+                day = datetime.strptime(options["date"], "%Y-%m-%d").date()
+            except ValueError as exc:
+                raise CommandError("Sana formati: YYYY-MM-DD") from exc
+            at = timezone.make_aware(datetime.combine(day, time.max))
+        with transaction.atomic():
+            written = take_snapshots(at)
+        self.stdout.write(self.style.SUCCESS(f"Snapshot yozildi: {written} ta kitob."))
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.6 on 2026-10-19 05:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_debt_paid_amount'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reports', models.JSONField(default=list, verbose_name='Hisobotlar')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Parametrlar')),
+                ('fingerprint', models.CharField(db_index=True, max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Navbatda'), ('running', 'Tayyorlanmoqda'), ('done', 'Tayyor'), ('failed', 'Xato')], default='pending', max_length=20, verbose_name='Holat')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='Jarayon (%)')),
+                ('file', models.FileField(blank=True, upload_to='exports/', verbose_name='Fayl')),
+                ('error', models.TextField(blank=True, verbose_name='Xato')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='export_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Eksport',
+                'verbose_name_plural': 'Eksportlar',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='exportjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('fingerprint',), name='crm_exportjob_active_fingerprint'),
+        ),
+    ]
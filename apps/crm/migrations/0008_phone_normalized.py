@@ -0,0 +1,116 @@
+import re
+from collections import defaultdict
+
+from django.db import migrations, models
+
+_NON_DIGITS = re.compile(r"\D")
+BATCH = 1000
+
+
+def normalize_phone(value):
+    # Frozen copy of apps.crm.utils.phones.normalize_phone as of this migration.
+    raw = "" if value is None else str(value).strip()
+    if not raw:
+        return ""
+    digits = _NON_DIGITS.sub("", raw)
+    if raw.startswith("00"):
+        digits = digits[2:]
+    if len(digits) == 9:
+        digits = "998" + digits
+    elif len(digits) == 10 and digits.startswith("8"):
+        digits = "998" + digits[1:]
+    if not 10 <= len(digits) <= 15:
+        return ""
+    return f"+{digits}"
+
+
+def backfill_normalized_phones(model, empty=""):
+    stale = []
+    for obj in model.objects.only("id", "phone", "phone_normalized").iterator(chunk_size=BATCH):
+        value = normalize_phone(obj.phone) or empty
+        if obj.phone_normalized != value:
+            obj.phone_normalized = value
+            stale.append(obj)
+        if len(stale) >= BATCH:
+            model.objects.bulk_update(stale, ["phone_normalized"])
+            stale = []
+    if stale:
+        model.objects.bulk_update(stale, ["phone_normalized"])
+
+
+def merge_duplicate_customers(customer_model, order_model):
+    """
+    Fold customers whose phones normalize to the same number into the one with the most orders (oldest on
+    ties) before phone_normalized becomes unique: orders re-pointed, metrics summed, flags/tags/notes combined.
+    """
+    groups = defaultdict(list)
+    for row in customer_model.objects.values("id", "phone", "orders_count").order_by("id").iterator():
+        normalized = normalize_phone(row["phone"])
+        if normalized:
+            groups[normalized].append(row)
+    for rows in groups.values():
+        if len(rows) < 2:
+            continue
+        rows.sort(key=lambda r: (-r["orders_count"], r["id"]))
+        keeper_id, other_ids = rows[0]["id"], [r["id"] for r in rows[1:]]
+        keeper = customer_model.objects.get(id=keeper_id)
+        for other in customer_model.objects.filter(id__in=other_ids):
+            keeper.orders_count += other.orders_count
+            keeper.total_spent += other.total_spent
+            if other.last_order_at and (not keeper.last_order_at or other.last_order_at > keeper.last_order_at):
+                keeper.last_order_at = other.last_order_at
+            keeper.discount_percent = max(keeper.discount_percent, other.discount_percent)
+            keeper.is_vip = keeper.is_vip or other.is_vip
+            keeper.is_problem = keeper.is_problem or other.is_problem
+            keeper.email = keeper.email or other.email
+            tags = [t.strip() for t in f"{keeper.tags},{other.tags}".split(",") if t.strip()]
+            keeper.tags = ", ".join(dict.fromkeys(tags))[:255]
+            if other.notes and other.notes not in keeper.notes:
+                keeper.notes = f"{keeper.notes}\n{other.notes}".strip()
+        order_model.objects.filter(customer_id__in=other_ids).update(customer_id=keeper_id)
+        customer_model.objects.filter(id__in=other_ids).delete()
+        customer_model.objects.filter(id=keeper_id).update(
+            orders_count=keeper.orders_count,
+            total_spent=keeper.total_spent,
+            last_order_at=keeper.last_order_at,
+            discount_percent=keeper.discount_percent,
+            is_vip=keeper.is_vip,
+            is_problem=keeper.is_problem,
+            email=keeper.email,
+            tags=keeper.tags,
+            notes=keeper.notes,
+        )
+
+
+def backfill_and_merge(apps, schema_editor):
+    merge_duplicate_customers(apps.get_model("crm", "Customer"), apps.get_model("orders", "Order"))
+    # Customer.phone_normalized is nullable-unique: non-phones ("POS") stay NULL.
+    backfill_normalized_phones(apps.get_model("crm", "Customer"), empty=None)
+    backfill_normalized_phones(apps.get_model("crm", "Debt"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_exportjob'),
+        ('orders', '0012_order_phone_normalized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='phone_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='debt',
+            name='phone_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16),
+        ),
+        migrations.RunPython(backfill_and_merge, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='customer',
+            name='phone_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True, unique=True),
+        ),
+    ]
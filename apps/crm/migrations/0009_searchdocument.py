@@ -0,0 +1,89 @@
+# Generated by Django 5.0.6 on 2026-10-19 05:24
+
+from django.db import DatabaseError, migrations, models, transaction
+
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE crm_searchdocument_fts USING fts5("
+    "content, content='crm_searchdocument', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER crm_searchdocument_ai AFTER INSERT ON crm_searchdocument BEGIN "
+    "INSERT INTO crm_searchdocument_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER crm_searchdocument_ad AFTER DELETE ON crm_searchdocument BEGIN "
+    "INSERT INTO crm_searchdocument_fts(crm_searchdocument_fts, rowid, content) "
+    "VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER crm_searchdocument_au AFTER UPDATE ON crm_searchdocument BEGIN "
+    "INSERT INTO crm_searchdocument_fts(crm_searchdocument_fts, rowid, content) "
+    "VALUES ('delete', old.id, old.content); "
+    "INSERT INTO crm_searchdocument_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS crm_searchdocument_ai",
+    "DROP TRIGGER IF EXISTS crm_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS crm_searchdocument_au",
+    "DROP TABLE IF EXISTS crm_searchdocument_fts",
+]
+POSTGRES_TRGM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS crm_searchdocument_content_trgm "
+    "ON crm_searchdocument USING gin (content gin_trgm_ops)",
+]
+POSTGRES_TRGM_DROP = ["DROP INDEX IF EXISTS crm_searchdocument_content_trgm"]
+
+
+def _run(schema_editor, statements):
+    # Without FTS5 trigram (SQLite < 3.34) or pg_trgm rights, search falls back to LIKE on content.
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            for sql in statements:
+                schema_editor.execute(sql)
+    except DatabaseError:
+        pass
+
+
+def create_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_FTS)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRES_TRGM)
+
+
+def drop_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_FTS_DROP)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRES_TRGM_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0008_phone_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_type', models.CharField(choices=[('orders', 'Buyurtmalar'), ('customers', 'Mijozlar'), ('couriers', 'Kuryerlar'), ('books', 'Kitoblar'), ('categories', 'Kategoriyalar'), ('authors', 'Mualliflar'), ('expenses', 'Chiqimlar'), ('debts', 'Qarzlar'), ('inventory_logs', 'Ombor yozuvlari'), ('delivery_notices', 'Yetkazib berish eslatmalari'), ('delivery_zones', 'Yetkazib berish zonalari'), ('banners', 'Bannerlar'), ('about_pages', 'Biz haqimizda')], max_length=32, verbose_name='Turi')),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=255, verbose_name='Sarlavha')),
+                ('subtitle', models.CharField(blank=True, max_length=255)),
+                ('url', models.CharField(blank=True, max_length=500)),
+                ('content', models.TextField()),
+                ('sort_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Qidiruv hujjati',
+                'verbose_name_plural': 'Qidiruv hujjatlari',
+                'indexes': [models.Index(fields=['entity_type', '-sort_at'], name='crm_searchdoc_type_sort')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchdocument',
+            constraint=models.UniqueConstraint(fields=('entity_type', 'object_id'), name='crm_searchdocument_entity'),
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+    ]
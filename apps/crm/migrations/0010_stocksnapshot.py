@@ -0,0 +1,53 @@
+# Generated by Django 5.0.6 on 2026-10-19 05:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_book_crm_fields'),
+        ('crm', '0009_searchdocument'),
+        ('orders', '0012_order_phone_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(verbose_name='Sana')),
+                ('quantity', models.IntegerField(verbose_name='Miqdor')),
+                ('unit_cost', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Tan narx')),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Qiymat')),
+                ('is_opening', models.BooleanField(default=False, verbose_name='Boshlang‘ich')),
+            ],
+            options={
+                'verbose_name': 'Ombor snapshoti',
+                'verbose_name_plural': 'Ombor snapshotlari',
+                'ordering': ['-taken_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inventorylog',
+            index=models.Index(fields=['book', 'created_at'], name='crm_invlog_book_created'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorylog',
+            index=models.Index(fields=['created_at'], name='crm_invlog_created'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='catalog.book'),
+        ),
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['taken_at'], name='crm_stocksnap_taken_at'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('book', 'taken_at'), name='crm_stocksnapshot_book_taken_at'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.6 on 2026-10-19 05:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0010_stocksnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventorylog',
+            name='reason',
+            field=models.CharField(choices=[('sale', 'Sotuv'), ('restock', 'To‘ldirish'), ('adjust', 'Tuzatish'), ('stocktake', 'Inventarizatsiya'), ('cancel', 'Bekor qilish')], max_length=20, verbose_name='Sabab'),
+        ),
+        migrations.CreateModel(
+            name='Stocktake',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_name', models.CharField(blank=True, max_length=255, verbose_name='Fayl')),
+                ('note', models.CharField(blank=True, max_length=255, verbose_name='Izoh')),
+                ('counts', models.JSONField(default=dict, verbose_name='Sanalgan')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='Xatolar')),
+                ('status', models.CharField(choices=[('draft', 'Ko‘rib chiqilmoqda'), ('applied', 'Qo‘llandi'), ('discarded', 'Bekor qilindi')], default='draft', max_length=20, verbose_name='Holat')),
+                ('summary', models.JSONField(blank=True, default=dict, verbose_name='Natija')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stocktakes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Inventarizatsiya',
+                'verbose_name_plural': 'Inventarizatsiyalar',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.6 on 2026-10-19 05:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_book_crm_fields'),
+        ('crm', '0011_stocktake'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Kun')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Sotildi')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_days', to='catalog.book')),
+            ],
+            options={
+                'verbose_name': 'Kunlik sotuv',
+                'verbose_name_plural': 'Kunlik sotuvlar',
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['day'], name='crm_salesday_day')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='salesday',
+            constraint=models.UniqueConstraint(fields=('book', 'day'), name='crm_salesday_book_day'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-19 05:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0012_salesday'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='imports/', verbose_name='Fayl')),
+                ('source_name', models.CharField(blank=True, max_length=255, verbose_name='Fayl nomi')),
+                ('status', models.CharField(choices=[('pending', 'Navbatda'), ('running', 'Yuklanmoqda'), ('done', 'Tayyor'), ('failed', 'Xato')], default='pending', max_length=20, verbose_name='Holat')),
+                ('rows_done', models.PositiveIntegerField(default=0, verbose_name='Qayta ishlangan qatorlar')),
+                ('created_count', models.PositiveIntegerField(default=0, verbose_name='Qo‘shildi')),
+                ('skipped_count', models.PositiveIntegerField(default=0, verbose_name='O‘tkazib yuborildi')),
+                ('error_count', models.PositiveIntegerField(default=0, verbose_name='Xatolar soni')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='Xatolar')),
+                ('error', models.TextField(blank=True, verbose_name='Xato')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='catalog_imports', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Katalog importi',
+                'verbose_name_plural': 'Katalog importlari',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
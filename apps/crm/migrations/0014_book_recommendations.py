@@ -0,0 +1,45 @@
+# Generated by Django 5.0.6 on 2026-10-19 05:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_image_variants'),
+        ('crm', '0013_catalogimport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookNeighbors',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='neighbors', serialize=False, to='catalog.book')),
+                ('baskets', models.PositiveIntegerField(default=0, verbose_name='Savatlar')),
+                ('related', models.JSONField(blank=True, default=list, verbose_name='O‘xshash kitoblar')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'O‘xshash kitoblar',
+                'verbose_name_plural': 'O‘xshash kitoblar',
+            },
+        ),
+        migrations.CreateModel(
+            name='CoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('baskets', models.PositiveIntegerField(default=0, verbose_name='Savatlar')),
+                ('book_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.book')),
+                ('book_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.book')),
+            ],
+            options={
+                'verbose_name': 'Birga sotib olish',
+                'verbose_name_plural': 'Birga sotib olishlar',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='copurchase',
+            constraint=models.UniqueConstraint(fields=('book_a', 'book_b'), name='crm_copurchase_pair'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-19 06:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0014_book_recommendations'),
+        ('orders', '0012_order_phone_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfflineSale',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sale_id', models.UUIDField(unique=True, verbose_name='Sotuv')),
+                ('seq', models.BigIntegerField(db_index=True)),
+                ('unmatched', models.PositiveIntegerField(default=0, verbose_name='Mos kelmagan qatorlar')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='offline_sale', to='orders.order')),
+            ],
+            options={
+                'verbose_name': 'Offline sotuv',
+                'verbose_name_plural': 'Offline sotuvlar',
+                'ordering': ['-seq'],
+            },
+        ),
+    ]
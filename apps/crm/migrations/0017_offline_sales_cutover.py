@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-19 06:26
+
+from django.db import migrations, models
+
+
+def seed_cutover(apps, schema_editor):
+    """
+    Sales already synced when the bridge is deployed were reconciled by hand: start importing after the
+    current change-feed head (import_offline_sales --backfill brings the older ones in without stock).
+    """
+    sequence = apps.get_model("sync", "SyncSequence")
+    watermark = apps.get_model("crm", "JobWatermark")
+    head = sequence.objects.filter(name="changes").values_list("value", flat=True).first() or 0
+    watermark.objects.get_or_create(name="offline_sales_cutover", defaults={"value": head})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0016_job_watermark'),
+        ('sync', '0003_change_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='offlinesale',
+            name='stock_moved',
+            field=models.BooleanField(default=True, verbose_name='Ombordan chiqarildi'),
+        ),
+        migrations.RunPython(seed_cutover, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,15 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
+from apps.crm.utils.phones import normalized_update_fields
+
 
 class Customer(models.Model):
     full_name = models.CharField("F.I.Sh", max_length=255)
     phone = models.CharField("Telefon", max_length=50, unique=True)
+    # E.164 form of phone; the identity used for lookups and dedupe. NULL when phone isn't a number.
+    phone_normalized = models.CharField(max_length=16, null=True, blank=True, unique=True, editable=False)
     email = models.EmailField("Email", blank=True)
     tags = models.CharField("Teglar", max_length=255, blank=True)
     notes = models.TextField("Izoh", blank=True)
@@ -24,6 +29,10 @@ class Customer(models.Model):
     def __str__(self):
         return f"{self.full_name} ({self.phone})"
 
+    def save(self, *args, **kwargs):
+        kwargs["update_fields"] = normalized_update_fields(self, kwargs.get("update_fields"), empty=None)
+        super().save(*args, **kwargs)
+
 
 class Courier(models.Model):
     name = models.CharField("F.I.Sh", max_length=255)
@@ -48,6 +57,7 @@ class InventoryLog(models.Model):
         ("sale", "Sotuv"),
         ("restock", "To‘ldirish"),
         ("adjust", "Tuzatish"),
+        ("stocktake", "Inventarizatsiya"),
         ("cancel", "Bekor qilish"),
     ]
 
@@ -68,11 +78,231 @@ class InventoryLog(models.Model):
         ordering = ["-created_at"]
         verbose_name = "Ombor yozuvi"
         verbose_name_plural = "Ombor yozuvlari"
+        indexes = [
+            # Ledger deltas are "between two instants", for one book or for all of them.
+            models.Index(fields=["book", "created_at"], name="crm_invlog_book_created"),
+            models.Index(fields=["created_at"], name="crm_invlog_created"),
+        ]
 
     def __str__(self):
         return f"{self.book} ({self.delta})"
 
 
+class StockSnapshot(models.Model):
+    """
+    Ledger checkpoint: a book's quantity and valuation at taken_at. Stock at any date is the nearest
+    snapshot plus the InventoryLog deltas between the two, so the log never has to be scanned in full.
+    """
+
+    book = models.ForeignKey("catalog.Book", on_delete=models.CASCADE, related_name="stock_snapshots")
+    taken_at = models.DateTimeField("Sana")
+    quantity = models.IntegerField("Miqdor")
+    unit_cost = models.DecimalField("Tan narx", max_digits=10, decimal_places=2, default=0)
+    value = models.DecimalField("Qiymat", max_digits=14, decimal_places=2, default=0)
+    # Opening snapshots copy Book.stock_quantity; later ones are carried forward from the ledger.
+    is_opening = models.BooleanField("Boshlang‘ich", default=False)
+
+    class Meta:
+        ordering = ["-taken_at"]
+        verbose_name = "Ombor snapshoti"
+        verbose_name_plural = "Ombor snapshotlari"
+        constraints = [
+            models.UniqueConstraint(fields=["book", "taken_at"], name="crm_stocksnapshot_book_taken_at"),
+        ]
+        indexes = [
+            models.Index(fields=["taken_at"], name="crm_stocksnap_taken_at"),
+        ]
+
+    def __str__(self):
+        return f"{self.book} @ {self.taken_at:%Y-%m-%d}: {self.quantity}"
+
+
+class OfflineSale(models.Model):
+    """
+    A till sale synced through apps.sync, imported into the order ledger (services.offline_sales). The
+    unique sale id makes the import idempotent; seq is the sale's change-feed position when imported.
+    """
+
+    sale_id = models.UUIDField("Sotuv", unique=True)
+    seq = models.BigIntegerField(db_index=True)
+    order = models.OneToOneField(
+        "orders.Order", on_delete=models.SET_NULL, null=True, blank=True, related_name="offline_sale"
+    )
+    # Lines whose sync product has no barcode or no book with that barcode.
+    unmatched = models.PositiveIntegerField("Mos kelmagan qatorlar", default=0)
+    # False for sales made before the cutover (reconciled by hand): imported as orders, stock left alone.
+    stock_moved = models.BooleanField("Ombordan chiqarildi", default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-seq"]
+        verbose_name = "Offline sotuv"
+        verbose_name_plural = "Offline sotuvlar"
+
+    def __str__(self):
+        return f"{self.sale_id} -> {self.order_id or '-'}"
+
+
+class SalesDay(models.Model):
+    """Units sold per book per local day (orders, imported offline POS sales included); the input of the reorder forecast."""
+
+    book = models.ForeignKey("catalog.Book", on_delete=models.CASCADE, related_name="sales_days")
+    day = models.DateField("Kun")
+    quantity = models.PositiveIntegerField("Sotildi", default=0)
+
+    class Meta:
+        ordering = ["-day"]
+        verbose_name = "Kunlik sotuv"
+        verbose_name_plural = "Kunlik sotuvlar"
+        constraints = [
+            models.UniqueConstraint(fields=["book", "day"], name="crm_salesday_book_day"),
+        ]
+        indexes = [
+            models.Index(fields=["day"], name="crm_salesday_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.book} {self.day}: {self.quantity}"
+
+
+class CoPurchase(models.Model):
+    """Number of order baskets containing both books (book_a < book_b); input of the related-books table."""
+
+    book_a = models.ForeignKey("catalog.Book", on_delete=models.CASCADE, related_name="+")
+    book_b = models.ForeignKey("catalog.Book", on_delete=models.CASCADE, related_name="+")
+    baskets = models.PositiveIntegerField("Savatlar", default=0)
+
+    class Meta:
+        verbose_name = "Birga sotib olish"
+        verbose_name_plural = "Birga sotib olishlar"
+        constraints = [
+            models.UniqueConstraint(fields=["book_a", "book_b"], name="crm_copurchase_pair"),
+        ]
+
+    def __str__(self):
+        return f"{self.book_a_id} + {self.book_b_id}: {self.baskets}"
+
+
+class BookNeighbors(models.Model):
+    """Precomputed top related books per book (co-purchase first, then same author/category)."""
+
+    book = models.OneToOneField("catalog.Book", on_delete=models.CASCADE, primary_key=True, related_name="neighbors")
+    # Baskets containing this book; the co-purchase score is pair baskets / sqrt(baskets_a * baskets_b).
+    baskets = models.PositiveIntegerField("Savatlar", default=0)
+    related = models.JSONField("O‘xshash kitoblar", default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "O‘xshash kitoblar"
+        verbose_name_plural = "O‘xshash kitoblar"
+
+    def __str__(self):
+        return f"{self.book_id}: {self.related}"
+
+
+class JobWatermark(models.Model):
+    """
+    How far an incremental batch job has read (an order id, a change-feed seq). Kept in the database:
+    the cache may be per-process (LocMemCache fallback) or evicted, and a lost watermark means a full rerun.
+    """
+
+    name = models.CharField(max_length=60, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Ish belgisi"
+        verbose_name_plural = "Ish belgilari"
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
+    @classmethod
+    def get(cls, name):
+        """The stored value, or None when the job has never run."""
+        return cls.objects.filter(name=name).values_list("value", flat=True).first()
+
+    @classmethod
+    def put(cls, name, value):
+        cls.objects.update_or_create(name=name, defaults={"value": value})
+
+
+class Stocktake(models.Model):
+    """An uploaded count sheet: parsed once, previewed against live stock, then applied in one transaction."""
+
+    STATUS_CHOICES = [
+        ("draft", "Ko‘rib chiqilmoqda"),
+        ("applied", "Qo‘llandi"),
+        ("discarded", "Bekor qilindi"),
+    ]
+
+    source_name = models.CharField("Fayl", max_length=255, blank=True)
+    note = models.CharField("Izoh", max_length=255, blank=True)
+    # {barcode: counted quantity}, duplicates already summed.
+    counts = models.JSONField("Sanalgan", default=dict)
+    errors = models.JSONField("Xatolar", default=list, blank=True)
+    status = models.CharField("Holat", max_length=20, choices=STATUS_CHOICES, default="draft")
+    summary = models.JSONField("Natija", default=dict, blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="stocktakes",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "Inventarizatsiya"
+        verbose_name_plural = "Inventarizatsiyalar"
+
+    def __str__(self):
+        return f"Inventarizatsiya #{self.id} ({self.get_status_display()})"
+
+
+class CatalogImport(models.Model):
+    """A supplier catalog file loaded in chunks; rows_done makes an interrupted run resumable."""
+
+    STATUS_CHOICES = [
+        ("pending", "Navbatda"),
+        ("running", "Yuklanmoqda"),
+        ("done", "Tayyor"),
+        ("failed", "Xato"),
+    ]
+
+    file = models.FileField("Fayl", upload_to="imports/")
+    source_name = models.CharField("Fayl nomi", max_length=255, blank=True)
+    status = models.CharField("Holat", max_length=20, choices=STATUS_CHOICES, default="pending")
+    # Data rows (after the header) already committed; a resumed run skips them.
+    rows_done = models.PositiveIntegerField("Qayta ishlangan qatorlar", default=0)
+    created_count = models.PositiveIntegerField("Qo‘shildi", default=0)
+    skipped_count = models.PositiveIntegerField("O‘tkazib yuborildi", default=0)
+    error_count = models.PositiveIntegerField("Xatolar soni", default=0)
+    # [[row number, message], ...], capped.
+    errors = models.JSONField("Xatolar", default=list, blank=True)
+    error = models.TextField("Xato", blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="catalog_imports",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "Katalog importi"
+        verbose_name_plural = "Katalog importlari"
+
+    def __str__(self):
+        return f"Import #{self.id} ({self.get_status_display()})"
+
+
 class Expense(models.Model):
     title = models.CharField("Sarlavha", max_length=255)
     amount = models.DecimalField("Chiqim", max_digits=12, decimal_places=2)
@@ -92,6 +322,7 @@ class Expense(models.Model):
 class Debt(models.Model):
     full_name = models.CharField("F.I.Sh", max_length=255)
     phone = models.CharField("Telefon", max_length=50, blank=True)
+    phone_normalized = models.CharField(max_length=16, blank=True, db_index=True, editable=False)
     amount = models.DecimalField("Qarz summasi", max_digits=12, decimal_places=2)
     paid_amount = models.DecimalField("To'langan summa", max_digits=12, decimal_places=2, default=0)
     note = models.TextField("Izoh", blank=True)
@@ -106,9 +337,111 @@ class Debt(models.Model):
     def __str__(self):
         return f"{self.full_name} ({self.amount})"
 
+    def save(self, *args, **kwargs):
+        kwargs["update_fields"] = normalized_update_fields(self, kwargs.get("update_fields"))
+        super().save(*args, **kwargs)
+
     def remaining_amount(self):
         if self.is_paid:
             return 0
         paid = self.paid_amount or 0
         remaining = self.amount - paid
         return remaining if remaining > 0 else 0
+
+
+class ExportJob(models.Model):
+    STATUS_CHOICES = [
+        ("pending", "Navbatda"),
+        ("running", "Tayyorlanmoqda"),
+        ("done", "Tayyor"),
+        ("failed", "Xato"),
+    ]
+    ACTIVE_STATUSES = ("pending", "running")
+
+    reports = models.JSONField("Hisobotlar", default=list)
+    params = models.JSONField("Parametrlar", default=dict, blank=True)
+    fingerprint = models.CharField(max_length=64, db_index=True)
+    status = models.CharField("Holat", max_length=20, choices=STATUS_CHOICES, default="pending")
+    progress = models.PositiveSmallIntegerField("Jarayon (%)", default=0)
+    file = models.FileField("Fayl", upload_to="exports/", blank=True)
+    error = models.TextField("Xato", blank=True)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="export_jobs",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "Eksport"
+        verbose_name_plural = "Eksportlar"
+        constraints = [
+            # Only one queued/running job per identical request; duplicates attach to it.
+            models.UniqueConstraint(
+                fields=["fingerprint"],
+                condition=models.Q(status__in=["pending", "running"]),
+                name="crm_exportjob_active_fingerprint",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Eksport #{self.id} ({', '.join(self.reports)})"
+
+    @property
+    def is_ready(self):
+        return self.status == "done" and bool(self.file) and not self.is_expired
+
+    @property
+    def is_expired(self):
+        return bool(self.expires_at and self.expires_at <= timezone.now())
+
+
+class SearchDocument(models.Model):
+    """
+    One denormalized row per searchable CRM entity, kept current by apps.crm.signals.
+    content holds the normalized text; it is indexed by FTS5 (SQLite) or pg_trgm (PostgreSQL).
+    """
+
+    ENTITY_CHOICES = [
+        ("orders", "Buyurtmalar"),
+        ("customers", "Mijozlar"),
+        ("couriers", "Kuryerlar"),
+        ("books", "Kitoblar"),
+        ("categories", "Kategoriyalar"),
+        ("authors", "Mualliflar"),
+        ("expenses", "Chiqimlar"),
+        ("debts", "Qarzlar"),
+        ("inventory_logs", "Ombor yozuvlari"),
+        ("delivery_notices", "Yetkazib berish eslatmalari"),
+        ("delivery_zones", "Yetkazib berish zonalari"),
+        ("banners", "Bannerlar"),
+        ("about_pages", "Biz haqimizda"),
+    ]
+
+    entity_type = models.CharField("Turi", max_length=32, choices=ENTITY_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField("Sarlavha", max_length=255)
+    subtitle = models.CharField(max_length=255, blank=True)
+    url = models.CharField(max_length=500, blank=True)
+    content = models.TextField()
+    sort_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Qidiruv hujjati"
+        verbose_name_plural = "Qidiruv hujjatlari"
+        constraints = [
+            models.UniqueConstraint(fields=["entity_type", "object_id"], name="crm_searchdocument_entity"),
+        ]
+        indexes = [
+            models.Index(fields=["entity_type", "-sort_at"], name="crm_searchdoc_type_sort"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_entity_type_display()}: {self.title}"
@@ -0,0 +1 @@
+# Package for CRM domain services.
@@ -0,0 +1,370 @@
+import csv
+import io
+import logging
+from contextlib import closing
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.text import slugify
+
+from apps.catalog.models import Author, Book, Category
+from apps.catalog.signals import invalidate_author_caches, invalidate_book_list_caches, invalidate_category_caches
+from apps.crm.models import CatalogImport
+from apps.crm.utils.xlsx import iter_xlsx_rows
+from .pos_index import mark_books_changed
+from .price_grid import allocate_slugs, barcode_error, price_error
+from .search import rebuild_search_index
+
+logger = logging.getLogger("django")
+
+CHUNK_SIZE = 1000
+MAX_ERRORS = 500
+
+# Accepted header spellings per field (compared casefolded).
+COLUMNS = {
+    "title": {"title", "nomi", "sarlavha", "kitob", "name"},
+    "author": {"author", "muallif"},
+    "category": {"category", "kategoriya", "bo'lim", "bo‘lim"},
+    "purchase_price": {"purchase_price", "purchase price", "sotib olish", "sotib olish narxi", "tan narx", "cost"},
+    "sale_price": {"sale_price", "sale price", "sotish", "sotish narxi", "narx", "price"},
+    "barcode": {"barcode", "shtrix-kod", "shtrix kod", "shtrixkod", "ean", "isbn"},
+    "stock_quantity": {"stock_quantity", "stock", "ombor", "soni", "qty", "quantity"},
+    "pages": {"pages", "betlar", "betlar soni"},
+    "book_format": {"book_format", "format"},
+    "description": {"description", "tavsif"},
+}
+REQUIRED = ("title", "purchase_price", "sale_price")
+# Largest value of Book's IntegerField / PositiveIntegerField columns (stock, pages) on every backend.
+MAX_INTEGER = 2**31 - 1
+FORMATS = {"hard": "hard", "qattiq": "hard", "soft": "soft", "yumshoq": "soft"}
+DEFAULT_CATEGORY = "Umumiy"
+DEFAULT_AUTHOR = "Noma'lum"
+
+
+class CatalogImportError(ValueError):
+    pass
+
+
+def iter_rows(fileobj, name):
+    """Rows of an uploaded CSV (any of , ; tab) or XLSX file as lists of strings, streamed."""
+    if name.lower().endswith(".xlsx"):
+        yield from iter_xlsx_rows(fileobj)
+        return
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        sample = text.readline()
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader([sample], dialect)
+        yield from csv.reader(text, dialect)
+    finally:
+        text.detach()
+
+
+def map_header(cells):
+    """{field: column index} from the header row; raises if a required column is missing."""
+    mapping = {}
+    for index, cell in enumerate(cells):
+        key = (cell or "").strip().casefold()
+        for field, names in COLUMNS.items():
+            if key in names and field not in mapping:
+                mapping[field] = index
+    missing = [field for field in REQUIRED if field not in mapping]
+    if missing:
+        raise CatalogImportError(f"Ustun topilmadi: {', '.join(missing)}")
+    return mapping
+
+
+def _decimal(raw):
+    cleaned = (raw or "").replace(" ", "").replace(",", "")
+    if not cleaned:
+        return None
+    try:
+        value = Decimal(cleaned)
+    except InvalidOperation:
+        raise CatalogImportError(f"Noto‘g‘ri son: {raw}")
+    if not value.is_finite():
+        raise CatalogImportError(f"Noto‘g‘ri son: {raw}")
+    if value < 0:
+        raise CatalogImportError(f"Manfiy son: {raw}")
+    return value
+
+
+def _price(raw):
+    value = _decimal(raw)
+    if value is not None and price_error(value):
+        raise CatalogImportError(f"{price_error(value)}: {raw}")
+    return value
+
+
+def _integer(raw):
+    value = _decimal(raw)
+    if value is None:
+        return None
+    if value != value.to_integral_value():
+        raise CatalogImportError(f"Butun son bo‘lishi kerak: {raw}")
+    if value > MAX_INTEGER:
+        raise CatalogImportError(f"Son juda katta: {raw}")
+    return int(value)
+
+
+def _barcode(raw):
+    value = "".join((raw or "").split())
+    # Spreadsheets store long codes as numbers: "4780000000014.0".
+    if value.endswith(".0") and value[:-2].isdigit():
+        value = value[:-2]
+    return value
+
+
+def clean_row(cells, mapping):
+    """One data row -> dict of Book values (author/category as names). Raises CatalogImportError."""
+
+    def cell(field):
+        index = mapping.get(field)
+        return (cells[index] if index is not None and index < len(cells) else "").strip()
+
+    title = cell("title")
+    if not title:
+        raise CatalogImportError("Nomi yo‘q")
+    purchase, sale = _price(cell("purchase_price")), _price(cell("sale_price"))
+    if purchase is None or sale is None:
+        raise CatalogImportError("Narx ko‘rsatilmagan")
+    barcode = _barcode(cell("barcode"))
+    if barcode and barcode_error(barcode):
+        raise CatalogImportError(barcode_error(barcode))
+    stock = _integer(cell("stock_quantity"))
+    pages = _integer(cell("pages"))
+    return {
+        "title": title[:255],
+        "author": cell("author")[:255] or DEFAULT_AUTHOR,
+        "category": cell("category")[:255] or DEFAULT_CATEGORY,
+        "purchase_price": purchase,
+        "sale_price": sale,
+        "barcode": barcode,
+        "stock_quantity": stock or 0,
+        "pages": pages or None,
+        "book_format": FORMATS.get(cell("book_format").casefold(), ""),
+        "description": cell("description"),
+    }
+
+
+class _Lookups:
+    """Author/category ids by casefolded name, filled in bulk per chunk and kept for the whole import."""
+
+    def __init__(self):
+        self.authors = {}
+        self.categories = {}
+        self.created_authors = 0
+        self.created_categories = 0
+
+    def resolve_authors(self, names):
+        missing = {name for name in names if name.casefold() not in self.authors}
+        if not missing:
+            return
+        wanted = Author.objects.annotate(key=Lower("name")).filter(key__in={name.lower() for name in missing})
+        for author_id, name in wanted.order_by("-id").values_list("id", "name"):
+            self.authors[name.casefold()] = author_id
+        new = {}
+        for name in missing:
+            if name.casefold() not in self.authors:
+                new.setdefault(name.casefold(), name)
+        if new:
+            for author in Author.objects.bulk_create([Author(name=name) for name in new.values()]):
+                self.authors[author.name.casefold()] = author.id
+            self.created_authors += len(new)
+
+    def resolve_categories(self, names):
+        missing = {name for name in names if name.casefold() not in self.categories}
+        if not missing:
+            return
+        wanted = Category.objects.annotate(key=Lower("name")).filter(key__in={name.lower() for name in missing})
+        for category_id, name in wanted.order_by("-id").values_list("id", "name"):
+            self.categories[name.casefold()] = category_id
+        new = {}
+        for name in missing:
+            if name.casefold() not in self.categories:
+                new.setdefault(name.casefold(), name)
+        if not new:
+            return
+        bases = {name: slugify(name)[:45] or "kategoriya" for name in new.values()}
+        condition = Q()
+        for base in set(bases.values()):
+            condition |= Q(slug=base) | Q(slug__startswith=f"{base}-")
+        taken = set(Category.objects.filter(condition).values_list("slug", flat=True))
+        rows = []
+        for name, base in bases.items():
+            slug, suffix = base, 1
+            while slug in taken:
+                suffix += 1
+                slug = f"{base}-{suffix}"
+            taken.add(slug)
+            rows.append(Category(name=name, slug=slug))
+        for category in Category.objects.bulk_create(rows):
+            self.categories[category.name.casefold()] = category.id
+        self.created_categories += len(rows)
+
+
+def _reserve_book_ids(count):
+    """Ids from the Book sequence, so barcodes can be computed before the insert (PostgreSQL only)."""
+    if connection.vendor != "postgresql" or not count:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [Book._meta.db_table, count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _write_chunk(job, rows, lookups):
+    """
+    Insert one chunk of cleaned rows and advance rows_done in the same transaction, so a crash never
+    half-applies a chunk and a resumed run starts at the first uncommitted row. Returns (created, skipped).
+    """
+    with transaction.atomic():
+        barcodes = [values["barcode"] for _row_no, values in rows if values["barcode"]]
+        existing = set(Book.objects.filter(barcode__in=barcodes).values_list("barcode", flat=True)) if barcodes else set()
+        fresh = []
+        seen = set()
+        skipped = 0
+        for row_no, values in rows:
+            barcode = values["barcode"]
+            if barcode and (barcode in existing or barcode in seen):
+                # Already in the catalog (or earlier in this file): safe to re-run an import.
+                skipped += 1
+                continue
+            if barcode:
+                seen.add(barcode)
+            fresh.append(values)
+
+        lookups.resolve_authors([values["author"] for values in fresh])
+        lookups.resolve_categories([values["category"] for values in fresh])
+        slugs = allocate_slugs([values["title"] for values in fresh])
+        ids = _reserve_book_ids(len(fresh))
+        books = []
+        for position, (values, slug) in enumerate(zip(fresh, slugs)):
+            book = Book(
+                title=values["title"],
+                slug=slug,
+                author_id=lookups.authors[values["author"].casefold()],
+                category_id=lookups.categories[values["category"].casefold()],
+                purchase_price=values["purchase_price"],
+                sale_price=values["sale_price"],
+                barcode=values["barcode"] or None,
+                stock_quantity=values["stock_quantity"],
+                pages=values["pages"],
+                book_format=values["book_format"],
+                description=values["description"],
+            )
+            if ids is not None:
+                book.id = ids[position]
+                book.barcode = book.barcode or Book.generate_barcode_from_id(book.id)
+            books.append(book)
+        created = Book.objects.bulk_create(books, batch_size=CHUNK_SIZE)
+        generated = [book for book in created if not book.barcode]
+        for book in generated:
+            book.barcode = Book.generate_barcode_from_id(book.id)
+        if generated:
+            Book.objects.bulk_update(generated, ["barcode"], batch_size=CHUNK_SIZE)
+
+        job.rows_done = rows[-1][0]
+        job.created_count += len(created)
+        job.skipped_count += skipped
+        job.save(update_fields=["rows_done", "created_count", "skipped_count", "error_count", "errors"])
+    return len(created), skipped
+
+
+def _claim(job_id, statuses):
+    """Conditional move to running: exactly one caller wins, whichever path (queue worker or CRM) it takes."""
+    return CatalogImport.objects.filter(id=job_id, status__in=statuses).update(
+        status="running", started_at=Coalesce(F("started_at"), Value(timezone.now()))
+    )
+
+
+def claim_next_import():
+    """Move the oldest pending import to running; safe with several workers."""
+    for job_id in CatalogImport.objects.filter(status="pending").order_by("created_at").values_list("id", flat=True)[:10]:
+        if _claim(job_id, ["pending"]):
+            return CatalogImport.objects.get(id=job_id)
+    return None
+
+
+def run_import(job, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Stream the job's file and bulk-create its books chunk by chunk, resuming after rows_done. Bad rows are
+    recorded and skipped. Search documents, storefront caches and the POS index are rebuilt once at the end.
+    progress(job) is called after every committed chunk. A job not claimed yet is claimed first; if someone
+    else has it (or it is done), it is returned as it stands without being run.
+    """
+    if job.status != "running":
+        claimed = _claim(job.id, ["pending", "failed"])
+        job.refresh_from_db()
+        if not claimed:
+            return job
+    # Errors past the last committed chunk are re-read on resume; drop them so they aren't counted twice.
+    kept = [entry for entry in job.errors if entry[0] - 1 <= job.rows_done]
+    job.error_count -= len(job.errors) - len(kept)
+    job.errors = kept
+    lookups = _Lookups()
+    try:
+        with job.file.open("rb") as handle, closing(iter_rows(handle, job.source_name or job.file.name)) as rows:
+            header = next(rows, None)
+            if header is None:
+                raise CatalogImportError("Fayl bo‘sh.")
+            mapping = map_header(header)
+            chunk = []
+            row_no = job.rows_done
+            for row_no, cells in enumerate(rows, start=1):
+                if row_no <= job.rows_done or not any((cell or "").strip() for cell in cells):
+                    continue
+                try:
+                    chunk.append((row_no, clean_row(cells, mapping)))
+                except CatalogImportError as exc:
+                    job.error_count += 1
+                    if len(job.errors) < MAX_ERRORS:
+                        job.errors.append([row_no + 1, str(exc)])
+                if len(chunk) >= chunk_size:
+                    _write_chunk(job, chunk, lookups)
+                    chunk = []
+                    if progress:
+                        progress(job)
+            if chunk:
+                _write_chunk(job, chunk, lookups)
+                if progress:
+                    progress(job)
+    except Exception as exc:
+        if not isinstance(exc, CatalogImportError):
+            logger.exception("Catalog import #%s failed", job.id)
+        CatalogImport.objects.filter(id=job.id).update(
+            status="failed", error=str(exc)[:2000], errors=job.errors, error_count=job.error_count, finished_at=timezone.now()
+        )
+        job.refresh_from_db()
+        return job
+
+    finish_import(lookups.created_authors, lookups.created_categories)
+    job.rows_done = max(job.rows_done, row_no)
+    job.status = "done"
+    job.error = ""
+    job.finished_at = timezone.now()
+    job.save(update_fields=["rows_done", "status", "error", "errors", "error_count", "finished_at"])
+    return job
+
+
+def finish_import(created_authors=0, created_categories=0):
+    """The deferred side effects of every chunk: one search rebuild and one cache/POS invalidation."""
+    keys = ["books"]
+    if created_authors:
+        keys.append("authors")
+        invalidate_author_caches(sender=Author, instance=None)
+    if created_categories:
+        keys.append("categories")
+        invalidate_category_caches(sender=Category, instance=None)
+    rebuild_search_index(keys)
+    invalidate_book_list_caches(Category.objects.values_list("id", flat=True))
+    mark_books_changed()
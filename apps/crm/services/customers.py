@@ -0,0 +1,153 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from apps.crm.models import Customer
+from apps.orders.models import Order
+from apps.crm.utils.phones import normalize_phone, phone_lookup
+
+
+def order_contribution(status, total_price):
+    """What one order adds to its customer's metrics: canceled orders count for nothing."""
+    if status == "canceled":
+        return 0, Decimal("0")
+    return 1, Decimal(str(total_price or 0))
+
+
+def apply_customer_delta(phone, count_delta, total_delta, last_order_at=None):
+    """
+    Shift a customer's counters with a single UPDATE using F() expressions,
+    so concurrent orders for the same phone can't overwrite each other.
+    """
+    if not phone or (not count_delta and not total_delta and last_order_at is None):
+        return 0
+    updates = {}
+    if count_delta:
+        updates["orders_count"] = Greatest(F("orders_count") + count_delta, Value(0))
+    if total_delta:
+        updates["total_spent"] = F("total_spent") + Value(total_delta)
+    if last_order_at is not None:
+        updates["last_order_at"] = Greatest(Coalesce("last_order_at", Value(last_order_at)), Value(last_order_at))
+    return Customer.objects.filter(**phone_lookup(phone)).update(**updates)
+
+
+def upsert_customer_for_order(order):
+    """
+    The single place an order creates/links its customer and adds its own contribution.
+    Returns the customer (or None for orders without a phone).
+    """
+    if not order.phone:
+        return None
+    count, total = order_contribution(order.status, order.total_price)
+    normalized = normalize_phone(order.phone)
+    customer, created = Customer.objects.get_or_create(
+        **phone_lookup(order.phone),
+        defaults={
+            "phone": normalized or order.phone.strip(),
+            "full_name": order.full_name or order.phone,
+            "orders_count": count,
+            "total_spent": total,
+            "last_order_at": order.created_at,
+        },
+    )
+    if not created:
+        updates = {}
+        if count:
+            updates["orders_count"] = F("orders_count") + count
+        if total:
+            updates["total_spent"] = F("total_spent") + Value(total)
+        if order.created_at:
+            updates["last_order_at"] = Greatest(
+                Coalesce("last_order_at", Value(order.created_at)), Value(order.created_at)
+            )
+        if order.full_name and order.full_name != customer.full_name:
+            updates["full_name"] = order.full_name
+        if updates:
+            Customer.objects.filter(pk=customer.pk).update(**updates)
+    if order.customer_id != customer.id:
+        Order.objects.filter(pk=order.pk).update(customer=customer)
+        order.customer = customer
+    return customer
+
+
+BACKFILL_BATCH = 1000
+
+
+def backfill_normalized_phones(model):
+    """Recompute phone_normalized for every row of model whose stored value is stale. Returns rows fixed."""
+    stale = []
+    fixed = 0
+    empty = None if model._meta.get_field("phone_normalized").null else ""
+    for obj in model.objects.only("id", "phone", "phone_normalized").iterator(chunk_size=BACKFILL_BATCH):
+        value = normalize_phone(obj.phone) or empty
+        if obj.phone_normalized != value:
+            obj.phone_normalized = value
+            stale.append(obj)
+        if len(stale) >= BACKFILL_BATCH:
+            model.objects.bulk_update(stale, ["phone_normalized"])
+            fixed += len(stale)
+            stale = []
+    if stale:
+        model.objects.bulk_update(stale, ["phone_normalized"])
+        fixed += len(stale)
+    return fixed
+
+
+def merge_duplicate_customers(customer_model=None, order_model=None, dry_run=False):
+    """
+    Fold customers whose phones normalize to the same number into one record, then fill
+    phone_normalized for everybody. The keeper is the customer with the most orders (oldest on ties);
+    the others' orders are re-pointed, metrics summed, flags/tags/notes combined, and the rows deleted.
+    Accepts historical models so migrations can run it. Returns {normalized phone: [merged ids]}.
+    """
+    customer_model = customer_model or Customer
+    order_model = order_model or Order
+    groups = defaultdict(list)
+    for row in customer_model.objects.values("id", "phone", "orders_count").order_by("id").iterator():
+        normalized = normalize_phone(row["phone"])
+        if normalized:
+            groups[normalized].append(row)
+
+    merged = {}
+    for normalized, rows in groups.items():
+        if len(rows) < 2:
+            continue
+        rows.sort(key=lambda r: (-r["orders_count"], r["id"]))
+        keeper_id, other_ids = rows[0]["id"], [r["id"] for r in rows[1:]]
+        merged[normalized] = other_ids
+        if dry_run:
+            continue
+        keeper = customer_model.objects.get(id=keeper_id)
+        others = list(customer_model.objects.filter(id__in=other_ids))
+        for other in others:
+            keeper.orders_count += other.orders_count
+            keeper.total_spent += other.total_spent
+            if other.last_order_at and (not keeper.last_order_at or other.last_order_at > keeper.last_order_at):
+                keeper.last_order_at = other.last_order_at
+            keeper.discount_percent = max(keeper.discount_percent, other.discount_percent)
+            keeper.is_vip = keeper.is_vip or other.is_vip
+            keeper.is_problem = keeper.is_problem or other.is_problem
+            keeper.email = keeper.email or other.email
+            tags = [t.strip() for t in f"{keeper.tags},{other.tags}".split(",") if t.strip()]
+            keeper.tags = ", ".join(dict.fromkeys(tags))[:255]
+            if other.notes and other.notes not in keeper.notes:
+                keeper.notes = f"{keeper.notes}\n{other.notes}".strip()
+        order_model.objects.filter(customer_id__in=other_ids).update(customer_id=keeper_id)
+        customer_model.objects.filter(id__in=other_ids).delete()
+        customer_model.objects.filter(id=keeper_id).update(
+            orders_count=keeper.orders_count,
+            total_spent=keeper.total_spent,
+            last_order_at=keeper.last_order_at,
+            discount_percent=keeper.discount_percent,
+            is_vip=keeper.is_vip,
+            is_problem=keeper.is_problem,
+            email=keeper.email,
+            tags=keeper.tags,
+            notes=keeper.notes,
+        )
+
+    if not dry_run:
+        backfill_normalized_phones(customer_model)
+    return merged
@@ -0,0 +1,223 @@
+import csv
+
+from django.utils import timezone
+
+from apps.crm.models import Debt, Expense, InventoryLog
+from apps.crm.utils.xlsx import stream_xlsx
+from apps.orders.models import Order, OrderItem
+from .periods import parse_report_period
+
+CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+_STATUS = dict(Order.STATUS_CHOICES)
+_SOURCE = dict(Order.SOURCE_CHOICES)
+_PAYMENT = dict(Order.PAYMENT_CHOICES)
+_REASON = dict(InventoryLog.REASON_CHOICES)
+
+
+class Dataset:
+    """
+    One exportable table: a lean values() query plus a row mapper.
+    Every format (PDF lines, CSV, XLSX) consumes the same row iterator, so the DB is hit once per export.
+    """
+
+    def __init__(self, title, headers, queryset, fields, row, period_field, period_kind="datetime"):
+        self.title = title
+        self.headers = headers
+        self.queryset = queryset
+        self.fields = fields
+        self.row = row
+        self.period_field = period_field
+        self.period_kind = period_kind
+
+    def rows(self, params=None, limit=None):
+        qs = self.queryset()
+        period = dataset_period(params)
+        if period:
+            if self.period_kind == "date":
+                qs = qs.filter(
+                    **{f"{self.period_field}__gte": period["start_date"], f"{self.period_field}__lte": period["end_date"]}
+                )
+            else:
+                qs = qs.filter(
+                    **{f"{self.period_field}__gte": period["start_dt"], f"{self.period_field}__lte": period["end_dt"]}
+                )
+        qs = qs.values(*self.fields)
+        if limit:
+            qs = qs[:limit]
+        for values in qs.iterator(chunk_size=CHUNK_SIZE):
+            yield self.row(values)
+
+
+def dataset_period(params):
+    """Only filter by date when the caller asked for a window; plain exports cover all history."""
+    params = params or {}
+    if not (params.get("start") or params.get("end")):
+        return None
+    return parse_report_period(params)
+
+
+def _ts(value):
+    return timezone.localtime(value).strftime("%Y-%m-%d %H:%M") if value else ""
+
+
+def _order_row(v):
+    return [
+        v["id"],
+        _ts(v["created_at"]),
+        v["full_name"],
+        v["phone"],
+        v["subtotal_before_discount"],
+        v["discount_amount"],
+        v["total_price"],
+        _PAYMENT.get(v["payment_type"], v["payment_type"]),
+        _STATUS.get(v["status"], v["status"]),
+        _SOURCE.get(v["order_source"], v["order_source"]),
+        v["courier__name"] or "",
+        v["address"],
+    ]
+
+
+def _sale_row(v):
+    return [
+        v["order_id"],
+        _ts(v["order__created_at"]),
+        v["book__title"],
+        v["book__barcode"] or "",
+        v["quantity"],
+        v["price"],
+        v["price"] * v["quantity"],
+        _SOURCE.get(v["order__order_source"], v["order__order_source"]),
+        v["order__full_name"],
+        v["order__phone"],
+        _STATUS.get(v["order__status"], v["order__status"]),
+    ]
+
+
+def _inventory_row(v):
+    return [
+        _ts(v["created_at"]),
+        v["book__title"],
+        v["book__barcode"] or "",
+        v["delta"],
+        _REASON.get(v["reason"], v["reason"]),
+        v["related_order_id"] or "",
+        v["note"],
+    ]
+
+
+def _expense_row(v):
+    return [v["spent_on"], v["title"], v["amount"], v["note"]]
+
+
+def _debt_row(v):
+    paid = v["amount"] if v["is_paid"] else min(v["paid_amount"] or 0, v["amount"])
+    return [
+        _ts(v["created_at"]),
+        v["full_name"],
+        v["phone"],
+        v["amount"],
+        paid,
+        v["amount"] - paid,
+        v["is_paid"],
+        v["note"],
+    ]
+
+
+DATASETS = {
+    "orders": Dataset(
+        "Buyurtmalar",
+        ["ID", "Sana", "Mijoz", "Telefon", "Chegirmasiz", "Chegirma", "Summa", "To'lov", "Status", "Kanal", "Kuryer", "Mo'ljal"],
+        lambda: Order.objects.order_by("-created_at"),
+        [
+            "id",
+            "created_at",
+            "full_name",
+            "phone",
+            "subtotal_before_discount",
+            "discount_amount",
+            "total_price",
+            "payment_type",
+            "status",
+            "order_source",
+            "courier__name",
+            "address",
+        ],
+        _order_row,
+        "created_at",
+    ),
+    "sales": Dataset(
+        "Xaridlar",
+        ["Buyurtma", "Sana", "Kitob", "Shtrix-kod", "Soni", "Narx", "Jami", "Kanal", "Mijoz", "Telefon", "Status"],
+        lambda: OrderItem.objects.order_by("-order__created_at", "id"),
+        [
+            "order_id",
+            "order__created_at",
+            "book__title",
+            "book__barcode",
+            "quantity",
+            "price",
+            "order__order_source",
+            "order__full_name",
+            "order__phone",
+            "order__status",
+        ],
+        _sale_row,
+        "order__created_at",
+    ),
+    "inventory": Dataset(
+        "Ombor yozuvlari",
+        ["Sana", "Kitob", "Shtrix-kod", "O'zgarish", "Sabab", "Buyurtma", "Izoh"],
+        lambda: InventoryLog.objects.order_by("-created_at"),
+        ["created_at", "book__title", "book__barcode", "delta", "reason", "related_order_id", "note"],
+        _inventory_row,
+        "created_at",
+    ),
+    "expenses": Dataset(
+        "Chiqimlar",
+        ["Sana", "Sarlavha", "Summa", "Izoh"],
+        lambda: Expense.objects.order_by("-spent_on", "-created_at"),
+        ["spent_on", "title", "amount", "note"],
+        _expense_row,
+        "spent_on",
+        period_kind="date",
+    ),
+    "debts": Dataset(
+        "Qarzdorlar",
+        ["Sana", "F.I.Sh", "Telefon", "Qarz", "To'langan", "Qoldiq", "Yopildi", "Izoh"],
+        lambda: Debt.objects.order_by("-created_at"),
+        ["created_at", "full_name", "phone", "amount", "paid_amount", "is_paid", "note"],
+        _debt_row,
+        "created_at",
+    ),
+}
+
+
+class _Echo:
+    """csv.writer target that hands each encoded line back instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(headers, rows):
+    writer = csv.writer(_Echo())
+    # BOM so Excel opens UTF-8 (Uzbek apostrophes, Cyrillic names) correctly.
+    yield "﻿" + writer.writerow(headers)
+    for values in rows:
+        yield writer.writerow(["" if value is None else value for value in values])
+
+
+def stream_dataset(name: str, fmt: str, params=None):
+    dataset = DATASETS[name]
+    rows = dataset.rows(params)
+    if fmt == "csv":
+        return (line.encode("utf-8") for line in stream_csv(dataset.headers, rows))
+    if fmt == "xlsx":
+        return stream_xlsx(dataset.headers, rows, sheet_title=dataset.title)
+    raise ValueError(f"Unknown export format: {fmt}")
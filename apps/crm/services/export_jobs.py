@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, connections, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.crm.models import ExportJob
+from .reports import REPORT_FORMATS, REPORTS, render_report
+
+logger = logging.getLogger("django")
+
+# Only these keys influence report output; anything else is dropped so it can't break dedupe.
+PARAM_KEYS = ("start", "end", "start_time", "end_time", "format")
+
+
+def _ttl() -> timedelta:
+    return timedelta(hours=getattr(settings, "EXPORT_JOB_TTL_HOURS", 24))
+
+
+def fail_stale_jobs(fingerprint=None):
+    """
+    Fail running jobs started more than EXPORT_JOB_STALE_MINUTES ago: their worker died (deploy, OOM kill)
+    and, while running, they would block identical requests through the unique constraint. Returns the count.
+    """
+    now = timezone.now()
+    stale = ExportJob.objects.filter(
+        status="running",
+        started_at__lt=now - timedelta(minutes=getattr(settings, "EXPORT_JOB_STALE_MINUTES", 60)),
+    )
+    if fingerprint is not None:
+        stale = stale.filter(fingerprint=fingerprint)
+    return stale.update(
+        status="failed",
+        error="Eksport to'xtab qoldi (ishlovchi jarayon to'xtagan).",
+        finished_at=now,
+        expires_at=now + _ttl(),
+    )
+
+
+def normalize_request(reports, params=None):
+    kinds = sorted({kind for kind in reports if kind in REPORTS})
+    clean = {}
+    for key in PARAM_KEYS:
+        value = ((params or {}).get(key) or "").strip()
+        if value:
+            clean[key] = value
+    if clean.get("format") not in REPORT_FORMATS or clean.get("format") == "pdf":
+        clean.pop("format", None)
+    return kinds, clean
+
+
+def job_fingerprint(reports, params) -> str:
+    raw = json.dumps({"reports": list(reports), "params": params}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def enqueue_export(reports, params=None, user=None):
+    """
+    Queue an export or attach to an identical one. Returns (job, created).
+    A pending/running job or a finished, unexpired artifact with the same fingerprint is reused.
+    """
+    kinds, clean = normalize_request(reports, params)
+    if not kinds:
+        raise ValueError("Hisobot tanlanmagan.")
+    fingerprint = job_fingerprint(kinds, clean)
+    existing = _find_reusable(fingerprint)
+    if existing:
+        return existing, False
+    try:
+        with transaction.atomic():
+            job = ExportJob.objects.create(
+                reports=kinds,
+                params=clean,
+                fingerprint=fingerprint,
+                requested_by=user if user is not None and user.is_authenticated else None,
+            )
+    except IntegrityError:
+        # Lost the race to a concurrent identical request; the partial unique index kept one row.
+        existing = _find_reusable(fingerprint)
+        if existing:
+            return existing, False
+        raise
+    return job, True
+
+
+def _find_reusable(fingerprint):
+    fail_stale_jobs(fingerprint)
+    now = timezone.now()
+    active = ExportJob.objects.filter(fingerprint=fingerprint, status__in=ExportJob.ACTIVE_STATUSES).first()
+    if active:
+        return active
+    return (
+        ExportJob.objects.filter(fingerprint=fingerprint, status="done", expires_at__gt=now)
+        .exclude(file="")
+        .order_by("-finished_at")
+        .first()
+    )
+
+
+def claim_next_job():
+    """Atomically move the oldest pending job to running; safe with several worker commands."""
+    fail_stale_jobs()
+    for job_id in ExportJob.objects.filter(status="pending").order_by("created_at").values_list("id", flat=True)[:10]:
+        claimed = ExportJob.objects.filter(id=job_id, status="pending").update(
+            status="running",
+            started_at=timezone.now(),
+            progress=0,
+        )
+        if claimed:
+            return ExportJob.objects.get(id=job_id)
+    return None
+
+
+def _render_in_worker(kind, params):
+    # Forked children must not reuse the parent's DB socket.
+    connections.close_all()
+    return kind, render_report(kind, params)
+
+
+def _render_all(job, workers):
+    total = len(job.reports)
+    results = {}
+
+    def _progress(done):
+        ExportJob.objects.filter(id=job.id).update(progress=int(done * 100 / total) if total else 100)
+
+    if workers <= 1 or total == 1:
+        for idx, kind in enumerate(job.reports, start=1):
+            results[kind] = render_report(kind, job.params)
+            _progress(idx)
+        return results
+
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=min(workers, total)) as pool:
+        futures = [pool.submit(_render_in_worker, kind, job.params) for kind in job.reports]
+        for idx, future in enumerate(as_completed(futures), start=1):
+            kind, rendered = future.result()
+            results[kind] = rendered
+            _progress(idx)
+    return results
+
+
+def _bundle(job, results):
+    if len(results) == 1:
+        filename, data = next(iter(results.values()))
+        return filename, data
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for kind in job.reports:
+            filename, data = results[kind]
+            archive.writestr(filename, data)
+    return f"bilimuz_export_{job.id}.zip", buffer.getvalue()
+
+
+def run_export_job(job, workers=None):
+    """Render every report of a claimed job, store the artifact under MEDIA_ROOT and mark it done."""
+    if workers is None:
+        workers = getattr(settings, "EXPORT_JOB_WORKERS", 2)
+    try:
+        results = _render_all(job, workers)
+        filename, data = _bundle(job, results)
+        job.refresh_from_db()
+        # Random prefix keeps artifact URLs unguessable if MEDIA_ROOT is served directly.
+        job.file.save(f"{uuid.uuid4().hex}/{filename}", ContentFile(data), save=False)
+        job.status = "done"
+        job.progress = 100
+        job.error = ""
+        job.finished_at = timezone.now()
+        job.expires_at = job.finished_at + _ttl()
+        job.save(update_fields=["file", "status", "progress", "error", "finished_at", "expires_at"])
+    except Exception as exc:
+        logger.exception("Export job #%s failed", job.id)
+        finished_at = timezone.now()
+        ExportJob.objects.filter(id=job.id).update(
+            status="failed",
+            error=str(exc)[:2000],
+            finished_at=finished_at,
+            expires_at=finished_at + _ttl(),
+        )
+        job.refresh_from_db()
+    return job
+
+
+def purge_expired_exports(now=None):
+    """Delete artifacts past their expiry. Returns the number of jobs removed."""
+    now = now or timezone.now()
+    expired = ExportJob.objects.filter(expires_at__lte=now).exclude(status__in=ExportJob.ACTIVE_STATUSES)
+    count = 0
+    for job in expired.iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        count += 1
+    return count
+
+
+def job_payload(job):
+    return {
+        "id": job.id,
+        "status": job.status,
+        "status_display": job.get_status_display(),
+        "progress": job.progress,
+        "reports": job.reports,
+        "error": job.error,
+        "expires_at": job.expires_at.isoformat() if job.expires_at else None,
+        "status_url": reverse("crm_export_job_status", args=[job.id]),
+        "download_url": reverse("crm_export_job_download", args=[job.id]) if job.is_ready else None,
+    }
@@ -0,0 +1,207 @@
+import math
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from apps.catalog.models import Book
+from apps.crm.models import JobWatermark, SalesDay
+from apps.orders.models import OrderItem
+
+# One-sided z for a ~95% chance of not running out during the lead time.
+SERVICE_LEVEL_Z = 1.65
+# Days before the previous refresh that an incremental refresh re-aggregates (late items, same-day edits).
+REFRESH_OVERLAP_DAYS = 2
+# Page loads trigger an incremental refresh at most this often.
+REFRESH_INTERVAL = timedelta(minutes=10)
+
+STATS_CACHE_KEY = "crm:reorder:stats"
+REFRESHED_CACHE_KEY = "crm:reorder:refreshed_at"
+# The refresh time (epoch microseconds) as seen by every process when the cache is per-process (LocMemCache):
+# a refresh_sales_velocity run from cron would otherwise never reach the web workers' cached stats.
+REFRESHED_WATERMARK = "reorder_refreshed"
+WRITE_BATCH = 2000
+
+
+def _history_days():
+    return settings.REORDER_HISTORY_DAYS
+
+
+def _local_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _daily_sales_since(start_day):
+    """
+    {(book_id, day): units} from orders since start_day. Offline till sales are counted once imported as POS
+    orders (services.offline_sales).
+    """
+    since = _local_start(start_day)
+    buckets = defaultdict(int)
+    order_rows = (
+        OrderItem.objects.filter(order__created_at__gte=since)
+        .exclude(order__status="canceled")
+        .annotate(day=TruncDate("order__created_at"))
+        .values("book_id", "day")
+        .annotate(units=Sum("quantity"))
+        .order_by()
+    )
+    for row in order_rows:
+        buckets[(row["book_id"], row["day"])] += row["units"] or 0
+
+    return buckets
+
+
+def _refresh_stamp():
+    """The shared refresh marker without a shared cache, else None (the cache itself is shared)."""
+    return None if settings.CACHE_IS_SHARED else JobWatermark.get(REFRESHED_WATERMARK)
+
+
+def _refreshed_at():
+    if settings.CACHE_IS_SHARED:
+        return cache.get(REFRESHED_CACHE_KEY)
+    stamp = JobWatermark.get(REFRESHED_WATERMARK)
+    return None if stamp is None else datetime.fromtimestamp(stamp / 1_000_000, tz=dt_timezone.utc)
+
+
+def refresh_sales_days(full=False):
+    """
+    Bring the SalesDay buckets up to date. Incremental runs only re-aggregate from REFRESH_OVERLAP_DAYS before
+    the previous refresh; full runs (and the first run after a cache flush) rebuild the whole history window,
+    which also picks up back-dated edits and cancellations of old orders. Returns buckets written.
+    """
+    today = timezone.localdate()
+    window_start = today - timedelta(days=_history_days() - 1)
+    refreshed_at = None if full else _refreshed_at()
+    if refreshed_at is None or not SalesDay.objects.exists():
+        start = window_start
+    else:
+        start = max(window_start, timezone.localdate(refreshed_at) - timedelta(days=REFRESH_OVERLAP_DAYS - 1))
+
+    buckets = _daily_sales_since(start)
+    rows = [
+        SalesDay(book_id=book_id, day=day, quantity=units)
+        for (book_id, day), units in buckets.items()
+        if units > 0 and day >= start
+    ]
+    with transaction.atomic():
+        SalesDay.objects.filter(day__gte=start).delete()
+        # Buckets older than the window no longer feed the forecast.
+        SalesDay.objects.filter(day__lt=window_start).delete()
+        SalesDay.objects.bulk_create(rows, batch_size=WRITE_BATCH)
+    now = timezone.now()
+    cache.delete(STATS_CACHE_KEY)
+    cache.set(REFRESHED_CACHE_KEY, now, None)
+    JobWatermark.put(REFRESHED_WATERMARK, int(now.timestamp() * 1_000_000))
+    return len(rows)
+
+
+def velocity_stats():
+    """
+    Per-book daily velocity and its standard deviation over the history window, computed with NumPy over a
+    books x days matrix of SalesDay buckets. Cached until the next refresh (in any process).
+    """
+    refreshed = _refresh_stamp()
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is not None and stats.get("refreshed") == refreshed:
+        return stats
+    days = _history_days()
+    today = timezone.localdate()
+    window_start = today - timedelta(days=days - 1)
+    rows = list(SalesDay.objects.filter(day__gte=window_start).values_list("book_id", "day", "quantity"))
+    if not rows:
+        stats = {
+            "book_ids": [], "velocity": [], "std": [], "units": [], "last_sale": [], "days": days, "refreshed": refreshed
+        }
+        cache.set(STATS_CACHE_KEY, stats, None)
+        return stats
+
+    book_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    offsets = np.array([(row[1] - window_start).days for row in rows], dtype=np.int64)
+    units = np.array([row[2] for row in rows], dtype=np.float64)
+    unique_ids, book_index = np.unique(book_ids, return_inverse=True)
+
+    matrix = np.zeros((unique_ids.size, days), dtype=np.float64)
+    np.add.at(matrix, (book_index, offsets), units)
+    velocity = matrix.mean(axis=1)
+    std = matrix.std(axis=1, ddof=1) if days > 1 else np.zeros(unique_ids.size)
+    # Index of the last day with a sale, per book (argmax over the reversed "sold" mask).
+    sold = matrix > 0
+    last_offset = days - 1 - np.argmax(sold[:, ::-1], axis=1)
+
+    stats = {
+        "book_ids": unique_ids.tolist(),
+        "velocity": velocity.tolist(),
+        "std": std.tolist(),
+        "units": matrix.sum(axis=1).astype(np.int64).tolist(),
+        "last_sale": [(window_start + timedelta(days=int(offset))).isoformat() for offset in last_offset],
+        "days": days,
+        "refreshed": refreshed,
+    }
+    cache.set(STATS_CACHE_KEY, stats, None)
+    return stats
+
+
+def _refresh_if_stale():
+    refreshed_at = _refreshed_at()
+    if refreshed_at is None or timezone.now() - refreshed_at > REFRESH_INTERVAL:
+        refresh_sales_days()
+
+
+def reorder_report(lead_time_days=None, cover_days=None, refresh=True):
+    """
+    Ranked reorder list for every book that sold in the window: days of stock cover left, reorder point
+    (lead-time demand + safety stock) and a suggested order quantity that restores cover_days of stock.
+    Only live stock is read per call; the velocity statistics come from the cache.
+    """
+    if refresh:
+        _refresh_if_stale()
+    lead_time = lead_time_days or settings.REORDER_LEAD_TIME_DAYS
+    cover = cover_days or settings.REORDER_COVER_DAYS
+    stats = velocity_stats()
+    if not stats["book_ids"]:
+        return []
+
+    ids = np.array(stats["book_ids"], dtype=np.int64)
+    velocity = np.array(stats["velocity"])
+    std = np.array(stats["std"])
+    books = {
+        book.id: book
+        for book in Book.objects.filter(id__in=stats["book_ids"]).only("id", "title", "barcode", "stock_quantity")
+    }
+    stock = np.array([max(books[bid].stock_quantity or 0, 0) if bid in books else 0 for bid in stats["book_ids"]])
+
+    with np.errstate(divide="ignore"):
+        days_of_cover = np.where(velocity > 0, stock / velocity, np.inf)
+    safety_stock = SERVICE_LEVEL_Z * std * math.sqrt(lead_time)
+    reorder_point = velocity * lead_time + safety_stock
+    target = velocity * (lead_time + cover) + safety_stock
+    suggested = np.maximum(np.ceil(target - stock), 0).astype(np.int64)
+
+    order = np.lexsort((-velocity, days_of_cover))
+    report = []
+    for idx in order:
+        book = books.get(int(ids[idx]))
+        if book is None:
+            continue
+        report.append(
+            {
+                "book": book,
+                "stock": int(stock[idx]),
+                "velocity": float(velocity[idx]),
+                "std": float(std[idx]),
+                "units": stats["units"][idx],
+                "last_sale": stats["last_sale"][idx],
+                "days_of_cover": None if math.isinf(days_of_cover[idx]) else float(days_of_cover[idx]),
+                "reorder_point": math.ceil(reorder_point[idx]),
+                "suggested": int(suggested[idx]),
+                "needs_reorder": bool(stock[idx] <= reorder_point[idx]),
+            }
+        )
+    return report
@@ -0,0 +1,73 @@
+from django.db import transaction
+
+from apps.catalog.models import Book
+from apps.crm.models import InventoryLog
+from apps.crm.utils.labels import LAYOUTS, Label, is_ean13, iter_label_pdf, iter_label_zpl
+from .pos_index import mark_books_changed
+
+LABEL_FIELDS = ("id", "title", "barcode", "sale_price", "stock_quantity")
+WRITE_BATCH = 1000
+# format -> (content type, file extension)
+LABEL_FORMATS = {"pdf": ("application/pdf", "pdf"), "zpl": ("application/octet-stream", "zpl")}
+
+
+def ensure_barcodes(books):
+    """Fill generated barcodes on books that have none with one bulk_update, instead of a save() per book."""
+    missing = [book for book in books if not book.barcode]
+    if not missing:
+        return []
+    for book in missing:
+        book.barcode = Book.generate_barcode_from_id(book.id)
+    with transaction.atomic():
+        Book.objects.bulk_update(missing, ["barcode"], batch_size=WRITE_BATCH)
+        book_ids = [book.id for book in missing]
+        transaction.on_commit(lambda: mark_books_changed(book_ids))
+    return missing
+
+
+def _labels(books, copies):
+    books = list(books)
+    ensure_barcodes(books)
+    labels = []
+    skipped = []
+    for book in books:
+        count = copies(book)
+        if count <= 0:
+            continue
+        if not is_ean13(book.barcode):
+            # Custom codes of other lengths can't be drawn as EAN-13; they're reported, not guessed at.
+            skipped.append(book)
+            continue
+        labels.append(Label(book.barcode, book.title, book.sale_price, count))
+    return labels, skipped
+
+
+def book_labels(queryset, copies=1, per_stock=False):
+    """
+    Labels for a book queryset: `copies` each, or one per unit in stock. Returns (labels, skipped books
+    whose barcode isn't EAN-13).
+    """
+    books = queryset.only(*LABEL_FIELDS).order_by("title", "id")
+    if per_stock:
+        return _labels(books, lambda book: book.stock_quantity or 0)
+    return _labels(books, lambda book: copies)
+
+
+def restock_labels(logs):
+    """One label per received copy for restock InventoryLog rows (a delivery), summed per book."""
+    received = {}
+    for book_id, delta in logs.filter(reason="restock", delta__gt=0).values_list("book_id", "delta"):
+        received[book_id] = received.get(book_id, 0) + delta
+    books = Book.objects.filter(id__in=received).only(*LABEL_FIELDS).order_by("title", "id")
+    return _labels(books, lambda book: received[book.id])
+
+
+def restock_logs_on(day):
+    return InventoryLog.objects.filter(reason="restock", created_at__date=day)
+
+
+def label_stream(labels, fmt="pdf", layout="a4"):
+    """Chunks of the label file: a PDF sheet in the given layout, or ZPL (thermal rolls, layout ignored)."""
+    if fmt == "zpl":
+        return iter_label_zpl(labels)
+    return iter_label_pdf(labels, layout if layout in LAYOUTS else "a4")
@@ -0,0 +1,164 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from apps.catalog.models import Book
+from apps.crm.models import InventoryLog, StockSnapshot
+
+SNAPSHOT_BATCH = 1000
+# Above this many books a window is summed for every book and filtered in Python (avoids huge IN lists).
+ID_FILTER_LIMIT = 500
+
+
+def _nearest_snapshots(at, before=True, book_ids=None):
+    """Per book, the latest snapshot at/before `at` (or the earliest after it). One windowed query."""
+    qs = StockSnapshot.objects.filter(taken_at__lte=at) if before else StockSnapshot.objects.filter(taken_at__gt=at)
+    if book_ids is not None:
+        qs = qs.filter(book_id__in=book_ids)
+    order = F("taken_at").desc() if before else F("taken_at").asc()
+    ranked = qs.annotate(rn=Window(RowNumber(), partition_by=[F("book_id")], order_by=order)).filter(rn=1)
+    return {snap.book_id: snap for snap in ranked}
+
+
+def _deltas_between(windows):
+    """
+    Sum InventoryLog deltas per book over (start, end]. windows maps (start, end) -> book ids; books that share
+    a window (the usual case after a snapshot run) are summed in one grouped query.
+    """
+    totals = defaultdict(int)
+    for (start, end), book_ids in windows.items():
+        if not book_ids or start == end:
+            continue
+        low, high = min(start, end), max(start, end)
+        rows = InventoryLog.objects.filter(created_at__gt=low, created_at__lte=high)
+        wanted = set(book_ids)
+        if len(wanted) <= ID_FILTER_LIMIT:
+            rows = rows.filter(book_id__in=wanted)
+        for row in rows.values("book_id").annotate(total=Sum("delta")).order_by():
+            if row["book_id"] in wanted:
+                totals[row["book_id"]] += row["total"] or 0
+    return totals
+
+
+def ledger_quantities(at=None, book_ids=None, books=None):
+    """
+    Stock per book at `at` according to the ledger: {book_id: (quantity, unit_cost, anchored)}.
+    Anchor is the nearest snapshot (forward or backward, plus the bounded delta in between); books that were
+    never snapshotted are anchored on their live stock_quantity. anchored is False for those.
+    """
+    at = at or timezone.now()
+    if books is None:
+        books = Book.objects.only("id", "stock_quantity", "purchase_price")
+        if book_ids is not None:
+            books = books.filter(id__in=book_ids)
+        books = {book.id: book for book in books}
+
+    before = _nearest_snapshots(at, before=True, book_ids=book_ids)
+    after = _nearest_snapshots(at, before=False, book_ids=book_ids)
+    now = timezone.now()
+
+    windows = defaultdict(list)
+    anchors = {}
+    for book_id, book in books.items():
+        if book_id in before:
+            snap = before[book_id]
+            anchors[book_id] = (snap.quantity, snap.unit_cost, snap.taken_at, 1, True)
+        elif book_id in after:
+            snap = after[book_id]
+            anchors[book_id] = (snap.quantity, snap.unit_cost, snap.taken_at, -1, True)
+        else:
+            anchors[book_id] = (book.stock_quantity or 0, book.purchase_price, now, -1, False)
+        windows[(anchors[book_id][2], at)].append(book_id)
+    deltas = _deltas_between(windows)
+
+    result = {}
+    for book_id, (quantity, unit_cost, _anchor_at, sign, anchored) in anchors.items():
+        result[book_id] = (quantity + sign * deltas.get(book_id, 0), unit_cost or Decimal("0"), anchored)
+    return result
+
+
+def stock_at(at=None, book_ids=None):
+    """{book_id: quantity} at the given instant."""
+    return {book_id: qty for book_id, (qty, _cost, _anchored) in ledger_quantities(at, book_ids).items()}
+
+
+def valuation_at(at=None, book_ids=None):
+    """Rows (book_id, quantity, unit_cost, value) and the total value at purchase price."""
+    rows = []
+    total = Decimal("0")
+    for book_id, (qty, cost, _anchored) in ledger_quantities(at, book_ids).items():
+        value = cost * qty
+        rows.append((book_id, qty, cost, value))
+        total += value
+    return rows, total
+
+
+def take_snapshots(at=None):
+    """
+    Write one snapshot per book at `at` (default now): previous snapshot carried forward with the log deltas
+    since, or an opening snapshot from stock_quantity for books without one. Returns the number written.
+    """
+    at = at or timezone.now()
+    existing = set(StockSnapshot.objects.filter(taken_at=at).values_list("book_id", flat=True))
+    previous = _nearest_snapshots(at, before=True)
+    windows = defaultdict(list)
+    for book_id, snap in previous.items():
+        windows[(snap.taken_at, at)].append(book_id)
+    deltas = _deltas_between(windows)
+
+    # Books created after `at` have no stock yet at that instant.
+    books = list(Book.objects.filter(created_at__lte=at).only("id", "stock_quantity", "purchase_price"))
+    # Opening snapshots read live stock; roll back any logged movement after `at` when backdating.
+    opening_ids = [book.id for book in books if book.id not in previous]
+    rollback = _deltas_between({(at, timezone.now()): opening_ids}) if opening_ids else {}
+
+    batch = []
+    written = 0
+    for book in books:
+        if book.id in existing:
+            continue
+        cost = book.purchase_price or Decimal("0")
+        if book.id in previous:
+            quantity = previous[book.id].quantity + deltas.get(book.id, 0)
+            is_opening = False
+        else:
+            quantity = (book.stock_quantity or 0) - rollback.get(book.id, 0)
+            is_opening = True
+        batch.append(
+            StockSnapshot(
+                book_id=book.id,
+                taken_at=at,
+                quantity=quantity,
+                unit_cost=cost,
+                value=cost * quantity,
+                is_opening=is_opening,
+            )
+        )
+        if len(batch) >= SNAPSHOT_BATCH:
+            StockSnapshot.objects.bulk_create(batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        StockSnapshot.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def reconcile_stock():
+    """
+    Books whose stock_quantity disagrees with the ledger (latest snapshot + later deltas).
+    Returns [(book, ledger_quantity), ...]; books never snapshotted have no ledger yet and are skipped.
+    """
+    books = {
+        book.id: book
+        for book in Book.objects.only("id", "title", "barcode", "stock_quantity", "purchase_price").order_by("title")
+    }
+    drifted = []
+    for book_id, (quantity, _cost, anchored) in ledger_quantities(books=books).items():
+        book = books[book_id]
+        if anchored and (book.stock_quantity or 0) != quantity:
+            drifted.append((book, quantity))
+    return drifted
@@ -0,0 +1,214 @@
+"""
+Bridge from the offline tills (apps.sync) into the main ledger: every synced Sale becomes a paid POS Order
+with its lines mapped to books by barcode, plus "sale" InventoryLog movements, so the dashboard, reports
+and stock ledger see till sales like any other order.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Max, Value, When
+
+from apps.catalog.models import Book
+from apps.catalog.signals import invalidate_book_list_caches
+from apps.crm.models import InventoryLog, JobWatermark, OfflineSale
+from apps.crm.utils.phones import normalize_phone
+from apps.orders.models import Order, OrderItem
+from apps.sync.models import Change, Sale
+from apps.sync.services.changes import head_seq
+from .customers import upsert_customer_for_order
+from .pos_index import mark_books_changed
+from .search import index_objects
+
+# JobWatermark: last change-feed seq scanned. Anything seen again is skipped by sale id, never imported twice.
+WATERMARK = "offline_sales"
+# JobWatermark seeded by migration crm 0017 at the change-feed head when the bridge was deployed. Sales
+# synced before it were reconciled by hand: they move no stock, and only --backfill imports them.
+CUTOVER = "offline_sales_cutover"
+BATCH_SIZE = 500
+WRITE_BATCH = 1000
+# Tills take cash or card; orders know cash or bank transfer.
+PAYMENT_TYPES = {"cash": "cash", "card": "bank"}
+NOTE = "POS (offline)"
+
+
+def _cutover():
+    """(seq, time) of the cutover; set to now if the migration's row is missing."""
+    row = JobWatermark.objects.filter(name=CUTOVER).values_list("value", "updated_at").first()
+    if row is None:
+        JobWatermark.objects.get_or_create(name=CUTOVER, defaults={"value": head_seq()})
+        row = JobWatermark.objects.filter(name=CUTOVER).values_list("value", "updated_at").first()
+    return row
+
+
+def _watermark(cutover_seq):
+    watermark = JobWatermark.get(WATERMARK)
+    if watermark is None:
+        watermark = OfflineSale.objects.aggregate(last=Max("seq"))["last"] or cutover_seq
+    return max(watermark, cutover_seq)
+
+
+def _barcode(item):
+    return item.product.barcode if item.product_id and item.product.barcode else ""
+
+
+def _order(sale, unmatched):
+    customer = sale.customer
+    phone = (customer.phone if customer else "") or "POS"
+    subtotal = sum((item.price * item.quantity for item in sale.items.all()), Decimal("0"))
+    discount = max(subtotal - sale.total, Decimal("0"))
+    note = NOTE + (f", sotuvchi: {sale.seller}" if sale.seller else "")
+    if unmatched:
+        note += f". Kitobga mos kelmagan qatorlar: {unmatched}"
+    return Order(
+        full_name=(customer.full_name if customer else "") or "POS",
+        phone=phone,
+        # bulk_create skips Order.save(), which normally derives this column.
+        phone_normalized=normalize_phone(phone) or "",
+        payment_type=PAYMENT_TYPES.get(sale.payment_type, "cash"),
+        order_source="pos",
+        status="paid",
+        paid_at=sale.sale_datetime,
+        subtotal_before_discount=subtotal,
+        discount_percent=int(discount * 100 / subtotal) if subtotal else 0,
+        discount_amount=discount,
+        total_price=sale.total,
+        note=note,
+    )
+
+
+def _take_stock(book_deltas):
+    """stock_quantity += delta per book id, one UPDATE per WRITE_BATCH books."""
+    items = list(book_deltas.items())
+    for start in range(0, len(items), WRITE_BATCH):
+        batch = items[start : start + WRITE_BATCH]
+        Book.objects.filter(id__in=[book_id for book_id, _delta in batch]).update(
+            stock_quantity=F("stock_quantity")
+            + Case(*(When(id=book_id, then=Value(delta)) for book_id, delta in batch), default=Value(0), output_field=IntegerField()),
+        )
+
+
+def _import_batch(changes, cutover_at):
+    """
+    Import the sales among changes [(seq, sale id)] that are not imported yet, in one transaction with a
+    fixed number of bulk statements (plus one customer upsert per sale with a phone). Only sales synced
+    after cutover_at take stock off and log inventory movements. Returns counts.
+    """
+    seqs = {sale_id: seq for seq, sale_id in changes}
+    stats = {"orders": 0, "items": 0, "unmatched": 0}
+    with transaction.atomic():
+        done = set(OfflineSale.objects.filter(sale_id__in=seqs).values_list("sale_id", flat=True))
+        sales = list(
+            Sale.objects.filter(id__in=seqs.keys() - done)
+            .select_related("customer")
+            .prefetch_related("items__product")
+            .order_by("sale_datetime", "id")
+        )
+        if not sales:
+            return stats
+        barcodes = {_barcode(item) for sale in sales for item in sale.items.all()} - {""}
+        # Full instances: the search documents of the new inventory logs read the book's title.
+        books = {
+            book.barcode: book
+            for book in Book.objects.filter(barcode__in=barcodes).only("id", "title", "barcode", "category_id")
+        }
+
+        orders = []
+        matched = []
+        unmatched = []
+        for sale in sales:
+            lines = [(item, books[_barcode(item)]) for item in sale.items.all() if _barcode(item) in books]
+            missing = len(sale.items.all()) - len(lines)
+            orders.append(_order(sale, missing))
+            matched.append(lines)
+            unmatched.append(missing)
+        Order.objects.bulk_create(orders, batch_size=WRITE_BATCH)
+        # auto_now_add stamped the import time; reports need the moment of sale.
+        for order, sale in zip(orders, sales):
+            order.created_at = sale.sale_datetime
+        Order.objects.bulk_update(orders, ["created_at"], batch_size=WRITE_BATCH)
+
+        order_items = []
+        book_deltas = defaultdict(int)
+        moved_items = []
+        for sale, order, lines in zip(sales, orders, matched):
+            for item, book in lines:
+                order_item = OrderItem(order=order, book=book, quantity=item.quantity, price=item.price)
+                order_items.append(order_item)
+                if sale.created_at > cutover_at:
+                    moved_items.append(order_item)
+                    book_deltas[book.id] -= item.quantity
+        OrderItem.objects.bulk_create(order_items, batch_size=WRITE_BATCH)
+        _take_stock(book_deltas)
+        # Movements are logged now, not back-dated to the sale: a snapshot taken in between already holds
+        # the stock as it was before this import.
+        logs = InventoryLog.objects.bulk_create(
+            [
+                InventoryLog(book=item.book, delta=-item.quantity, reason="sale", related_order=item.order, note=NOTE)
+                for item in moved_items
+            ],
+            batch_size=WRITE_BATCH,
+        )
+
+        # bulk_create sends no post_save: link customers the way track_customer_metrics would.
+        linked = []
+        for order in orders:
+            if order.phone_normalized:
+                order.customer = upsert_customer_for_order(order)
+                linked.append(order)
+        Order.objects.bulk_update(linked, ["customer"], batch_size=WRITE_BATCH)
+        OfflineSale.objects.bulk_create(
+            [
+                OfflineSale(
+                    sale_id=sale.id,
+                    seq=seqs[sale.id],
+                    order=order,
+                    unmatched=missing,
+                    stock_moved=sale.created_at > cutover_at,
+                )
+                for sale, order, missing in zip(sales, orders, unmatched)
+            ],
+            batch_size=WRITE_BATCH,
+        )
+        index_objects([*orders, *logs])
+
+        book_ids = list(book_deltas)
+        category_ids = {book.category_id for book in books.values() if book.id in book_deltas}
+        if book_ids:
+            transaction.on_commit(lambda: invalidate_book_list_caches(category_ids))
+            transaction.on_commit(lambda: mark_books_changed(book_ids))
+    stats.update(orders=len(orders), items=len(order_items), unmatched=sum(unmatched))
+    return stats
+
+
+def import_offline_sales(full=False, backfill=False, batch_size=BATCH_SIZE):
+    """
+    Import sales synced since the last run, walking the sync change feed (commit-ordered, gap-free) from the
+    watermark in batches of batch_size. Full runs rescan everything after the cutover; backfill imports the
+    sales from before it, as orders without stock movements. Imported sales are skipped either way.
+    Returns {"orders", "items", "unmatched"}.
+    """
+    cutover_seq, cutover_at = _cutover()
+    if backfill:
+        after, until = 0, cutover_seq
+    else:
+        after, until = (cutover_seq if full else _watermark(cutover_seq)), None
+    stats = {"orders": 0, "items": 0, "unmatched": 0}
+    changes = Change.objects.filter(entity_type="sale", deleted=False).order_by("seq")
+    if until is not None:
+        changes = changes.filter(seq__lte=until)
+    while True:
+        batch = list(changes.filter(seq__gt=after).values_list("seq", "entity_id")[:batch_size])
+        if not batch:
+            break
+        try:
+            result = _import_batch(batch, cutover_at)
+        except IntegrityError:
+            # A concurrent run imported some of these sales first; the retry skips them.
+            result = _import_batch(batch, cutover_at)
+        for key, value in result.items():
+            stats[key] += value
+        after = batch[-1][0]
+        if not backfill:
+            JobWatermark.put(WATERMARK, after)
+    return stats
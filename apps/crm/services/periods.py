@@ -0,0 +1,56 @@
+from datetime import date, datetime, time
+
+from django.utils import timezone
+
+
+def parse_report_period(params):
+    """
+    Resolve the report window from GET-style params (start, end, start_time, end_time).
+    Defaults to the current month up to today; bad values fall back silently like the UI.
+    """
+    today = timezone.localdate()
+    month_start = today.replace(day=1)
+    start_raw = (params.get("start") or "").strip()
+    end_raw = (params.get("end") or "").strip()
+    start_time_raw = (params.get("start_time") or "").strip()
+    end_time_raw = (params.get("end_time") or "").strip()
+    start_date = month_start
+    end_date = today
+    start_time = time(0, 0)
+    end_time = time(23, 59)
+    if start_raw:
+        try:
+            start_date = date.fromisoformat(start_raw)
+        except ValueError:
+            start_date = month_start
+    if end_raw:
+        try:
+            end_date = date.fromisoformat(end_raw)
+        except ValueError:
+            end_date = today
+    if start_time_raw:
+        try:
+            start_time = time.fromisoformat(start_time_raw)
+        except ValueError:
+            start_time = time(0, 0)
+    if end_time_raw:
+        try:
+            end_time = time.fromisoformat(end_time_raw)
+        except ValueError:
+            end_time = time(23, 59)
+    if start_date > end_date:
+        start_date, end_date = end_date, start_date
+
+    start_dt = datetime.combine(start_date, start_time)
+    end_dt = datetime.combine(end_date, end_time)
+    if start_dt > end_dt:
+        start_dt, end_dt = end_dt, start_dt
+    tz = timezone.get_current_timezone()
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "start_time": start_time,
+        "end_time": end_time,
+        "start_dt": timezone.make_aware(start_dt, tz),
+        "end_dt": timezone.make_aware(end_dt, tz),
+    }
@@ -0,0 +1,103 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.catalog.models import Book
+from apps.crm.models import Customer
+from apps.orders.models import Order, OrderItem
+from apps.crm.utils.phones import phone_lookup
+
+# Cashiers may give at most this share of the subtotal as a manual discount.
+MANUAL_DISCOUNT_CAP = Decimal("0.07")
+
+
+def pos_discount(subtotal, phone="", manual_amount=None):
+    """
+    The till's discount rules: the customer's own discount_percent (looked up by phone) unless the cashier
+    enters an amount, which is capped at 7% of the subtotal. Returns (customer, discount_percent, amount).
+    """
+    customer = None
+    discount_percent = 0
+    discount_amount = Decimal("0")
+    if phone:
+        customer = Customer.objects.filter(**phone_lookup(phone)).first()
+        if customer:
+            discount_percent = min(int(customer.discount_percent or 0), 100)
+    if manual_amount is not None and manual_amount > 0:
+        max_discount = (subtotal * MANUAL_DISCOUNT_CAP).quantize(Decimal("0.01"))
+        discount_amount = min(manual_amount, max_discount)
+        discount_percent = int((discount_amount * Decimal("100")) / subtotal) if subtotal > 0 else 0
+    if not discount_amount and discount_percent:
+        discount_amount = (subtotal * Decimal(discount_percent)) / Decimal("100")
+    return customer, discount_percent, discount_amount
+
+
+def create_pos_order(items, full_name, phone, payment_type, manual_discount=None):
+    """
+    One paid POS order for items [{"book", "quantity", "price"}]. Order and items commit together, so the
+    order's on_commit stock/inventory-log hook sees the items.
+    """
+    subtotal = sum((item["price"] * item["quantity"] for item in items), Decimal("0"))
+    customer, discount_percent, discount_amount = pos_discount(subtotal, phone, manual_discount)
+    with transaction.atomic():
+        order = Order.objects.create(
+            full_name=full_name,
+            phone=phone or "POS",
+            payment_type=payment_type,
+            subtotal_before_discount=subtotal,
+            discount_percent=discount_percent,
+            discount_amount=discount_amount,
+            total_price=subtotal - discount_amount,
+            order_source="pos",
+            status="paid",
+            paid_at=timezone.now(),
+            customer=customer,
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, book=item["book"], quantity=item["quantity"], price=item["price"]) for item in items
+        )
+    return order
+
+
+def verify_pos_cart(lines, phone="", manual_discount=None, expected_total=None):
+    """
+    Check a browser-held cart against the database in one locked read. lines are
+    [(book_id, quantity, client_price)]. Returns items priced from the database, the totals the server
+    would charge and the list of changes the cashier has to confirm (price, stock, missing, discount, total).
+    Call inside a transaction so the locked stock holds until the order is written.
+    """
+    books = Book.objects.select_for_update().only("id", "title", "sale_price", "stock_quantity").in_bulk(
+        [book_id for book_id, _qty, _price in lines]
+    )
+    items = []
+    changes = []
+    for book_id, quantity, client_price in lines:
+        book = books.get(book_id)
+        if book is None:
+            changes.append({"kind": "missing", "book_id": book_id})
+            continue
+        price = book.sale_price
+        if client_price is None or client_price != price:
+            changes.append({"kind": "price", "book_id": book_id, "title": book.title, "was": client_price, "now": price})
+        stock = book.stock_quantity or 0
+        if quantity > stock:
+            changes.append({"kind": "stock", "book_id": book_id, "title": book.title, "wanted": quantity, "available": stock})
+        items.append({"book": book, "quantity": quantity, "price": price, "line_total": price * quantity})
+
+    subtotal = sum((item["line_total"] for item in items), Decimal("0"))
+    customer, discount_percent, discount_amount = pos_discount(subtotal, phone, manual_discount)
+    if manual_discount is not None and manual_discount > 0 and discount_amount < manual_discount:
+        changes.append({"kind": "discount", "was": manual_discount, "now": discount_amount})
+    total = subtotal - discount_amount
+    if expected_total is not None and expected_total != total and not any(c["kind"] == "discount" for c in changes):
+        changes.append({"kind": "total", "was": expected_total, "now": total})
+    return {
+        "items": items,
+        "subtotal": subtotal,
+        "customer": customer,
+        "discount_percent": discount_percent,
+        "discount_amount": discount_amount,
+        "total": total,
+        "changes": changes,
+    }
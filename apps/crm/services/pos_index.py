@@ -0,0 +1,185 @@
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from apps.catalog.models import Book
+from apps.crm.models import JobWatermark
+from .search import normalize_text
+
+# What the POS needs per book; everything else stays in the database.
+PosBook = namedtuple("PosBook", "id title barcode price stock")
+
+# Book fields the index mirrors: saves touching none of them don't invalidate anything.
+INDEXED_FIELDS = {"title", "barcode", "sale_price", "stock_quantity"}
+
+VERSION_CACHE_KEY = "crm:pos_index:version"
+# Where the stamp lives when the cache is per-process (LocMemCache): a bump must reach every worker.
+VERSION_WATERMARK = "pos_index"
+CHANGED_CACHE_KEY = "crm:pos_index:changed:{}"
+# A process further behind than this rebuilds from scratch instead of replaying changed ids.
+MAX_REPLAY = 100
+CHANGED_TTL = 60 * 60
+SUGGEST_LIMIT = 15
+
+
+class PosIndex:
+    """Per-process barcode -> book map plus a sorted title/word prefix list for typeahead."""
+
+    def __init__(self, version, books=()):
+        self.version = version
+        self.by_id = {}
+        self.by_barcode = {}
+        self._prefixes = []
+        for book in books:
+            self._put(book)
+        self._prefixes.sort()
+
+    def _keys(self, book):
+        title = normalize_text(book.title)
+        words = title.split(" ")
+        # Every word start is a key, so "kunlar" finds "O'tkan kunlar".
+        return {" ".join(words[i:]) for i in range(len(words)) if words[i]}
+
+    def _put(self, book):
+        self.by_id[book.id] = book
+        if book.barcode:
+            self.by_barcode[book.barcode] = book
+        self._prefixes.extend((key, book.id) for key in self._keys(book))
+
+    def replace(self, book_ids, books):
+        """Swap in fresh rows for book_ids (deleted books simply aren't in books)."""
+        book_ids = set(book_ids)
+        for book_id in book_ids:
+            book = self.by_id.pop(book_id, None)
+            if book is not None and book.barcode and self.by_barcode.get(book.barcode) is book:
+                del self.by_barcode[book.barcode]
+        prefixes = [entry for entry in self._prefixes if entry[1] not in book_ids]
+        for book in books:
+            self.by_id[book.id] = book
+            if book.barcode:
+                self.by_barcode[book.barcode] = book
+            prefixes.extend((key, book.id) for key in self._keys(book))
+        # Mostly sorted already, so this is close to linear; swapped in whole so readers never see it half-built.
+        prefixes.sort()
+        self._prefixes = prefixes
+
+    def suggest(self, query, limit=SUGGEST_LIMIT):
+        query = normalize_text(query)
+        if not query:
+            return []
+        found = []
+        seen = set()
+        for key, book_id in self._prefixes[bisect_left(self._prefixes, (query,)) :]:
+            if not key.startswith(query):
+                break
+            if book_id not in seen:
+                seen.add(book_id)
+                found.append(self.by_id[book_id])
+                if len(found) >= limit:
+                    break
+        return sorted(found, key=lambda book: book.title.casefold())
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def _load(book_ids=None):
+    qs = Book.objects.order_by()
+    if book_ids is not None:
+        qs = qs.filter(id__in=book_ids)
+    return [
+        PosBook(book_id, title, barcode or "", price or Decimal("0"), stock or 0)
+        for book_id, title, barcode, price, stock in qs.values_list(
+            "id", "title", "barcode", "sale_price", "stock_quantity"
+        )
+    ]
+
+
+def _current_version():
+    if not settings.CACHE_IS_SHARED:
+        return JobWatermark.get(VERSION_WATERMARK) or 1
+    return cache.get_or_set(VERSION_CACHE_KEY, 1, None)
+
+
+def _bump_version():
+    if not settings.CACHE_IS_SHARED:
+        with transaction.atomic():
+            JobWatermark.objects.get_or_create(name=VERSION_WATERMARK, defaults={"value": 1})
+            JobWatermark.objects.filter(name=VERSION_WATERMARK).update(value=F("value") + 1)
+            return JobWatermark.get(VERSION_WATERMARK)
+    try:
+        return cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        cache.add(VERSION_CACHE_KEY, 1, None)
+        return cache.incr(VERSION_CACHE_KEY)
+
+
+def get_index():
+    """
+    The process-local index, brought up to date with the shared version stamp: one cache read (one primary-key
+    query without a shared cache) when nothing changed, a reload of just the changed books when a few did, a
+    full reload otherwise.
+    """
+    global _index
+    version = _current_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        index = _index
+        if index is not None and index.version == version:
+            return index
+        changed = None
+        if index is not None and 0 < version - index.version <= MAX_REPLAY:
+            keys = [CHANGED_CACHE_KEY.format(v) for v in range(index.version + 1, version + 1)]
+            entries = cache.get_many(keys)
+            if len(entries) == len(keys) and all(entry is not None for entry in entries.values()):
+                changed = {book_id for entry in entries.values() for book_id in entry}
+        if changed is None:
+            index = PosIndex(version, _load())
+        else:
+            index.replace(changed, _load(changed) if changed else [])
+            index.version = version
+        _index = index
+        return index
+
+
+def mark_books_changed(book_ids=None):
+    """
+    Bump the shared version so every process refreshes its index. With book ids, processes reload only those
+    books; None (bulk writes of unknown scope) forces a full reload. The changed ids go to the cache, so
+    without a shared one other processes (finding none) reload in full.
+    """
+    version = _bump_version()
+    cache.set(CHANGED_CACHE_KEY.format(version), sorted(book_ids) if book_ids is not None else None, CHANGED_TTL)
+    return version
+
+
+def lookup_barcode(barcode):
+    return get_index().by_barcode.get("".join(str(barcode or "").split()))
+
+
+def suggest_books(query, limit=SUGGEST_LIMIT):
+    return get_index().suggest(query, limit)
+
+
+def book_payload(book):
+    return {"id": book.id, "title": book.title, "barcode": book.barcode, "price": str(book.price), "stock": book.stock}
+
+
+def cart_items(cart):
+    """Session cart rows for pos_cart.html resolved from the index (no per-scan book query)."""
+    index = get_index()
+    items = []
+    for key, quantity in cart.cart.items():
+        book = index.by_id.get(int(key)) if str(key).isdigit() else None
+        if book is not None:
+            items.append({"book": book, "quantity": quantity, "price": book.price, "line_total": book.price * quantity})
+    return items
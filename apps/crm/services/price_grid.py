@@ -0,0 +1,239 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+from apps.catalog.models import Author, Book, Category
+from apps.catalog.signals import invalidate_book_list_caches
+from apps.crm.models import InventoryLog
+from .pos_index import mark_books_changed
+from .search import index_objects, reindex_queryset
+
+GRID_FIELDS = ("title", "purchase_price", "sale_price", "barcode")
+WRITE_BATCH = 1000
+SLUG_LOOKUP_CHUNK = 200
+_ROW_KEY = re.compile(r"^rows-(\d+)-(id|title|purchase_price|sale_price|barcode)$")
+# Both prices share Book's DecimalField(max_digits=8, decimal_places=2); a larger value is a DataError.
+_PRICE_FIELD = Book._meta.get_field("sale_price")
+BARCODE_MAX_LENGTH = Book._meta.get_field("barcode").max_length
+
+
+class GridError(ValueError):
+    pass
+
+
+def _money(raw):
+    cleaned = (raw or "").replace(" ", "").replace(",", "")
+    if not cleaned:
+        return None
+    try:
+        value = Decimal(cleaned)
+    except InvalidOperation as exc:
+        raise GridError(f"Noto‘g‘ri narx: {raw}") from exc
+    if not value.is_finite():
+        raise GridError(f"Noto‘g‘ri narx: {raw}")
+    if value < 0:
+        raise GridError(f"Manfiy narx: {raw}")
+    if price_error(value):
+        raise GridError(f"{price_error(value)}: {raw}")
+    return value
+
+
+def price_error(value):
+    """Why a non-negative Decimal doesn't fit Book's price columns, or None."""
+    if value >= 10 ** (_PRICE_FIELD.max_digits - _PRICE_FIELD.decimal_places):
+        return "Narx juda katta"
+    if value != value.quantize(Decimal(1).scaleb(-_PRICE_FIELD.decimal_places)):
+        return f"Narxda ko‘pi bilan {_PRICE_FIELD.decimal_places} ta kasr raqam bo‘ladi"
+    return None
+
+
+def parse_grid(data):
+    """
+    Rows from a submitted grid (rows-<n>-<field> keys). Rows without an id are new books; fully blank new rows
+    are dropped. Returns [{"row": n, "id", "title", "purchase_price", "sale_price", "barcode"}, ...] where
+    a missing field is None (left unchanged).
+    """
+    raw = {}
+    for key in data:
+        match = _ROW_KEY.match(key)
+        if match:
+            raw.setdefault(int(match.group(1)), {})[match.group(2)] = (data.get(key) or "").strip()
+    rows = []
+    for number in sorted(raw):
+        values = raw[number]
+        book_id = values.get("id") or ""
+        if not book_id and not any(values.get(field) for field in GRID_FIELDS):
+            continue
+        rows.append(
+            {
+                "row": number,
+                "id": int(book_id) if book_id.isdigit() else None,
+                **{field: values.get(field) for field in GRID_FIELDS},
+            }
+        )
+    return rows
+
+
+def barcode_error(barcode):
+    """Why a barcode can't be stored, or None. 13-digit codes must carry a valid EAN-13 check digit."""
+    if not barcode.isdigit():
+        return f"Shtrix-kod faqat raqamlardan iborat bo‘lishi kerak: {barcode}"
+    if len(barcode) > BARCODE_MAX_LENGTH:
+        return f"Shtrix-kod {BARCODE_MAX_LENGTH} belgidan uzun: {barcode[:20]}…"
+    if len(barcode) == 13 and Book._ean13_check_digit(barcode[:12]) != barcode[12]:
+        return f"EAN-13 nazorat raqami noto‘g‘ri: {barcode}"
+    return None
+
+
+def _taken_slugs(bases):
+    """Existing slugs equal to or suffixed from any base, in a few OR'ed queries."""
+    bases = sorted(set(bases))
+    taken = set()
+    for start in range(0, len(bases), SLUG_LOOKUP_CHUNK):
+        condition = Q()
+        for base in bases[start : start + SLUG_LOOKUP_CHUNK]:
+            condition |= Q(slug=base) | Q(slug__startswith=f"{base}-")
+        taken.update(Book.objects.filter(condition).values_list("slug", flat=True))
+    return taken
+
+
+def allocate_slugs(titles):
+    """Unique slugs for new books: base, base-2, base-3 ... skipping existing ones and each other."""
+    bases = [slugify(title)[:45] or "book" for title in titles]
+    taken = _taken_slugs(bases)
+    slugs = []
+    for base in bases:
+        slug, suffix = base, 1
+        while slug in taken:
+            suffix += 1
+            slug = f"{base}-{suffix}"
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def _default_category_author():
+    category = Category.objects.order_by("id").first() or Category.objects.create(name="Umumiy", slug="umumiy")
+    author = Author.objects.order_by("id").first() or Author.objects.create(name="Noma'lum")
+    return category, author
+
+
+def validate_grid(rows):
+    """Parse prices and check titles/barcodes for all rows at once. Returns ({row: message}, cleaned rows)."""
+    errors = {}
+    cleaned = []
+    for row in rows:
+        try:
+            purchase = _money(row["purchase_price"])
+            sale = _money(row["sale_price"])
+        except GridError as exc:
+            errors[row["row"]] = str(exc)
+            continue
+        barcode = None if row["barcode"] is None else "".join(row["barcode"].split())
+        if barcode and barcode_error(barcode):
+            errors[row["row"]] = barcode_error(barcode)
+            continue
+        if row["id"] is None and (not row["title"] or purchase is None or sale is None):
+            errors[row["row"]] = "Yangi mahsulot uchun nom va ikkala narx kerak."
+            continue
+        cleaned.append({**row, "purchase_price": purchase, "sale_price": sale, "barcode": barcode})
+
+    # Barcode uniqueness: against each other, then against the database in one query.
+    owners = {}
+    for row in cleaned:
+        if row["barcode"]:
+            owners.setdefault(row["barcode"], []).append(row)
+    for barcode, claimants in owners.items():
+        if len(claimants) > 1:
+            for row in claimants:
+                errors[row["row"]] = f"Shtrix-kod jadvalda takrorlangan: {barcode}"
+    existing = dict(Book.objects.filter(barcode__in=list(owners)).values_list("barcode", "id")) if owners else {}
+    for row in cleaned:
+        owner = existing.get(row["barcode"])
+        if owner is not None and owner != row["id"] and row["row"] not in errors:
+            errors[row["row"]] = f"Shtrix-kod boshqa mahsulotda: {row['barcode']}"
+    return errors, [row for row in cleaned if row["row"] not in errors]
+
+
+def save_price_grid(rows):
+    """
+    Validate every row, then write all of them in one transaction: one bulk_update for the edited books and
+    one bulk_create for the new ones. Nothing is written if any row is invalid. Search documents, the POS
+    index and the storefront caches are refreshed once after commit. Returns (summary, {row: error}).
+    """
+    errors, cleaned = validate_grid(rows)
+    if errors:
+        return {"created": 0, "updated": 0}, errors
+
+    edits = [row for row in cleaned if row["id"] is not None]
+    new_rows = [row for row in cleaned if row["id"] is None]
+    with transaction.atomic():
+        books = Book.objects.select_for_update().in_bulk([row["id"] for row in edits])
+        changed = {}
+        renamed = []
+        for row in edits:
+            book = books.get(row["id"])
+            if book is None:
+                errors[row["row"]] = "Mahsulot topilmadi."
+                continue
+            fields = set()
+            if row["title"] and row["title"] != book.title:
+                book.title = row["title"]
+                fields.add("title")
+                renamed.append(book.id)
+            for field in ("purchase_price", "sale_price"):
+                if row[field] is not None and row[field] != getattr(book, field):
+                    setattr(book, field, row[field])
+                    fields.add(field)
+            # An emptied barcode gets the generated one, as Book.save would do.
+            barcode = row["barcode"] or Book.generate_barcode_from_id(book.id)
+            if row["barcode"] is not None and barcode != book.barcode:
+                book.barcode = barcode
+                fields.add("barcode")
+            if fields:
+                changed[book.id] = (book, fields)
+        if errors:
+            transaction.set_rollback(True)
+            return {"created": 0, "updated": 0}, errors
+
+        if changed:
+            update_fields = sorted(set().union(*(fields for _book, fields in changed.values())))
+            Book.objects.bulk_update([book for book, _fields in changed.values()], update_fields, batch_size=WRITE_BATCH)
+
+        created = []
+        if new_rows:
+            category, author = _default_category_author()
+            slugs = allocate_slugs([row["title"] for row in new_rows])
+            created = Book.objects.bulk_create(
+                [
+                    Book(
+                        title=row["title"],
+                        slug=slug,
+                        category=category,
+                        author=author,
+                        purchase_price=row["purchase_price"],
+                        sale_price=row["sale_price"],
+                        barcode=row["barcode"] or None,
+                    )
+                    for row, slug in zip(new_rows, slugs)
+                ],
+                batch_size=WRITE_BATCH,
+            )
+            generated = [book for book in created if not book.barcode]
+            for book in generated:
+                book.barcode = Book.generate_barcode_from_id(book.id)
+            Book.objects.bulk_update(generated, ["barcode"], batch_size=WRITE_BATCH)
+
+        touched = [book for book, _fields in changed.values()] + created
+        book_ids = [book.id for book in touched]
+        if touched:
+            index_objects(Book.objects.filter(id__in=book_ids).select_related("author", "category"))
+            if renamed:
+                reindex_queryset(InventoryLog.objects.filter(book_id__in=renamed).select_related("book"))
+            category_ids = {book.category_id for book in touched}
+            transaction.on_commit(lambda: invalidate_book_list_caches(category_ids))
+            transaction.on_commit(lambda: mark_books_changed(book_ids))
+    return {"created": len(created), "updated": len(changed)}, {}
@@ -0,0 +1,273 @@
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from apps.catalog.models import Book
+from apps.crm.models import BookNeighbors, CoPurchase, JobWatermark
+from apps.orders.models import Order, OrderItem
+
+RELATED_CACHE_KEY = "crm:related:{}"
+RELATED_TTL = 60 * 60 * 24 * 2
+# JobWatermark: last order id folded into CoPurchase, written in the same transaction as the counts.
+# Without it the next run rebuilds from scratch, never double counts.
+WATERMARK = "related_books"
+# Orders younger than this are left for the next run: their items may still be being written.
+SETTLE_DELAY = timedelta(minutes=10)
+# Wholesale/school orders say little about taste and would add n^2 pairs.
+MAX_BASKET = 30
+WRITE_BATCH = 2000
+ID_SHIFT = np.int64(1) << 32
+
+
+def _top_k():
+    return settings.RECOMMENDATION_TOP_K
+
+
+def _baskets(min_order_id=None, max_order_id=None):
+    """(order ids, book ids) of non-canceled order lines, one row per distinct book per order."""
+    rows = OrderItem.objects.exclude(order__status="canceled")
+    if min_order_id is not None:
+        rows = rows.filter(order_id__gt=min_order_id)
+    if max_order_id is not None:
+        rows = rows.filter(order_id__lte=max_order_id)
+    pairs = np.array(list(rows.values_list("order_id", "book_id").distinct().order_by()), dtype=np.int64)
+    if not len(pairs):
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def basket_counts(orders, books):
+    """
+    Sparse item-item co-occurrence of baskets given as parallel (order id, book id) arrays. Returns
+    (book ids, baskets per book, pair a ids, pair b ids, pair baskets) with a < b.
+    """
+    empty = np.empty(0, np.int64)
+    if not len(orders):
+        return empty, empty, empty, empty, empty
+    order = np.lexsort((books, orders))
+    orders, books = orders[order], books[order]
+    distinct = np.ones(len(orders), dtype=bool)
+    distinct[1:] = (orders[1:] != orders[:-1]) | (books[1:] != books[:-1])
+    orders, books = orders[distinct], books[distinct]
+
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    sizes = np.diff(np.r_[starts, len(orders)])
+    keep = sizes <= MAX_BASKET
+    item_ids, item_counts = np.unique(books[np.repeat(keep, sizes)], return_counts=True)
+
+    # Baskets of equal size expand to their (i < j) pairs in one indexing step per size.
+    keys = []
+    for size in np.unique(sizes[keep & (sizes >= 2)]):
+        first = starts[keep & (sizes == size)]
+        left, right = np.triu_indices(size, 1)
+        a = books[first[:, None] + left[None, :]].ravel()
+        b = books[first[:, None] + right[None, :]].ravel()
+        keys.append(a * ID_SHIFT + b)
+    if not keys:
+        return item_ids, item_counts, empty, empty, empty
+    pair_keys, pair_counts = np.unique(np.concatenate(keys), return_counts=True)
+    return item_ids, item_counts, pair_keys // ID_SHIFT, pair_keys % ID_SHIFT, pair_counts
+
+
+def _apply_counts(item_ids, item_counts, pair_a, pair_b, pair_counts, reset=False):
+    """Add basket counts to BookNeighbors.baskets and CoPurchase (replacing everything when reset)."""
+    with transaction.atomic():
+        if reset:
+            CoPurchase.objects.all().delete()
+            BookNeighbors.objects.update(baskets=0)
+        ids = item_ids.tolist()
+        current = dict(BookNeighbors.objects.filter(book_id__in=ids).values_list("book_id", "baskets")) if ids else {}
+        BookNeighbors.objects.bulk_create(
+            [
+                BookNeighbors(book_id=book_id, baskets=current.get(book_id, 0) + count)
+                for book_id, count in zip(ids, item_counts.tolist())
+            ],
+            update_conflicts=True,
+            unique_fields=["book"],
+            update_fields=["baskets"],
+            batch_size=WRITE_BATCH,
+        )
+        stored = {}
+        if not reset and len(pair_a):
+            for a, b, baskets in CoPurchase.objects.filter(book_a_id__in=set(pair_a.tolist())).values_list(
+                "book_a_id", "book_b_id", "baskets"
+            ):
+                stored[(a, b)] = baskets
+        CoPurchase.objects.bulk_create(
+            [
+                CoPurchase(book_a_id=a, book_b_id=b, baskets=stored.get((a, b), 0) + count)
+                for a, b, count in zip(pair_a.tolist(), pair_b.tolist(), pair_counts.tolist())
+            ],
+            update_conflicts=True,
+            unique_fields=["book_a", "book_b"],
+            update_fields=["baskets"],
+            batch_size=WRITE_BATCH,
+        )
+
+
+def _pairs(book_ids=None):
+    """Stored pairs as symmetric (src, dst, baskets) arrays, limited to rows touching book_ids if given."""
+    rows = CoPurchase.objects.all()
+    if book_ids is not None:
+        rows = rows.filter(Q(book_a_id__in=book_ids) | Q(book_b_id__in=book_ids))
+    data = np.array(list(rows.values_list("book_a_id", "book_b_id", "baskets").order_by()), dtype=np.int64)
+    if not len(data):
+        empty = np.empty(0, np.int64)
+        return empty, empty, empty
+    a, b, counts = data[:, 0], data[:, 1], data[:, 2]
+    return np.concatenate([a, b]), np.concatenate([b, a]), np.concatenate([counts, counts])
+
+
+def _copurchase_neighbors(src, dst, counts, book_ids, k):
+    """{book: [top-k partners]} ranked by baskets / sqrt(baskets_a * baskets_b), then raw count."""
+    if not len(src):
+        return {}
+    wanted = np.isin(src, np.fromiter(book_ids, dtype=np.int64)) if book_ids is not None else np.ones(len(src), bool)
+    src, dst, counts = src[wanted], dst[wanted], counts[wanted]
+    involved = np.unique(np.concatenate([src, dst]))
+    baskets = dict(BookNeighbors.objects.filter(book_id__in=involved.tolist()).values_list("book_id", "baskets"))
+    totals = np.array([max(baskets.get(book_id, 1), 1) for book_id in involved.tolist()], dtype=np.float64)
+    score = counts / np.sqrt(totals[np.searchsorted(involved, src)] * totals[np.searchsorted(involved, dst)])
+
+    order = np.lexsort((dst, -counts, -score, src))
+    src, dst = src[order], dst[order]
+    starts = np.flatnonzero(np.r_[True, src[1:] != src[:-1]])
+    rank = np.arange(len(src)) - np.repeat(starts, np.diff(np.r_[starts, len(src)]))
+    result = defaultdict(list)
+    for book_id, partner in zip(src[rank < k].tolist(), dst[rank < k].tolist()):
+        result[book_id].append(partner)
+    return result
+
+
+def _fallbacks(k):
+    """Best-viewed books per author and per category, to top up books with few co-purchases."""
+    by_author = defaultdict(list)
+    by_category = defaultdict(list)
+    rows = Book.objects.order_by("-views", "-id").values_list("id", "author_id", "category_id")
+    for book_id, author_id, category_id in rows:
+        if len(by_author[author_id]) <= k:
+            by_author[author_id].append(book_id)
+        if len(by_category[category_id]) <= k:
+            by_category[category_id].append(book_id)
+    return by_author, by_category
+
+
+def _neighbors(book_ids=None):
+    """{book id: related ids} for book_ids (all books when None)."""
+    k = _top_k()
+    src, dst, counts = _pairs(book_ids)
+    bought = _copurchase_neighbors(src, dst, counts, book_ids, k)
+    by_author, by_category = _fallbacks(k)
+    books = Book.objects.order_by()
+    if book_ids is not None:
+        books = books.filter(id__in=book_ids)
+    related = {}
+    for book_id, author_id, category_id in books.values_list("id", "author_id", "category_id"):
+        picked = list(bought.get(book_id, ()))
+        seen = {book_id, *picked}
+        for candidate in (*by_author[author_id], *by_category[category_id]):
+            if len(picked) >= k:
+                break
+            if candidate not in seen:
+                seen.add(candidate)
+                picked.append(candidate)
+        related[book_id] = picked
+    return related
+
+
+def _store_neighbors(related):
+    with transaction.atomic():
+        BookNeighbors.objects.bulk_create(
+            [BookNeighbors(book_id=book_id, related=ids) for book_id, ids in related.items()],
+            update_conflicts=True,
+            unique_fields=["book"],
+            update_fields=["related", "updated_at"],
+            batch_size=WRITE_BATCH,
+        )
+    items = list(related.items())
+    for start in range(0, len(items), WRITE_BATCH):
+        batch = items[start : start + WRITE_BATCH]
+        cache.set_many({RELATED_CACHE_KEY.format(book_id): ids for book_id, ids in batch}, RELATED_TTL)
+
+
+def build_recommendations(full=False):
+    """
+    Fold orders placed since the last run into the co-purchase counts and recompute the related lists of
+    the books whose scores moved (their baskets' books and those books' partners) plus books that have no
+    list yet. Full runs recount every order, which also drops canceled orders, and recompute every book.
+    Returns {"orders", "pairs", "books"}.
+    """
+    cutoff = timezone.now() - SETTLE_DELAY
+    last_order_id = Order.objects.filter(created_at__lte=cutoff).aggregate(last=Max("id"))["last"] or 0
+    watermark = JobWatermark.get(WATERMARK)
+    if watermark is None or watermark > last_order_id:
+        full = True
+    if full:
+        orders, books = _baskets(max_order_id=last_order_id)
+    else:
+        orders, books = _baskets(min_order_id=watermark, max_order_id=last_order_id)
+    item_ids, item_counts, pair_a, pair_b, pair_counts = basket_counts(orders, books)
+    with transaction.atomic():
+        _apply_counts(item_ids, item_counts, pair_a, pair_b, pair_counts, reset=full)
+        JobWatermark.put(WATERMARK, last_order_id)
+
+    if full:
+        related = _neighbors()
+    else:
+        touched = set(item_ids.tolist())
+        if touched:
+            _src, partners, _counts = _pairs(touched)
+            touched.update(partners.tolist())
+        touched.update(Book.objects.filter(neighbors__isnull=True).values_list("id", flat=True))
+        related = _neighbors(touched) if touched else {}
+    _store_neighbors(related)
+    return {"orders": len(np.unique(orders)), "pairs": len(pair_a), "books": len(related)}
+
+
+def related_ids(book_id):
+    """Related book ids for one book: one cache key, the table row on a miss."""
+    key = RELATED_CACHE_KEY.format(book_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = BookNeighbors.objects.filter(book_id=book_id).values_list("related", flat=True).first() or []
+        cache.set(key, ids, RELATED_TTL)
+    return ids
+
+
+def _books(ids):
+    books = Book.objects.select_related("author", "category").in_bulk(ids)
+    return [books[book_id] for book_id in ids if book_id in books]
+
+
+def related_books(book_id, limit=6):
+    return _books(related_ids(book_id)[:limit])
+
+
+def cart_related_books(book_ids, limit=6):
+    """Books bought with anything in the cart: lists merged by rank (earlier and shared ones first)."""
+    book_ids = [int(book_id) for book_id in book_ids]
+    if not book_ids:
+        return []
+    keys = {RELATED_CACHE_KEY.format(book_id): book_id for book_id in book_ids}
+    found = cache.get_many(list(keys))
+    missing = [book_id for key, book_id in keys.items() if key not in found]
+    if missing:
+        stored = dict(BookNeighbors.objects.filter(book_id__in=missing).values_list("book_id", "related"))
+        fetched = {RELATED_CACHE_KEY.format(book_id): stored.get(book_id, []) for book_id in missing}
+        cache.set_many(fetched, RELATED_TTL)
+        found.update(fetched)
+    k = _top_k()
+    scores = defaultdict(int)
+    in_cart = set(book_ids)
+    for ids in found.values():
+        for position, related_id in enumerate(ids):
+            if related_id not in in_cart:
+                scores[related_id] += k - position
+    ranked = sorted(scores, key=lambda related_id: (-scores[related_id], related_id))
+    return _books(ranked[:limit])
@@ -0,0 +1,186 @@
+from datetime import date
+from decimal import Decimal
+from textwrap import wrap
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from apps.orders.models import Order
+from apps.crm.models import Expense
+from apps.crm.utils.pdf import build_pdf
+from .datasets import DATASETS, stream_dataset
+from .periods import parse_report_period
+
+# Historic row caps of the PDF exports; CSV/XLSX are uncapped.
+PDF_ROW_LIMITS = {"orders": 2000, "sales": 4000, "report": 4000}
+
+
+def format_money(value) -> str:
+    try:
+        v = int(value)
+    except (TypeError, ValueError):
+        return str(value)
+    return f"{v:,}".replace(",", " ")
+
+
+def period_totals(period):
+    income_total = (
+        Order.objects.filter(created_at__gte=period["start_dt"], created_at__lte=period["end_dt"])
+        .aggregate(total=Sum("total_price"))
+        .get("total")
+        or Decimal("0")
+    )
+    expense_total = (
+        Expense.objects.filter(spent_on__gte=period["start_date"], spent_on__lte=period["end_date"])
+        .aggregate(total=Sum("amount"))
+        .get("total")
+        or Decimal("0")
+    )
+    return income_total, expense_total, income_total - expense_total
+
+
+def _generated_line() -> str:
+    return f"Yaratilgan: {timezone.localtime().strftime('%Y-%m-%d %H:%M')}"
+
+
+def _text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "Ha" if value else "Yo'q"
+    if isinstance(value, Decimal):
+        return format_money(value)
+    if isinstance(value, date):
+        return value.strftime("%Y-%m-%d")
+    return str(value)
+
+
+def _dataset_lines(name: str, title: str, params=None, limit=None):
+    dataset = DATASETS[name]
+    rows = [" | ".join(_text(value) for value in row) for row in dataset.rows(params, limit=limit)]
+    return [
+        f"BILIM UZ - {title}",
+        _generated_line(),
+        f"Jami: {len(rows)} qator",
+        "",
+        " | ".join(dataset.headers),
+        "-" * 90,
+        *rows,
+    ]
+
+
+def _table_lines(headers, widths, rows):
+    """Fixed-width table; long cells wrap onto continuation lines instead of being cut off."""
+
+    def _border() -> str:
+        return "-" * (sum(widths) + len(widths) + 1)
+
+    def _row(cols):
+        cells = [wrap(_text(col).strip(), max(width - 2, 1)) or [""] for col, width in zip(cols, widths)]
+        height = max(len(parts) for parts in cells)
+        for line_no in range(height):
+            yield "|" + "|".join(
+                f" {(parts[line_no] if line_no < len(parts) else '').ljust(max(width - 2, 1))} "
+                for parts, width in zip(cells, widths)
+            ) + "|"
+
+    lines = [_border(), *_row(headers), _border()]
+    for cols in rows:
+        lines.extend(_row(cols))
+    lines.append(_border())
+    return lines
+
+
+def orders_report_lines(params=None):
+    return _dataset_lines("orders", "Buyurtmalar tarixi", params, limit=PDF_ROW_LIMITS["orders"])
+
+
+def sales_report_lines(params=None):
+    return _dataset_lines("sales", "Xaridlar tarixi", params, limit=PDF_ROW_LIMITS["sales"])
+
+
+def combined_report_lines(params=None):
+    widths = [12, 8, 22, 40, 6, 16, 16, 18]
+    headers = ["Turi", "ID", "Mijoz", "Kitob", "Soni", "Tel", "Summa", "Status"]
+    rows = (
+        # sales row: order, date, title, barcode, qty, price, total, source, customer, phone, status
+        [row[7], f"#{row[0]}", row[8], row[2], row[4], row[9], row[6], row[10]]
+        for row in DATASETS["sales"].rows(params, limit=PDF_ROW_LIMITS["report"])
+    )
+    return [
+        "BILIM UZ - Hisobot (Buyurtmalar + Xaridlar)",
+        _generated_line(),
+        "",
+        *_table_lines(headers, widths, rows),
+    ]
+
+
+def monthly_report_lines(params=None):
+    period = parse_report_period(params or {})
+    income_total, expense_total, net_total = period_totals(period)
+    start_date, end_date = period["start_date"], period["end_date"]
+    lines = [
+        "BILIM UZ - Oylik hisobot",
+        f"Davr: {start_date:%Y-%m-%d} {period['start_time']:%H:%M} - {end_date:%Y-%m-%d} {period['end_time']:%H:%M}",
+        "",
+        f"Kirim (sotuv): {format_money(income_total)}",
+        f"Chiqim: {format_money(expense_total)}",
+        f"Qoldiq: {format_money(net_total)}",
+        "",
+        "Chiqimlar ro'yxati:",
+        "Sana | Sarlavha | Summa",
+        "-" * 60,
+    ]
+    expense_params = _monthly_params(params)
+    for spent_on, title, amount, _note in DATASETS["expenses"].rows(expense_params):
+        lines.append(f"{spent_on:%Y-%m-%d} | {title} | {format_money(amount)}")
+    return lines
+
+
+def _monthly_params(params):
+    """The monthly report always has a window (current month by default); pin it for the dataset filter."""
+    period = parse_report_period(params or {})
+    return {
+        **(params or {}),
+        "start": period["start_date"].isoformat(),
+        "end": period["end_date"].isoformat(),
+    }
+
+
+def inventory_report_lines(params=None):
+    return _dataset_lines("inventory", "Ombor yozuvlari", params)
+
+
+def expenses_report_lines(params=None):
+    return _dataset_lines("expenses", "Chiqimlar", params)
+
+
+def debts_report_lines(params=None):
+    return _dataset_lines("debts", "Qarzdorlar", params)
+
+
+# kind -> (label, file stem, PDF line builder, dataset behind CSV/XLSX).
+# The job runner and the download views share this table.
+REPORTS = {
+    "orders": ("Buyurtmalar", "bilimuz_orders", orders_report_lines, "orders"),
+    "sales": ("Xaridlar", "bilimuz_sales", sales_report_lines, "sales"),
+    "report": ("Hisobot", "bilimuz_report", combined_report_lines, "sales"),
+    "monthly": ("Oylik hisobot", "bilimuz_monthly_report", monthly_report_lines, "expenses"),
+    "inventory": ("Ombor yozuvlari", "bilimuz_inventory", inventory_report_lines, "inventory"),
+    "expenses": ("Chiqimlar", "bilimuz_expenses", expenses_report_lines, "expenses"),
+    "debts": ("Qarzdorlar", "bilimuz_debts", debts_report_lines, "debts"),
+}
+
+REPORT_FORMATS = ("pdf", "csv", "xlsx")
+
+
+def render_report(kind: str, params=None):
+    """Render one report to bytes in params["format"] (PDF by default). Returns (filename, bytes)."""
+    params = params or {}
+    _label, stem, builder, dataset = REPORTS[kind]
+    fmt = params.get("format") or "pdf"
+    if fmt == "pdf":
+        return f"{stem}.pdf", build_pdf(builder(params))
+    if kind == "monthly":
+        params = _monthly_params(params)
+    return f"{stem}.{fmt}", b"".join(stream_dataset(dataset, fmt, params))
@@ -0,0 +1,396 @@
+import re
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from django.db import connection
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.urls import reverse
+
+from apps.catalog.models import AboutPage, Author, Banner, Book, Category
+from apps.crm.models import Courier, Customer, Debt, Expense, InventoryLog, JobWatermark, SearchDocument
+from apps.crm.utils.phones import format_phone, normalize_phone
+from apps.orders.models import DeliveryNotice, DeliveryZone, Order
+from .reports import format_money
+
+REBUILD_BATCH = 1000
+# FTS5 trigram and pg_trgm only index 3-character windows; shorter queries use LIKE.
+MIN_INDEXED_QUERY = 3
+# JobWatermark set by a full rebuild_search_index. Until then the documents only cover rows saved since the
+# migration, so search reads the live tables instead.
+INDEX_READY = "search_index"
+
+_APOSTROPHES = re.compile(r"[‘’ʻʼ`´]")
+_SPACES = re.compile(r"\s+")
+_NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_text(*parts) -> str:
+    """Lowercase, unify Uzbek apostrophe variants (o‘, g‘) and collapse whitespace."""
+    text = " ".join(str(part) for part in parts if part not in (None, ""))
+    text = _APOSTROPHES.sub("'", text.casefold())
+    return _SPACES.sub(" ", text).strip()
+
+
+def _phone_text(raw, normalized):
+    # Digits of the E.164 form make "901234567" and "+998 90 123 45 67" match the same row.
+    return f"{raw or ''} {(normalized or '').lstrip('+')}"
+
+
+class SearchEntity:
+    """
+    How one model becomes a SearchDocument: the fields that matter, per-type limit, row builder, and the
+    lookups the live-table search runs before the index is built.
+    """
+
+    def __init__(self, key, model, fields, build, lookups, limit=10, queryset=None, dependents=None):
+        self.key = key
+        self.model = model
+        self.fields = set(fields)
+        self.lookups = lookups
+        self.build = build
+        self.limit = limit
+        self._queryset = queryset
+        self.dependents = dependents
+
+    def queryset(self):
+        if self._queryset:
+            return self._queryset()
+        return self.model.objects.all()
+
+    def document(self, obj):
+        title, subtitle, url, text, sort_at = self.build(obj)
+        return SearchDocument(
+            entity_type=self.key,
+            object_id=obj.pk,
+            title=(title or "")[:255],
+            subtitle=(subtitle or "")[:255],
+            url=url or "",
+            content=normalize_text(title, subtitle, text),
+            sort_at=sort_at,
+        )
+
+
+def _order(obj):
+    url = f"{reverse('crm_orders')}?{urlencode({'status': obj.status})}#order-{obj.pk}"
+    text = (
+        f"#{obj.pk} {_phone_text(obj.phone, obj.phone_normalized)} "
+        f"{obj.address} {obj.address_text} {obj.location} {obj.note}"
+    )
+    return f"#{obj.pk} · {obj.full_name}", format_phone(obj.phone_normalized, obj.phone), url, text, obj.created_at
+
+
+def _customer(obj):
+    url = reverse("crm_customer_detail", args=[obj.pk])
+    text = f"{_phone_text(obj.phone, obj.phone_normalized)} {obj.email} {obj.tags} {obj.notes}"
+    return obj.full_name, format_phone(obj.phone_normalized, obj.phone), url, text, obj.last_order_at or obj.created_at
+
+
+def _courier(obj):
+    url = f"{reverse('crm_couriers')}#courier-{obj.pk}"
+    normalized = normalize_phone(obj.phone)
+    text = f"{_phone_text(obj.phone, normalized)} {obj.telegram_username}"
+    return obj.name, format_phone(normalized, obj.phone), url, text, obj.created_at
+
+
+def _book(obj):
+    url = f"{reverse('crm_prices')}?{urlencode({'q': obj.barcode or obj.title})}"
+    author = obj.author.name if obj.author_id else ""
+    category = obj.category.name if obj.category_id else ""
+    return obj.title, author, url, f"{category} {obj.barcode or ''}", obj.created_at
+
+
+def _category(obj):
+    return obj.name, "", "", obj.slug, None
+
+
+def _author(obj):
+    return obj.name, "", f"{reverse('crm_prices')}?{urlencode({'q': obj.name})}", "", None
+
+
+def _expense(obj):
+    url = f"{reverse('crm_expenses')}#expense-{obj.pk}"
+    return obj.title, format_money(obj.amount), url, obj.note, obj.created_at
+
+
+def _debt(obj):
+    url = f"{reverse('crm_debts')}#debt-{obj.pk}"
+    text = f"{_phone_text(obj.phone, obj.phone_normalized)} {obj.note}"
+    return obj.full_name, format_money(obj.amount), url, text, obj.created_at
+
+
+def _inventory_log(obj):
+    return obj.book.title, f"{obj.delta:+d}", reverse("crm_inventory"), obj.note, obj.created_at
+
+
+def _delivery_notice(obj):
+    return obj.title, "", "", obj.body, obj.updated_at
+
+
+def _delivery_zone(obj):
+    return obj.name, "", "", obj.message, None
+
+
+def _banner(obj):
+    return obj.title or "Banner", "", obj.link, "", obj.created_at
+
+
+def _about_page(obj):
+    return obj.title, "", obj.link, obj.body, obj.updated_at
+
+
+# Registry order is the display order of result groups.
+ENTITIES = [
+    SearchEntity(
+        "orders",
+        Order,
+        ["full_name", "phone", "phone_normalized", "address", "address_text", "location", "note", "status"],
+        _order,
+        ["full_name", "phone", "address", "address_text", "location", "note"],
+        limit=30,
+    ),
+    SearchEntity(
+        "customers",
+        Customer,
+        ["full_name", "phone", "phone_normalized", "email", "tags", "notes"],
+        _customer,
+        ["full_name", "phone", "email", "tags", "notes"],
+        limit=30,
+    ),
+    SearchEntity("couriers", Courier, ["name", "phone", "telegram_username"], _courier, ["name", "phone", "telegram_username"]),
+    SearchEntity(
+        "books",
+        Book,
+        ["title", "barcode", "author", "category"],
+        _book,
+        ["title", "author__name", "category__name", "barcode"],
+        limit=30,
+        queryset=lambda: Book.objects.select_related("author", "category"),
+        dependents=lambda book: InventoryLog.objects.filter(book=book).select_related("book"),
+    ),
+    SearchEntity(
+        "categories",
+        Category,
+        ["name", "slug"],
+        _category,
+        ["name"],
+        dependents=lambda category: Book.objects.filter(category=category).select_related("author", "category"),
+    ),
+    SearchEntity(
+        "authors",
+        Author,
+        ["name"],
+        _author,
+        ["name"],
+        dependents=lambda author: Book.objects.filter(author=author).select_related("author", "category"),
+    ),
+    SearchEntity("expenses", Expense, ["title", "amount", "note"], _expense, ["title", "note"]),
+    SearchEntity(
+        "debts", Debt, ["full_name", "phone", "phone_normalized", "amount", "note"], _debt, ["full_name", "phone", "note"]
+    ),
+    SearchEntity(
+        "inventory_logs",
+        InventoryLog,
+        ["book", "delta", "note"],
+        _inventory_log,
+        ["book__title", "note"],
+        queryset=lambda: InventoryLog.objects.select_related("book"),
+    ),
+    SearchEntity("delivery_notices", DeliveryNotice, ["title", "body"], _delivery_notice, ["title", "body"]),
+    SearchEntity("delivery_zones", DeliveryZone, ["name", "message"], _delivery_zone, ["name", "message"]),
+    SearchEntity("banners", Banner, ["title", "link"], _banner, ["title"]),
+    SearchEntity("about_pages", AboutPage, ["title", "body"], _about_page, ["title", "body"]),
+]
+ENTITY_BY_KEY = {entity.key: entity for entity in ENTITIES}
+ENTITY_BY_MODEL = {entity.model: entity for entity in ENTITIES}
+
+
+def index_object(obj, update_fields=None):
+    """Upsert the document of one saved object (and of objects that embed its text)."""
+    entity = ENTITY_BY_MODEL.get(type(obj))
+    if entity is None:
+        return
+    # Stock/counter-only saves are the common case and don't change what is searchable.
+    if update_fields is not None and not (set(update_fields) & entity.fields):
+        return
+    doc = entity.document(obj)
+    SearchDocument.objects.update_or_create(
+        entity_type=doc.entity_type,
+        object_id=doc.object_id,
+        defaults={
+            "title": doc.title,
+            "subtitle": doc.subtitle,
+            "url": doc.url,
+            "content": doc.content,
+            "sort_at": doc.sort_at,
+        },
+    )
+    if entity.dependents:
+        reindex_queryset(entity.dependents(obj))
+
+
+def remove_object(obj):
+    entity = ENTITY_BY_MODEL.get(type(obj))
+    if entity is not None:
+        SearchDocument.objects.filter(entity_type=entity.key, object_id=obj.pk).delete()
+
+
+def index_objects(objs):
+    """Document freshly bulk-created objects (bulk_create sends no post_save)."""
+    by_entity = defaultdict(list)
+    for obj in objs:
+        entity = ENTITY_BY_MODEL.get(type(obj))
+        if entity is not None and obj.pk is not None:
+            by_entity[entity].append(entity.document(obj))
+    count = 0
+    for entity, docs in by_entity.items():
+        for start in range(0, len(docs), REBUILD_BATCH):
+            count += _replace_documents(entity, docs[start : start + REBUILD_BATCH])
+    return count
+
+
+def reindex_queryset(queryset):
+    """Replace the documents of every object in queryset, in batches."""
+    entity = ENTITY_BY_MODEL[queryset.model]
+    batch = []
+    count = 0
+    for obj in queryset.iterator(chunk_size=REBUILD_BATCH):
+        batch.append(entity.document(obj))
+        if len(batch) >= REBUILD_BATCH:
+            count += _replace_documents(entity, batch)
+            batch = []
+    if batch:
+        count += _replace_documents(entity, batch)
+    return count
+
+
+def _replace_documents(entity, docs):
+    SearchDocument.objects.filter(entity_type=entity.key, object_id__in=[doc.object_id for doc in docs]).delete()
+    SearchDocument.objects.bulk_create(docs)
+    return len(docs)
+
+
+def rebuild_search_index(keys=None):
+    """Rebuild documents from scratch. Returns {entity key: rows indexed}."""
+    counts = {}
+    for entity in ENTITIES:
+        if keys and entity.key not in keys:
+            continue
+        SearchDocument.objects.filter(entity_type=entity.key).delete()
+        counts[entity.key] = reindex_queryset(entity.queryset())
+    if not keys:
+        JobWatermark.put(INDEX_READY, sum(counts.values()))
+    return counts
+
+
+def normalize_query(query: str) -> str:
+    if normalize_phone(query):
+        return _NON_DIGITS.sub("", query)
+    return normalize_text(query)
+
+
+_FTS_STATE = {}
+
+
+def _fts_available() -> bool:
+    """Whether the migration managed to create the FTS5 table / pg_trgm extension (checked once per DB)."""
+    key = (connection.alias, str(connection.settings_dict.get("NAME")))
+    if key not in _FTS_STATE:
+        if connection.vendor == "sqlite":
+            sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'crm_searchdocument_fts'"
+        elif connection.vendor == "postgresql":
+            sql = "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+        else:
+            _FTS_STATE[key] = False
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            _FTS_STATE[key] = cursor.fetchone() is not None
+    return _FTS_STATE[key]
+
+
+def _limit_case():
+    return "CASE d.entity_type " + " ".join(f"WHEN '{e.key}' THEN {e.limit}" for e in ENTITIES) + " ELSE 10 END"
+
+
+def _ranked_documents(term):
+    """One query: full-text match, ranked, cut to each type's limit with ROW_NUMBER()."""
+    table = SearchDocument._meta.db_table
+    if connection.vendor == "sqlite":
+        sql = (
+            "SELECT * FROM ("
+            f" SELECT d.*, ROW_NUMBER() OVER (PARTITION BY d.entity_type ORDER BY f.rank, d.sort_at DESC) AS rn,"
+            f" {_limit_case()} AS type_limit"
+            f" FROM crm_searchdocument_fts f JOIN {table} d ON d.id = f.rowid"
+            " WHERE crm_searchdocument_fts MATCH %s"
+            ") WHERE rn <= type_limit"
+        )
+        params = ['"' + term.replace('"', '""') + '"']
+    else:
+        sql = (
+            "SELECT * FROM ("
+            " SELECT d.*, ROW_NUMBER() OVER ("
+            "  PARTITION BY d.entity_type ORDER BY similarity(d.content, %s) DESC, d.sort_at DESC NULLS LAST"
+            f" ) AS rn, {_limit_case()} AS type_limit"
+            f" FROM {table} d WHERE d.content ILIKE %s"
+            ") ranked WHERE rn <= type_limit"
+        )
+        escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params = [term, f"%{escaped}%"]
+    return list(SearchDocument.objects.raw(sql, params))
+
+
+def _like_documents(term):
+    ranked = (
+        SearchDocument.objects.filter(content__contains=term)
+        .annotate(
+            rn=Window(
+                RowNumber(),
+                partition_by=[F("entity_type")],
+                order_by=F("sort_at").desc(nulls_last=True),
+            )
+        )
+        .filter(rn__lte=max(entity.limit for entity in ENTITIES))
+    )
+    return [doc for doc in ranked if doc.rn <= ENTITY_BY_KEY[doc.entity_type].limit]
+
+
+def _live_documents(query):
+    """The pre-index search: icontains on each model's own columns, documents built on the fly."""
+    # A full phone number hits the normalized column exactly; fragments fall back to substring match.
+    phone = normalize_phone(query)
+    docs = []
+    for entity in ENTITIES:
+        condition = Q()
+        for lookup in entity.lookups:
+            if lookup == "phone" and phone and "phone_normalized" in entity.fields:
+                condition |= Q(phone_normalized=phone)
+            else:
+                condition |= Q(**{f"{lookup}__icontains": query})
+        for rn, obj in enumerate(entity.queryset().filter(condition).order_by("-pk")[: entity.limit], start=1):
+            doc = entity.document(obj)
+            doc.rn = rn
+            docs.append(doc)
+    return docs
+
+
+def search_documents(query: str):
+    """
+    Grouped results for the CRM search page: [(key, label, [SearchDocument, ...]), ...] in registry order,
+    every group present (possibly empty).
+    """
+    term = normalize_query(query or "")
+    grouped = {entity.key: [] for entity in ENTITIES}
+    if term:
+        if JobWatermark.get(INDEX_READY) is None:
+            docs = _live_documents(query.strip())
+        elif len(term) >= MIN_INDEXED_QUERY and _fts_available():
+            docs = _ranked_documents(term)
+        else:
+            docs = _like_documents(term)
+        for doc in docs:
+            grouped.setdefault(doc.entity_type, []).append(doc)
+        for docs in grouped.values():
+            docs.sort(key=lambda doc: doc.rn)
+    labels = dict(SearchDocument.ENTITY_CHOICES)
+    return [(entity.key, labels[entity.key], grouped[entity.key]) for entity in ENTITIES]
@@ -0,0 +1,177 @@
+import csv
+import io
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.catalog.models import Book
+from apps.catalog.signals import invalidate_book_list_caches
+from apps.crm.models import InventoryLog
+from .pos_index import mark_books_changed
+from .search import index_objects
+
+LOOKUP_CHUNK = 500
+WRITE_BATCH = 1000
+MAX_ERRORS = 200
+
+BARCODE_HEADERS = {"barcode", "shtrix-kod", "shtrix kod", "shtrixkod", "ean", "isbn"}
+COUNT_HEADERS = {"quantity", "qty", "count", "counted", "soni", "miqdor", "son"}
+
+
+class StocktakeError(ValueError):
+    pass
+
+
+def _clean_barcode(value) -> str:
+    return "".join(str(value or "").split())
+
+
+def parse_stocktake(uploaded):
+    """
+    Stream an uploaded count sheet line by line. Accepts a CSV with barcode/quantity columns (header optional)
+    or a plain list of scanned barcodes where every scan counts one copy. Returns (counts, errors).
+    """
+    text = io.TextIOWrapper(getattr(uploaded, "file", uploaded), encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        return _parse_lines(text)
+    finally:
+        # Leave the upload open for Django to clean up.
+        text.detach()
+
+
+def _parse_lines(text):
+    sample = text.readline()
+    if not sample:
+        raise StocktakeError("Fayl bo‘sh.")
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    counts = defaultdict(int)
+    errors = []
+
+    def _rows():
+        yield from csv.reader([sample], dialect)
+        yield from csv.reader(text, dialect)
+
+    barcode_col, count_col = 0, 1
+    for line_no, row in enumerate(_rows(), start=1):
+        cells = [cell.strip() for cell in row]
+        if not any(cells):
+            continue
+        if line_no == 1:
+            lowered = [cell.lower() for cell in cells]
+            if any(cell in BARCODE_HEADERS for cell in lowered):
+                barcode_col = next(i for i, cell in enumerate(lowered) if cell in BARCODE_HEADERS)
+                count_col = next((i for i, cell in enumerate(lowered) if cell in COUNT_HEADERS), None)
+                continue
+        barcode = _clean_barcode(cells[barcode_col] if barcode_col < len(cells) else "")
+        if not barcode:
+            _error(errors, line_no, "Shtrix-kod yo‘q")
+            continue
+        raw_count = cells[count_col] if count_col is not None and count_col < len(cells) else ""
+        if not raw_count:
+            counts[barcode] += 1
+            continue
+        try:
+            quantity = int(raw_count.replace(" ", ""))
+        except ValueError:
+            _error(errors, line_no, f"Noto‘g‘ri son: {raw_count}")
+            continue
+        if quantity < 0:
+            _error(errors, line_no, f"Manfiy son: {quantity}")
+            continue
+        counts[barcode] += quantity
+    return dict(counts), errors
+
+
+def _error(errors, line_no, message):
+    if len(errors) < MAX_ERRORS:
+        errors.append([line_no, message])
+
+
+def _books_by_barcode(barcodes, lock=False):
+    """Resolve barcodes in chunks of one IN query each."""
+    barcodes = list(barcodes)
+    found = {}
+    for start in range(0, len(barcodes), LOOKUP_CHUNK):
+        qs = Book.objects.filter(barcode__in=barcodes[start : start + LOOKUP_CHUNK]).only(
+            "id", "title", "barcode", "stock_quantity", "category_id"
+        )
+        if lock:
+            qs = qs.select_for_update()
+        for book in qs:
+            found[book.barcode] = book
+    return found
+
+
+def preview_stocktake(stocktake):
+    """Diff of counted vs current stock: {"changes": [...], "unchanged": n, "unknown": [...]}."""
+    books = _books_by_barcode(stocktake.counts)
+    changes = []
+    unchanged = 0
+    for barcode, counted in stocktake.counts.items():
+        book = books.get(barcode)
+        if book is None:
+            continue
+        current = book.stock_quantity or 0
+        if counted == current:
+            unchanged += 1
+            continue
+        changes.append(
+            {
+                "book_id": book.id,
+                "title": book.title,
+                "barcode": barcode,
+                "current": current,
+                "counted": counted,
+                "delta": counted - current,
+            }
+        )
+    changes.sort(key=lambda row: (-abs(row["delta"]), row["title"]))
+    unknown = sorted(barcode for barcode in stocktake.counts if barcode not in books)
+    return {"changes": changes, "unchanged": unchanged, "unknown": unknown}
+
+
+def apply_stocktake(stocktake):
+    """
+    Set every counted book's stock to the counted quantity in one transaction: rows are locked and deltas
+    recomputed against the locked stock (the preview may be stale), then one bulk_update for the books and one
+    bulk_create of InventoryLog rows. Storefront caches are invalidated once, after commit.
+    """
+    with transaction.atomic():
+        locked = type(stocktake).objects.select_for_update().get(pk=stocktake.pk)
+        if locked.status != "draft":
+            raise StocktakeError("Bu inventarizatsiya allaqachon yakunlangan.")
+        books = _books_by_barcode(locked.counts, lock=True)
+        note = f"Inventarizatsiya #{locked.id}" + (f": {locked.note}" if locked.note else "")
+        changed = []
+        logs = []
+        for barcode, counted in locked.counts.items():
+            book = books.get(barcode)
+            if book is None or counted == (book.stock_quantity or 0):
+                continue
+            delta = counted - (book.stock_quantity or 0)
+            book.stock_quantity = counted
+            changed.append(book)
+            logs.append(InventoryLog(book=book, delta=delta, reason="stocktake", note=note[:255]))
+        Book.objects.bulk_update(changed, ["stock_quantity"], batch_size=WRITE_BATCH)
+        created = InventoryLog.objects.bulk_create(logs, batch_size=WRITE_BATCH)
+        index_objects(created)
+
+        locked.status = "applied"
+        locked.applied_at = timezone.now()
+        locked.summary = {
+            "changed": len(changed),
+            "unchanged": len(books) - len(changed),
+            "unknown": len(locked.counts) - len(books),
+            "delta_total": sum(log.delta for log in logs),
+        }
+        locked.save(update_fields=["status", "applied_at", "summary"])
+        category_ids = {book.category_id for book in changed}
+        book_ids = [book.id for book in changed]
+        if book_ids:
+            transaction.on_commit(lambda: invalidate_book_list_caches(category_ids))
+            transaction.on_commit(lambda: mark_books_changed(book_ids))
+    return locked
@@ -1,36 +1,87 @@
 from django.db import transaction
-from django.db.models import Sum
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 
-from apps.orders.models import Order, OrderItem
-from .models import Customer
+from apps.catalog.models import Book
+from apps.orders.models import Order
+from .services.customers import apply_customer_delta, order_contribution, upsert_customer_for_order
+from .services.pos_index import INDEXED_FIELDS, mark_books_changed
+from .services.search import ENTITIES, index_object, remove_object
+
+
+def _metrics_state(instance: Order):
+    # Read via __dict__ so deferred fields (e.g. .only("id")) don't trigger extra queries.
+    data = instance.__dict__
+    if "phone" not in data or "status" not in data or "total_price" not in data:
+        return None
+    return data["phone"], data["status"], data["total_price"]
+
+
+@receiver(post_init, sender=Order)
+def remember_order_metrics_state(sender, instance: Order, **kwargs):
+    """Snapshot what this order currently contributes so saves can apply only the difference."""
+    instance._crm_metrics_state = _metrics_state(instance)
 
 
 @receiver(post_save, sender=Order)
-def sync_customer_metrics(sender, instance: Order, created: bool, **kwargs):
+def track_customer_metrics(sender, instance: Order, created: bool, **kwargs):
     """
-    Keep basic CRM metrics in sync when an order is created.
+    Keep CRM customer metrics current with F() increments inside the order's transaction,
+    instead of re-aggregating every order of the phone number.
     """
-    if not created:
+    new_state = _metrics_state(instance)
+    if created:
+        upsert_customer_for_order(instance)
+        instance._crm_metrics_state = new_state
+        return
+
+    old_state = getattr(instance, "_crm_metrics_state", None)
+    if old_state is None or new_state is None or old_state == new_state:
+        instance._crm_metrics_state = new_state
+        return
+
+    old_phone, old_status, old_total = old_state
+    new_phone, new_status, new_total = new_state
+    old_count, old_amount = order_contribution(old_status, old_total)
+    new_count, new_amount = order_contribution(new_status, new_total)
+    if old_phone == new_phone:
+        apply_customer_delta(new_phone, new_count - old_count, new_amount - old_amount)
+    else:
+        apply_customer_delta(old_phone, -old_count, -old_amount)
+        apply_customer_delta(new_phone, new_count, new_amount, last_order_at=instance.created_at)
+    instance._crm_metrics_state = new_state
+
+
+@receiver(post_delete, sender=Order)
+def drop_customer_metrics(sender, instance: Order, **kwargs):
+    state = getattr(instance, "_crm_metrics_state", None)
+    if state is None:
         return
+    phone, status, total = state
+    count, amount = order_contribution(status, total)
+    apply_customer_delta(phone, -count, -amount)
 
-    def _update_customer():
-        if not instance.phone:
-            return
-        customer, _ = Customer.objects.get_or_create(
-            phone=instance.phone,
-            defaults={"full_name": instance.full_name or instance.phone},
-        )
-        if instance.full_name and instance.full_name != customer.full_name:
-            customer.full_name = instance.full_name
-        total_spent = (
-            Order.objects.filter(phone=instance.phone).aggregate(total=Sum("total_price")).get("total") or 0
-        )
-        orders_count = Order.objects.filter(phone=instance.phone).count()
-        customer.total_spent = total_spent
-        customer.orders_count = orders_count
-        customer.last_order_at = instance.created_at
-        customer.save(update_fields=["full_name", "total_spent", "orders_count", "last_order_at"])
-
-    transaction.on_commit(_update_customer)
+
+def update_search_document(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Keep the CRM search index in step with every searchable model (runs in the saving transaction)."""
+    if raw:
+        return
+    index_object(instance, update_fields=update_fields)
+
+
+def delete_search_document(sender, instance, **kwargs):
+    remove_object(instance)
+
+
+for _entity in ENTITIES:
+    post_save.connect(update_search_document, sender=_entity.model, dispatch_uid=f"crm_search_save_{_entity.key}")
+    post_delete.connect(delete_search_document, sender=_entity.model, dispatch_uid=f"crm_search_delete_{_entity.key}")
+
+
+@receiver([post_save, post_delete], sender=Book)
+def refresh_pos_index(sender, instance, update_fields=None, **kwargs):
+    """Tell every process's POS index to reload this book once the write is committed."""
+    if update_fields is not None and not INDEXED_FIELDS.intersection(update_fields):
+        return
+    book_id = instance.id
+    transaction.on_commit(lambda: mark_books_changed([book_id]))
@@ -1,7 +1,7 @@
-import re
-
 from django import template
 
+from apps.crm.utils.phones import format_phone, normalize_phone
+
 register = template.Library()
 
 
@@ -28,13 +28,19 @@ def field_value(obj, field):
 
 
 @register.filter
-def phone(value):
+def phone(value, fallback=""):
+    """
+    Display a phone. Pass the precomputed phone_normalized with the raw phone as fallback
+    ({{ order.phone_normalized|phone:order.phone }}); raw values are normalized on the fly.
+    """
     raw = "" if value is None else str(value).strip()
     if not raw:
-        return ""
-    digits = re.sub(r"\D", "", raw)
-    if len(digits) == 12 and digits.startswith("998"):
-        return f"+{digits[:3]} {digits[3:5]} {digits[5:8]} {digits[8:10]} {digits[10:12]}"
-    if len(digits) == 9:
-        return f"+998 {digits[:2]} {digits[2:5]} {digits[5:7]} {digits[7:9]}"
-    return raw
+        return _normalize_and_format(fallback)
+    if raw.startswith("+") and raw[1:].isdigit():
+        return format_phone(raw)
+    return _normalize_and_format(raw)
+
+
+def _normalize_and_format(value):
+    raw = "" if value is None else str(value).strip()
+    return format_phone(normalize_phone(raw), fallback=raw)
@@ -0,0 +1,1241 @@
+import json
+import re
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from xml.etree import ElementTree
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import Max
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.catalog.images import backfill_variants, stale_images, variants_for
+from apps.catalog.models import Author, Book, Category
+from apps.orders.models import Order, OrderItem
+from apps.sync.models import Change, Customer as SyncCustomer, Product, Sale, SaleItem
+
+from .models import (
+    BookNeighbors,
+    CatalogImport,
+    CoPurchase,
+    Customer,
+    Debt,
+    Expense,
+    ExportJob,
+    InventoryLog,
+    JobWatermark,
+    OfflineSale,
+    SalesDay,
+    SearchDocument,
+    StockSnapshot,
+    Stocktake,
+)
+from .services.datasets import stream_dataset
+from .services.export_jobs import claim_next_job, enqueue_export, purge_expired_exports, run_export_job
+from .services.catalog_import import claim_next_import, iter_rows, run_import
+from .services.customers import merge_duplicate_customers
+from .services import pos_index
+from .services.forecast import REFRESHED_CACHE_KEY, STATS_CACHE_KEY, refresh_sales_days, reorder_report, velocity_stats
+from .services.offline_sales import import_offline_sales
+from .services.labels import book_labels, label_stream, restock_labels
+from .services.ledger import reconcile_stock, stock_at, take_snapshots, valuation_at
+from .services.price_grid import parse_grid, save_price_grid
+from .services.recommendations import basket_counts, build_recommendations, cart_related_books, related_ids
+from .services.reports import render_report
+from .services.search import ENTITY_BY_KEY, INDEX_READY, rebuild_search_index, search_documents
+from .services.stocktake import StocktakeError, apply_stocktake, parse_stocktake, preview_stocktake
+from .templatetags.crm_extras import phone as phone_filter
+from .utils.phones import normalize_phone
+from .utils.labels import Label, build_label_pdf, ean13_bars, ean13_bits
+from .utils.xlsx import stream_xlsx
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.user = get_user_model().objects.create_user(username="staff", password="pass1234", is_staff=True)
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_identical_requests_share_one_job(self):
+        job1, created1 = enqueue_export(["sales", "orders"], {}, user=self.user)
+        job2, created2 = enqueue_export(["orders", "sales", "unknown"], {"ignored": "x"}, user=self.user)
+        self.assertTrue(created1)
+        self.assertFalse(created2)
+        self.assertEqual(job1.id, job2.id)
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+    def test_different_params_create_new_job(self):
+        enqueue_export(["monthly"], {"start": "2025-01-01"})
+        _job, created = enqueue_export(["monthly"], {"start": "2025-02-01"})
+        self.assertTrue(created)
+
+    def test_run_job_bundles_zip(self):
+        Expense.objects.create(title="Ijara", amount=100000)
+        enqueue_export(["orders", "monthly"], {})
+        job = run_export_job(claim_next_job(), workers=1)
+        self.assertEqual(job.status, "done")
+        self.assertEqual(job.progress, 100)
+        self.assertTrue(job.is_ready)
+        with job.file.open("rb") as fh, zipfile.ZipFile(fh) as archive:
+            self.assertEqual(
+                sorted(archive.namelist()),
+                ["bilimuz_monthly_report.pdf", "bilimuz_orders.pdf"],
+            )
+        # A finished artifact is reused until it expires.
+        again, created = enqueue_export(["orders", "monthly"], {})
+        self.assertFalse(created)
+        self.assertEqual(again.id, job.id)
+
+    def test_stale_running_job_is_failed_and_unblocks_identical_requests(self):
+        job, _created = enqueue_export(["orders"], {})
+        self.assertEqual(claim_next_job().id, job.id)
+        ExportJob.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(hours=2))
+        again, created = enqueue_export(["orders"], {})
+        self.assertTrue(created)
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(claim_next_job().id, again.id)
+
+    def test_purge_expired(self):
+        enqueue_export(["orders"], {})
+        job = run_export_job(claim_next_job(), workers=1)
+        self.assertEqual(purge_expired_exports(now=job.expires_at + timedelta(seconds=1)), 1)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_status_and_download_views(self):
+        self.client.force_login(self.user)
+        resp = self.client.post("/export/jobs/", {"reports": ["orders"]}, HTTP_X_REQUESTED_WITH="XMLHttpRequest", secure=True)
+        self.assertEqual(resp.status_code, 202)
+        job_id = resp.json()["id"]
+        self.assertIsNone(resp.json()["download_url"])
+        run_export_job(claim_next_job(), workers=1)
+        status = self.client.get(f"/export/jobs/{job_id}/status/", secure=True).json()
+        self.assertEqual(status["status"], "done")
+        download = self.client.get(status["download_url"], secure=True)
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(b"".join(download.streaming_content).startswith(b"%PDF"))
+        ExportJob.objects.filter(id=job_id).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.client.get(status["download_url"], secure=True).status_code, 404)
+
+
+class DatasetExportTests(TestCase):
+    def setUp(self):
+        Expense.objects.create(title='Ijara, "markaz"', amount=Decimal("1500000"), note="a" * 300)
+        Debt.objects.create(full_name="Ali", phone="+998901234567", amount=Decimal("50000"), paid_amount=Decimal("20000"))
+
+    def test_csv_keeps_full_values(self):
+        body = b"".join(stream_dataset("expenses", "csv")).decode("utf-8-sig")
+        lines = body.splitlines()
+        self.assertEqual(lines[0], "Sana,Sarlavha,Summa,Izoh")
+        self.assertIn('"Ijara, ""markaz"""', lines[1])
+        self.assertIn("a" * 300, lines[1])
+
+    def test_xlsx_is_valid_workbook(self):
+        data = b"".join(stream_dataset("debts", "xlsx"))
+        with zipfile.ZipFile(BytesIO(data)) as archive:
+            self.assertIn("xl/workbook.xml", archive.namelist())
+            sheet = ElementTree.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+        ns = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+        rows = sheet.findall(".//m:row", ns)
+        self.assertEqual(len(rows), 2)
+        values = [c.findtext("m:v", namespaces=ns) for c in rows[1].findall("m:c", ns)]
+        self.assertIn("30000.00", values)
+
+    def test_job_can_render_spreadsheet(self):
+        filename, data = render_report("monthly", {"format": "xlsx"})
+        self.assertEqual(filename, "bilimuz_monthly_report.xlsx")
+        self.assertTrue(data.startswith(b"PK"))
+
+    def test_streaming_view(self):
+        user = get_user_model().objects.create_user(username="staff", password="pass1234", is_staff=True)
+        self.client.force_login(user)
+        resp = self.client.get("/export/data/expenses.csv", secure=True)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertIn("Ijara", b"".join(resp.streaming_content).decode("utf-8-sig"))
+        self.assertEqual(self.client.get("/export/data/nope.csv", secure=True).status_code, 404)
+
+
+class CustomerMetricsTests(TestCase):
+    def _order(self, total, phone="+998901234567", **extra):
+        return Order.objects.create(full_name="Ali", phone=phone, address="-", total_price=Decimal(total), **extra)
+
+    def test_orders_increment_one_customer(self):
+        first = self._order("100")
+        self._order("50")
+        customer = Customer.objects.get(phone="+998901234567")
+        self.assertEqual(customer.orders_count, 2)
+        self.assertEqual(customer.total_spent, Decimal("150"))
+        first.refresh_from_db()
+        self.assertEqual(first.customer_id, customer.id)
+
+    def test_status_and_total_changes_apply_deltas(self):
+        order = self._order("100")
+        self._order("40")
+        order.total_price = Decimal("120")
+        order.save(update_fields=["total_price"])
+        customer = Customer.objects.get(phone="+998901234567")
+        self.assertEqual((customer.orders_count, customer.total_spent), (2, Decimal("160")))
+
+        order.status = "canceled"
+        order.save()
+        customer.refresh_from_db()
+        self.assertEqual((customer.orders_count, customer.total_spent), (1, Decimal("40")))
+
+        order.status = "new"
+        order.save()
+        customer.refresh_from_db()
+        self.assertEqual((customer.orders_count, customer.total_spent), (2, Decimal("160")))
+
+        order.delete()
+        customer.refresh_from_db()
+        self.assertEqual((customer.orders_count, customer.total_spent), (1, Decimal("40")))
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        self._order("100")
+        Customer.objects.filter(phone="+998901234567").update(orders_count=7, total_spent=Decimal("1"))
+        out = StringIO()
+        call_command("reconcile_customer_metrics", stdout=out)
+        self.assertIn("7 -> 1", out.getvalue())
+        self.assertEqual(Customer.objects.get().orders_count, 7)
+
+        call_command("reconcile_customer_metrics", "--apply", stdout=StringIO())
+        customer = Customer.objects.get()
+        self.assertEqual((customer.orders_count, customer.total_spent), (1, Decimal("100")))
+
+
+class PhoneNormalizationTests(TestCase):
+    def test_normalize_variants(self):
+        for raw in ("+998 90 123 45 67", "901234567", "(90) 123-45-67", "998901234567", "00998901234567"):
+            self.assertEqual(normalize_phone(raw), "+998901234567", raw)
+        self.assertEqual(normalize_phone("POS"), "")
+        self.assertEqual(normalize_phone(""), "")
+        self.assertEqual(phone_filter("+998901234567"), "+998 90 123 45 67")
+        self.assertEqual(phone_filter("", "POS"), "POS")
+
+    def test_differently_typed_phones_share_one_customer(self):
+        Order.objects.create(full_name="Ali", phone="+998 90 123 45 67", address="-", total_price=Decimal("10"))
+        order = Order.objects.create(full_name="Ali", phone="901234567", address="-", total_price=Decimal("5"))
+        self.assertEqual(order.phone_normalized, "+998901234567")
+        customer = Customer.objects.get()
+        self.assertEqual(customer.phone_normalized, "+998901234567")
+        self.assertEqual((customer.orders_count, customer.total_spent), (2, Decimal("15")))
+        debt = Debt.objects.create(full_name="Ali", phone="90 123 45 67", amount=Decimal("1"))
+        self.assertEqual(debt.phone_normalized, "+998901234567")
+
+    def test_merge_duplicates(self):
+        keeper = Customer.objects.create(full_name="Ali", phone="+998901234567", orders_count=3, total_spent=Decimal("30"))
+        dup = Customer.objects.create(full_name="Ali V.", phone="x", orders_count=1, total_spent=Decimal("5"), is_vip=True)
+        # Simulate a legacy row written before normalization existed.
+        Customer.objects.filter(pk=dup.pk).update(phone="90 123 45 67", phone_normalized=None)
+        Order.objects.filter(pk=Order.objects.create(full_name="A", phone="POS", address="-").pk).update(customer=dup)
+
+        merged = merge_duplicate_customers()
+        self.assertEqual(merged, {"+998901234567": [dup.pk]})
+        keeper.refresh_from_db()
+        self.assertEqual((keeper.orders_count, keeper.total_spent, keeper.is_vip), (4, Decimal("35"), True))
+        self.assertFalse(Customer.objects.filter(pk=dup.pk).exists())
+        self.assertEqual(Order.objects.get(phone="POS").customer_id, keeper.pk)
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(name="Abdulla Qodiriy")
+        self.category = Category.objects.create(name="Roman")
+        self.book = Book.objects.create(
+            title="O‘tkan kunlar",
+            category=self.category,
+            author=self.author,
+            purchase_price=Decimal("10000"),
+            sale_price=Decimal("15000"),
+        )
+        Order.objects.create(full_name="Jasur", phone="+998 90 123 45 67", address="Chilonzor", total_price=Decimal("1"))
+        JobWatermark.put(INDEX_READY, 0)
+
+    def _groups(self, query):
+        return {key: docs for key, _label, docs in search_documents(query)}
+
+    def test_signals_index_and_search_groups(self):
+        groups = self._groups("o'tkan")
+        self.assertEqual([doc.title for doc in groups["books"]], ["O‘tkan kunlar"])
+        self.assertEqual(groups["orders"], [])
+
+        groups = self._groups("901234567")
+        self.assertEqual(len(groups["orders"]), 1)
+        self.assertEqual(len(groups["customers"]), 1)
+        self.assertIn("/customers/", groups["customers"][0].url)
+
+        # Short queries bypass the trigram index but still work.
+        self.assertEqual(len(self._groups("ja")["orders"]), 1)
+
+    def test_dependent_and_deleted_documents(self):
+        self.author.name = "A. Qodiriy"
+        self.author.save()
+        self.assertEqual(self._groups("a. qodiriy")["books"][0].subtitle, "A. Qodiriy")
+
+        stock_only = SearchDocument.objects.get(entity_type="books").updated_at
+        self.book.stock_quantity = 5
+        self.book.save(update_fields=["stock_quantity"])
+        self.assertEqual(SearchDocument.objects.get(entity_type="books").updated_at, stock_only)
+
+        self.book.delete()
+        self.assertFalse(SearchDocument.objects.filter(entity_type="books").exists())
+
+    def test_per_type_limit_and_rebuild(self):
+        limit = ENTITY_BY_KEY["orders"].limit
+        for idx in range(limit + 5):
+            Order.objects.create(full_name=f"Limit {idx}", phone="POS", address="-")
+        self.assertEqual(len(self._groups("limit")["orders"]), limit)
+
+        SearchDocument.objects.all().delete()
+        counts = rebuild_search_index()
+        self.assertEqual(counts["orders"], limit + 6)
+        self.assertEqual(len(self._groups("chilonzor")["orders"]), 1)
+
+    def test_live_tables_until_the_index_is_built(self):
+        JobWatermark.objects.filter(name=INDEX_READY).delete()
+        SearchDocument.objects.all().delete()
+        groups = self._groups("Chilonzor")
+        self.assertEqual([doc.title for doc in groups["orders"]], [f"#{Order.objects.get().pk} · Jasur"])
+        self.assertEqual(len(self._groups("+998901234567")["customers"]), 1)
+        self.assertEqual([doc.subtitle for doc in self._groups("roman")["books"]], ["Abdulla Qodiriy"])
+
+        rebuild_search_index(["books"])
+        self.assertIsNone(JobWatermark.get(INDEX_READY))
+        rebuild_search_index()
+        self.assertIsNotNone(JobWatermark.get(INDEX_READY))
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(name="Muallif")
+        category = Category.objects.create(name="Tarix")
+        self.book = Book.objects.create(
+            title="Kitob",
+            category=category,
+            author=author,
+            purchase_price=Decimal("1000"),
+            sale_price=Decimal("1500"),
+            stock_quantity=10,
+        )
+        self.t0 = timezone.now() - timedelta(days=10)
+        Book.objects.filter(pk=self.book.pk).update(created_at=self.t0 - timedelta(days=1))
+
+    def _move(self, delta, when):
+        self.book.stock_quantity += delta
+        self.book.save(update_fields=["stock_quantity"])
+        log = InventoryLog.objects.create(book=self.book, delta=delta, reason="adjust")
+        InventoryLog.objects.filter(pk=log.pk).update(created_at=when)
+
+    def test_stock_at_date_from_snapshot_plus_deltas(self):
+        self._move(-2, self.t0 - timedelta(days=1))
+        self._move(-3, self.t0 + timedelta(days=2))
+        # Backdated opening snapshot: live stock (5) with the later -3 rolled back.
+        self.assertEqual(take_snapshots(self.t0), 1)
+        snapshot = StockSnapshot.objects.get()
+        self.assertEqual((snapshot.quantity, snapshot.is_opening, snapshot.value), (8, True, Decimal("8000")))
+
+        self.assertEqual(stock_at(self.t0)[self.book.id], 8)
+        self.assertEqual(stock_at(self.t0 + timedelta(days=3))[self.book.id], 5)
+        self.assertEqual(stock_at(self.t0 - timedelta(days=2))[self.book.id], 10)
+        _rows, total = valuation_at(self.t0 + timedelta(days=3))
+        self.assertEqual(total, Decimal("5000"))
+
+        take_snapshots(self.t0 + timedelta(days=5))
+        carried = StockSnapshot.objects.order_by("-taken_at").first()
+        self.assertEqual((carried.quantity, carried.is_opening), (5, False))
+
+    def test_reconcile_flags_unlogged_stock_changes(self):
+        take_snapshots()
+        self._move(-1, timezone.now())
+        self.assertEqual(reconcile_stock(), [])
+        Book.objects.filter(pk=self.book.pk).update(stock_quantity=42)
+        drifted = reconcile_stock()
+        self.assertEqual([(book.id, qty) for book, qty in drifted], [(self.book.id, 9)])
+
+
+class StocktakeTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(name="Muallif")
+        category = Category.objects.create(name="Tarix")
+        self.books = [
+            Book.objects.create(
+                title=f"Kitob {idx}",
+                category=category,
+                author=author,
+                purchase_price=Decimal("1000"),
+                sale_price=Decimal("1500"),
+                stock_quantity=5,
+                barcode=f"200000000{idx:03d}",
+            )
+            for idx in range(3)
+        ]
+
+    def test_parse_csv_with_header_and_scan_list(self):
+        csv_file = SimpleUploadedFile("count.csv", "Shtrix-kod;Soni\n200000000000;7\n200000000001;x\n\n200000000000;1\n".encode())
+        counts, errors = parse_stocktake(csv_file)
+        self.assertEqual(counts, {"200000000000": 8})
+        self.assertEqual(errors, [[3, "Noto‘g‘ri son: x"]])
+
+        scans = SimpleUploadedFile("scan.txt", b"200000000001\n200000000001\n999\n")
+        counts, _errors = parse_stocktake(scans)
+        self.assertEqual(counts, {"200000000001": 2, "999": 1})
+
+        with self.assertRaises(StocktakeError):
+            parse_stocktake(SimpleUploadedFile("empty.csv", b""))
+
+    def test_preview_then_apply_in_bulk(self):
+        stocktake = Stocktake.objects.create(counts={"200000000000": 8, "200000000001": 5, "200000000002": 2, "404": 1})
+        preview = preview_stocktake(stocktake)
+        self.assertEqual([(row["barcode"], row["delta"]) for row in preview["changes"]], [("200000000000", 3), ("200000000002", -3)])
+        self.assertEqual((preview["unchanged"], preview["unknown"]), (1, ["404"]))
+
+        applied = apply_stocktake(stocktake)
+        self.assertEqual(applied.summary, {"changed": 2, "unchanged": 1, "unknown": 1, "delta_total": 0})
+        self.assertEqual(
+            list(Book.objects.order_by("barcode").values_list("stock_quantity", flat=True)),
+            [8, 5, 2],
+        )
+        logs = InventoryLog.objects.filter(reason="stocktake").order_by("delta")
+        self.assertEqual([log.delta for log in logs], [-3, 3])
+        self.assertEqual(SearchDocument.objects.filter(entity_type="inventory_logs").count(), 2)
+        with self.assertRaises(StocktakeError):
+            apply_stocktake(stocktake)
+
+    def test_upload_view_creates_draft(self):
+        user = get_user_model().objects.create_user(username="boss", password="pass1234", is_staff=True, is_superuser=True)
+        self.client.force_login(user)
+        upload = SimpleUploadedFile("scan.txt", b"200000000000\n")
+        response = self.client.post("/inventory/stocktake/", {"file": upload, "note": "test"}, HTTP_HOST="localhost")
+        stocktake = Stocktake.objects.get()
+        self.assertRedirects(response, f"/inventory/stocktake/{stocktake.id}/", fetch_redirect_response=False)
+        self.assertEqual(stocktake.counts, {"200000000000": 1})
+        self.assertContains(self.client.get(f"/inventory/stocktake/{stocktake.id}/", HTTP_HOST="localhost"), "-4")
+        self.client.post(f"/inventory/stocktake/{stocktake.id}/", {"action": "apply"}, HTTP_HOST="localhost")
+        self.assertEqual(Book.objects.get(barcode="200000000000").stock_quantity, 1)
+
+
+@override_settings(REORDER_HISTORY_DAYS=10, REORDER_LEAD_TIME_DAYS=2, REORDER_COVER_DAYS=5)
+class ReorderForecastTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = Author.objects.create(name="Muallif")
+        category = Category.objects.create(name="Tarix")
+        self.fast, self.slow = [
+            Book.objects.create(
+                title=title,
+                category=category,
+                author=author,
+                purchase_price=Decimal("1000"),
+                sale_price=Decimal("1500"),
+                stock_quantity=stock,
+                barcode=barcode,
+            )
+            for title, stock, barcode in (("Tez", 4, "300000000001"), ("Sekin", 50, "300000000002"))
+        ]
+        self.today = timezone.now()
+
+    def _sell(self, book, quantity, days_ago, status="new"):
+        order = Order.objects.create(full_name="Ali", phone="901234567", address="-", status=status)
+        OrderItem.objects.create(order=order, book=book, quantity=quantity, price=Decimal("1500"))
+        Order.objects.filter(pk=order.pk).update(created_at=self.today - timedelta(days=days_ago))
+
+    def test_velocity_from_orders_and_offline_sales(self):
+        for days_ago in range(10):
+            self._sell(self.fast, 2, days_ago)
+        self._sell(self.fast, 100, 1, status="canceled")
+        self._sell(self.slow, 1, 3)
+        product = Product.objects.create(name="Tez", barcode="300000000001")
+        sale = Sale.objects.create(sale_datetime=self.today - timedelta(days=2), payment_type="cash")
+        SaleItem.objects.create(sale=sale, product=product, quantity=10)
+        # Till sales reach the forecast as imported POS orders, counted once.
+        import_offline_sales()
+        Book.objects.filter(pk=self.fast.pk).update(stock_quantity=4)
+
+        refresh_sales_days(full=True)
+        self.assertEqual(SalesDay.objects.filter(book=self.fast).count(), 10)
+        stats = velocity_stats()
+        velocity = dict(zip(stats["book_ids"], stats["velocity"]))
+        self.assertAlmostEqual(velocity[self.fast.id], 3.0)
+        self.assertAlmostEqual(velocity[self.slow.id], 0.1)
+
+        report = reorder_report(refresh=False)
+        self.assertEqual([row["book"] for row in report], [self.fast, self.slow])
+        fast = report[0]
+        self.assertAlmostEqual(fast["days_of_cover"], 4 / 3)
+        self.assertTrue(fast["needs_reorder"])
+        # 3/day over lead (2) + cover (5) days plus safety stock, minus the 4 on hand.
+        self.assertGreaterEqual(fast["suggested"], 17)
+        self.assertFalse(report[1]["needs_reorder"])
+
+    def test_unimported_offline_sales_are_not_counted(self):
+        product = Product.objects.create(name="Tez", barcode="300000000001")
+        sale = Sale.objects.create(sale_datetime=self.today, payment_type="cash")
+        SaleItem.objects.create(sale=sale, product=product, quantity=10)
+        refresh_sales_days(full=True)
+        self.assertFalse(SalesDay.objects.exists())
+
+    def test_incremental_refresh_only_touches_recent_days(self):
+        self._sell(self.fast, 3, 5)
+        refresh_sales_days()
+        old = SalesDay.objects.get(book=self.fast)
+        self._sell(self.fast, 1, 0)
+        refresh_sales_days()
+        self.assertTrue(SalesDay.objects.filter(pk=old.pk).exists())
+        self.assertEqual(sorted(SalesDay.objects.values_list("quantity", flat=True)), [1, 3])
+
+    @override_settings(CACHE_IS_SHARED=False)
+    def test_per_process_cache_sees_refreshes_of_other_processes(self):
+        self._sell(self.fast, 10, 1)
+        refresh_sales_days(full=True)
+        stale = velocity_stats()
+        self._sell(self.slow, 10, 1)
+        refresh_sales_days()
+        # The refresh ran in another process: this one still holds its old stats.
+        cache.set(STATS_CACHE_KEY, stale, None)
+        cache.delete(REFRESHED_CACHE_KEY)
+        self.assertIn(self.slow.id, velocity_stats()["book_ids"])
+        self.assertIn(self.slow, [row["book"] for row in reorder_report(refresh=False)])
+
+    def test_reorder_page(self):
+        self._sell(self.fast, 20, 1)
+        user = get_user_model().objects.create_user(username="boss", password="pass1234", is_staff=True, is_superuser=True)
+        self.client.force_login(user)
+        response = self.client.get("/inventory/reorder/", HTTP_HOST="localhost")
+        self.assertContains(response, "Tez")
+        self.assertNotContains(response, "Sekin")
+
+    def test_reorder_page_is_staff_only(self):
+        user = get_user_model().objects.create_user(username="clerk", password="pass1234")
+        self.client.force_login(user)
+        response = self.client.get("/inventory/reorder/", HTTP_HOST="localhost")
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(CACHE_IS_SHARED=True)
+class PosIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pos_index._index = None
+        author = Author.objects.create(name="Muallif")
+        category = Category.objects.create(name="Tarix")
+        self.books = [
+            Book.objects.create(
+                title=title,
+                category=category,
+                author=author,
+                purchase_price=Decimal("1000"),
+                sale_price=Decimal("1500"),
+                stock_quantity=5,
+                barcode=barcode,
+            )
+            for title, barcode in (("O‘tkan kunlar", "400000000001"), ("Kecha va kunduz", "400000000002"))
+        ]
+
+    def test_barcode_and_prefix_lookup_without_queries(self):
+        pos_index.get_index()
+        with self.assertNumQueries(0):
+            self.assertEqual(pos_index.lookup_barcode(" 400000000001 ").id, self.books[0].id)
+            self.assertEqual([book.id for book in pos_index.suggest_books("kun")], [self.books[1].id, self.books[0].id])
+            self.assertEqual([book.title for book in pos_index.suggest_books("o'tkan")], ["O‘tkan kunlar"])
+            self.assertEqual(pos_index.suggest_books("zz"), [])
+
+    def test_signal_refreshes_only_changed_book(self):
+        index = pos_index.get_index()
+        book = self.books[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            book.sale_price = Decimal("2000")
+            book.title = "Yangi nom"
+            book.save()
+        refreshed = pos_index.get_index()
+        self.assertIs(refreshed, index)
+        self.assertEqual(pos_index.lookup_barcode("400000000001").price, Decimal("2000"))
+        self.assertEqual(pos_index.suggest_books("o'tkan"), [])
+        self.assertEqual(pos_index.suggest_books("yangi")[0].id, book.id)
+        # Saves that don't touch indexed fields leave the version alone.
+        with self.captureOnCommitCallbacks(execute=True):
+            book.views = 10
+            book.save(update_fields=["views"])
+        self.assertEqual(pos_index.get_index().version, refreshed.version)
+
+    def test_lookup_endpoint_and_scan(self):
+        user = get_user_model().objects.create_user(username="kassir", password="pass1234", is_staff=True)
+        self.client.force_login(user)
+        response = self.client.get("/pos/lookup/", {"barcode": "400000000002"}, HTTP_HOST="localhost")
+        self.assertEqual(response.json()["book"]["title"], "Kecha va kunduz")
+        response = self.client.get("/pos/lookup/", {"barcode": "999"}, HTTP_HOST="localhost")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get("/pos/lookup/", {"q": "kecha"}, HTTP_HOST="localhost")
+        self.assertEqual([row["barcode"] for row in response.json()["results"]], ["400000000002"])
+        response = self.client.post(
+            "/pos/",
+            {"action": "add", "barcode": "400000000002", "quantity": "2"},
+            HTTP_HOST="localhost",
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+        self.assertIn("Kecha va kunduz", response.json()["cart_html"])
+        self.assertContains(self.client.get("/pos/", HTTP_HOST="localhost"), "Kecha va kunduz")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/pos/", {"action": "checkout", "discount_amount": "abc"}, HTTP_HOST="localhost")
+        self.assertEqual(Order.objects.get().total_price, Decimal("3000"))
+        self.assertEqual(Book.objects.get(barcode="400000000002").stock_quantity, 3)
+
+    @override_settings(CACHE_IS_SHARED=False)
+    def test_per_process_cache_reads_version_from_database(self):
+        index = pos_index.get_index()
+        # Another worker changes a book: its cache bump and changed ids never reach this process.
+        Book.objects.filter(id=self.books[0].id).update(barcode="400000000009", sale_price=Decimal("1700"))
+        pos_index.mark_books_changed([self.books[0].id])
+        cache.clear()
+        refreshed = pos_index.get_index()
+        self.assertGreater(refreshed.version, index.version)
+        self.assertIsNone(pos_index.lookup_barcode("400000000001"))
+        self.assertEqual(pos_index.lookup_barcode("400000000009").price, Decimal("1700"))
+
+
+class PosCartCheckoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pos_index._index = None
+        author = Author.objects.create(name="Muallif")
+        category = Category.objects.create(name="Tarix")
+        self.book = Book.objects.create(
+            title="Kitob",
+            category=category,
+            author=author,
+            purchase_price=Decimal("1000"),
+            sale_price=Decimal("2000"),
+            stock_quantity=3,
+            barcode="500000000001",
+        )
+        user = get_user_model().objects.create_user(username="kassir", password="pass1234", is_staff=True)
+        self.client.force_login(user)
+
+    def _checkout(self, **payload):
+        body = {"items": [{"book_id": self.book.id, "quantity": 2, "price": "2000.00"}], **payload}
+        return self.client.post(
+            "/pos/checkout/", json.dumps(body), content_type="application/json", HTTP_HOST="localhost"
+        )
+
+    def test_changed_price_needs_confirmation(self):
+        Book.objects.filter(pk=self.book.pk).update(sale_price=Decimal("2500"))
+        response = self._checkout(total="4000.00")
+        self.assertEqual(response.status_code, 409)
+        kinds = {change["kind"] for change in response.json()["changes"]}
+        self.assertEqual(kinds, {"price", "total"})
+        self.assertEqual(response.json()["total"], "5000.00")
+        self.assertFalse(Order.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._checkout(total="4000.00", confirm=True)
+        self.assertTrue(response.json()["ok"])
+        order = Order.objects.get()
+        self.assertEqual((order.order_source, order.total_price), ("pos", Decimal("5000")))
+        self.assertEqual(order.items.get().price, Decimal("2500"))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock_quantity, 1)
+
+    def test_manual_discount_is_capped(self):
+        response = self._checkout(discount_amount="1000")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["changes"], [{"kind": "discount", "was": "1000", "now": "280.00"}])
+        response = self._checkout(discount_amount="200", total="3800.00")
+        self.assertTrue(response.json()["ok"])
+        self.assertEqual(Order.objects.get().discount_amount, Decimal("200"))
+
+    def test_cart_of_only_missing_books_is_refused(self):
+        response = self._checkout(items=[{"book_id": self.book.id + 100, "quantity": 1, "price": "2000.00"}], confirm=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["changes"], [{"kind": "missing", "book_id": self.book.id + 100}])
+        self.assertFalse(Order.objects.exists())
+
+    def test_stock_shortage_and_catalog_etag(self):
+        response = self._checkout(items=[{"book_id": self.book.id, "quantity": 5, "price": "2000.00"}])
+        self.assertEqual(response.json()["changes"][0]["available"], 3)
+        response = self.client.get("/pos/catalog/", HTTP_HOST="localhost")
+        self.assertEqual(response.json()["books"], [[self.book.id, "Kitob", "500000000001", "2000.00", 3]])
+        cached = self.client.get("/pos/catalog/", HTTP_HOST="localhost", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+
+class PriceGridTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Tarix")
+        self.author = Author.objects.create(name="Muallif")
+        self.book = Book.objects.create(
+            title="Kitob",
+            category=self.category,
+            author=self.author,
+            purchase_price=Decimal("1000"),
+            sale_price=Decimal("1500"),
+            barcode="4780000000014",
+        )
+        Book.objects.create(
+            title="Yangi", slug="yangi", category=self.category, author=self.author,
+            purchase_price=Decimal("1"), sale_price=Decimal("2"),
+        )
+
+    def test_grid_saves_edits_and_new_rows_together(self):
+        rows = parse_grid(
+            {
+                "rows-0-id": str(self.book.id),
+                "rows-0-title": "Kitob",
+                "rows-0-purchase_price": "1 000",
+                "rows-0-sale_price": "1 800",
+                "rows-0-barcode": "4780000000014",
+                "rows-1-id": "",
+                "rows-1-title": "Yangi",
+                "rows-1-purchase_price": "500",
+                "rows-1-sale_price": "900",
+                "rows-2-title": "Yangi",
+                "rows-2-purchase_price": "500",
+                "rows-2-sale_price": "900",
+                "rows-2-barcode": "4780000000021",
+                "rows-3-id": "",
+                "rows-3-title": "",
+            }
+        )
+        self.assertEqual(len(rows), 3)
+        with self.captureOnCommitCallbacks() as callbacks:
+            summary, errors = save_price_grid(rows)
+        self.assertEqual((summary, errors), ({"created": 2, "updated": 1}, {}))
+        # One storefront cache invalidation and one POS index bump for the whole grid.
+        self.assertEqual(len(callbacks), 2)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.sale_price, Decimal("1800"))
+        created = Book.objects.filter(title="Yangi").exclude(slug="yangi").order_by("id")
+        self.assertEqual([book.slug for book in created], ["yangi-2", "yangi-3"])
+        self.assertEqual(created[0].barcode, Book.generate_barcode_from_id(created[0].id))
+        self.assertEqual(created[1].barcode, "4780000000021")
+        self.assertTrue(SearchDocument.objects.filter(entity_type="books", object_id=created[0].id).exists())
+
+    def test_invalid_rows_write_nothing(self):
+        rows = parse_grid(
+            {
+                "rows-0-id": str(self.book.id),
+                "rows-0-sale_price": "2000",
+                "rows-1-title": "A",
+                "rows-1-purchase_price": "1",
+                "rows-1-sale_price": "2",
+                "rows-1-barcode": "4780000000019",
+                "rows-2-title": "B",
+                "rows-2-purchase_price": "1",
+                "rows-2-sale_price": "2",
+                "rows-2-barcode": "4780000000014",
+                "rows-3-title": "C",
+                "rows-3-purchase_price": "x",
+                "rows-3-sale_price": "2",
+            }
+        )
+        summary, errors = save_price_grid(rows)
+        self.assertEqual(summary, {"created": 0, "updated": 0})
+        self.assertEqual(sorted(errors), [1, 2, 3])
+        self.assertIn("EAN-13", errors[1])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.sale_price, Decimal("1500"))
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_values_the_columns_cannot_hold_are_row_errors(self):
+        rows = parse_grid(
+            {
+                "rows-0-id": str(self.book.id),
+                "rows-0-sale_price": "1 000 000",
+                "rows-1-id": str(self.book.id),
+                "rows-1-purchase_price": "10.555",
+                "rows-2-title": "D",
+                "rows-2-purchase_price": "1",
+                "rows-2-sale_price": "2",
+                "rows-2-barcode": "1" * 65,
+                "rows-3-title": "E",
+                "rows-3-purchase_price": "999 999.99",
+                "rows-3-sale_price": "1500.5",
+            }
+        )
+        summary, errors = save_price_grid(rows)
+        self.assertEqual(sorted(errors), [0, 1, 2])
+        self.assertIn("juda katta", errors[0])
+        self.assertIn("kasr", errors[1])
+        self.assertIn("64", errors[2])
+        self.assertEqual(summary, {"created": 0, "updated": 0})
+        summary, errors = save_price_grid([rows[3]])
+        self.assertEqual((summary, errors), ({"created": 1, "updated": 0}, {}))
+        self.assertEqual(Book.objects.get(title="E").sale_price, Decimal("1500.50"))
+
+    def test_entry_view_grid_and_single_row_posts(self):
+        user = get_user_model().objects.create_user(username="boss", password="pass1234", is_staff=True, is_superuser=True)
+        self.client.force_login(user)
+        self.assertContains(self.client.get("/entry/", HTTP_HOST="localhost"), f'name="rows-0-id" value="{self.book.id}"')
+        response = self.client.post(
+            "/entry/",
+            {"action": "update", "book_id": self.book.id, "title": "Kitob", "sale_price": "1 700", "barcode": "4780000000014"},
+            HTTP_HOST="localhost",
+        )
+        self.assertEqual(response.status_code, 302)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.sale_price, Decimal("1700"))
+        Book.objects.filter(id=self.book.id).update(purchase_price=Decimal("1500.50"))
+        response = self.client.get("/entry/", HTTP_HOST="localhost")
+        self.assertContains(response, 'value="1 500.5"')
+        self.assertContains(response, 'value="1 700"')
+        response = self.client.post(
+            "/entry/", {"rows-0-title": "Z", "rows-0-purchase_price": "1", "rows-0-sale_price": "2", "rows-0-barcode": "12a"},
+            HTTP_HOST="localhost",
+        )
+        self.assertContains(response, "faqat raqamlardan")
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.category = Category.objects.create(name="Roman", slug="roman")
+        self.author = Author.objects.create(name="Qodiriy")
+        Book.objects.create(
+            title="O'tkan kunlar", slug="otkan-kunlar", category=self.category, author=self.author,
+            purchase_price=Decimal("1000"), sale_price=Decimal("1500"), barcode="4780000000014",
+        )
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def _job(self, name, content):
+        return CatalogImport.objects.create(file=SimpleUploadedFile(name, content), source_name=name)
+
+    def test_csv_import_creates_books_and_lookups(self):
+        content = (
+            "Nomi;Muallif;Kategoriya;Sotib olish;Sotish;Shtrix-kod;Soni\n"
+            "O'tkan kunlar;qodiriy;roman;1000;1600;4780000000014;3\n"
+            "O'tkan kunlar;Qodiriy;Roman;1 100;1 700;;2\n"
+            "Yangi kitob;Yangi muallif;Fantastika;500;900;4780000000021;5\n"
+            "Takror;Yangi muallif;Fantastika;500;900;4780000000021;1\n"
+            "Xato;;;abc;900;;\n"
+            ";;;;;;\n"
+            "Shtrix;;;1;2;4780000000015;\n"
+        ).encode("utf-8")
+        job = run_import(self._job("katalog.csv", content), chunk_size=2)
+        self.assertEqual(job.status, "done")
+        self.assertEqual((job.created_count, job.skipped_count, job.error_count), (2, 2, 2))
+        self.assertEqual([row for row, _message in job.errors], [6, 8])
+        self.assertEqual(job.rows_done, 7)
+        copy = Book.objects.exclude(barcode="4780000000014").get(title="O'tkan kunlar")
+        self.assertEqual((copy.slug, copy.author_id, copy.category_id), ("otkan-kunlar-2", self.author.id, self.category.id))
+        self.assertEqual(copy.barcode, Book.generate_barcode_from_id(copy.id))
+        fresh = Book.objects.get(barcode="4780000000021")
+        self.assertEqual((fresh.author.name, fresh.category.name, fresh.stock_quantity), ("Yangi muallif", "Fantastika", 5))
+        self.assertEqual(Author.objects.filter(name__iexact="yangi muallif").count(), 1)
+        groups = {key: docs for key, _label, docs in search_documents("Yangi kitob")}
+        self.assertIn(fresh.id, [doc.object_id for doc in groups["books"]])
+
+    def test_values_the_columns_cannot_hold_are_row_errors(self):
+        content = (
+            "title,purchase_price,sale_price,barcode,stock_quantity,pages\n"
+            "A,1,2,,1,100\n"
+            "B,1,2,,1,-5\n"
+            "C,1,1000000,,1,\n"
+            "D,1,2.505,,1,\n"
+            f"E,1,2,{'1' * 65},1,\n"
+            "F,1,2,,1.5,\n"
+            "G,1,2,,99999999999,\n"
+            "H,1,1500.5,,2,\n"
+        ).encode("utf-8")
+        job = run_import(self._job("a.csv", content))
+        self.assertEqual(job.status, "done")
+        self.assertEqual((job.created_count, job.error_count), (2, 6))
+        self.assertEqual([row for row, _message in job.errors], [3, 4, 5, 6, 7, 8])
+        self.assertEqual(sorted(Book.objects.filter(title__in="ABCDEFGH").values_list("title", flat=True)), ["A", "H"])
+        self.assertEqual(Book.objects.get(title="H").sale_price, Decimal("1500.50"))
+
+    def test_resume_skips_committed_rows(self):
+        content = "title,purchase_price,sale_price\nA,1,2\nB,1,2\nC,1,2\n".encode("utf-8")
+        job = self._job("a.csv", content)
+        job.rows_done = 2
+        job.status = "failed"
+        job.errors = [[4, "eski"]]
+        job.error_count = 1
+        job.save()
+        job = run_import(job)
+        self.assertEqual((job.status, job.created_count, job.error_count), ("done", 1, 0))
+        self.assertFalse(Book.objects.filter(title__in=["A", "B"]).exists())
+        self.assertTrue(Book.objects.filter(title="C").exists())
+
+    def test_missing_column_fails_job(self):
+        job = run_import(self._job("a.csv", b"title,price\nA,2\n"))
+        self.assertEqual(job.status, "failed")
+        self.assertIn("purchase_price", job.error)
+
+    def test_xlsx_rows_roundtrip(self):
+        data = b"".join(stream_xlsx(["title", "purchase_price", "sale_price"], [["Kitob", 1000, Decimal("1500.50")]]))
+        rows = list(iter_rows(BytesIO(data), "k.xlsx"))
+        self.assertEqual(rows[0], ["title", "purchase_price", "sale_price"])
+        self.assertEqual(rows[1][0], "Kitob")
+        job = run_import(self._job("k.xlsx", data))
+        self.assertEqual((job.status, job.created_count), ("done", 1))
+        self.assertEqual(Book.objects.get(title="Kitob").sale_price, Decimal("1500.50"))
+
+    def test_upload_and_run_views(self):
+        user = get_user_model().objects.create_user(username="boss", password="pass1234", is_staff=True, is_superuser=True)
+        self.client.force_login(user)
+        upload = SimpleUploadedFile("k.csv", b"title,purchase_price,sale_price\nKitob,1,2\nX,y,2\n")
+        response = self.client.post("/catalog/import/", {"file": upload}, HTTP_HOST="localhost")
+        job = CatalogImport.objects.get()
+        self.assertRedirects(response, f"/catalog/import/{job.id}/", fetch_redirect_response=False)
+        self.assertEqual(job.status, "pending")
+        self.client.post(f"/catalog/import/{job.id}/", {"action": "run"}, HTTP_HOST="localhost")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.created_count, job.error_count), ("done", 1, 1))
+        csv_response = self.client.get(f"/catalog/import/{job.id}/?format=csv", HTTP_HOST="localhost")
+        self.assertIn("Noto‘g‘ri son", csv_response.content.decode("utf-8"))
+
+    def test_run_needs_the_claim(self):
+        job = self._job("a.csv", b"title,purchase_price,sale_price\nA,1,2\n")
+        self.assertEqual(claim_next_import().id, job.id)
+        # A stale copy (the CRM page loaded before the queue worker took the job) must not run it again.
+        job.status = "pending"
+        job = run_import(job)
+        self.assertEqual((job.status, job.rows_done), ("running", 0))
+        self.assertFalse(Book.objects.filter(title="A").exists())
+
+    @override_settings(CATALOG_IMPORT_INLINE_MAX_KB=0)
+    def test_large_files_are_left_to_the_queue(self):
+        user = get_user_model().objects.create_user(username="boss", password="pass1234", is_staff=True, is_superuser=True)
+        self.client.force_login(user)
+        job = self._job("a.csv", b"title,purchase_price,sale_price\nA,1,2\n")
+        CatalogImport.objects.filter(id=job.id).update(status="failed")
+        self.client.post(f"/catalog/import/{job.id}/", {"action": "run"}, HTTP_HOST="localhost")
+        job.refresh_from_db()
+        self.assertEqual(job.status, "pending")
+        self.assertFalse(Book.objects.filter(title="A").exists())
+
+
+class LabelSheetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Roman", slug="roman")
+        author = Author.objects.create(name="Qodiriy")
+        self.book = Book.objects.create(
+            title="O‘tkan kunlar", slug="otkan-kunlar", category=category, author=author,
+            purchase_price=Decimal("1000"), sale_price=Decimal("15000"), barcode="4780000000014", stock_quantity=3,
+        )
+        self.other = Book.objects.create(
+            title="Mehrobdan chayon", slug="mehrobdan-chayon", category=category, author=author,
+            purchase_price=Decimal("1000"), sale_price=Decimal("12000"), stock_quantity=2,
+        )
+
+    def _objects(self, data):
+        return {int(match.group(1)): match.start() for match in re.finditer(rb"(?m)^(\d+) 0 obj", data)}
+
+    def test_ean13_pattern_and_bars(self):
+        bits = ean13_bits("4780000000014")
+        self.assertEqual(len(bits), 95)
+        self.assertTrue(bits.startswith("101") and bits.endswith("101") and bits[45:50] == "01010")
+        bars = ean13_bars("4780000000014")
+        self.assertEqual(len(bars), 30)
+        self.assertEqual(sum(width for _start, width, _guard in bars), bits.count("1"))
+        self.assertEqual(sum(1 for *_rest, guard in bars if guard), 6)
+
+    def test_pdf_sheet_shares_symbols_and_xref_is_valid(self):
+        labels = [Label("4780000000014", "A", Decimal("15000"), 20), Label("4780000000021", "B", None, 5)]
+        data = build_label_pdf(labels, compress=False)
+        self.assertIn(b"/Type /Pages /Kids", data)
+        self.assertIn(b"/Count 2", data)
+        self.assertEqual(data.count(b"/Subtype /Form"), 2)
+        self.assertEqual(data.count(b"/B1 Do"), 20)
+        self.assertIn(b"(15 000 so'm) Tj", data)
+        xref_start = data.rindex(b"\nxref\n") + 1
+        xref = data[xref_start:].split(b"\n")
+        offsets = self._objects(data)
+        for number, line in enumerate(xref[3:3 + len(offsets)], start=1):
+            self.assertEqual(int(line[:10]), offsets[number])
+        self.assertEqual(int(data.rsplit(b"startxref\n", 1)[1].split(b"\n")[0]), xref_start)
+        compressed = build_label_pdf(labels)
+        self.assertIn(b"/FlateDecode", compressed)
+        self.assertLess(len(compressed), len(data))
+
+    def test_book_and_restock_labels(self):
+        Book.objects.filter(id=self.other.id).update(barcode=None)
+        labels, skipped = book_labels(Book.objects.all(), per_stock=True)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.barcode, Book.generate_barcode_from_id(self.other.id))
+        self.assertEqual(sorted((label.barcode, label.copies) for label in labels), sorted([("4780000000014", 3), (self.other.barcode, 2)]))
+        self.assertEqual(skipped, [])
+        InventoryLog.objects.create(book=self.book, delta=4, reason="restock")
+        InventoryLog.objects.create(book=self.book, delta=6, reason="restock")
+        InventoryLog.objects.create(book=self.other, delta=-1, reason="adjust")
+        labels, _skipped = restock_labels(InventoryLog.objects.all())
+        self.assertEqual([(label.barcode, label.copies) for label in labels], [("4780000000014", 10)])
+        zpl = b"".join(label_stream(labels, "zpl")).decode("utf-8")
+        self.assertIn("^BEN", zpl)
+        self.assertIn("^FD478000000001^FS", zpl)
+        self.assertIn("^PQ10", zpl)
+
+    def test_labels_view_streams_pdf(self):
+        user = get_user_model().objects.create_user(username="boss", password="pass1234", is_staff=True, is_superuser=True)
+        self.client.force_login(user)
+        response = self.client.get(f"/inventory/labels/?book={self.book.id}&copies=stock&layout=roll", HTTP_HOST="localhost")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        data = b"".join(response.streaming_content)
+        self.assertTrue(data.startswith(b"%PDF"))
+        self.assertIn(b"/Count 3", data)
+        self.assertEqual(self.client.get("/inventory/labels/", HTTP_HOST="localhost").status_code, 302)
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.category = Category.objects.create(name="Roman", slug="roman")
+        self.author = Author.objects.create(name="Qodiriy")
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def _png(self, size, mode="RGBA"):
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new(mode, size, (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30)).save(buffer, "PNG")
+        return SimpleUploadedFile("cover.png", buffer.getvalue(), content_type="image/png")
+
+    def _book(self, **extra):
+        return Book.objects.create(
+            title="Kitob", slug=f"kitob-{Book.objects.count()}", category=self.category, author=self.author,
+            purchase_price=Decimal("1"), sale_price=Decimal("2"), **extra,
+        )
+
+    def test_upload_renders_hashed_size_buckets(self):
+        from PIL import Image
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book = self._book(cover_image=self._png((1000, 1500)))
+        book.refresh_from_db()
+        variants = variants_for(book.cover_image)
+        self.assertEqual(sorted(variants["webp"], key=int), ["160", "320", "640"])
+        self.assertEqual((variants["width"], variants["height"]), (1000, 1500))
+        path = variants["jpeg"]["320"]
+        self.assertTrue(path.startswith(f"derived/cover/{variants['hash'][:2]}/{variants['hash']}-320"))
+        with Image.open(f"{self.media_root}/{path}") as image:
+            self.assertEqual((image.format, image.size), ("JPEG", (320, 480)))
+
+        # Same bytes on another book reuse the files.
+        with self.captureOnCommitCallbacks(execute=True):
+            other = self._book(cover_image=self._png((1000, 1500)))
+        other.refresh_from_db()
+        self.assertEqual(other.cover_variants["webp"], variants["webp"])
+
+        html = Template("{% load catalog_images %}{% responsive_image book.cover_image sizes='50vw' alt=book.title width=320 %}").render(
+            Context({"book": book})
+        )
+        self.assertIn('type="image/webp"', html)
+        self.assertIn("-640.webp 640w", html)
+        self.assertIn(f'src="/media/{path}"', html)
+        self.assertIn('alt="Kitob"', html)
+
+    def test_small_images_are_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = self._book(cover_image=self._png((200, 300), mode="P"))
+        book.refresh_from_db()
+        self.assertEqual(sorted(book.cover_variants["jpeg"], key=int), ["160", "200"])
+
+    def test_stale_map_falls_back_and_backfill_renders(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = self._book(cover_image=self._png((400, 600)))
+        book.refresh_from_db()
+        book.cover_image.save("second.png", self._png((500, 750), mode="RGB"), save=False)
+        Book.objects.filter(id=book.id).update(cover_image=book.cover_image.name)
+        book.refresh_from_db()
+        self.assertIsNone(variants_for(book.cover_image))
+        html = Template("{% load catalog_images %}{% responsive_image book.cover_image %}").render(Context({"book": book}))
+        self.assertNotIn("<picture>", html)
+        self.assertEqual([item[1] for item in stale_images()], [book.id])
+        self.assertEqual(backfill_variants(workers=1), (1, 0))
+        book.refresh_from_db()
+        self.assertEqual(variants_for(book.cover_image)["width"], 500)
+        self.assertEqual(list(stale_images()), [])
+
+
+@override_settings(RECOMMENDATION_TOP_K=3)
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Roman", slug="roman")
+        self.other_category = Category.objects.create(name="Tarix", slug="tarix")
+        self.author = Author.objects.create(name="Qodiriy")
+        self.other_author = Author.objects.create(name="Cho'lpon")
+        self.books = {}
+        for index, (name, author, category, views) in enumerate(
+            [
+                ("A", self.author, self.category, 5),
+                ("B", self.other_author, self.other_category, 1),
+                ("C", self.other_author, self.other_category, 2),
+                ("D", self.author, self.category, 9),
+                ("E", self.other_author, self.category, 0),
+            ]
+        ):
+            self.books[name] = Book.objects.create(
+                title=name, slug=f"book-{index}", category=category, author=author,
+                purchase_price=Decimal("1"), sale_price=Decimal("2"), views=views,
+            )
+
+    def _order(self, *names, status="new"):
+        order = Order.objects.create(full_name="Ali", phone="+998901234567", address="-", total_price=Decimal("2"), status=status)
+        for name in names:
+            OrderItem.objects.create(order=order, book=self.books[name], quantity=1, price=Decimal("2"))
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(hours=1))
+        return order
+
+    def _ids(self, *names):
+        return [self.books[name].id for name in names]
+
+    def test_basket_counts(self):
+        import numpy as np
+
+        orders = np.array([1, 1, 1, 1, 2, 2, 3], dtype=np.int64)
+        books = np.array([30, 10, 20, 10, 20, 10, 10], dtype=np.int64)
+        item_ids, item_counts, a, b, counts = basket_counts(orders, books)
+        self.assertEqual(dict(zip(item_ids.tolist(), item_counts.tolist())), {10: 3, 20: 2, 30: 1})
+        self.assertEqual(
+            sorted(zip(a.tolist(), b.tolist(), counts.tolist())), [(10, 20, 2), (10, 30, 1), (20, 30, 1)]
+        )
+
+    def test_full_then_incremental_build(self):
+        self._order("A", "B")
+        self._order("A", "B")
+        self._order("A", "C")
+        self._order("A", "C", "E", status="canceled")
+        result = build_recommendations()
+        self.assertEqual((result["orders"], result["pairs"]), (3, 2))
+        self.assertEqual(CoPurchase.objects.get(book_a=self.books["A"], book_b=self.books["B"]).baskets, 2)
+        # Co-purchases first (B twice, C once), then A's author fills the last slot.
+        self.assertEqual(related_ids(self.books["A"].id), self._ids("B", "C", "D"))
+        # E has no co-purchases (its order was canceled): same author first, then same category.
+        self.assertEqual(related_ids(self.books["E"].id), self._ids("C", "B", "D"))
+
+        self._order("B", "E")
+        self._order("B", "E")
+        self._order("B", "E")
+        result = build_recommendations()
+        self.assertEqual((result["orders"], result["pairs"]), (3, 1))
+        self.assertEqual(BookNeighbors.objects.get(book=self.books["B"]).baskets, 5)
+        self.assertEqual(related_ids(self.books["B"].id)[0], self.books["E"].id)
+        self.assertEqual(related_ids(self.books["E"].id)[0], self.books["B"].id)
+
+        # The watermark lives in the database: a flushed cache still runs incrementally.
+        cache.clear()
+        self.assertEqual(related_ids(self.books["B"].id)[0], self.books["E"].id)
+        self.assertEqual([book.title for book in cart_related_books(self._ids("A", "E"))], ["B", "C", "D"])
+        self._order("A", "D")
+        self.assertEqual(build_recommendations()["orders"], 1)
+
+    def test_related_api(self):
+        self._order("A", "B")
+        build_recommendations()
+        user = get_user_model().objects.create_user(username="boss", password="pass1234", is_staff=True)
+        self.client.force_login(user)
+        response = self.client.get(f"/api/books/{self.books['A'].id}/related/", HTTP_HOST="localhost")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["title"], "B")
+
+
+class OfflineSalesImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = Author.objects.create(name="Muallif")
+        self.category = Category.objects.create(name="Tarix")
+        self.book = Book.objects.create(
+            title="Tarix kitobi",
+            category=self.category,
+            author=author,
+            purchase_price=Decimal("1000"),
+            sale_price=Decimal("1500"),
+            stock_quantity=10,
+            barcode="400000000001",
+        )
+        self.product = Product.objects.create(name="Tarix kitobi", barcode="400000000001")
+        self.unknown = Product.objects.create(name="Daftar", barcode="")
+
+    def _sale(self, items, total, days_ago=1, customer=None, payment_type="card"):
+        sale = Sale.objects.create(
+            sale_datetime=timezone.now() - timedelta(days=days_ago),
+            total=Decimal(total),
+            payment_type=payment_type,
+            seller="Kassir",
+            customer=customer,
+        )
+        for product, quantity, price in items:
+            SaleItem.objects.create(sale=sale, product=product, quantity=quantity, price=Decimal(price))
+        return sale
+
+    def test_sales_become_pos_orders_once(self):
+        sale = self._sale([(self.product, 2, "1500"), (self.unknown, 1, "500")], "3300")
+        self.assertEqual(import_offline_sales(), {"orders": 1, "items": 1, "unmatched": 1})
+        order = OfflineSale.objects.get(sale_id=sale.id).order
+        self.assertEqual((order.order_source, order.status, order.payment_type), ("pos", "paid", "bank"))
+        self.assertEqual(order.created_at, sale.sale_datetime)
+        self.assertEqual((order.subtotal_before_discount, order.discount_amount, order.total_price), (3500, 200, 3300))
+        self.assertEqual([(item.book_id, item.quantity) for item in order.items.all()], [(self.book.id, 2)])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock_quantity, 8)
+        log = InventoryLog.objects.get()
+        self.assertEqual((log.delta, log.reason, log.related_order_id), (-2, "sale", order.id))
+
+        # Incremental: nothing new. Full rescan (or a lost watermark): imported sales are skipped by id.
+        self.assertEqual(import_offline_sales()["orders"], 0)
+        JobWatermark.objects.filter(name="offline_sales").delete()
+        self.assertEqual(import_offline_sales()["orders"], 0)
+        self.assertEqual(import_offline_sales(full=True)["orders"], 0)
+        self.assertEqual((Order.objects.count(), InventoryLog.objects.count()), (1, 1))
+
+        self._sale([(self.product, 1, "1500")], "1500", days_ago=0, payment_type="cash")
+        self.assertEqual(import_offline_sales(batch_size=1)["orders"], 1)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.stock_quantity, Order.objects.count()), (7, 2))
+
+    def test_sales_before_cutover_move_no_stock(self):
+        old = self._sale([(self.product, 3, "1500")], "4500")
+        # Deploy: the migration's cutover is the change-feed head, after the hand-reconciled sale.
+        JobWatermark.objects.filter(name="offline_sales_cutover").update(
+            value=Change.objects.aggregate(last=Max("seq"))["last"], updated_at=timezone.now()
+        )
+        self.assertEqual(import_offline_sales(full=True)["orders"], 0)
+
+        self.assertEqual(import_offline_sales(backfill=True)["orders"], 1)
+        link = OfflineSale.objects.get(sale_id=old.id)
+        self.assertFalse(link.stock_moved)
+        self.assertEqual([item.quantity for item in link.order.items.all()], [3])
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.stock_quantity, InventoryLog.objects.count()), (10, 0))
+
+        self._sale([(self.product, 1, "1500")], "1500", days_ago=0)
+        self.assertEqual(import_offline_sales()["orders"], 1)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.stock_quantity, InventoryLog.objects.count()), (9, 1))
+        self.assertEqual(import_offline_sales(backfill=True)["orders"], 0)
+
+    def test_customer_sales_link_crm_customer(self):
+        customer = SyncCustomer.objects.create(full_name="Vali", phone="+998 90 123 45 67")
+        self._sale([(self.product, 1, "1500")], "1500", customer=customer)
+        import_offline_sales()
+        order = Order.objects.get()
+        self.assertEqual((order.full_name, order.phone_normalized), ("Vali", normalize_phone("+998 90 123 45 67")))
+        self.assertEqual(order.customer, Customer.objects.get(phone_normalized=order.phone_normalized))
+        self.assertTrue(SearchDocument.objects.filter(entity_type="orders", object_id=order.id).exists())
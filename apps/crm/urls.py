@@ -8,9 +8,16 @@ urlpatterns = [
     path("export/orders.pdf", views.export_orders_pdf, name="crm_export_orders_pdf"),
     path("export/sales.pdf", views.export_sales_pdf, name="crm_export_sales_pdf"),
     path("export/monthly.pdf", views.export_monthly_report_pdf, name="crm_export_monthly_report_pdf"),
+    path("export/data/<slug:dataset>.<slug:fmt>", views.export_dataset, name="crm_export_dataset"),
+    path("export/jobs/", views.export_job_create, name="crm_export_job_create"),
+    path("export/jobs/<int:job_id>/", views.export_job_detail, name="crm_export_job"),
+    path("export/jobs/<int:job_id>/status/", views.export_job_status, name="crm_export_job_status"),
+    path("export/jobs/<int:job_id>/download/", views.export_job_download, name="crm_export_job_download"),
     path("cleanup/", views.cleanup_data, name="crm_cleanup"),
     path("report/", views.monthly_report, name="crm_report"),
     path("entry/", views.entry_list, name="crm_entry"),
+    path("catalog/import/", views.catalog_import_upload, name="crm_catalog_import"),
+    path("catalog/import/<int:import_id>/", views.catalog_import_detail, name="crm_catalog_import_detail"),
     path("prices/", views.prices_list, name="crm_prices"),
     path("expenses/", views.expenses_list, name="crm_expenses"),
     path("debts/", views.debts_list, name="crm_debts"),
@@ -19,6 +26,15 @@ urlpatterns = [
     path("customers/<int:customer_id>/", views.customer_detail, name="crm_customer_detail"),
     path("couriers/", views.couriers_list, name="crm_couriers"),
     path("inventory/", views.inventory_list, name="crm_inventory"),
+    path("inventory/labels/", views.inventory_labels, name="crm_inventory_labels"),
+    path("inventory/valuation/", views.inventory_valuation, name="crm_inventory_valuation"),
+    path("inventory/reorder/", views.reorder_list, name="crm_reorder"),
+    path("inventory/stocktake/", views.stocktake_upload, name="crm_stocktake"),
+    path("inventory/stocktake/<int:stocktake_id>/", views.stocktake_detail, name="crm_stocktake_detail"),
     path("pos/", views.pos_checkout, name="crm_pos"),
+    path("pos/lookup/", views.pos_lookup, name="crm_pos_lookup"),
+    path("pos/local/", views.pos_local, name="crm_pos_local"),
+    path("pos/catalog/", views.pos_catalog, name="crm_pos_catalog"),
+    path("pos/checkout/", views.pos_cart_checkout, name="crm_pos_checkout"),
     path("search/", views.search, name="crm_search"),
 ]
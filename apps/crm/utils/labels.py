@@ -0,0 +1,260 @@
+import zlib
+from collections import namedtuple
+from functools import lru_cache
+
+
+POINTS_PER_MM = 72.0 / 25.4
+DOTS_PER_MM = 8  # 203 dpi thermal printers
+
+# One printed label; copies of the same barcode share a single drawn symbol.
+Label = namedtuple("Label", "barcode title price copies")
+
+# Sheet geometry in millimetres: page size, grid and the label cell.
+Layout = namedtuple("Layout", "page_width page_height columns rows label_width label_height")
+LAYOUTS = {
+    # Standard 24-up A4 sticker sheet (3 x 8, 70 x 37 mm).
+    "a4": Layout(210.0, 297.0, 3, 8, 70.0, 37.0),
+    # Thermal roll in PDF mode: every page is one 54.2 x 32 mm label.
+    "roll": Layout(54.2, 32.0, 1, 1, 54.2, 32.0),
+}
+
+_L_CODES = ("0001101", "0011001", "0010011", "0111101", "0100011", "0110001", "0101111", "0111011", "0110111", "0001011")
+_G_CODES = ("0100111", "0110011", "0011011", "0100001", "0011101", "0111001", "0000101", "0010001", "0001001", "0010111")
+_R_CODES = ("1110010", "1100110", "1101100", "1000010", "1011100", "1001110", "1010000", "1000100", "1001000", "1110100")
+_PARITY = ("AAAAAA", "AABABB", "AABBAB", "AABBBA", "ABAABB", "ABBAAB", "ABBBAA", "ABABAB", "ABABBA", "ABBABA")
+
+QUIET_LEFT = 11
+QUIET_RIGHT = 7
+SYMBOL_MODULES = 95
+
+
+def is_ean13(barcode: str) -> bool:
+    return len(barcode) == 13 and barcode.isdigit()
+
+
+@lru_cache(maxsize=4096)
+def ean13_bits(barcode: str) -> str:
+    """The 95-module bit pattern of an EAN-13 code (cached: reprints and copies reuse it)."""
+    parity = _PARITY[int(barcode[0])]
+    parts = ["101"]
+    for kind, digit in zip(parity, barcode[1:7]):
+        parts.append((_L_CODES if kind == "A" else _G_CODES)[int(digit)])
+    parts.append("01010")
+    parts.extend(_R_CODES[int(digit)] for digit in barcode[7:])
+    parts.append("101")
+    return "".join(parts)
+
+
+@lru_cache(maxsize=4096)
+def ean13_bars(barcode: str):
+    """Bars as (first module, width in modules, is_guard) runs: 30 rectangles instead of one per dark module."""
+    bits = ean13_bits(barcode)
+    bars = []
+    start = None
+    for index, bit in enumerate(bits + "0"):
+        if bit == "1" and start is None:
+            start = index
+        elif bit != "1" and start is not None:
+            guard = start < 3 or 45 <= start < 50 or start >= 92
+            bars.append((start, index - start, guard))
+            start = None
+    return tuple(bars)
+
+
+def _pdf_text(text: str) -> str:
+    text = text.replace("‘", "'").replace("’", "'").replace("ʼ", "'").replace("`", "'")
+    text = text.encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _fit(text: str, width: float, size: float) -> str:
+    # Courier glyphs are 0.6 em wide.
+    limit = max(int(width / (size * 0.6)), 1)
+    return text if len(text) <= limit else text[: limit - 1] + "~"
+
+
+def _price_text(price) -> str:
+    if price is None:
+        return ""
+    return f"{int(price):,}".replace(",", " ") + " so'm"
+
+
+class _Geometry:
+    """Label cell measurements in points, shared by every symbol on the sheet."""
+
+    def __init__(self, layout: Layout):
+        self.width = layout.label_width * POINTS_PER_MM
+        self.height = layout.label_height * POINTS_PER_MM
+        self.pad = 2.0 * POINTS_PER_MM
+        self.title_size = 7.0
+        self.digit_size = 8.0
+        self.module = (self.width - 2 * self.pad) / (QUIET_LEFT + SYMBOL_MODULES + QUIET_RIGHT)
+        self.bar_x = self.pad + QUIET_LEFT * self.module
+        self.bar_bottom = self.pad + self.digit_size + 1.0
+        self.bar_top = self.height - self.pad - self.title_size - 2.0
+        self.guard_bottom = self.bar_bottom - self.digit_size * 0.5
+
+
+def _symbol_stream(barcode: str, geo: _Geometry) -> bytes:
+    """Bars plus human-readable digits, drawn once per barcode as a form XObject."""
+    parts = ["0 0 0 rg"]
+    for start, width, guard in ean13_bars(barcode):
+        bottom = geo.guard_bottom if guard else geo.bar_bottom
+        parts.append(
+            f"{geo.bar_x + start * geo.module:.2f} {bottom:.2f} {width * geo.module:.2f} {geo.bar_top - bottom:.2f} re f"
+        )
+    text_width = geo.digit_size * 0.6 * len(barcode)
+    text_x = geo.bar_x + (SYMBOL_MODULES * geo.module - text_width) / 2.0
+    parts.append(f"BT /F1 {geo.digit_size:.1f} Tf {text_x:.2f} {geo.pad:.2f} Td ({barcode}) Tj ET")
+    return "\n".join(parts).encode("ascii")
+
+
+class _PdfStream:
+    """Numbered objects written as they are produced; the xref is assembled from recorded offsets."""
+
+    def __init__(self, compress: bool):
+        self.compress = compress
+        self.offsets = {}
+        self.position = 0
+        self.next_number = 5  # 1 catalog, 2 pages, 3 font, 4 shared resources
+
+    def allocate(self) -> int:
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def chunk(self, data: bytes) -> bytes:
+        self.position += len(data)
+        return data
+
+    def obj(self, number: int, body: bytes) -> bytes:
+        self.offsets[number] = self.position
+        return self.chunk(f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n")
+
+    def stream(self, number: int, data: bytes, extra: str = "") -> bytes:
+        if self.compress:
+            data = zlib.compress(data, 6)
+            extra += " /Filter /FlateDecode"
+        return self.obj(number, f"<< /Length {len(data)}{extra} >>\nstream\n".encode("ascii") + data + b"\nendstream")
+
+    def trailer(self) -> bytes:
+        size = max(self.offsets) + 1
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for number in range(1, size):
+            lines.append(f"{self.offsets.get(number, 0):010d} 00000 n \n")
+        lines.append(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{self.position}\n%%EOF\n")
+        return "".join(lines).encode("ascii")
+
+
+def _expand(labels):
+    for label in labels:
+        for _copy in range(max(int(label.copies or 0), 0)):
+            yield label
+
+
+def iter_label_pdf(labels, layout: str = "a4", compress: bool = True):
+    """
+    Stream a PDF laying out labels (copies expanded) page by page. Every page shares one font and one
+    resource dictionary; each distinct barcode is drawn once as a form XObject and placed by reference.
+    Labels whose barcode is not EAN-13 must be filtered out by the caller.
+    """
+    sheet = LAYOUTS[layout]
+    geo = _Geometry(sheet)
+    page_width = sheet.page_width * POINTS_PER_MM
+    page_height = sheet.page_height * POINTS_PER_MM
+    margin_x = (page_width - sheet.columns * geo.width) / 2.0
+    margin_y = (page_height - sheet.rows * geo.height) / 2.0
+    per_page = sheet.columns * sheet.rows
+    bbox = f"[0 0 {geo.width:.2f} {geo.height:.2f}]"
+
+    out = _PdfStream(compress)
+    symbols = {}
+    kids = []
+    yield out.chunk(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def page(batch):
+        parts = []
+        for slot, label in enumerate(batch):
+            entry = symbols.get(label.barcode)
+            if entry is None:
+                entry = symbols[label.barcode] = (f"B{len(symbols) + 1}", out.allocate())
+                yield out.stream(
+                    entry[1],
+                    _symbol_stream(label.barcode, geo),
+                    f" /Type /XObject /Subtype /Form /BBox {bbox} /Resources 4 0 R",
+                )
+            name = entry[0]
+            row, column = divmod(slot, sheet.columns)
+            x = margin_x + column * geo.width
+            y = page_height - margin_y - (row + 1) * geo.height
+            price = _price_text(label.price)
+            title_width = geo.width - 2 * geo.pad - (len(price) + 1) * geo.title_size * 0.6
+            title_y = y + geo.height - geo.pad - geo.title_size
+            parts.append(f"q 1 0 0 1 {x:.2f} {y:.2f} cm /{name} Do Q")
+            parts.append(
+                f"BT /F1 {geo.title_size:.1f} Tf {x + geo.pad:.2f} {title_y:.2f} Td "
+                f"({_pdf_text(_fit(label.title or '', title_width, geo.title_size))}) Tj ET"
+            )
+            if price:
+                price_x = x + geo.width - geo.pad - len(price) * geo.title_size * 0.6
+                parts.append(f"BT /F1 {geo.title_size:.1f} Tf {price_x:.2f} {title_y:.2f} Td ({price}) Tj ET")
+        content = out.allocate()
+        yield out.stream(content, "\n".join(parts).encode("latin-1"))
+        number = out.allocate()
+        kids.append(number)
+        yield out.obj(
+            number,
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] "
+            f"/Resources 4 0 R /Contents {content} 0 R >>".encode("ascii"),
+        )
+
+    batch = []
+    for label in _expand(labels):
+        batch.append(label)
+        if len(batch) == per_page:
+            yield from page(batch)
+            batch = []
+    if batch or not kids:
+        yield from page(batch)
+
+    xobjects = " ".join(f"/{name} {number} 0 R" for name, number in symbols.values())
+    yield out.obj(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>")
+    yield out.obj(4, f"<< /Font << /F1 3 0 R >> /XObject << {xobjects} >> >>".encode("ascii"))
+    yield out.obj(2, f"<< /Type /Pages /Kids [{' '.join(f'{n} 0 R' for n in kids)}] /Count {len(kids)} >>".encode("ascii"))
+    yield out.obj(
+        1,
+        b"<< /Type /Catalog /Pages 2 0 R /ViewerPreferences << /PrintScaling /None /PickTrayByPDFSize true >> >>",
+    )
+    yield out.trailer()
+
+
+def build_label_pdf(labels, layout: str = "a4", compress: bool = True) -> bytes:
+    return b"".join(iter_label_pdf(labels, layout, compress))
+
+
+def _zpl_text(text: str) -> str:
+    # ^ and ~ start commands; everything else passes through as UTF-8 (^CI28).
+    return text.replace("^", " ").replace("~", " ")
+
+
+def iter_label_zpl(labels, layout: str = "roll"):
+    """ZPL II for thermal printers: one format per barcode, copies via ^PQ so the printer repeats it."""
+    sheet = LAYOUTS[layout]
+    width = int(sheet.label_width * DOTS_PER_MM)
+    height = int(sheet.label_height * DOTS_PER_MM)
+    pad = 2 * DOTS_PER_MM
+    module = max(int((width - 2 * pad) / (QUIET_LEFT + SYMBOL_MODULES + QUIET_RIGHT)), 1)
+    bar_height = height - 2 * pad - 24 - 30
+    for label in labels:
+        copies = max(int(label.copies or 0), 0)
+        if not copies:
+            continue
+        price = _price_text(label.price)
+        title_width = width - 2 * pad - (len(price) + 1) * 11 if price else width - 2 * pad
+        yield (
+            f"^XA^CI28^PW{width}^LL{height}\n"
+            f"^FO{pad},{pad}^A0N,20,20^FB{title_width},1,0,L^FD{_zpl_text(label.title or '')}^FS\n"
+            + (f"^FO{pad},{pad}^A0N,20,20^FB{width - 2 * pad},1,0,R^FD{price}^FS\n" if price else "")
+            + f"^FO{pad + QUIET_LEFT * module},{pad + 26}^BY{module}^BEN,{bar_height},Y,N^FD{label.barcode[:12]}^FS\n"
+            f"^PQ{copies}\n^XZ\n"
+        ).encode("utf-8")
@@ -0,0 +1,55 @@
+import re
+
+DEFAULT_COUNTRY_CODE = "998"
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_phone(value) -> str:
+    """
+    Canonical E.164 form ("+998901234567") of a user-typed phone, or "" when it isn't a phone
+    (blank, "POS", too short). Local 9-digit Uzbek numbers get the country code.
+    """
+    raw = "" if value is None else str(value).strip()
+    if not raw:
+        return ""
+    digits = _NON_DIGITS.sub("", raw)
+    if raw.startswith("00"):
+        digits = digits[2:]
+    if len(digits) == 9:
+        digits = DEFAULT_COUNTRY_CODE + digits
+    elif len(digits) == 10 and digits.startswith("8"):
+        # Old trunk prefix: 8 90 123 45 67.
+        digits = DEFAULT_COUNTRY_CODE + digits[1:]
+    if not 10 <= len(digits) <= 15:
+        return ""
+    return f"+{digits}"
+
+
+def format_phone(normalized: str, fallback: str = "") -> str:
+    """Human spacing for a normalized number: +998 90 123 45 67."""
+    if not normalized:
+        return fallback
+    if len(normalized) == 13 and normalized.startswith("+998"):
+        d = normalized[1:]
+        return f"+{d[:3]} {d[3:5]} {d[5:8]} {d[8:10]} {d[10:12]}"
+    return normalized
+
+
+def phone_lookup(value, field: str = "phone") -> dict:
+    """Filter kwargs that find a record by phone through the normalized index when possible."""
+    normalized = normalize_phone(value)
+    if normalized:
+        return {f"{field}_normalized": normalized}
+    return {field: (value or "").strip()}
+
+
+def normalized_update_fields(instance, update_fields, empty=""):
+    """
+    Refresh instance.phone_normalized from instance.phone before save(); returns update_fields
+    widened to include the derived column when the caller saves "phone" selectively.
+    """
+    instance.phone_normalized = normalize_phone(instance.phone) or empty
+    if update_fields is not None and "phone" in update_fields:
+        return {*update_fields, "phone_normalized"}
+    return update_fields
@@ -0,0 +1,203 @@
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from io import RawIOBase
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+# Rows are written straight into the deflate stream; the worksheet is never held in memory.
+FLUSH_EVERY = 500
+
+_ILLEGAL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    "</Types>"
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    "</Relationships>"
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    "</Relationships>"
+)
+# Style 0: default, 1: bold header.
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    "</styleSheet>"
+)
+
+
+class _ChunkBuffer(RawIOBase):
+    """Write-only, unseekable sink; zipfile then emits data descriptors instead of seeking back."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _column_letter(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _cell(ref: str, value, style: int = 0) -> str:
+    style_attr = f' s="{style}"' if style else ""
+    if value is None or value == "":
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"{style_attr}><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c r="{ref}"{style_attr}><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        value = value.strftime("%Y-%m-%d %H:%M")
+    elif isinstance(value, date):
+        value = value.isoformat()
+    text = escape(_ILLEGAL_XML.sub("", str(value)))
+    return f'<c r="{ref}" t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row(number: int, values, style: int = 0) -> str:
+    cells = "".join(_cell(f"{_column_letter(idx)}{number}", value, style) for idx, value in enumerate(values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+def stream_xlsx(headers, rows, sheet_title: str = "Sheet1"):
+    """
+    Yield an .xlsx workbook chunk by chunk. Cells use inline strings, so there is no
+    shared-strings table to accumulate and memory stays flat regardless of row count.
+    """
+    sheet_name = escape(re.sub(r"[\[\]\*\?/\\:]", " ", sheet_title)[:31] or "Sheet1", {'"': "&quot;"})
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _ROOT_RELS)
+        archive.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        archive.writestr("xl/styles.xml", _STYLES)
+        archive.writestr(
+            "xl/workbook.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        )
+        yield buffer.drain()
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" '
+                b'activePane="bottomLeft" state="frozen"/></sheetView></sheetViews><sheetData>'
+            )
+            sheet.write(_row(1, headers, style=1).encode("utf-8"))
+            for number, values in enumerate(rows, start=2):
+                sheet.write(_row(number, values).encode("utf-8"))
+                if number % FLUSH_EVERY == 0:
+                    yield buffer.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield buffer.drain()
+
+
+_SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_CELL_REF = re.compile(r"([A-Z]+)")
+
+
+def _column_index(ref: str) -> int:
+    letters = _CELL_REF.match(ref).group(1)
+    index = 0
+    for ch in letters:
+        index = index * 26 + (ord(ch) - 64)
+    return index - 1
+
+
+def _shared_strings(archive):
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    with archive.open("xl/sharedStrings.xml") as handle:
+        for _event, elem in ElementTree.iterparse(handle):
+            if elem.tag == f"{_SHEET_NS}si":
+                strings.append("".join(node.text or "" for node in elem.iter(f"{_SHEET_NS}t")))
+                elem.clear()
+    return strings
+
+
+def iter_xlsx_rows(fileobj):
+    """
+    Yield the first worksheet's rows as lists of strings, parsing the sheet XML incrementally so large
+    workbooks are never held in memory (only the shared-strings table is).
+    """
+    with zipfile.ZipFile(fileobj) as archive:
+        strings = _shared_strings(archive)
+        sheets = sorted(name for name in archive.namelist() if name.startswith("xl/worksheets/sheet"))
+        if not sheets:
+            return
+        sheet = "xl/worksheets/sheet1.xml" if "xl/worksheets/sheet1.xml" in sheets else sheets[0]
+        with archive.open(sheet) as handle:
+            for _event, elem in ElementTree.iterparse(handle):
+                if elem.tag != f"{_SHEET_NS}row":
+                    continue
+                values = []
+                for cell in elem.iter(f"{_SHEET_NS}c"):
+                    kind = cell.get("t")
+                    if kind == "inlineStr":
+                        value = "".join(node.text or "" for node in cell.iter(f"{_SHEET_NS}t"))
+                    else:
+                        node = cell.find(f"{_SHEET_NS}v")
+                        value = node.text if node is not None and node.text is not None else ""
+                        if kind == "s" and value:
+                            value = strings[int(value)]
+                    ref = cell.get("r")
+                    index = _column_index(ref) if ref else len(values)
+                    values.extend([""] * (index - len(values)))
+                    values.append(value)
+                elem.clear()
+                yield values
@@ -1,14 +1,25 @@
-from decimal import Decimal
+import csv
+import json
+from decimal import Decimal, InvalidOperation
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from functools import wraps
+from django.db import transaction
 from django.db.models import Count, Sum, F, Q, DecimalField, ExpressionWrapper
-from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
 from django.utils import timezone
-from django.utils.text import slugify
 from datetime import timedelta, date, time, datetime
 import calendar
 
@@ -40,11 +51,33 @@ def _operator_block(request):
         return HttpResponseForbidden("Operator role has access only to POS.")
     return None
 
-from apps.catalog.models import AboutPage, Author, Banner, Book, Category
+from apps.catalog.models import Book
 from apps.orders.cart import Cart
-from apps.orders.models import DeliveryNotice, DeliveryZone, Order, OrderItem
-from .models import Courier, Customer, InventoryLog, Expense, Debt
-from .utils.pdf import build_pdf
+from apps.orders.models import Order, OrderItem
+from .models import (
+    CatalogImport,
+    Courier,
+    Customer,
+    Debt,
+    Expense,
+    ExportJob,
+    InventoryLog,
+    StockSnapshot,
+    Stocktake,
+)
+from .services.catalog_import import run_import
+from .services.export_jobs import enqueue_export, job_payload
+from .services.forecast import reorder_report
+from .services.labels import LABEL_FORMATS, book_labels, label_stream, restock_labels, restock_logs_on
+from .services.ledger import reconcile_stock, take_snapshots, valuation_at
+from .services.datasets import DATASETS, EXPORT_FORMATS, stream_dataset
+from .services.periods import parse_report_period
+from .services.pos import create_pos_order, verify_pos_cart
+from .services.price_grid import parse_grid, save_price_grid
+from .services.pos_index import book_payload, cart_items as pos_cart_items, get_index, lookup_barcode, suggest_books
+from .services.reports import REPORTS, period_totals, render_report
+from .services.search import search_documents
+from .services.stocktake import StocktakeError, apply_stocktake, parse_stocktake, preview_stocktake
 
 
 def _set_status_timestamps(order: Order, status: str) -> None:
@@ -177,51 +210,29 @@ def dashboard(request):
     return render(request, "crm/dashboard.html", context)
 
 
-def _format_money(value) -> str:
-    try:
-        v = int(value)
-    except (TypeError, ValueError):
-        return str(value)
-    return f"{v:,}".replace(",", " ")
-
-
 def _parse_money(raw: str):
     cleaned = (raw or "").replace(" ", "").replace(",", "")
     if not cleaned:
         return None
     try:
         return Decimal(cleaned)
-    except (TypeError, ValueError):
+    except (TypeError, ValueError, InvalidOperation):
         return None
 
 
+def _report_pdf_response(kind: str, params=None):
+    filename, pdf_bytes = render_report(kind, params)
+    response = HttpResponse(pdf_bytes, content_type="application/pdf")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
 @staff_member_required
 def export_orders_pdf(request):
     operator_response = _operator_block(request)
     if operator_response:
         return operator_response
-    orders = (
-        Order.objects.select_related("customer", "courier")
-        .order_by("-created_at")[:2000]
-    )
-    lines = [
-        "BILIM UZ - Buyurtmalar tarixi",
-        f"Yaratilgan: {timezone.localtime().strftime('%Y-%m-%d %H:%M')}",
-        f"Jami: {orders.count()} ta",
-        "",
-        "ID | Sana | Mijoz | Telefon | Summa | Status | Kanal | Kuryer",
-        "-" * 90,
-    ]
-    for order in orders:
-        lines.append(
-            f"#{order.id} | {order.created_at:%Y-%m-%d} | {order.full_name} | {order.phone} | "
-            f"{_format_money(order.total_price)} | {order.get_status_display()} | "
-            f"{order.get_order_source_display()} | {order.courier or '—'}"
-        )
-    pdf_bytes = build_pdf(lines)
-    response = HttpResponse(pdf_bytes, content_type="application/pdf")
-    response["Content-Disposition"] = 'attachment; filename="bilimuz_orders.pdf"'
-    return response
+    return _report_pdf_response("orders")
 
 
 @staff_member_required
@@ -229,28 +240,7 @@ def export_sales_pdf(request):
     operator_response = _operator_block(request)
     if operator_response:
         return operator_response
-    items = (
-        OrderItem.objects.select_related("book", "order")
-        .order_by("-order__created_at")[:4000]
-    )
-    lines = [
-        "BILIM UZ - Xaridlar tarixi",
-        f"Yaratilgan: {timezone.localtime().strftime('%Y-%m-%d %H:%M')}",
-        f"Jami: {items.count()} qator",
-        "",
-        "Order | Sana | Kitob | Soni | Narx | Jami",
-        "-" * 90,
-    ]
-    for item in items:
-        total = item.line_total()
-        lines.append(
-            f"#{item.order_id} | {item.order.created_at:%Y-%m-%d} | {item.book.title} | "
-            f"{item.quantity} | {_format_money(item.price)} | {_format_money(total)}"
-        )
-    pdf_bytes = build_pdf(lines)
-    response = HttpResponse(pdf_bytes, content_type="application/pdf")
-    response["Content-Disposition"] = 'attachment; filename="bilimuz_sales.pdf"'
-    return response
+    return _report_pdf_response("sales")
 
 
 @staff_member_required
@@ -258,59 +248,22 @@ def export_report_pdf(request):
     operator_response = _operator_block(request)
     if operator_response:
         return operator_response
-    orders = Order.objects.select_related("customer", "courier").order_by("-created_at")[:2000]
-    items = OrderItem.objects.select_related("book", "order").order_by("-order__created_at")[:4000]
-
-    def _cell(value: str, width: int) -> str:
-        text = (value or "").strip()
-        inner_width = max(width - 2, 1)
-        if len(text) > inner_width:
-            if inner_width <= 3:
-                text = text[:inner_width]
-            else:
-                text = text[: inner_width - 3] + "..."
-        return f" {text.ljust(inner_width)} "
-
-    widths = [12, 8, 22, 40, 6, 16, 16, 18]
-    headers = ["Turi", "ID", "Mijoz", "Kitob", "Soni", "Tel", "Summa", "Status"]
-
-    def _border() -> str:
-        return "-" * (sum(widths) + len(widths) + 1)
+    return _report_pdf_response("report")
 
-    def _row(cols) -> str:
-        return "|" + "|".join([_cell(col, widths[i]) for i, col in enumerate(cols)]) + "|"
 
-    lines = [
-        "BILIM UZ - Hisobot (Buyurtmalar + Xaridlar)",
-        f"Yaratilgan: {timezone.localtime().strftime('%Y-%m-%d %H:%M')}",
-        "",
-        _border(),
-        _row(headers),
-        _border(),
-    ]
-
-    for item in items:
-        order = item.order
-        total = item.line_total()
-        lines.append(
-            _row(
-                [
-                    "Online" if order.order_source == "online" else "Offline",
-                    f"#{order.id}",
-                    order.full_name,
-                    item.book.title,
-                    str(item.quantity),
-                    order.phone,
-                    _format_money(total),
-                    order.get_status_display(),
-                ]
-            )
-        )
-    lines.append(_border())
-
-    pdf_bytes = build_pdf(lines)
-    response = HttpResponse(pdf_bytes, content_type="application/pdf")
-    response["Content-Disposition"] = 'attachment; filename="bilimuz_report.pdf"'
+@staff_member_required
+def export_dataset(request, dataset: str, fmt: str):
+    """CSV/XLSX stream rows as they are read; PDF goes through the same dataset rows."""
+    operator_response = _operator_block(request)
+    if operator_response:
+        return operator_response
+    if dataset not in DATASETS or fmt not in ("pdf", *EXPORT_FORMATS):
+        raise Http404("Noma'lum eksport.")
+    if fmt == "pdf":
+        return _report_pdf_response(dataset, request.GET)
+    stem = REPORTS[dataset][1]
+    response = StreamingHttpResponse(stream_dataset(dataset, fmt, request.GET), content_type=EXPORT_FORMATS[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{stem}.{fmt}"'
     return response
 
 
@@ -319,60 +272,10 @@ def monthly_report(request):
     operator_response = _operator_block(request)
     if operator_response:
         return operator_response
-    today = timezone.localdate()
-    month_start = today.replace(day=1)
-    start_raw = (request.GET.get("start") or "").strip()
-    end_raw = (request.GET.get("end") or "").strip()
-    start_time_raw = (request.GET.get("start_time") or "").strip()
-    end_time_raw = (request.GET.get("end_time") or "").strip()
-    start_date = month_start
-    end_date = today
-    start_time = time(0, 0)
-    end_time = time(23, 59)
-    if start_raw:
-        try:
-            start_date = date.fromisoformat(start_raw)
-        except ValueError:
-            start_date = month_start
-    if end_raw:
-        try:
-            end_date = date.fromisoformat(end_raw)
-        except ValueError:
-            end_date = today
-    if start_time_raw:
-        try:
-            start_time = time.fromisoformat(start_time_raw)
-        except ValueError:
-            start_time = time(0, 0)
-    if end_time_raw:
-        try:
-            end_time = time.fromisoformat(end_time_raw)
-        except ValueError:
-            end_time = time(23, 59)
-    if start_date > end_date:
-        start_date, end_date = end_date, start_date
-
-    start_dt = datetime.combine(start_date, start_time)
-    end_dt = datetime.combine(end_date, end_time)
-    if start_dt > end_dt:
-        start_dt, end_dt = end_dt, start_dt
-    tz = timezone.get_current_timezone()
-    start_dt = timezone.make_aware(start_dt, tz)
-    end_dt = timezone.make_aware(end_dt, tz)
-
-    income_total = (
-        Order.objects.filter(created_at__gte=start_dt, created_at__lte=end_dt)
-        .aggregate(total=Sum("total_price"))
-        .get("total")
-        or Decimal("0")
-    )
-    expense_total = (
-        Expense.objects.filter(spent_on__gte=start_date, spent_on__lte=end_date)
-        .aggregate(total=Sum("amount"))
-        .get("total")
-        or Decimal("0")
-    )
-    net_total = income_total - expense_total
+    period = parse_report_period(request.GET)
+    start_date, end_date = period["start_date"], period["end_date"]
+    start_time, end_time = period["start_time"], period["end_time"]
+    income_total, expense_total, net_total = period_totals(period)
 
     base_month = start_date
     last_day = calendar.monthrange(base_month.year, base_month.month)[1]
@@ -490,80 +393,58 @@ def export_monthly_report_pdf(request):
     operator_response = _operator_block(request)
     if operator_response:
         return operator_response
-    today = timezone.localdate()
-    month_start = today.replace(day=1)
-    start_raw = (request.GET.get("start") or "").strip()
-    end_raw = (request.GET.get("end") or "").strip()
-    start_time_raw = (request.GET.get("start_time") or "").strip()
-    end_time_raw = (request.GET.get("end_time") or "").strip()
-    start_date = month_start
-    end_date = today
-    start_time = time(0, 0)
-    end_time = time(23, 59)
-    if start_raw:
-        try:
-            start_date = date.fromisoformat(start_raw)
-        except ValueError:
-            start_date = month_start
-    if end_raw:
-        try:
-            end_date = date.fromisoformat(end_raw)
-        except ValueError:
-            end_date = today
-    if start_time_raw:
-        try:
-            start_time = time.fromisoformat(start_time_raw)
-        except ValueError:
-            start_time = time(0, 0)
-    if end_time_raw:
-        try:
-            end_time = time.fromisoformat(end_time_raw)
-        except ValueError:
-            end_time = time(23, 59)
-    if start_date > end_date:
-        start_date, end_date = end_date, start_date
-
-    start_dt = datetime.combine(start_date, start_time)
-    end_dt = datetime.combine(end_date, end_time)
-    if start_dt > end_dt:
-        start_dt, end_dt = end_dt, start_dt
-    tz = timezone.get_current_timezone()
-    start_dt = timezone.make_aware(start_dt, tz)
-    end_dt = timezone.make_aware(end_dt, tz)
-
-    income_total = (
-        Order.objects.filter(created_at__gte=start_dt, created_at__lte=end_dt)
-        .aggregate(total=Sum("total_price"))
-        .get("total")
-        or Decimal("0")
-    )
-    expense_total = (
-        Expense.objects.filter(spent_on__gte=start_date, spent_on__lte=end_date)
-        .aggregate(total=Sum("amount"))
-        .get("total")
-        or Decimal("0")
-    )
-    net_total = income_total - expense_total
-
-    lines = [
-        "BILIM UZ - Oylik hisobot",
-        f"Davr: {start_date:%Y-%m-%d} {start_time:%H:%M} - {end_date:%Y-%m-%d} {end_time:%H:%M}",
-        "",
-        f"Kirim (sotuv): {_format_money(income_total)}",
-        f"Chiqim: {_format_money(expense_total)}",
-        f"Qoldiq: {_format_money(net_total)}",
-        "",
-        "Chiqimlar ro'yxati:",
-        "Sana | Sarlavha | Summa",
-        "-" * 60,
-    ]
-    for expense in Expense.objects.filter(spent_on__gte=start_date, spent_on__lte=end_date).order_by("-spent_on"):
-        lines.append(f"{expense.spent_on:%Y-%m-%d} | {expense.title} | {_format_money(expense.amount)}")
+    return _report_pdf_response("monthly", request.GET)
 
-    pdf_bytes = build_pdf(lines)
-    response = HttpResponse(pdf_bytes, content_type="application/pdf")
-    response["Content-Disposition"] = 'attachment; filename="bilimuz_monthly_report.pdf"'
-    return response
+
+@staff_member_required
+def export_job_create(request):
+    operator_response = _operator_block(request)
+    if operator_response:
+        return operator_response
+    if request.method != "POST":
+        return redirect("crm_dashboard")
+    is_ajax = request.headers.get("x-requested-with") == "XMLHttpRequest"
+    try:
+        job, created = enqueue_export(request.POST.getlist("reports"), request.POST, user=request.user)
+    except ValueError as exc:
+        if is_ajax:
+            return JsonResponse({"ok": False, "error": str(exc)}, status=400)
+        messages.warning(request, str(exc))
+        return redirect("crm_dashboard")
+    if is_ajax:
+        return JsonResponse({"ok": True, "created": created, **job_payload(job)}, status=202 if created else 200)
+    return redirect("crm_export_job", job_id=job.id)
+
+
+@staff_member_required
+def export_job_detail(request, job_id: int):
+    operator_response = _operator_block(request)
+    if operator_response:
+        return operator_response
+    job = get_object_or_404(ExportJob, id=job_id)
+    labels = [REPORTS[kind][0] for kind in job.reports if kind in REPORTS]
+    return render(request, "crm/export_job.html", {"job": job, "labels": labels, "payload": job_payload(job)})
+
+
+@staff_member_required
+def export_job_status(request, job_id: int):
+    operator_response = _operator_block(request)
+    if operator_response:
+        return operator_response
+    job = get_object_or_404(ExportJob, id=job_id)
+    return JsonResponse(job_payload(job))
+
+
+@staff_member_required
+def export_job_download(request, job_id: int):
+    operator_response = _operator_block(request)
+    if operator_response:
+        return operator_response
+    job = get_object_or_404(ExportJob, id=job_id)
+    if not job.is_ready:
+        raise Http404("Fayl tayyor emas yoki muddati o'tgan.")
+    filename = job.file.name.rsplit("/", 1)[-1]
+    return FileResponse(job.file.open("rb"), as_attachment=True, filename=filename)
 
 
 @staff_member_required
@@ -655,16 +536,162 @@ def inventory_list(request):
     return render(request, "crm/inventory.html", {"books": books})
 
 
+@staff_member_required
+def inventory_labels(request):
+    """Barcode label sheet for checked books (copies each or one per unit in stock) or a day's restock."""
+    operator_response = _operator_block(request)
+    if operator_response:
+        return operator_response
+    fmt = request.GET.get("format") or "pdf"
+    layout = request.GET.get("layout") or "a4"
+    if fmt not in LABEL_FORMATS:
+        raise Http404("Unknown format")
+    restock_day = (request.GET.get("restock") or "").strip()
+    if restock_day:
+        try:
+            labels, skipped = restock_labels(restock_logs_on(date.fromisoformat(restock_day)))
+        except ValueError:
+            messages.warning(request, "Sana noto'g'ri.")
+            return redirect("crm_inventory")
+    else:
+        book_ids = [value for value in request.GET.getlist("book") if value.isdigit()]
+        try:
+            copies = min(max(int(request.GET.get("copies") or 1), 1), 500)
+        except ValueError:
+            copies = 1
+        labels, skipped = book_labels(
+            Book.objects.filter(id__in=book_ids), copies=copies, per_stock=request.GET.get("copies") == "stock"
+        )
+    if not labels:
+        messages.warning(request, "Chop etiladigan yorliq yo'q.")
+        return redirect("crm_inventory")
+    if skipped:
+        messages.warning(request, f"EAN-13 bo'lmagan shtrix-kodlar o'tkazib yuborildi: {len(skipped)} ta.")
+    content_type, extension = LABEL_FORMATS[fmt]
+    response = StreamingHttpResponse(label_stream(labels, fmt, layout), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="labels.{extension}"'
+    return response
+
+
+@staff_member_required
+def stocktake_upload(request):
+    operator_response = _operator_block(request)
+    if operator_response:
+        return operator_response
+    if request.method == "POST":
+        uploaded = request.FILES.get("file")
+        if not uploaded:
+            messages.warning(request, "Fayl tanlanmagan.")
+            return redirect("crm_stocktake")
+        try:
+            counts, errors = parse_stocktake(uploaded)
+        except StocktakeError as exc:
+            messages.warning(request, str(exc))
+            return redirect("crm_stocktake")
+        stocktake = Stocktake.objects.create(
+            source_name=uploaded.name[:255],
+            note=(request.POST.get("note") or "").strip()[:255],
+            counts=counts,
+            errors=errors,
+            created_by=request.user,
+        )
+        return redirect("crm_stocktake_detail", stocktake_id=stocktake.id)
+    recent = Stocktake.objects.select_related("created_by")[:20]
+    return render(request, "crm/stocktake.html", {"recent": recent})
+
+
+@staff_member_required
+def stocktake_detail(request, stocktake_id: int):
+    operator_response = _operator_block(request)
+    if operator_response:
+        return operator_response
+    stocktake = get_object_or_404(Stocktake, id=stocktake_id)
+    if request.method == "POST" and stocktake.status == "draft":
+        action = request.POST.get("action")
+        if action == "apply":
+            try:
+                stocktake = apply_stocktake(stocktake)
+            except StocktakeError as exc:
+                messages.warning(request, str(exc))
+            else:
+                messages.success(request, f"Qo'llandi: {stocktake.summary['changed']} ta kitob yangilandi.")
+        elif action == "discard":
+            stocktake.status = "discarded"
+            stocktake.save(update_fields=["status"])
+        return redirect("crm_stocktake_detail", stocktake_id=stocktake.id)
+    preview = preview_stocktake(stocktake) if stocktake.status == "draft" else None
+    return render(request, "crm/stocktake_detail.html", {"stocktake": stocktake, "preview": preview})
+
+
+@staff_member_required
+def inventory_valuation(request):
+    operator_response = _operator_block(request)
+    if operator_response:
+        return operator_response
+    day = timezone.localdate()
+    date_raw = (request.GET.get("date") or "").strip()
+    if date_raw:
+        try:
+            day = date.fromisoformat(date_raw)
+        except ValueError:
+            pass
+    at = timezone.make_aware(datetime.combine(day, time.max))
+    rows, total_value = valuation_at(at)
+    titles = dict(Book.objects.values_list("id", "title"))
+    rows = sorted(
+        (
+            {"book_id": book_id, "title": titles.get(book_id, ""), "quantity": qty, "unit_cost": cost, "value": value}
+            for book_id, qty, cost, value in rows
+        ),
+        key=lambda row: row["value"],
+        reverse=True,
+    )
+    context = {
+        "day": day,
+        "rows": rows[:500],
+        "total_value": total_value,
+        "total_quantity": sum(row["quantity"] for row in rows),
+        "books_count": len(rows),
+        "last_snapshot": (
+            StockSnapshot.objects.filter(taken_at__lte=at).order_by("-taken_at").values_list("taken_at", flat=True).first()
+        ),
+        "mismatches": reconcile_stock() if day == timezone.localdate() else [],
+    }
+    return render(request, "crm/inventory_valuation.html", context)
+
+
+@staff_member_required
+def reorder_list(request):
+    operator_response = _operator_block(request)
+    if operator_response:
+        return operator_response
+    show_all = request.GET.get("all") == "1"
+    report = reorder_report()
+    rows = report if show_all else [row for row in report if row["needs_reorder"]]
+    context = {
+        "rows": rows[:500],
+        "rows_count": len(rows),
+        "books_count": len(report),
+        "needs_reorder_count": sum(1 for row in report if row["needs_reorder"]),
+        "suggested_total": sum(row["suggested"] for row in rows),
+        "show_all": show_all,
+        "history_days": settings.REORDER_HISTORY_DAYS,
+        "lead_time_days": settings.REORDER_LEAD_TIME_DAYS,
+        "cover_days": settings.REORDER_COVER_DAYS,
+    }
+    return render(request, "crm/reorder.html", context)
+
+
 @login_required
 def pos_checkout(request):
     cart = Cart(request)
     is_ajax = request.headers.get("x-requested-with") == "XMLHttpRequest"
 
     def _cart_payload():
-        cart_items = list(cart.items())
+        cart_items = pos_cart_items(cart)
         cart_html = render_to_string(
             "crm/pos_cart.html",
-            {"cart_items": cart_items, "cart_total": cart.total_price()},
+            {"cart_items": cart_items, "cart_total": sum(item["line_total"] for item in cart_items)},
             request=request,
         )
         return JsonResponse({"ok": True, "cart_html": cart_html})
@@ -680,7 +707,7 @@ def pos_checkout(request):
                 return _cart_payload()
             return redirect("crm_pos")
         if action == "add" and barcode and not book_id:
-            book = Book.objects.only("id").filter(barcode=barcode).first()
+            book = lookup_barcode(barcode)
             if not book:
                 message = "Shtrix-kod topilmadi."
                 if is_ajax:
@@ -705,54 +732,128 @@ def pos_checkout(request):
             return redirect("crm_pos")
 
         if action == "checkout":
-            full_name = request.POST.get("full_name", "POS mijoz")
-            phone = request.POST.get("phone", "")
-            payment_type = request.POST.get("payment_type", "cash")
-            discount_raw = (request.POST.get("discount_amount") or "").strip()
             cart_items = list(cart.items())
             if cart_items:
-                subtotal = cart.total_price()
-                customer = None
-                discount_percent = 0
-                discount_amount = Decimal("0")
-                if phone:
-                    customer = Customer.objects.filter(phone=phone).first()
-                    if customer:
-                        discount_percent = min(int(customer.discount_percent or 0), 100)
-                if discount_raw:
-                    parsed_discount = _parse_money(discount_raw)
-                    if parsed_discount is not None and parsed_discount > 0:
-                        max_discount = (subtotal * Decimal("0.07")).quantize(Decimal("0.01"))
-                        discount_amount = min(parsed_discount, max_discount)
-                        discount_percent = int((discount_amount * Decimal("100")) / subtotal) if subtotal > 0 else 0
-                if not discount_amount and discount_percent:
-                    discount_amount = (subtotal * Decimal(discount_percent)) / Decimal("100")
-                total_price = subtotal - discount_amount
-                order = Order.objects.create(
-                    full_name=full_name,
-                    phone=phone or "POS",
-                    payment_type=payment_type,
-                    subtotal_before_discount=subtotal,
-                    discount_percent=discount_percent,
-                    discount_amount=discount_amount,
-                    total_price=total_price,
-                    order_source="pos",
-                    status="paid",
-                    paid_at=timezone.now(),
-                    customer=customer,
+                create_pos_order(
+                    cart_items,
+                    full_name=request.POST.get("full_name", "POS mijoz"),
+                    phone=request.POST.get("phone", ""),
+                    payment_type=request.POST.get("payment_type", "cash"),
+                    manual_discount=_parse_money((request.POST.get("discount_amount") or "").strip()),
                 )
-                for item in cart_items:
-                    OrderItem.objects.create(
-                        order=order,
-                        book=item["book"],
-                        quantity=item["quantity"],
-                        price=item["price"],
-                    )
                 cart.clear()
             return redirect("crm_pos")
 
-    books = Book.objects.all().order_by("title")[:200]
-    return render(request, "crm/pos.html", {"books": books, "cart_items": list(cart.items()), "cart_total": cart.total_price()})
+    cart_items = pos_cart_items(cart)
+    return render(
+        request,
+        "crm/pos.html",
+        {"cart_items": cart_items, "cart_total": sum(item["line_total"] for item in cart_items)},
+    )
+
+
+@login_required
+def pos_local(request):
+    """POS whose cart lives in the browser; the server is only contacted for the catalog and the checkout."""
+    return render(request, "crm/pos_local.html")
+
+
+@login_required
+def pos_catalog(request):
+    """Price/stock snapshot for the browser cart, keyed by the POS index version (ETag)."""
+    index = get_index()
+    etag = f'"pos-{index.version}"'
+    if request.headers.get("If-None-Match") == etag:
+        response = HttpResponse(status=304)
+    else:
+        response = JsonResponse(
+            {
+                "version": index.version,
+                "fields": ["id", "title", "barcode", "price", "stock"],
+                "books": [
+                    [book.id, book.title, book.barcode, str(book.price), book.stock] for book in index.by_id.values()
+                ],
+            }
+        )
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def _pos_change_payload(change):
+    return {key: str(value) if isinstance(value, Decimal) else value for key, value in change.items()}
+
+
+@login_required
+def pos_cart_checkout(request):
+    """
+    Checkout for the browser cart: one JSON request that re-prices every line from the database (rows locked),
+    re-applies the discount rules and checks stock. Any difference is returned as a 409 diff; the cashier
+    resends with "confirm": true to sell at the server's prices.
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    try:
+        payload = json.loads(request.body or b"{}")
+        lines = []
+        for row in payload.get("items") or []:
+            quantity = int(row.get("quantity") or 0)
+            if quantity > 0:
+                price = row.get("price")
+                lines.append((int(row["book_id"]), quantity, Decimal(str(price)) if price is not None else None))
+        expected_total = payload.get("total")
+        expected_total = Decimal(str(expected_total)) if expected_total is not None else None
+    except (ValueError, TypeError, KeyError, AttributeError, ArithmeticError):
+        return JsonResponse({"ok": False, "error": "Noto‘g‘ri so‘rov."}, status=400)
+    if not lines:
+        return JsonResponse({"ok": False, "error": "Savat bo'sh."}, status=400)
+
+    phone = str(payload.get("phone") or "").strip()
+    manual_discount = _parse_money(str(payload.get("discount_amount") or ""))
+    with transaction.atomic():
+        verified = verify_pos_cart(lines, phone, manual_discount, expected_total)
+        totals = {
+            "subtotal": str(verified["subtotal"]),
+            "discount_amount": str(verified["discount_amount"]),
+            "total": str(verified["total"]),
+        }
+        if not verified["items"]:
+            # Every line points at a deleted book: confirming would sell nothing, as an empty paid order.
+            return JsonResponse(
+                {
+                    "ok": False,
+                    "error": "Savatdagi kitoblar topilmadi.",
+                    "changes": [_pos_change_payload(change) for change in verified["changes"]],
+                    **totals,
+                },
+                status=400,
+            )
+        if verified["changes"] and not payload.get("confirm"):
+            return JsonResponse(
+                {"ok": False, "changes": [_pos_change_payload(change) for change in verified["changes"]], **totals},
+                status=409,
+            )
+        order = create_pos_order(
+            verified["items"],
+            full_name=str(payload.get("full_name") or "POS mijoz"),
+            phone=phone,
+            payment_type=payload.get("payment_type") if payload.get("payment_type") in ("cash", "bank") else "cash",
+            manual_discount=manual_discount,
+        )
+    return JsonResponse({"ok": True, "order_id": order.id, **totals})
+
+
+@login_required
+def pos_lookup(request):
+    """Scan/typeahead for the POS, answered from the in-process index: ?barcode= for one book, ?q= for titles."""
+    barcode = (request.GET.get("barcode") or "").strip()
+    if barcode:
+        book = lookup_barcode(barcode)
+        if book is None:
+            return JsonResponse({"ok": False, "error": "Shtrix-kod topilmadi."}, status=404)
+        return JsonResponse({"ok": True, "book": book_payload(book)})
+    query = (request.GET.get("q") or "").strip()
+    return JsonResponse({"ok": True, "results": [book_payload(book) for book in suggest_books(query)]})
 
 
 @staff_member_required
@@ -772,6 +873,9 @@ def cleanup_data(request):
     scope = (request.POST.get("scope") or "closed").strip()
     force_all = (request.POST.get("force_all") or "").strip() == "1"
 
+    # Fold the inventory log into ledger snapshots before it is deleted, so stock-at-date keeps working.
+    take_snapshots(timezone.now() if force_all else cutoff)
+
     if force_all:
         orders_count = Order.objects.count()
         Order.objects.all().delete()
@@ -812,81 +916,9 @@ def search(request):
     if operator_response:
         return operator_response
     query = (request.GET.get("q") or "").strip()
-    results = {
-        "orders": [],
-        "customers": [],
-        "couriers": [],
-        "books": [],
-        "categories": [],
-        "authors": [],
-        "expenses": [],
-        "debts": [],
-        "inventory_logs": [],
-        "delivery_notices": [],
-        "delivery_zones": [],
-        "banners": [],
-        "about_pages": [],
-    }
-
-    if query:
-        order_filter = (
-            Q(full_name__icontains=query)
-            | Q(phone__icontains=query)
-            | Q(address__icontains=query)
-            | Q(address_text__icontains=query)
-            | Q(location__icontains=query)
-            | Q(note__icontains=query)
-        )
-        results["orders"] = Order.objects.filter(order_filter).order_by("-created_at")[:50]
-
-        customer_filter = (
-            Q(full_name__icontains=query)
-            | Q(phone__icontains=query)
-            | Q(email__icontains=query)
-            | Q(tags__icontains=query)
-            | Q(notes__icontains=query)
-        )
-        results["customers"] = Customer.objects.filter(customer_filter).order_by("-created_at")[:50]
-
-        courier_filter = (
-            Q(name__icontains=query)
-            | Q(phone__icontains=query)
-            | Q(telegram_username__icontains=query)
-        )
-        results["couriers"] = Courier.objects.filter(courier_filter).order_by("-created_at")[:50]
-
-        book_filter = (
-            Q(title__icontains=query)
-            | Q(author__name__icontains=query)
-            | Q(category__name__icontains=query)
-            | Q(barcode__icontains=query)
-        )
-        results["books"] = Book.objects.filter(book_filter).order_by("-created_at")[:50]
-
-        results["categories"] = Category.objects.filter(name__icontains=query).order_by("name")[:50]
-        results["authors"] = Author.objects.filter(name__icontains=query).order_by("name")[:50]
-
-        expense_filter = Q(title__icontains=query) | Q(note__icontains=query)
-        results["expenses"] = Expense.objects.filter(expense_filter).order_by("-spent_on")[:50]
-
-        debt_filter = Q(full_name__icontains=query) | Q(phone__icontains=query) | Q(note__icontains=query)
-        results["debts"] = Debt.objects.filter(debt_filter).order_by("-created_at")[:50]
-
-        inv_filter = Q(book__title__icontains=query) | Q(note__icontains=query)
-        results["inventory_logs"] = InventoryLog.objects.filter(inv_filter).order_by("-created_at")[:50]
-
-        notice_filter = Q(title__icontains=query) | Q(body__icontains=query)
-        results["delivery_notices"] = DeliveryNotice.objects.filter(notice_filter).order_by("-updated_at")[:50]
-
-        zone_filter = Q(name__icontains=query) | Q(message__icontains=query)
-        results["delivery_zones"] = DeliveryZone.objects.filter(zone_filter).order_by("name")[:50]
-
-        results["banners"] = Banner.objects.filter(title__icontains=query).order_by("-created_at")[:50]
-
-        about_filter = Q(title__icontains=query) | Q(body__icontains=query)
-        results["about_pages"] = AboutPage.objects.filter(about_filter).order_by("-updated_at")[:50]
-
-    return render(request, "crm/search.html", {"query": query, "results": results})
+    groups = search_documents(query) if query else []
+    total = sum(len(docs) for _key, _label, docs in groups)
+    return render(request, "crm/search.html", {"query": query, "groups": groups, "total": total})
 
 
 @staff_member_required
@@ -907,83 +939,120 @@ def prices_list(request):
 
 
 @staff_member_required
-def entry_list(request):
+def catalog_import_upload(request):
     operator_response = _operator_block(request)
     if operator_response:
         return operator_response
     if request.method == "POST":
-        action = (request.POST.get("action") or "update").strip()
-        if action == "create":
-            title = (request.POST.get("title") or "").strip()
-            purchase_raw = (request.POST.get("purchase_price") or "").strip()
-            sale_raw = (request.POST.get("sale_price") or "").strip()
-            barcode = (request.POST.get("barcode") or "").strip()
-
-            purchase_price = _parse_money(purchase_raw) if purchase_raw else None
-            sale_price = _parse_money(sale_raw) if sale_raw else None
-
-            if title and purchase_price is not None and sale_price is not None:
-                category = Category.objects.first()
-                if not category:
-                    category = Category.objects.create(name="Umumiy", slug="umumiy")
-
-                author = Author.objects.first()
-                if not author:
-                    author = Author.objects.create(name="Noma'lum")
-
-                base_slug = slugify(title) or "book"
-                slug = base_slug
-                suffix = 1
-                while Book.objects.filter(slug=slug).exists():
-                    suffix += 1
-                    slug = f"{base_slug}-{suffix}"
-
-                Book.objects.create(
-                    title=title,
-                    slug=slug,
-                    category=category,
-                    author=author,
-                    purchase_price=purchase_price,
-                    sale_price=sale_price,
-                    barcode=barcode or None,
-                )
-            return redirect("crm_entry")
-        if action == "update":
-            book_id = request.POST.get("book_id")
-            book = get_object_or_404(Book, id=book_id)
-            title = (request.POST.get("title") or "").strip()
-            purchase_raw = (request.POST.get("purchase_price") or "").strip()
-            sale_raw = (request.POST.get("sale_price") or "").strip()
-            barcode = (request.POST.get("barcode") or "").strip()
-
-            purchase_price = _parse_money(purchase_raw) if purchase_raw else None
-            sale_price = _parse_money(sale_raw) if sale_raw else None
-
-            update_fields = []
-            if title:
-                book.title = title
-                update_fields.append("title")
-            if purchase_price is not None:
-                book.purchase_price = purchase_price
-                update_fields.append("purchase_price")
-            if sale_price is not None:
-                book.sale_price = sale_price
-                update_fields.append("sale_price")
-
-            book.barcode = barcode
-            update_fields.append("barcode")
-
-            if update_fields:
-                book.save(update_fields=update_fields)
-        return redirect("crm_entry")
+        uploaded = request.FILES.get("file")
+        if not uploaded or not uploaded.name.lower().endswith((".csv", ".txt", ".xlsx")):
+            messages.warning(request, "CSV yoki XLSX fayl tanlang.")
+            return redirect("crm_catalog_import")
+        job = CatalogImport(source_name=uploaded.name[:255], created_by=request.user)
+        job.file.save(uploaded.name, uploaded, save=False)
+        job.save()
+        return redirect("crm_catalog_import_detail", import_id=job.id)
+    recent = CatalogImport.objects.select_related("created_by")[:20]
+    return render(request, "crm/catalog_import.html", {"recent": recent})
+
+
+@staff_member_required
+def catalog_import_detail(request, import_id: int):
+    operator_response = _operator_block(request)
+    if operator_response:
+        return operator_response
+    job = get_object_or_404(CatalogImport, id=import_id)
+    if request.method == "POST" and request.POST.get("action") == "run" and job.status in ("pending", "failed"):
+        # In-request run for small files; large ones would hold the worker, so they go back to the queue
+        # (`import_catalog --queue`), which resumes a failed import after its last committed chunk.
+        try:
+            size = job.file.size
+        except OSError:
+            size = 0
+        if size > settings.CATALOG_IMPORT_INLINE_MAX_KB * 1024:
+            CatalogImport.objects.filter(id=job.id, status="failed").update(status="pending")
+            messages.info(request, "Fayl katta: navbatga qo'yildi, fon jarayoni yuklaydi.")
+            return redirect("crm_catalog_import_detail", import_id=job.id)
+        job = run_import(job)
+        if job.status == "done":
+            messages.success(request, f"Yuklandi: {job.created_count} ta kitob.")
+        elif job.status == "running":
+            messages.info(request, "Bu import allaqachon yuklanmoqda.")
+        else:
+            messages.warning(request, job.error)
+        return redirect("crm_catalog_import_detail", import_id=job.id)
+    if request.GET.get("format") == "csv":
+        response = HttpResponse(content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="import-{job.id}-errors.csv"'
+        writer = csv.writer(response)
+        writer.writerow(["row", "error"])
+        writer.writerows(job.errors)
+        return response
+    return render(request, "crm/catalog_import_detail.html", {"job": job})
+
 
+NEW_GRID_ROWS = 5
+
+
+def _grid_money(value):
+    # Every digit the price has: the grid posts the whole row back, so a rounded cell would be saved rounded.
+    return f"{value.normalize():,f}".replace(",", " ") if value is not None else ""
+
+
+@staff_member_required
+def entry_list(request):
+    operator_response = _operator_block(request)
+    if operator_response:
+        return operator_response
     query = (request.GET.get("q") or "").strip()
-    books = Book.objects.all()
-    if query:
-        books = books.filter(
-            Q(title__icontains=query)
-            | Q(author__name__icontains=query)
-            | Q(barcode__icontains=query)
-        )
-    books = books.order_by("title")[:500]
-    return render(request, "crm/entry.html", {"books": books, "query": query})
+    errors = {}
+    if request.method == "POST":
+        action = (request.POST.get("action") or "grid").strip()
+        if action in ("create", "update"):
+            # Single-row form posts go through the same validation as the grid.
+            data = {f"rows-0-{field}": request.POST.get(field) for field in ("title", "purchase_price", "sale_price", "barcode")}
+            data["rows-0-id"] = request.POST.get("book_id") if action == "update" else ""
+            rows = parse_grid(data)
+        else:
+            rows = parse_grid(request.POST)
+        summary, errors = save_price_grid(rows)
+        if not errors:
+            if summary["created"] or summary["updated"]:
+                messages.success(request, f"Saqlandi: {summary['updated']} ta o'zgartirildi, {summary['created']} ta qo'shildi.")
+            return redirect(request.get_full_path())
+        messages.error(request, f"Saqlanmadi: {len(errors)} ta qatorda xato.")
+        grid_rows = [{**row, "error": errors.get(row["row"], "")} for row in rows]
+        next_row = max((row["row"] for row in rows), default=-1) + 1
+    else:
+        books = Book.objects.all()
+        if query:
+            books = books.filter(
+                Q(title__icontains=query)
+                | Q(author__name__icontains=query)
+                | Q(barcode__icontains=query)
+            )
+        books = books.order_by("title").only("id", "title", "purchase_price", "sale_price", "barcode")[:500]
+        grid_rows = [
+            {
+                "row": number,
+                "id": book.id,
+                "title": book.title,
+                "purchase_price": _grid_money(book.purchase_price),
+                "sale_price": _grid_money(book.sale_price),
+                "barcode": book.barcode or "",
+                "error": "",
+            }
+            for number, book in enumerate(books)
+        ]
+        next_row = len(grid_rows)
+    new_rows = [{"row": next_row + offset, "id": None, "error": ""} for offset in range(NEW_GRID_ROWS)]
+    return render(
+        request,
+        "crm/entry.html",
+        {
+            "grid_rows": grid_rows + new_rows,
+            "next_row": next_row + NEW_GRID_ROWS,
+            "query": query,
+            "resubmit": bool(errors),
+        },
+    )
@@ -0,0 +1,57 @@
+import re
+
+from django.db import migrations, models
+
+_NON_DIGITS = re.compile(r"\D")
+BATCH = 1000
+
+
+def normalize_phone(value):
+    # Frozen copy of apps.crm.utils.phones.normalize_phone as of this migration.
+    raw = "" if value is None else str(value).strip()
+    if not raw:
+        return ""
+    digits = _NON_DIGITS.sub("", raw)
+    if raw.startswith("00"):
+        digits = digits[2:]
+    if len(digits) == 9:
+        digits = "998" + digits
+    elif len(digits) == 10 and digits.startswith("8"):
+        digits = "998" + digits[1:]
+    if not 10 <= len(digits) <= 15:
+        return ""
+    return f"+{digits}"
+
+
+def backfill_normalized_phones(model, empty=""):
+    stale = []
+    for obj in model.objects.only("id", "phone", "phone_normalized").iterator(chunk_size=BATCH):
+        value = normalize_phone(obj.phone) or empty
+        if obj.phone_normalized != value:
+            obj.phone_normalized = value
+            stale.append(obj)
+        if len(stale) >= BATCH:
+            model.objects.bulk_update(stale, ["phone_normalized"])
+            stale = []
+    if stale:
+        model.objects.bulk_update(stale, ["phone_normalized"])
+
+
+def backfill(apps, schema_editor):
+    backfill_normalized_phones(apps.get_model("orders", "Order"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_merge_0010_alter_order_address_0010_order_discounts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='phone_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from apps.catalog.models import Book
+from apps.crm.utils.phones import normalized_update_fields
 
 
 class Order(models.Model):
@@ -27,6 +28,7 @@ class Order(models.Model):
 
     full_name = models.CharField("F.I.Sh", max_length=255)
     phone = models.CharField("Telefon", max_length=50)
+    phone_normalized = models.CharField(max_length=16, blank=True, db_index=True, editable=False)
     extra_phone = models.CharField("Qo‘shimcha telefon", max_length=50, blank=True)
     location = models.CharField("Lokatsiya", max_length=255, blank=True)
     address_text = models.CharField("Qo‘shimcha manzil matni", max_length=255, blank=True)
@@ -69,6 +71,10 @@ class Order(models.Model):
     def __str__(self):
         return f"Buyurtma #{self.id} - {self.full_name}"
 
+    def save(self, *args, **kwargs):
+        kwargs["update_fields"] = normalized_update_fields(self, kwargs.get("update_fields"))
+        super().save(*args, **kwargs)
+
 
 class DeliveryZone(models.Model):
     MODE_CHOICES = [
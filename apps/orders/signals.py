@@ -3,7 +3,7 @@ from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
 
 from .models import Order
-from apps.crm.models import Customer, InventoryLog
+from apps.crm.models import InventoryLog
 from .services.delivery import generate_google_maps_link
 from .services.telegram import send_order_created
 
@@ -22,6 +22,7 @@ def notify_new_order(sender, instance: Order, created: bool, **kwargs):
     """
     When a customer submits a new order (checkout), send it to Telegram.
     Uses transaction.on_commit so OrderItem rows are already created.
+    Customer linking and metrics live in apps.crm.signals.track_customer_metrics.
     """
     if not created:
         return
@@ -31,15 +32,6 @@ def notify_new_order(sender, instance: Order, created: bool, **kwargs):
         order = Order.objects.filter(pk=order_id).prefetch_related("items__book").first()
         if not order:
             return
-        if order.phone:
-            customer, _ = Customer.objects.get_or_create(
-                phone=order.phone,
-                defaults={"full_name": order.full_name or order.phone},
-            )
-            if order.customer_id != customer.id:
-                order.customer = customer
-                order.save(update_fields=["customer"])
-
         for item in order.items.all():
             book = item.book
             if book and hasattr(book, "stock_quantity"):
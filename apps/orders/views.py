@@ -9,6 +9,8 @@ from django.db import transaction
 
 from apps.catalog.models import Book
 from apps.crm.models import Customer
+from apps.crm.services.recommendations import cart_related_books
+from apps.crm.utils.phones import phone_lookup
 from .cart import Cart
 from .forms import CheckoutForm
 from .models import DeliveryNotice, DeliverySettings, Order, OrderItem
@@ -17,7 +19,16 @@ from .services.delivery import recalculate_delivery
 
 def cart_detail(request):
     cart = Cart(request)
-    return render(request, "cart.html", {"cart_items": list(cart.items()), "cart_total": cart.total_price()})
+    cart_items = list(cart.items())
+    return render(
+        request,
+        "cart.html",
+        {
+            "cart_items": cart_items,
+            "cart_total": cart.total_price(),
+            "related_books": cart_related_books([item["book"].id for item in cart_items], limit=4),
+        },
+    )
 
 
 @require_POST
@@ -66,7 +77,7 @@ def checkout(request):
                 customer = None
                 phone = (order.phone or "").strip()
                 if phone:
-                    customer = Customer.objects.filter(phone=phone).first()
+                    customer = Customer.objects.filter(**phone_lookup(phone)).first()
                     if customer:
                         discount_percent = min(int(customer.discount_percent or 0), 100)
                         order.customer = customer
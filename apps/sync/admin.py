@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Product, Customer, Sale, SaleItem, Expense, SyncEventLog, ConflictLog
+from .models import Product, Customer, Sale, SaleItem, Expense, SyncEventLog, ConflictLog, Change, StockCounter, SyncSnapshot, SyncDevice
+from .services.stock import adjust_stock
 
 
 class SaleItemInline(admin.TabularInline):
@@ -8,11 +9,32 @@ class SaleItemInline(admin.TabularInline):
     extra = 0
 
 
+class StockCounterInline(admin.TabularInline):
+    model = StockCounter
+    extra = 0
+    can_delete = False
+    readonly_fields = ("device_id", "increments", "decrements", "updated_at")
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ("name", "barcode", "sell_price", "stock_qty", "version", "needs_review", "updated_at")
     search_fields = ("name", "barcode")
     list_filter = ("needs_review",)
+    inlines = [StockCounterInline]
+
+    def save_model(self, request, obj, form, change):
+        # Stock edits become a server counter movement so they merge with what tills report.
+        if not change or "stock_qty" not in form.changed_data:
+            return super().save_model(request, obj, form, change)
+        delta = obj.stock_qty - (form.initial.get("stock_qty") or 0)
+        obj.stock_qty -= delta
+        super().save_model(request, obj, form, change)
+        adjust_stock(obj, delta)
+        obj.refresh_from_db(fields=["stock_qty"])
 
 
 @admin.register(Customer)
@@ -46,3 +68,24 @@ class ConflictLogAdmin(admin.ModelAdmin):
     list_display = ("entity_type", "entity_id", "conflict_type", "resolved", "created_at")
     list_filter = ("entity_type", "conflict_type", "resolved")
     search_fields = ("entity_id", "event_id")
+
+
+@admin.register(Change)
+class ChangeAdmin(admin.ModelAdmin):
+    list_display = ("seq", "entity_type", "entity_id", "deleted", "changed_at")
+    list_filter = ("entity_type", "deleted")
+    search_fields = ("entity_id",)
+    ordering = ("-seq",)
+
+
+@admin.register(SyncSnapshot)
+class SyncSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("id", "seq", "format", "size", "created_at")
+    readonly_fields = ("file", "seq", "format", "sha256", "size", "rows", "created_at")
+
+
+@admin.register(SyncDevice)
+class SyncDeviceAdmin(admin.ModelAdmin):
+    list_display = ("device_id", "acked_log_id", "acked_at")
+    search_fields = ("device_id",)
+    readonly_fields = ("device_id", "acked_log_id", "acked_at")
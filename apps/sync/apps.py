@@ -5,3 +5,7 @@ class SyncConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.sync"
     verbose_name = "Sync"
+
+    def ready(self):
+        # Feed every write of a synced entity into the change log (apps.sync.services.changes).
+        from . import signals  # noqa: F401
@@ -0,0 +1,103 @@
+import gzip
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from apps.sync.models import Customer, Expense, Product, Sale, SaleItem
+from apps.sync.services.changes import ENTITIES
+from apps.sync.services.pull import SERIALIZERS
+from apps.sync.services.wire import brotli, compress_bytes, encode_row, schema_header
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare sync pull payload size and serialization time: DRF serializers (current JSON) vs the "
+        "columnar encoding, raw and gzip/brotli compressed. Works on synthetic rows in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000, help="Products to generate (sales/expenses: a quarter each).")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per format; the fastest is reported.")
+
+    def _seed(self, rows):
+        now = timezone.now()
+        products = Product.objects.bulk_create(
+            [
+                Product(
+                    name=f"Kitob {index} — sinov nashri",
+                    barcode=f"478{index:010d}",
+                    buy_price=Decimal("35000.00") + index,
+                    sell_price=Decimal("49900.00") + index,
+                    stock_qty=index % 40,
+                )
+                for index in range(rows)
+            ]
+        )
+        customers = Customer.objects.bulk_create(
+            [Customer(full_name=f"Mijoz {index}", phone=f"+99890{index:07d}") for index in range(max(rows // 10, 1))]
+        )
+        sales = Sale.objects.bulk_create(
+            [
+                Sale(sale_datetime=now, total=Decimal("149700.00"), payment_type="cash", seller="kassa-1")
+                for _index in range(max(rows // 4, 1))
+            ]
+        )
+        SaleItem.objects.bulk_create(
+            [
+                SaleItem(sale=sale, product=products[(index * 3 + line) % rows], quantity=1, price=Decimal("49900.00"))
+                for index, sale in enumerate(sales)
+                for line in range(3)
+            ]
+        )
+        expenses = Expense.objects.bulk_create(
+            [Expense(expense_datetime=now, category="transport", amount=Decimal("25000.00")) for _index in range(max(rows // 4, 1))]
+        )
+        return {
+            "products": list(Product.objects.all()),
+            "customers": customers,
+            "sales": list(Sale.objects.prefetch_related("items")),
+            "expenses": expenses,
+        }
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            data = self._seed(max(options["rows"], 1))
+            encoder = JSONEncoder(separators=(",", ":"))
+            serializers = {key: SERIALIZERS[entity_type] for entity_type, (_model, key) in ENTITIES.items()}
+
+            def drf():
+                page = {key: serializers[key](objs, many=True).data for key, objs in data.items()}
+                return JSONRenderer().render(page)
+
+            def columnar():
+                page = {"schema": schema_header()}
+                page.update({key: [encode_row(key, obj) for obj in objs] for key, objs in data.items()})
+                return encoder.encode(page).encode()
+
+            results = []
+            for name, build in (("drf-json", drf), ("columnar", columnar)):
+                best = None
+                for _run in range(max(options["repeat"], 1)):
+                    started = time.perf_counter()
+                    body = build()
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                sizes = {"raw": len(body), "gzip": len(gzip.compress(body, 6))}
+                if brotli is not None:
+                    sizes["br"] = len(compress_bytes(body, "br"))
+                results.append((name, best, sizes))
+            transaction.set_rollback(True)
+
+        rows = sum(len(objs) for objs in data.values())
+        self.stdout.write(f"Qatorlar: {rows}" + ("" if brotli is not None else " (brotli o'rnatilmagan)"))
+        base_time, base_sizes = results[0][1], results[0][2]
+        for name, elapsed, sizes in results:
+            size_text = ", ".join(
+                f"{kind} {size / 1024:.1f} KiB ({size / base_sizes[kind]:.0%})" for kind, size in sizes.items()
+            )
+            self.stdout.write(f"{name:9} {elapsed * 1000:8.1f} ms ({elapsed / base_time:.0%})  {size_text}")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from apps.sync.services.retention import BATCH_SIZE, compact_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact acknowledged SyncEventLog rows older than the retention window: payloads are dropped "
+        "(or archived with --archive), event-id fingerprints are kept for duplicate checks (run from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None, help="Retention in days (default SYNC_EVENT_RETENTION_DAYS).")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows deleted per transaction.")
+        parser.add_argument("--archive", action="store_true", help="Write payloads to gzipped JSON-lines files in SYNC_EVENT_ARCHIVE_ROOT first.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would be compacted.")
+
+    def handle(self, *args, **options):
+        verbose = options["verbosity"] > 1
+
+        def progress(device_id, count):
+            if verbose:
+                self.stdout.write(f"  {device_id}: {count} ta hodisa")
+
+        stats = compact_events(
+            days=options["days"],
+            batch_size=max(options["batch_size"], 1),
+            archive=options["archive"],
+            dry_run=options["dry_run"],
+            progress=progress,
+        )
+        if options["dry_run"]:
+            self.stdout.write(f"Siqiladi: {stats['events']} ta hodisa, {stats['devices']} ta qurilma.")
+            return
+        message = f"Siqildi: {stats['events']} ta hodisa, {stats['devices']} ta qurilma."
+        if options["archive"]:
+            message += f" Arxiv fayllari: {stats['files']}."
+        self.stdout.write(self.style.SUCCESS(message))
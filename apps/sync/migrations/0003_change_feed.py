@@ -0,0 +1,60 @@
+# Generated by Django 5.0.6 on 2026-10-19 05:57
+
+from django.db import migrations, models
+
+
+# Change.entity_type -> model, as of this migration.
+ENTITY_MODELS = {"product": "Product", "customer": "Customer", "sale": "Sale", "expense": "Expense"}
+WRITE_BATCH = 1000
+
+
+def seed_change_feed(apps, schema_editor):
+    """Give every existing entity a seq, oldest update first."""
+    change_model = apps.get_model("sync", "Change")
+    sequence_model = apps.get_model("sync", "SyncSequence")
+    rows = []
+    for entity_type, model_name in ENTITY_MODELS.items():
+        queryset = apps.get_model("sync", model_name).objects.values_list("updated_at", "id")
+        rows.extend((updated_at, entity_type, entity_id) for updated_at, entity_id in queryset.iterator())
+    rows.sort(key=lambda row: (row[0], row[1], str(row[2])))
+    sequence_model.objects.update_or_create(name="changes", defaults={"value": len(rows)})
+    change_model.objects.bulk_create(
+        [
+            change_model(seq=offset, entity_type=entity_type, entity_id=entity_id)
+            for offset, (_updated_at, entity_type, entity_id) in enumerate(rows, start=1)
+        ],
+        batch_size=WRITE_BATCH,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0002_pull_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField(unique=True)),
+                ('entity_type', models.CharField(max_length=20)),
+                ('entity_id', models.UUIDField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SyncSequence',
+            fields=[
+                ('name', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='change',
+            constraint=models.UniqueConstraint(fields=('entity_type', 'entity_id'), name='sync_change_entity'),
+        ),
+        migrations.RunPython(seed_change_feed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.6 on 2026-10-19 06:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def seed_stock_counters(apps, schema_editor):
+    """Existing stock becomes the balance of the server's own counter (device_id "")."""
+    product_model = apps.get_model("sync", "Product")
+    counter_model = apps.get_model("sync", "StockCounter")
+    counter_model.objects.bulk_create(
+        [
+            counter_model(product_id=product_id, device_id="", increments=max(stock_qty, 0), decrements=max(-stock_qty, 0))
+            for product_id, stock_qty in product_model.objects.exclude(stock_qty=0).values_list("id", "stock_qty").iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0003_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(blank=True, max_length=120)),
+                ('increments', models.PositiveBigIntegerField(default=0)),
+                ('decrements', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_counters', to='sync.product')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stockcounter',
+            constraint=models.UniqueConstraint(fields=('product', 'device_id'), name='sync_stockcounter_device'),
+        ),
+        migrations.RunPython(seed_stock_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-19 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0004_stock_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='sync/snapshots/')),
+                ('seq', models.BigIntegerField()),
+                ('format', models.CharField(max_length=40)),
+                ('sha256', models.CharField(max_length=64)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('rows', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-seq', '-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-19 06:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0005_sync_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncDevice',
+            fields=[
+                ('device_id', models.CharField(max_length=120, primary_key=True, serialize=False)),
+                ('acked_log_id', models.BigIntegerField(default=0)),
+                ('acked_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SyncEventFingerprint',
+            fields=[
+                ('fingerprint', models.BigIntegerField(primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='synceventlog',
+            index=models.Index(fields=['device_id', 'id'], name='sync_eventlog_device_idx'),
+        ),
+    ]
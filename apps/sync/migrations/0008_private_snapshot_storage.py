@@ -0,0 +1,36 @@
+# Generated by Django 5.0.6 on 2026-10-19 06:46
+
+import apps.sync.models
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import migrations, models
+
+
+def move_snapshot_files(apps, schema_editor):
+    """Take the snapshots already built out of the public media tree, keeping their names."""
+    snapshot_model = apps.get_model("sync", "SyncSnapshot")
+    private = FileSystemStorage(location=settings.SYNC_SNAPSHOT_ROOT, base_url=None)
+    for name in snapshot_model.objects.exclude(file="").values_list("file", flat=True):
+        if not default_storage.exists(name):
+            continue
+        if not private.exists(name):
+            with default_storage.open(name, "rb") as handle:
+                private.save(name, File(handle))
+        default_storage.delete(name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0007_sync_device_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='syncsnapshot',
+            name='file',
+            field=models.FileField(storage=apps.sync.models.SnapshotStorage(), upload_to='sync/snapshots/'),
+        ),
+        migrations.RunPython(move_snapshot_files, migrations.RunPython.noop),
+    ]
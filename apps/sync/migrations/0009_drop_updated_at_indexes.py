@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-19 06:47
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0008_private_snapshot_storage'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='customer',
+            name='sync_customer_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='expense',
+            name='sync_expense_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='sync_product_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='sale',
+            name='sync_sale_updated_idx',
+        ),
+    ]
@@ -1,6 +1,10 @@
+import os
 import uuid
 
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db import models
+from django.utils.deconstruct import deconstructible
 
 
 class Product(models.Model):
@@ -19,6 +23,25 @@ class Product(models.Model):
         return self.name
 
 
+class StockCounter(models.Model):
+    """
+    One device's share of a product's stock as a PN-counter: units added and removed, both only
+    ever growing. Product.stock_qty is the materialized sum of increments - decrements.
+    """
+
+    product = models.ForeignKey(Product, related_name="stock_counters", on_delete=models.CASCADE)
+    device_id = models.CharField(max_length=120, blank=True)
+    increments = models.PositiveBigIntegerField(default=0)
+    decrements = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["product", "device_id"], name="sync_stockcounter_device")]
+
+    def __str__(self) -> str:
+        return f"{self.product_id} {self.device_id or 'server'} +{self.increments} -{self.decrements}"
+
+
 class Customer(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     full_name = models.CharField(max_length=255)
@@ -81,10 +104,41 @@ class SyncEventLog(models.Model):
     status = models.CharField(max_length=20, default="applied")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Acks and compaction walk one device's rows by id.
+        indexes = [models.Index(fields=["device_id", "id"], name="sync_eventlog_device_idx")]
+
     def __str__(self) -> str:
         return f"{self.entity_type} {self.operation} {self.event_id}"
 
 
+class SyncDevice(models.Model):
+    """
+    A pushing device, its owner and its acknowledged watermark: the device has stored the results of all
+    its SyncEventLog rows with id <= acked_log_id, so compaction may drop them.
+    """
+
+    device_id = models.CharField(max_length=120, primary_key=True)
+    # The user whose first push registered the device; other users may not push or ack under its id.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="sync_devices"
+    )
+    acked_log_id = models.BigIntegerField(default=0)
+    acked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.device_id} <= {self.acked_log_id}"
+
+
+class SyncEventFingerprint(models.Model):
+    """64-bit hash of a compacted event id; enough for push to keep reporting resends as duplicates."""
+
+    fingerprint = models.BigIntegerField(primary_key=True)
+
+    def __str__(self) -> str:
+        return f"{self.fingerprint:x}"
+
+
 class ConflictLog(models.Model):
     event_id = models.UUIDField()
     entity_type = models.CharField(max_length=50)
@@ -97,3 +151,71 @@ class ConflictLog(models.Model):
 
     def __str__(self) -> str:
         return f"{self.entity_type} {self.conflict_type}"
+
+
+class SyncSequence(models.Model):
+    """Single-row counter behind Change.seq; taking its row lock orders commits by seq."""
+
+    name = models.CharField(max_length=40, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.name}={self.value}"
+
+
+class Change(models.Model):
+    """
+    Latest change per synced entity. Every write moves the row to a fresh seq, so "changes after
+    seq N" lists each entity once, in commit order.
+    """
+
+    seq = models.BigIntegerField(unique=True)
+    entity_type = models.CharField(max_length=20)
+    entity_id = models.UUIDField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["entity_type", "entity_id"], name="sync_change_entity")]
+
+    def __str__(self) -> str:
+        return f"{self.seq} {self.entity_type} {self.entity_id}"
+
+
+@deconstructible
+class SnapshotStorage(FileSystemStorage):
+    """
+    SYNC_SNAPSHOT_ROOT, read on every access (so override_settings works) and with no URL: snapshots hold
+    every customer, sale and expense, so they are never under MEDIA_ROOT and only the sync_snapshot view,
+    which requires a login, sends them.
+    """
+
+    @property
+    def base_url(self):
+        return None
+
+    @property
+    def base_location(self):
+        return settings.SYNC_SNAPSHOT_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+class SyncSnapshot(models.Model):
+    """Gzipped columnar dump of every synced entity as of change-feed seq `seq`, for new devices."""
+
+    file = models.FileField(upload_to="sync/snapshots/", storage=SnapshotStorage())
+    seq = models.BigIntegerField()
+    format = models.CharField(max_length=40)
+    sha256 = models.CharField(max_length=64)
+    size = models.PositiveBigIntegerField(default=0)
+    rows = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-seq", "-id"]
+
+    def __str__(self) -> str:
+        return f"Snapshot {self.id} @ {self.seq}"
@@ -0,0 +1,46 @@
+import json
+import zlib
+
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import JSONRenderer
+
+from .services.wire import COLUMNAR_TYPE, BodyTooLarge, UnsupportedEncoding, decode_push, decompress_body
+
+
+class _CompressedBodyParser(BaseParser):
+    """Reads the body honouring Content-Encoding (gzip/deflate, br when available)."""
+
+    def read(self, stream, parser_context):
+        request = parser_context["request"]
+        try:
+            body = decompress_body(stream.read() if stream else b"", request.META.get("HTTP_CONTENT_ENCODING"))
+            return json.loads(body or b"{}")
+        except UnsupportedEncoding as exc:
+            raise UnsupportedMediaType(f"Content-Encoding {exc}")
+        except BodyTooLarge:
+            raise ParseError("Request body too large")
+        except (ValueError, OSError, zlib.error) as exc:
+            raise ParseError(f"Malformed request body: {exc}")
+
+
+class SyncJSONParser(_CompressedBodyParser):
+    media_type = "application/json"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return self.read(stream, parser_context)
+
+
+class ColumnarParser(_CompressedBodyParser):
+    media_type = COLUMNAR_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        data = self.read(stream, parser_context)
+        if not isinstance(data, dict):
+            raise ParseError("Columnar body must be an object")
+        return decode_push(data)
+
+
+class ColumnarRenderer(JSONRenderer):
+    media_type = COLUMNAR_TYPE
+    format = "columnar"
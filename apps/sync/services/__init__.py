@@ -0,0 +1 @@
+# Package for offline sync services.
@@ -0,0 +1,140 @@
+"""
+Change feed for offline sync: every write to a synced entity takes the next value of a single
+counter, in the writer's transaction, so seqs are gap-free and committed in order.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.sync.models import Change, Customer, Expense, Product, Sale, SyncSequence
+
+SEQUENCE = "changes"
+WRITE_BATCH = 1000
+# Last committed seq, published after each commit so idle long-polls never touch the database.
+HEAD_CACHE_KEY = "sync:changes:head"
+# Pulls currently held open, across all processes (needs a shared cache).
+WAITERS_CACHE_KEY = "sync:changes:waiters"
+POLL_INTERVAL = 0.5
+
+# Change.entity_type -> (model, response key)
+ENTITIES = {
+    "product": (Product, "products"),
+    "customer": (Customer, "customers"),
+    "sale": (Sale, "sales"),
+    "expense": (Expense, "expenses"),
+}
+ENTITY_TYPES = {model: entity_type for entity_type, (model, _key) in ENTITIES.items()}
+
+
+def _reserve(count):
+    """Take `count` seqs: returns the first. Holds the counter's row lock until the transaction ends."""
+    counter, _created = SyncSequence.objects.select_for_update().get_or_create(name=SEQUENCE)
+    first = counter.value + 1
+    counter.value += count
+    counter.save(update_fields=["value"])
+    return first
+
+
+def record_changes(entities, deleted=False):
+    """
+    Move (entity_type, id) pairs to the head of the feed. Call inside the transaction that wrote
+    them; writers then wait for each other on the counter, which is what keeps commits in seq order.
+    """
+    pairs = list(dict.fromkeys((entity_type, entity_id) for entity_type, entity_id in entities))
+    if not pairs:
+        return None
+    with transaction.atomic():
+        first = _reserve(len(pairs))
+        Change.objects.bulk_create(
+            [
+                Change(seq=first + offset, entity_type=entity_type, entity_id=entity_id, deleted=deleted)
+                for offset, (entity_type, entity_id) in enumerate(pairs)
+            ],
+            update_conflicts=True,
+            unique_fields=["entity_type", "entity_id"],
+            update_fields=["seq", "deleted", "changed_at"],
+            batch_size=WRITE_BATCH,
+        )
+    last = first + len(pairs) - 1
+    transaction.on_commit(lambda: publish_head(last))
+    return last
+
+
+def record_instances(instances, deleted=False):
+    return record_changes(((ENTITY_TYPES[type(obj)], obj.pk) for obj in instances), deleted=deleted)
+
+
+def head_seq():
+    return SyncSequence.objects.filter(name=SEQUENCE).values_list("value", flat=True).first() or 0
+
+
+def publish_head(seq):
+    # Commit callbacks of different processes may land out of order; never move the head back.
+    current = cache.get(HEAD_CACHE_KEY)
+    if current is None or seq > current:
+        cache.set(HEAD_CACHE_KEY, seq, None)
+
+
+def cached_head():
+    """
+    The change-feed head from the cache (one DB read to warm it). A per-process cache (the LocMemCache
+    fallback) never hears about other processes' writes, so without a shared cache it is read from the DB.
+    """
+    if not settings.CACHE_IS_SHARED:
+        return head_seq()
+    seq = cache.get(HEAD_CACHE_KEY)
+    if seq is None:
+        seq = head_seq()
+        publish_head(seq)
+    return seq
+
+
+def _acquire_waiter():
+    # The counter expires now and then, so a count leaked by a killed process heals itself; the
+    # decrements that follow a reset only let a few extra waiters in until the next one.
+    cache.add(WAITERS_CACHE_KEY, 0, settings.SYNC_PULL_MAX_WAIT * 20 or 60)
+    try:
+        count = cache.incr(WAITERS_CACHE_KEY)
+    except ValueError:
+        return False
+    if count > settings.SYNC_PULL_MAX_WAITERS:
+        _release_waiter()
+        return False
+    return True
+
+
+def _release_waiter():
+    try:
+        cache.decr(WAITERS_CACHE_KEY)
+    except ValueError:
+        pass
+
+
+def wait_for_changes(after, timeout):
+    """
+    Block until the head passes `after` or `timeout` seconds elapse, watching only the cache. The
+    database is read once at the end, in case a publish was missed (an evicted key). Every waiter holds
+    a worker, so this returns the head at once when the cache isn't shared across processes or
+    SYNC_PULL_MAX_WAITERS pulls are already waiting. Returns the head.
+    """
+    if not settings.CACHE_IS_SHARED or not _acquire_waiter():
+        return cached_head()
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            seq = cached_head()
+            if seq > after:
+                return seq
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(POLL_INTERVAL, remaining))
+    finally:
+        _release_waiter()
+    seq = head_seq()
+    if seq > after:
+        publish_head(seq)
+    return seq
+
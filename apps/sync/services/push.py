@@ -0,0 +1,352 @@
+"""Batched ingestion of events pushed by offline devices (POST /api/sync/push)."""
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+from uuid import UUID
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.sync.models import ConflictLog, Customer, Expense, Product, Sale, SaleItem, SyncEventLog
+from apps.sync.serializers import CustomerSerializer, ProductSerializer
+from .changes import record_instances
+from .retention import compacted_ids
+from .stock import add_to_stock, merge_counters
+
+# Events applied per transaction: a crash loses at most one chunk, which the device simply resends.
+CHUNK_SIZE = 500
+WRITE_BATCH = 1000
+# stock_qty is never written absolutely: it moves only through StockCounter deltas (services.stock).
+PRODUCT_FIELDS = ["name", "barcode", "buy_price", "sell_price", "version", "needs_review", "updated_at"]
+# Fields whose stale edits are a real clash worth a human look (stock merges, so it never is).
+REVIEW_FIELDS = ("name", "barcode", "buy_price", "sell_price")
+CUSTOMER_FIELDS = ["full_name", "phone", "version", "updated_at"]
+
+Event = namedtuple("Event", "raw_id event_id entity_type entity_id operation payload")
+
+
+def parse_uuid(value):
+    try:
+        return UUID(str(value))
+    except Exception:
+        return None
+
+
+def parse_decimal(value):
+    try:
+        return Decimal(str(value))
+    except Exception:
+        return Decimal("0")
+
+
+def _parse_event(event):
+    return Event(
+        raw_id=event.get("event_id"),
+        event_id=parse_uuid(event.get("event_id")),
+        entity_type=(event.get("entity_type") or "").lower(),
+        entity_id=parse_uuid(event.get("entity_id")),
+        operation=(event.get("operation") or "").upper(),
+        payload=event.get("payload_json") or {},
+    )
+
+
+class _Batch:
+    """
+    Entities touched by one chunk, loaded up front and changed in memory; write() flushes them with bulk
+    statements. Events later in the chunk see the effects of earlier ones, exactly as if applied one by one.
+    """
+
+    def __init__(self, device_id, events):
+        self.device_id = device_id
+        product_ids, customer_ids, sale_ids, expense_ids = set(), set(), set(), set()
+        for event in events:
+            if event.entity_type in ("product", "stock"):
+                product_ids.add(event.entity_id)
+            elif event.entity_type == "customer":
+                customer_ids.add(event.entity_id)
+            elif event.entity_type == "sale":
+                sale_ids.add(event.entity_id)
+                for item in event.payload.get("items") or []:
+                    product_id = parse_uuid(item.get("product"))
+                    if product_id:
+                        product_ids.add(product_id)
+            elif event.entity_type == "expense":
+                expense_ids.add(event.entity_id)
+
+        self.products = Product.objects.in_bulk(product_ids) if product_ids else {}
+        self.customers = Customer.objects.in_bulk(customer_ids) if customer_ids else {}
+        self.sale_ids = set(Sale.objects.filter(id__in=sale_ids).values_list("id", flat=True)) if sale_ids else set()
+        self.expense_ids = (
+            set(Expense.objects.filter(id__in=expense_ids).values_list("id", flat=True)) if expense_ids else set()
+        )
+        self.new_products = {}
+        self.changed_products = {}
+        self.flagged_products = {}
+        self.new_customers = {}
+        self.changed_customers = {}
+        self.sales = []
+        self.sale_items = []
+        self.expenses = []
+        self.conflicts = []
+        self.logs = []
+        # (product id, device id) -> [units in, units out]; product id -> net delta for rows already stored.
+        self.counter_moves = defaultdict(lambda: [0, 0])
+        self.stock_deltas = defaultdict(int)
+
+    def conflict(self, event, conflict_type, server_payload):
+        self.conflicts.append(
+            ConflictLog(
+                event_id=event.event_id,
+                entity_type=event.entity_type,
+                entity_id=event.entity_id,
+                conflict_type=conflict_type,
+                server_payload=server_payload,
+                client_payload=event.payload,
+            )
+        )
+
+    def move_stock(self, product, delta):
+        if not delta:
+            return
+        product.stock_qty += delta
+        self.counter_moves[(product.id, self.device_id)][0 if delta > 0 else 1] += abs(delta)
+        if product.id not in self.new_products:
+            self.stock_deltas[product.id] += delta
+
+    def _clashes(self, product, payload):
+        for field in REVIEW_FIELDS:
+            if field not in payload:
+                continue
+            current = getattr(product, field)
+            incoming = parse_decimal(payload[field]) if field.endswith("_price") else (payload[field] or "")
+            if incoming != current:
+                return True
+        return False
+
+    def product(self, event):
+        payload = event.payload
+        product = self.products.get(event.entity_id)
+        incoming_version = int(payload.get("version") or 1)
+        incoming_stock = payload.get("stock_qty")
+        if product is None:
+            product = Product(
+                id=event.entity_id,
+                name=payload.get("name", ""),
+                barcode=payload.get("barcode", "") or "",
+                buy_price=parse_decimal(payload.get("buy_price", 0)),
+                sell_price=parse_decimal(payload.get("sell_price", 0)),
+                stock_qty=0,
+                version=incoming_version,
+            )
+            self.products[product.id] = self.new_products[product.id] = product
+            # Opening stock is this device's first delta.
+            self.move_stock(product, int(incoming_stock or 0))
+            return "applied"
+        if incoming_version > product.version:
+            product.name = payload.get("name", product.name)
+            product.barcode = payload.get("barcode", product.barcode) or ""
+            product.buy_price = parse_decimal(payload.get("buy_price", product.buy_price))
+            product.sell_price = parse_decimal(payload.get("sell_price", product.sell_price))
+            if incoming_stock is not None:
+                # Older clients send absolute stock: apply it as this device's delta.
+                self.move_stock(product, int(incoming_stock) - product.stock_qty)
+            product.version = incoming_version
+            if product.id not in self.new_products:
+                self.changed_products[product.id] = product
+            return "applied"
+        if not self._clashes(product, payload):
+            # A stale copy that differs at most in stock: nothing to merge or review.
+            return "ignored"
+        product.needs_review = True
+        if product.id not in self.new_products:
+            self.flagged_products[product.id] = product
+        self.conflict(event, "version_conflict", ProductSerializer(product).data)
+        return "conflict"
+
+    def stock(self, event):
+        """Append-only stock movement: payload {"delta": n} for product entity_id."""
+        product = self.products.get(event.entity_id)
+        try:
+            delta = int(event.payload.get("delta"))
+        except (TypeError, ValueError):
+            return "invalid"
+        if product is None:
+            return "invalid"
+        self.move_stock(product, delta)
+        return "applied"
+
+    def customer(self, event):
+        payload = event.payload
+        customer = self.customers.get(event.entity_id)
+        incoming_version = int(payload.get("version") or 1)
+        if customer is None:
+            customer = Customer(
+                id=event.entity_id,
+                full_name=payload.get("full_name", ""),
+                phone=payload.get("phone", ""),
+                version=incoming_version,
+            )
+            self.customers[customer.id] = self.new_customers[customer.id] = customer
+            return "applied"
+        if incoming_version > customer.version:
+            customer.full_name = payload.get("full_name", customer.full_name)
+            customer.phone = payload.get("phone", customer.phone)
+            customer.version = incoming_version
+            if customer.id not in self.new_customers:
+                self.changed_customers[customer.id] = customer
+            return "applied"
+        self.conflict(event, "version_conflict", CustomerSerializer(customer).data)
+        return "conflict"
+
+    def sale(self, event):
+        payload = event.payload
+        if event.operation != "CREATE":
+            self.conflict(event, "append_only", {})
+            return "ignored"
+        if event.entity_id in self.sale_ids:
+            # Same sale resent under a new event id (e.g. the device lost its outbox state).
+            return "duplicate"
+        sale_dt = payload.get("sale_datetime")
+        sale = Sale(
+            id=event.entity_id,
+            sale_datetime=parse_datetime(sale_dt) if sale_dt else timezone.now(),
+            total=parse_decimal(payload.get("total", 0)),
+            payment_type=payload.get("payment_type", "cash"),
+            seller=payload.get("seller", ""),
+        )
+        self.sale_ids.add(sale.id)
+        self.sales.append(sale)
+        for item in payload.get("items") or []:
+            product = self.products.get(parse_uuid(item.get("product")))
+            quantity = int(item.get("quantity") or 1)
+            self.sale_items.append(
+                SaleItem(
+                    sale=sale,
+                    # Lines for products the server has never seen keep their price but lose the link.
+                    product_id=product.id if product else None,
+                    quantity=quantity,
+                    price=parse_decimal(item.get("price", 0)),
+                )
+            )
+            if product is not None:
+                self.move_stock(product, -quantity)
+        return "applied"
+
+    def expense(self, event):
+        payload = event.payload
+        if event.operation != "CREATE":
+            self.conflict(event, "append_only", {})
+            return "ignored"
+        if event.entity_id in self.expense_ids:
+            return "duplicate"
+        exp_dt = payload.get("expense_datetime")
+        self.expense_ids.add(event.entity_id)
+        self.expenses.append(
+            Expense(
+                id=event.entity_id,
+                expense_datetime=parse_datetime(exp_dt) if exp_dt else timezone.now(),
+                category=payload.get("category", ""),
+                amount=parse_decimal(payload.get("amount", 0)),
+                note=payload.get("note", ""),
+            )
+        )
+        return "applied"
+
+    def log(self, event, status):
+        self.logs.append(
+            SyncEventLog(
+                event_id=event.event_id,
+                entity_type=event.entity_type,
+                entity_id=event.entity_id,
+                operation=event.operation,
+                payload_json=event.payload,
+                device_id=self.device_id,
+                status=status,
+            )
+        )
+
+    def write(self):
+        now = timezone.now()
+        # bulk_update skips auto_now; stamp it so pulls see the change.
+        for obj in (*self.changed_products.values(), *self.changed_customers.values()):
+            obj.updated_at = now
+        Customer.objects.bulk_create(self.new_customers.values(), batch_size=WRITE_BATCH)
+        Customer.objects.bulk_update(self.changed_customers.values(), CUSTOMER_FIELDS, batch_size=WRITE_BATCH)
+        Product.objects.bulk_create(self.new_products.values(), batch_size=WRITE_BATCH)
+        Product.objects.bulk_update(self.changed_products.values(), PRODUCT_FIELDS, batch_size=WRITE_BATCH)
+        flagged = [product for product_id, product in self.flagged_products.items() if product_id not in self.changed_products]
+        Product.objects.bulk_update(flagged, ["needs_review"], batch_size=WRITE_BATCH)
+        merge_counters(self.counter_moves)
+        add_to_stock(self.stock_deltas)
+        Sale.objects.bulk_create(self.sales, batch_size=WRITE_BATCH)
+        SaleItem.objects.bulk_create(self.sale_items, batch_size=WRITE_BATCH)
+        Expense.objects.bulk_create(self.expenses, batch_size=WRITE_BATCH)
+        ConflictLog.objects.bulk_create(self.conflicts, batch_size=WRITE_BATCH)
+        SyncEventLog.objects.bulk_create(self.logs, batch_size=WRITE_BATCH)
+        # Bulk writes send no signals; feed the change log here, in the same transaction.
+        record_instances(
+            [
+                *self.new_customers.values(),
+                *self.changed_customers.values(),
+                *self.new_products.values(),
+                *self.changed_products.values(),
+                *flagged,
+                *(self.products[product_id] for product_id in self.stock_deltas),
+                *self.sales,
+                *self.expenses,
+            ]
+        )
+
+
+HANDLERS = {
+    "product": _Batch.product,
+    "customer": _Batch.customer,
+    "sale": _Batch.sale,
+    "stock": _Batch.stock,
+    "expense": _Batch.expense,
+}
+
+
+def _apply_chunk(device_id, events):
+    with transaction.atomic():
+        valid = [event for event in events if event.event_id and event.entity_id and event.entity_type]
+        seen = set()
+        if valid:
+            logged = SyncEventLog.objects.filter(event_id__in={event.event_id for event in valid})
+            seen.update(logged.values_list("event_id", flat=True))
+            # Old events survive only as fingerprints once compacted (services.retention).
+            seen.update(compacted_ids({event.event_id for event in valid} - seen))
+        batch = _Batch(device_id, [event for event in valid if event.event_id not in seen])
+        results = []
+        for event in events:
+            if not (event.event_id and event.entity_id and event.entity_type):
+                results.append({"event_id": str(event.raw_id), "status": "invalid"})
+                continue
+            if event.event_id in seen:
+                results.append({"event_id": str(event.event_id), "status": "duplicate"})
+                continue
+            seen.add(event.event_id)
+            handler = HANDLERS.get(event.entity_type)
+            status = handler(batch, event) if handler else "invalid"
+            batch.log(event, status)
+            results.append({"event_id": str(event.event_id), "status": status})
+        batch.write()
+    return results
+
+
+def ingest_events(device_id, events, chunk_size=CHUNK_SIZE):
+    """
+    Apply pushed events and return one {"event_id", "status"} per event, in order. Each chunk costs a
+    fixed number of queries (one IN lookup per table, then bulk writes) inside a single transaction.
+    """
+    parsed = [_parse_event(event) for event in events]
+    results = []
+    for start in range(0, len(parsed), chunk_size):
+        chunk = parsed[start : start + chunk_size]
+        try:
+            results.extend(_apply_chunk(device_id, chunk))
+        except IntegrityError:
+            # Another request from the same device logged some of these event ids first; the retry
+            # reports them as duplicates.
+            results.extend(_apply_chunk(device_id, chunk))
+    return results
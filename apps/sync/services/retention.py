@@ -0,0 +1,130 @@
+"""
+SyncEventLog retention. Pushes carry the device's acknowledged watermark (the `ack` of an earlier
+response, sent once its results are stored); rows at or below it and older than the retention window
+are compacted: the payload is dropped (or archived to a gzipped file in SYNC_EVENT_ARCHIVE_ROOT) and only a 64-bit fingerprint of
+the event id stays behind, so a resend is still answered as a duplicate.
+"""
+import gzip
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from apps.sync.models import SyncDevice, SyncEventFingerprint, SyncEventLog
+
+# Rows compacted per transaction: each one holds its locks for a single short delete.
+BATCH_SIZE = 1000
+ARCHIVE_FIELDS = ("id", "event_id", "entity_type", "entity_id", "operation", "payload_json", "device_id", "status", "created_at")
+
+
+def fingerprint(event_id):
+    """
+    Signed 64-bit hash of an event id (fits a BigIntegerField). Collisions are ~n^2/2^65: about one
+    in 3,000 after 100 million compacted events.
+    """
+    return int.from_bytes(hashlib.blake2b(event_id.bytes, digest_size=8).digest(), "big", signed=True)
+
+
+def compacted_ids(event_ids):
+    """The subset of event_ids whose log rows were compacted (one IN query)."""
+    by_print = {fingerprint(event_id): event_id for event_id in event_ids}
+    if not by_print:
+        return set()
+    found = SyncEventFingerprint.objects.filter(fingerprint__in=by_print).values_list("fingerprint", flat=True)
+    return {by_print[value] for value in found}
+
+
+def device_ack(device_id):
+    """Watermark to hand back to a device: its newest logged event."""
+    if not device_id:
+        return 0
+    return SyncEventLog.objects.filter(device_id=device_id).aggregate(last=Max("id"))["last"] or 0
+
+
+def claim_device(device_id, user):
+    """
+    The SyncDevice for a push by user, registered to them on its first push (or first push since owners
+    were recorded). None when the id belongs to another user.
+    """
+    device, _created = SyncDevice.objects.get_or_create(device_id=device_id, defaults={"user": user})
+    if device.user_id is None:
+        SyncDevice.objects.filter(device_id=device_id, user__isnull=True).update(user=user)
+        device.refresh_from_db(fields=["user"])
+    return device if device.user_id == user.pk else None
+
+
+def acknowledge(device, acked):
+    """
+    Move a device's watermark forward to `acked` (never back), clamped to its newest logged event: a
+    client can't acknowledge events the server hasn't answered yet.
+    """
+    try:
+        acked = int(acked or 0)
+    except (TypeError, ValueError):
+        return
+    if acked <= device.acked_log_id:
+        return
+    acked = min(acked, device_ack(device.device_id))
+    SyncDevice.objects.filter(device_id=device.device_id, acked_log_id__lt=acked).update(
+        acked_log_id=acked, acked_at=timezone.now()
+    )
+
+
+def _archive_storage():
+    # Payloads hold customer names, phones and sales: never under MEDIA_ROOT, which the web server serves.
+    return FileSystemStorage(location=settings.SYNC_EVENT_ARCHIVE_ROOT, base_url=None)
+
+
+def _archive(storage, rows):
+    lines = "".join(json.dumps(row, cls=DjangoJSONEncoder, separators=(",", ":")) + "\n" for row in rows)
+    name = f"{rows[0]['created_at']:%Y/%m}/events-{rows[0]['id']}-{rows[-1]['id']}.jsonl.gz"
+    return storage.save(name, ContentFile(gzip.compress(lines.encode("utf-8"), mtime=0)))
+
+
+def compact_events(days=None, batch_size=BATCH_SIZE, archive=False, dry_run=False, progress=None):
+    """
+    Compact acknowledged log rows older than `days` (SYNC_EVENT_RETENTION_DAYS), device by device in
+    id order, batch_size rows per transaction. progress(device_id, count) is called per batch.
+    Returns {"events", "devices", "files"}.
+    """
+    if days is None:
+        days = settings.SYNC_EVENT_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+    stats = {"events": 0, "devices": 0, "files": 0}
+    storage = _archive_storage() if archive else None
+    for device_id, acked in SyncDevice.objects.filter(acked_log_id__gt=0).values_list("device_id", "acked_log_id"):
+        rows = SyncEventLog.objects.filter(device_id=device_id, id__lte=acked, created_at__lt=cutoff).order_by("id")
+        if dry_run:
+            count = rows.count()
+            stats["events"] += count
+            stats["devices"] += bool(count)
+            continue
+        after = 0
+        touched = False
+        while True:
+            with transaction.atomic():
+                batch = list(rows.filter(id__gt=after).values(*ARCHIVE_FIELDS)[:batch_size])
+                if not batch:
+                    break
+                if archive:
+                    _archive(storage, batch)
+                    stats["files"] += 1
+                SyncEventFingerprint.objects.bulk_create(
+                    [SyncEventFingerprint(fingerprint=fingerprint(row["event_id"])) for row in batch],
+                    ignore_conflicts=True,
+                )
+                SyncEventLog.objects.filter(id__in=[row["id"] for row in batch]).delete()
+            after = batch[-1]["id"]
+            stats["events"] += len(batch)
+            touched = True
+            if progress:
+                progress(device_id, len(batch))
+        stats["devices"] += touched
+    return stats
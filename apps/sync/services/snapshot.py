@@ -0,0 +1,103 @@
+"""
+Bootstrap snapshots: the whole synced dataset as one gzipped columnar file plus the change-feed
+seq it covers. A new device loads it in one go and then pulls only ?after=<seq>.
+"""
+import gzip
+import hashlib
+import logging
+import tempfile
+
+from django.core.files import File
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from apps.sync.models import SyncSnapshot
+from .changes import ENTITIES, head_seq
+from .wire import FORMAT_VERSION, encode_row, schema_header
+
+logger = logging.getLogger("django")
+
+# Snapshots kept on disk; devices mid-download of an older one can still finish it.
+KEEP = 3
+FETCH_CHUNK = 2000
+
+
+def _querysets():
+    for entity_type, (model, key) in ENTITIES.items():
+        queryset = model.objects.order_by("id")
+        if entity_type == "sale":
+            queryset = queryset.prefetch_related("items")
+        yield key, queryset
+
+
+def iter_snapshot(seq, rows):
+    """JSON text of a snapshot document; fills rows[key] with counts as it goes."""
+    encoder = JSONEncoder(separators=(",", ":"))
+    yield '{"format":' + encoder.encode(FORMAT_VERSION)
+    yield ',"seq":' + encoder.encode(seq) + ',"created_at":' + encoder.encode(timezone.now())
+    yield ',"schema":' + encoder.encode(schema_header())
+    for key, queryset in _querysets():
+        yield f',"{key}":['
+        count = 0
+        for obj in queryset.iterator(chunk_size=FETCH_CHUNK):
+            yield ("," if count else "") + encoder.encode(encode_row(key, obj))
+            count += 1
+        rows[key] = count
+        yield "]"
+    yield "}"
+
+
+def build_snapshot(force=False):
+    """
+    Write a new snapshot unless the latest already covers the head of the change feed. The seq is
+    read before any row: changes committed up to it are all in the file, later ones are either in
+    it already or pulled again after it (pulls are idempotent upserts). Returns the snapshot or None.
+    """
+    seq = head_seq()
+    latest = SyncSnapshot.objects.first()
+    if latest and latest.seq == seq and not force:
+        return None
+    rows = {}
+    digest = hashlib.sha256()
+    with tempfile.TemporaryFile() as handle:
+        # mtime=0: identical data gives identical bytes, and so the same hash.
+        with gzip.GzipFile(fileobj=handle, mode="wb", compresslevel=6, mtime=0) as archive:
+            for chunk in iter_snapshot(seq, rows):
+                archive.write(chunk.encode())
+        size = handle.tell()
+        handle.seek(0)
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+        handle.seek(0)
+        sha256 = digest.hexdigest()
+        snapshot = SyncSnapshot(seq=seq, format=FORMAT_VERSION, sha256=sha256, size=size, rows=rows)
+        snapshot.file.save(f"{seq}-{sha256[:16]}.json.gz", File(handle), save=False)
+    snapshot.save()
+    purge_snapshots()
+    return snapshot
+
+
+def purge_snapshots(keep=KEEP):
+    """Delete all but the newest `keep` snapshots and their files."""
+    removed = 0
+    for snapshot in SyncSnapshot.objects.all()[keep:]:
+        try:
+            snapshot.file.delete(save=False)
+        except OSError:
+            logger.exception("Could not delete snapshot file %s", snapshot.file.name)
+        snapshot.delete()
+        removed += 1
+    return removed
+
+
+def manifest(snapshot, url):
+    return {
+        "version": snapshot.id,
+        "format": snapshot.format,
+        "seq": snapshot.seq,
+        "created_at": snapshot.created_at.isoformat(),
+        "sha256": snapshot.sha256,
+        "size": snapshot.size,
+        "rows": snapshot.rows,
+        "url": url,
+    }
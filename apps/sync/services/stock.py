@@ -0,0 +1,67 @@
+"""
+Conflict-free stock for offline tills. Devices report quantity deltas (sales, stock events); each
+lands in that device's StockCounter and is added to Product.stock_qty with an F() increment, so
+merges commute and concurrent tills never overwrite each other.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from apps.sync.models import Product, StockCounter
+from .changes import record_changes
+
+# Counter for stock set on the server itself (admin corrections, pre-counter stock).
+SERVER_DEVICE = ""
+WRITE_BATCH = 500
+
+
+def merge_counters(moves):
+    """
+    Add {(product id, device id): (units in, units out)} to the device counters, rows locked while
+    updated. Both sides only grow, so replaying or reordering merges never loses a movement.
+    """
+    moves = {key: (added, removed) for key, (added, removed) in moves.items() if added or removed}
+    if not moves:
+        return
+    product_ids = {product_id for product_id, _device in moves}
+    devices = {device for _product, device in moves}
+    counters = {
+        (counter.product_id, counter.device_id): counter
+        for counter in StockCounter.objects.select_for_update().filter(product_id__in=product_ids, device_id__in=devices)
+    }
+    for (product_id, device_id), (added, removed) in moves.items():
+        counter = counters.get((product_id, device_id))
+        if counter is None:
+            counter = counters[(product_id, device_id)] = StockCounter(product_id=product_id, device_id=device_id)
+        counter.increments += added
+        counter.decrements += removed
+    StockCounter.objects.bulk_create(
+        [counters[key] for key in moves],
+        update_conflicts=True,
+        unique_fields=["product", "device_id"],
+        update_fields=["increments", "decrements", "updated_at"],
+        batch_size=WRITE_BATCH,
+    )
+
+
+def add_to_stock(product_deltas):
+    """stock_qty += delta per product id: one UPDATE per WRITE_BATCH products, commutative under concurrency."""
+    items = [(product_id, delta) for product_id, delta in product_deltas.items() if delta]
+    now = timezone.now()
+    for start in range(0, len(items), WRITE_BATCH):
+        batch = items[start : start + WRITE_BATCH]
+        Product.objects.filter(id__in=[product_id for product_id, _delta in batch]).update(
+            stock_qty=F("stock_qty")
+            + Case(*(When(id=product_id, then=Value(delta)) for product_id, delta in batch), default=Value(0), output_field=IntegerField()),
+            updated_at=now,
+        )
+
+
+def adjust_stock(product, delta, device_id=SERVER_DEVICE):
+    """Record one stock movement made outside a push (e.g. an admin correction) and apply it."""
+    if not delta:
+        return
+    with transaction.atomic():
+        merge_counters({(product.pk, device_id): (max(delta, 0), max(-delta, 0))})
+        add_to_stock({product.pk: delta})
+        record_changes([("product", product.pk)])
@@ -0,0 +1,211 @@
+"""
+Compact sync encodings. The columnar form sends each entity's field list once, rows as arrays,
+money as integer minor units (tiyin) and timestamps as epoch milliseconds. Body compression:
+gzip always, brotli when the optional `brotli` package is installed.
+"""
+import gzip
+import zlib
+from decimal import Decimal
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+COLUMNAR_TYPE = "application/vnd.sync.columnar+json"
+FORMAT_VERSION = "columnar/1"
+MINOR_UNITS = 100
+# Decompressed request bodies above this are refused (a small gzip can expand enormously).
+MAX_BODY_SIZE = 32 * 1024 * 1024
+# Brotli input is fed this many bytes at a time, so a bomb is stopped soon after it passes MAX_BODY_SIZE.
+BROTLI_INPUT_CHUNK = 1024
+# Payload keys holding money, in pushed events and their sale items.
+MONEY_KEYS = ("buy_price", "sell_price", "total", "amount", "price")
+
+# response key -> [(field, attribute, kind)]; kinds: str, int, bool, uuid, money, time, items
+SCHEMAS = {
+    "products": [
+        ("id", "id", "uuid"),
+        ("name", "name", "str"),
+        ("barcode", "barcode", "str"),
+        ("buy_price", "buy_price", "money"),
+        ("sell_price", "sell_price", "money"),
+        ("stock_qty", "stock_qty", "int"),
+        ("version", "version", "int"),
+        ("needs_review", "needs_review", "bool"),
+        ("updated_at", "updated_at", "time"),
+    ],
+    "customers": [
+        ("id", "id", "uuid"),
+        ("full_name", "full_name", "str"),
+        ("phone", "phone", "str"),
+        ("version", "version", "int"),
+        ("updated_at", "updated_at", "time"),
+    ],
+    "sales": [
+        ("id", "id", "uuid"),
+        ("sale_datetime", "sale_datetime", "time"),
+        ("total", "total", "money"),
+        ("payment_type", "payment_type", "str"),
+        ("seller", "seller", "str"),
+        ("customer", "customer_id", "uuid"),
+        ("version", "version", "int"),
+        ("updated_at", "updated_at", "time"),
+        ("items", "items", "items"),
+    ],
+    "sale_items": [
+        ("id", "id", "uuid"),
+        ("product", "product_id", "uuid"),
+        ("quantity", "quantity", "int"),
+        ("price", "price", "money"),
+    ],
+    "expenses": [
+        ("id", "id", "uuid"),
+        ("expense_datetime", "expense_datetime", "time"),
+        ("category", "category", "str"),
+        ("amount", "amount", "money"),
+        ("note", "note", "str"),
+        ("version", "version", "int"),
+        ("updated_at", "updated_at", "time"),
+    ],
+}
+
+
+def to_minor(value):
+    return None if value is None else int((Decimal(value) * MINOR_UNITS).to_integral_value())
+
+
+def from_minor(value):
+    return None if value is None else str(Decimal(int(value)) / MINOR_UNITS)
+
+
+def _time(value):
+    return None if value is None else int(value.timestamp() * 1000)
+
+
+def _uuid(value):
+    return None if value is None else str(value)
+
+
+def _items(manager):
+    return [encode_row("sale_items", item) for item in manager.all()]
+
+
+_CONVERTERS = {"uuid": _uuid, "money": to_minor, "time": _time, "items": _items}
+
+
+def schema_header():
+    """{key: {"fields": [...], "money": [...], "time": [...]}} sent once per columnar page."""
+    return {
+        key: {
+            "fields": [field for field, _attr, _kind in columns],
+            "money": [field for field, _attr, kind in columns if kind == "money"],
+            "time": [field for field, _attr, kind in columns if kind == "time"],
+        }
+        for key, columns in SCHEMAS.items()
+    }
+
+
+def encode_row(key, obj):
+    """One model instance as a row array in SCHEMAS[key] order (sales need items prefetched)."""
+    row = []
+    for _field, attr, kind in SCHEMAS[key]:
+        value = getattr(obj, attr)
+        converter = _CONVERTERS.get(kind)
+        row.append(converter(value) if converter else value)
+    return row
+
+
+def _money_payload(payload):
+    payload = dict(payload)
+    for key in MONEY_KEYS:
+        if isinstance(payload.get(key), int):
+            payload[key] = from_minor(payload[key])
+    if isinstance(payload.get("items"), list):
+        payload["items"] = [_money_payload(item) if isinstance(item, dict) else item for item in payload["items"]]
+    return payload
+
+
+def decode_push(data):
+    """
+    Columnar push body ({"device_id", "events": {"fields": [...], "rows": [[...]]}}, money in minor
+    units) to the plain shape ingest_events takes.
+    """
+    events = data.get("events") or {}
+    fields = events.get("fields") or []
+    decoded = []
+    for row in events.get("rows") or []:
+        event = dict(zip(fields, row))
+        if isinstance(event.get("payload_json"), dict):
+            event["payload_json"] = _money_payload(event["payload_json"])
+        decoded.append(event)
+    return {"device_id": data.get("device_id"), "acked": data.get("acked"), "events": decoded}
+
+
+def encode_results(results):
+    return {"fields": ["event_id", "status"], "rows": [[result["event_id"], result["status"]] for result in results]}
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+class UnsupportedEncoding(ValueError):
+    pass
+
+
+def decompress_body(data, content_encoding):
+    """Undo a request's Content-Encoding (identity, gzip, deflate, br), refusing oversized output."""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding in ("", "identity"):
+        return data
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        # wbits 47 auto-detects gzip and zlib headers.
+        inflater = zlib.decompressobj(47 if encoding != "deflate" else zlib.MAX_WBITS)
+        body = inflater.decompress(data, MAX_BODY_SIZE + 1)
+    elif encoding == "br" and brotli is not None:
+        body = _brotli_decompress(data)
+    else:
+        raise UnsupportedEncoding(encoding)
+    if len(body) > MAX_BODY_SIZE:
+        raise BodyTooLarge(len(body))
+    return body
+
+
+def _brotli_decompress(data):
+    """At most MAX_BODY_SIZE + 1 bytes of a brotli body: unlike zlib, brotli.decompress() takes no limit."""
+    decompressor = brotli.Decompressor()
+    body = bytearray()
+    try:
+        for start in range(0, len(data), BROTLI_INPUT_CHUNK):
+            body += decompressor.process(data[start : start + BROTLI_INPUT_CHUNK])
+            if len(body) > MAX_BODY_SIZE:
+                return bytes(body[: MAX_BODY_SIZE + 1])
+        finished = decompressor.is_finished()
+    except brotli.error as exc:
+        raise ValueError(f"brotli: {exc}") from exc
+    if not finished:
+        raise ValueError("brotli: truncated stream")
+    return bytes(body)
+
+
+def accepted_encoding(accept_encoding):
+    """'br' when the client takes it and brotli is installed; gzip is left to GZipMiddleware."""
+    offered = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    return "br" if brotli is not None and "br" in offered else None
+
+
+def brotli_stream(chunks):
+    """Brotli-compress a text chunk iterator on the fly."""
+    compressor = brotli.Compressor(quality=5)
+    for chunk in chunks:
+        data = compressor.process(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compress_bytes(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, 6)
@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Customer, Expense, Product, Sale, SaleItem
+from .services.changes import ENTITY_TYPES, record_changes
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Sale)
+@receiver(post_save, sender=Expense)
+def record_saved_entity(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    record_changes([(ENTITY_TYPES[sender], instance.pk)])
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Sale)
+@receiver(post_delete, sender=Expense)
+def record_deleted_entity(sender, instance, **kwargs):
+    record_changes([(ENTITY_TYPES[sender], instance.pk)], deleted=True)
+
+
+@receiver(post_save, sender=SaleItem)
+@receiver(post_delete, sender=SaleItem)
+def record_sale_item(sender, instance, raw=False, **kwargs):
+    # Devices receive items nested in their sale.
+    if raw or not instance.sale_id:
+        return
+    record_changes([("sale", instance.sale_id)])
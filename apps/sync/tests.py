@@ -1,13 +1,45 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
 from decimal import Decimal
+from unittest import mock, skipUnless
 from uuid import uuid4
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import Product, Sale, Expense, ConflictLog, SyncEventLog
+from .models import (
+    Change,
+    ConflictLog,
+    Expense,
+    Product,
+    Sale,
+    SaleItem,
+    StockCounter,
+    SyncDevice,
+    SyncEventFingerprint,
+    SyncEventLog,
+    SyncSequence,
+    SyncSnapshot,
+)
+from .services.changes import HEAD_CACHE_KEY, cached_head, publish_head
+from .services.retention import compact_events
+from .services.snapshot import build_snapshot
+from .services import wire
+from .services.wire import COLUMNAR_TYPE, BodyTooLarge, decompress_body
 
 
 class SyncApiTests(APITestCase):
@@ -43,7 +75,7 @@ class SyncApiTests(APITestCase):
             "entity_type": "product",
             "entity_id": str(product.id),
             "operation": "UPDATE",
-            "payload_json": {"id": str(product.id), "name": "A", "stock_qty": 10, "version": 1},
+            "payload_json": {"id": str(product.id), "name": "A", "sell_price": "900", "stock_qty": 10, "version": 1},
         }
         resp = self._push([payload])
         product.refresh_from_db()
@@ -51,6 +83,21 @@ class SyncApiTests(APITestCase):
         self.assertTrue(product.needs_review)
         self.assertEqual(ConflictLog.objects.count(), 1)
 
+    def test_stale_stock_only_is_not_a_conflict(self):
+        product = Product.objects.create(name="A", stock_qty=5, version=2)
+        payload = {
+            "event_id": str(uuid4()),
+            "entity_type": "product",
+            "entity_id": str(product.id),
+            "operation": "UPDATE",
+            "payload_json": {"id": str(product.id), "name": "A", "stock_qty": 10, "version": 1},
+        }
+        resp = self._push([payload])
+        product.refresh_from_db()
+        self.assertEqual(resp.data["results"][0]["status"], "ignored")
+        self.assertFalse(product.needs_review)
+        self.assertEqual((product.stock_qty, ConflictLog.objects.count()), (5, 0))
+
     def test_sale_append_only(self):
         sale_id = uuid4()
         event_id = uuid4()
@@ -89,4 +136,526 @@ class SyncApiTests(APITestCase):
         product = Product.objects.create(name="P", sell_price=Decimal("10"))
         resp = self.client.get("/api/sync/pull", {"since": (timezone.now() - timezone.timedelta(days=1)).isoformat()})
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(len(resp.data["products"]), 1)
+        self.assertEqual(len(json.loads(b"".join(resp.streaming_content))["products"]), 1)
+
+
+class SyncPushBatchTests(APITestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="tester", password="pass1234")
+        token = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def _push(self, events):
+        return self.client.post("/api/sync/push", {"device_id": "device-1", "events": events}, format="json")
+
+    def _event(self, entity_type, entity_id, payload, operation="CREATE", event_id=None):
+        return {
+            "event_id": str(event_id or uuid4()),
+            "entity_type": entity_type,
+            "entity_id": str(entity_id),
+            "operation": operation,
+            "payload_json": payload,
+        }
+
+    def test_query_count_does_not_grow_with_batch(self):
+        def batch(size):
+            events = []
+            for _ in range(size):
+                product_id = uuid4()
+                events.append(self._event("product", product_id, {"name": "P", "sell_price": "100", "stock_qty": 3}))
+                events.append(
+                    self._event(
+                        "sale",
+                        uuid4(),
+                        {"total": "100", "payment_type": "cash", "items": [{"product": str(product_id), "quantity": 1, "price": "100"}]},
+                    )
+                )
+                events.append(self._event("expense", uuid4(), {"amount": "5", "category": "taxi"}))
+            return events
+
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self._push(batch(2)).status_code, 200)
+        with CaptureQueriesContext(connection) as large:
+            resp = self._push(batch(60))
+        # Only SQLite's bound-parameter limit may split an insert; nothing is issued per event.
+        self.assertLessEqual(len(large), len(small) + 3)
+        self.assertEqual({result["status"] for result in resp.data["results"]}, {"applied"})
+        self.assertEqual(Product.objects.count(), 62)
+        self.assertEqual(SaleItem.objects.count(), 62)
+        self.assertEqual(SyncEventLog.objects.count(), 186)
+
+    def test_events_see_earlier_events_in_same_batch(self):
+        product_id = uuid4()
+        repeated = uuid4()
+        events = [
+            self._event("product", product_id, {"name": "Old", "stock_qty": 1, "version": 1}),
+            self._event("product", product_id, {"name": "New", "stock_qty": 4, "version": 2}, "UPDATE", repeated),
+            self._event("product", product_id, {"name": "New", "stock_qty": 4, "version": 2}, "UPDATE", repeated),
+            self._event("product", product_id, {"name": "Stale", "stock_qty": 9, "version": 2}, "UPDATE"),
+            {"event_id": "nope", "entity_type": "product"},
+            self._event("widget", uuid4(), {}),
+        ]
+        resp = self._push(events)
+        statuses = [result["status"] for result in resp.data["results"]]
+        self.assertEqual(statuses, ["applied", "applied", "duplicate", "conflict", "invalid", "invalid"])
+        product = Product.objects.get(id=product_id)
+        self.assertEqual((product.name, product.stock_qty, product.version), ("New", 4, 2))
+        self.assertTrue(product.needs_review)
+        conflict = ConflictLog.objects.get()
+        self.assertEqual(conflict.conflict_type, "version_conflict")
+        self.assertEqual(conflict.server_payload["name"], "New")
+        self.assertEqual(SyncEventLog.objects.count(), 4)
+
+    def test_update_existing_bumps_updated_at(self):
+        product = Product.objects.create(name="A", stock_qty=5, version=1)
+        before = product.updated_at
+        resp = self._push([self._event("product", product.id, {"name": "B", "version": 2}, "UPDATE")])
+        self.assertEqual(resp.data["results"][0]["status"], "applied")
+        product.refresh_from_db()
+        self.assertEqual(product.name, "B")
+        self.assertEqual(product.stock_qty, 5)
+        self.assertGreater(product.updated_at, before)
+
+    def test_resent_sale_is_not_duplicated(self):
+        sale_id = uuid4()
+        payload = {"total": "10", "payment_type": "card", "items": [{"product": str(uuid4()), "price": "10"}]}
+        self._push([self._event("sale", sale_id, payload)])
+        resp = self._push([self._event("sale", sale_id, payload)])
+        self.assertEqual(resp.data["results"][0]["status"], "duplicate")
+        self.assertEqual(Sale.objects.count(), 1)
+        item = SaleItem.objects.get()
+        self.assertIsNone(item.product_id)
+
+    def test_failed_chunk_rolls_back(self):
+        product_id = uuid4()
+        events = [
+            self._event("product", product_id, {"name": "P"}),
+            self._event("customer", uuid4(), {"full_name": "X", "version": "not-a-number"}),
+        ]
+        with self.assertRaises(ValueError):
+            self._push(events)
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(SyncEventLog.objects.exists())
+
+    def test_unauthenticated_api_gets_401_not_login_redirect(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get("/api/sync/pull").status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer broken")
+        self.assertEqual(self.client.get("/api/sync/pull").status_code, 401)
+        # A header alone unlocks nothing outside the sync API.
+        self.client.credentials(HTTP_AUTHORIZATION="Bogus x")
+        self.assertEqual(self.client.get("/api/schema/").status_code, 302)
+
+
+class SyncPullChangeFeedTests(APITestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="tester", password="pass1234")
+        token = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def _pull(self, **params):
+        resp = self.client.get("/api/sync/pull", params)
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(b"".join(resp.streaming_content))
+
+    def _pull_all(self, limit, after=0):
+        pages = []
+        while True:
+            page = self._pull(limit=limit, after=after)
+            pages.append(page)
+            after = page["seq"]
+            if not page["has_more"]:
+                return pages, after
+
+    def test_pages_cover_every_change_once(self):
+        stamp = timezone.now()
+        products = [Product.objects.create(name=f"P{index}") for index in range(7)]
+        # Equal timestamps (and clocks) don't matter: the feed is ordered by seq.
+        Product.objects.update(updated_at=stamp)
+        sale = Sale.objects.create(sale_datetime=stamp, total=Decimal("5"), payment_type="cash")
+        SaleItem.objects.create(sale=sale, quantity=2, price=Decimal("2.5"))
+        Expense.objects.create(expense_datetime=stamp, amount=Decimal("1"))
+
+        pages, seq = self._pull_all(limit=3)
+        self.assertEqual(len(pages), 3)
+        names = [row["name"] for page in pages for row in page["products"]]
+        self.assertEqual(names, [f"P{index}" for index in range(7)])
+        sales = [row for page in pages for row in page["sales"]]
+        self.assertEqual(len(sales), 1)
+        self.assertEqual(sales[0]["items"][0]["quantity"], 2)
+        self.assertEqual(sum(len(page["expenses"]) for page in pages), 1)
+        self.assertEqual(seq, Change.objects.order_by("-seq").values_list("seq", flat=True).first())
+
+        page = self._pull(after=seq)
+        self.assertEqual((page["products"], page["seq"], page["has_more"]), ([], seq, False))
+        products[3].name = "P3b"
+        products[3].save()
+        gone = str(products[5].id)
+        products[5].delete()
+        page = self._pull(after=seq)
+        self.assertEqual([row["name"] for row in page["products"]], ["P3b"])
+        self.assertEqual(page["deleted"]["products"], [gone])
+        self.assertEqual(page["seq"], seq + 2)
+
+    def test_seq_is_gap_free_across_push_batches(self):
+        def event(entity_type, payload):
+            return {
+                "event_id": str(uuid4()),
+                "entity_type": entity_type,
+                "entity_id": str(uuid4()),
+                "operation": "CREATE",
+                "payload_json": payload,
+            }
+
+        self.client.post(
+            "/api/sync/push",
+            {"device_id": "d", "events": [event("product", {"name": "A"}), event("expense", {"amount": "3"})]},
+            format="json",
+        )
+        Product.objects.create(name="B")
+        self.client.post("/api/sync/push", {"device_id": "d", "events": [event("customer", {"full_name": "C"})]}, format="json")
+        self.assertEqual(list(Change.objects.order_by("seq").values_list("seq", flat=True)), [1, 2, 3, 4])
+        self.assertEqual(SyncSequence.objects.get().value, 4)
+        pages, _seq = self._pull_all(limit=100)
+        self.assertEqual(len(pages[0]["customers"]), 1)
+
+    def test_sales_items_are_prefetched(self):
+        for _ in range(5):
+            sale = Sale.objects.create(sale_datetime=timezone.now(), payment_type="cash")
+            SaleItem.objects.create(sale=sale, price=Decimal("1"))
+        with CaptureQueriesContext(connection) as queries:
+            page = self._pull(limit=100)
+        self.assertEqual(len(page["sales"]), 5)
+        self.assertLessEqual(len(queries), 8)
+
+    def test_invalid_after(self):
+        resp = self.client.get("/api/sync/pull", {"after": "garbage"})
+        self.assertEqual(resp.status_code, 400)
+
+
+class SyncWireFormatTests(APITestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="tester", password="pass1234")
+        token = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def test_columnar_pull(self):
+        product = Product.objects.create(name="Kitob", sell_price=Decimal("49900.50"), stock_qty=3)
+        sale = Sale.objects.create(sale_datetime=timezone.now(), total=Decimal("12.34"), payment_type="card")
+        SaleItem.objects.create(sale=sale, product=product, quantity=2, price=Decimal("6.17"))
+        resp = self.client.get("/api/sync/pull", HTTP_ACCEPT=COLUMNAR_TYPE)
+        self.assertEqual(resp["Content-Type"], COLUMNAR_TYPE)
+        page = json.loads(b"".join(resp.streaming_content))
+        fields = page["schema"]["products"]["fields"]
+        row = dict(zip(fields, page["products"][0]))
+        self.assertEqual((row["id"], row["sell_price"], row["stock_qty"]), (str(product.id), 4990050, 3))
+        self.assertIsInstance(row["updated_at"], int)
+        sale_row = dict(zip(page["schema"]["sales"]["fields"], page["sales"][0]))
+        item = dict(zip(page["schema"]["sale_items"]["fields"], sale_row["items"][0]))
+        self.assertEqual((sale_row["total"], item["price"], item["product"]), (1234, 617, str(product.id)))
+
+    def test_columnar_gzip_push(self):
+        sale_id = uuid4()
+        body = {
+            "device_id": "till-2",
+            "events": {
+                "fields": ["event_id", "entity_type", "entity_id", "operation", "payload_json"],
+                "rows": [
+                    [str(uuid4()), "sale", str(sale_id), "CREATE", {"total": 150050, "payment_type": "cash", "items": [{"price": 150050}]}],
+                    ["bad", "sale", "", "CREATE", {}],
+                ],
+            },
+        }
+        resp = self.client.post(
+            "/api/sync/push",
+            gzip.compress(json.dumps(body).encode()),
+            content_type=COLUMNAR_TYPE,
+            HTTP_CONTENT_ENCODING="gzip",
+            HTTP_ACCEPT=COLUMNAR_TYPE,
+        )
+        self.assertEqual(resp.status_code, 200)
+        results = json.loads(resp.content)["results"]
+        self.assertEqual([row[1] for row in results["rows"]], ["applied", "invalid"])
+        sale = Sale.objects.get(id=sale_id)
+        self.assertEqual(sale.total, Decimal("1500.50"))
+        self.assertEqual(sale.items.get().price, Decimal("1500.50"))
+        self.assertEqual(SyncEventLog.objects.get().device_id, "till-2")
+
+    def test_unknown_content_encoding_is_refused(self):
+        resp = self.client.post(
+            "/api/sync/push", b"\x00\x01", content_type="application/json", HTTP_CONTENT_ENCODING="zstd"
+        )
+        self.assertEqual(resp.status_code, 415)
+
+    @skipUnless(wire.brotli, "brotli is optional")
+    def test_brotli_bomb_stops_at_the_size_limit(self):
+        bomb = wire.brotli.compress(b"\0" * 200_000)
+        with mock.patch.object(wire, "MAX_BODY_SIZE", 10_000), mock.patch.object(wire, "BROTLI_INPUT_CHUNK", 1):
+            with self.assertRaises(BodyTooLarge):
+                decompress_body(bomb, "br")
+            self.assertEqual(decompress_body(wire.brotli.compress(b"{}"), "br"), b"{}")
+            with self.assertRaises(ValueError):
+                decompress_body(wire.brotli.compress(b"{}" * 100)[:-2], "br")
+
+
+class StockCounterTests(APITestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="tester", password="pass1234")
+        token = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def _push(self, device_id, events):
+        resp = self.client.post("/api/sync/push", {"device_id": device_id, "events": events}, format="json")
+        return [result["status"] for result in resp.data["results"]]
+
+    def _event(self, entity_type, entity_id, payload, operation="CREATE"):
+        return {
+            "event_id": str(uuid4()),
+            "entity_type": entity_type,
+            "entity_id": str(entity_id),
+            "operation": operation,
+            "payload_json": payload,
+        }
+
+    def _sale(self, product_id, quantity):
+        return self._event(
+            "sale", uuid4(), {"total": "10", "payment_type": "cash", "items": [{"product": str(product_id), "quantity": quantity, "price": "10"}]}
+        )
+
+    def test_concurrent_tills_merge_without_conflicts(self):
+        product_id = uuid4()
+        self.assertEqual(self._push("till-1", [self._event("product", product_id, {"name": "Kitob", "stock_qty": 10})]), ["applied"])
+        # Both tills sold offline from the same stock of 10 and restocked / corrected.
+        self.assertEqual(
+            self._push("till-2", [self._sale(product_id, 3), self._event("stock", product_id, {"delta": 5}, "DELTA")]),
+            ["applied", "applied"],
+        )
+        self.assertEqual(self._push("till-1", [self._sale(product_id, 2), self._sale(product_id, 1)]), ["applied", "applied"])
+
+        product = Product.objects.get(id=product_id)
+        self.assertEqual(product.stock_qty, 10 - 3 + 5 - 2 - 1)
+        self.assertFalse(product.needs_review)
+        self.assertFalse(ConflictLog.objects.exists())
+        counters = {c.device_id: (c.increments, c.decrements) for c in StockCounter.objects.filter(product_id=product_id)}
+        self.assertEqual(counters, {"till-1": (10, 3), "till-2": (5, 3)})
+        self.assertEqual(product.stock_qty, sum(p - n for p, n in counters.values()))
+
+    def test_legacy_absolute_stock_becomes_delta(self):
+        product = Product.objects.create(name="A", stock_qty=0, version=1)
+        StockCounter.objects.create(product=product, device_id="till-1", increments=4)
+        Product.objects.filter(id=product.id).update(stock_qty=4)
+        self.assertEqual(
+            self._push("till-2", [self._event("product", product.id, {"name": "A", "stock_qty": 9, "version": 2}, "UPDATE")]),
+            ["applied"],
+        )
+        product.refresh_from_db()
+        self.assertEqual(product.stock_qty, 9)
+        self.assertEqual(StockCounter.objects.get(device_id="till-2").increments, 5)
+
+    def test_stock_event_for_unknown_product_is_invalid(self):
+        self.assertEqual(self._push("till-1", [self._event("stock", uuid4(), {"delta": 1}, "DELTA")]), ["invalid"])
+        self.assertFalse(StockCounter.objects.exists())
+
+
+class SyncSnapshotTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.snapshot_root = os.path.join(self.media_root, "private")
+        self.override = override_settings(MEDIA_ROOT=os.path.join(self.media_root, "media"), SYNC_SNAPSHOT_ROOT=self.snapshot_root)
+        self.override.enable()
+        user = get_user_model().objects.create_user(username="tester", password="pass1234")
+        token = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_bootstrap_then_pull_after_watermark(self):
+        self.assertEqual(self.client.get("/api/sync/bootstrap").status_code, 404)
+        product = Product.objects.create(name="Kitob", sell_price=Decimal("100"), stock_qty=2)
+        sale = Sale.objects.create(sale_datetime=timezone.now(), total=Decimal("100"), payment_type="cash")
+        SaleItem.objects.create(sale=sale, product=product, price=Decimal("100"))
+        snapshot = build_snapshot()
+        self.assertIsNone(build_snapshot())
+        # Kept out of the web-served media tree; only the authenticated view sends it.
+        self.assertTrue(os.path.exists(os.path.join(self.snapshot_root, snapshot.file.name)))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "media")))
+        with self.assertRaises(ValueError):
+            snapshot.file.url
+
+        manifest = self.client.get("/api/sync/bootstrap").json()
+        self.assertEqual((manifest["seq"], manifest["rows"]["products"], manifest["rows"]["sales"]), (snapshot.seq, 1, 1))
+        resp = self.client.get(manifest["url"])
+        self.assertEqual((resp["Content-Encoding"], resp["ETag"]), ("gzip", f'"{manifest["sha256"]}"'))
+        self.assertIn("immutable", resp["Cache-Control"])
+        raw = b"".join(resp.streaming_content)
+        self.assertEqual(hashlib.sha256(raw).hexdigest(), manifest["sha256"])
+        document = json.loads(gzip.decompress(raw))
+        self.assertEqual(document["seq"], manifest["seq"])
+        row = dict(zip(document["schema"]["products"]["fields"], document["products"][0]))
+        self.assertEqual((row["name"], row["sell_price"]), ("Kitob", 10000))
+        self.assertEqual(self.client.get(manifest["url"], HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 304)
+
+        Product.objects.create(name="Yangi")
+        page = json.loads(b"".join(self.client.get("/api/sync/pull", {"after": manifest["seq"]}).streaming_content))
+        self.assertEqual([item["name"] for item in page["products"]], ["Yangi"])
+
+    def test_old_snapshots_are_purged(self):
+        for index in range(5):
+            Product.objects.create(name=f"P{index}")
+            build_snapshot()
+        self.assertEqual(SyncSnapshot.objects.count(), 3)
+        stored = os.listdir(os.path.join(self.snapshot_root, "sync", "snapshots"))
+        self.assertEqual(sorted(stored), sorted(s.file.name.rsplit("/", 1)[-1] for s in SyncSnapshot.objects.all()))
+
+
+@override_settings(CACHE_IS_SHARED=True)
+class SyncLongPollTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_user(username="tester", password="pass1234")
+        token = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="A")
+        self.seq = SyncSequence.objects.get().value
+
+    def test_idle_pull_is_304_without_queries(self):
+        cached_head()
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get("/api/sync/pull", {"after": self.seq, "wait": 0}, HTTP_IF_NONE_MATCH=f'"seq-{self.seq}"')
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp["ETag"], f'"seq-{self.seq}"')
+        # Only the JWT user lookup.
+        self.assertLessEqual(len(queries), 1)
+
+    def test_long_poll_wakes_on_published_change(self):
+        cached_head()
+        Product.objects.create(name="B")  # committed later: the head is not published yet
+        timer = threading.Timer(0.3, publish_head, args=[self.seq + 1])
+        timer.start()
+        started = time.monotonic()
+        resp = self.client.get("/api/sync/pull", {"after": self.seq, "wait": 5}, HTTP_IF_NONE_MATCH=f'"seq-{self.seq}"')
+        timer.join()
+        self.assertLess(time.monotonic() - started, 4)
+        self.assertEqual(resp.status_code, 200)
+        page = json.loads(b"".join(resp.streaming_content))
+        self.assertEqual([row["name"] for row in page["products"]], ["B"])
+        self.assertEqual(resp["ETag"], f'"seq-{self.seq + 1}"')
+
+    def test_timeout_rechecks_database(self):
+        cached_head()
+        Product.objects.create(name="C")
+        resp = self.client.get("/api/sync/pull", {"after": self.seq, "wait": 0.2}, HTTP_IF_NONE_MATCH=f'"seq-{self.seq}"')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(cache.get(HEAD_CACHE_KEY), self.seq + 1)
+
+    @override_settings(SYNC_PULL_MAX_WAITERS=0)
+    def test_no_free_waiter_slot_answers_at_once(self):
+        started = time.monotonic()
+        resp = self.client.get("/api/sync/pull", {"after": self.seq, "wait": 5}, HTTP_IF_NONE_MATCH=f'"seq-{self.seq}"')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(resp.status_code, 304)
+
+    @override_settings(CACHE_IS_SHARED=False)
+    def test_per_process_cache_reads_head_from_database(self):
+        # Another process's write never reaches this process's LocMemCache.
+        cache.set(HEAD_CACHE_KEY, self.seq, None)
+        Product.objects.create(name="D")
+        started = time.monotonic()
+        resp = self.client.get("/api/sync/pull", {"after": self.seq, "wait": 5}, HTTP_IF_NONE_MATCH=f'"seq-{self.seq}"')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.get("/api/sync/pull", {"after": self.seq + 1, "wait": 5}, HTTP_IF_NONE_MATCH=f'"seq-{self.seq + 1}"')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(resp.status_code, 304)
+
+    def test_timeout_without_changes_is_304(self):
+        resp = self.client.get("/api/sync/pull", {"after": self.seq, "wait": 0.2}, HTTP_IF_NONE_MATCH=f'"seq-{self.seq}"')
+        self.assertEqual(resp.status_code, 304)
+
+
+class SyncEventRetentionTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        user = get_user_model().objects.create_user(username="tester", password="pass1234")
+        token = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def _push(self, events, acked=0, device_id="device-1"):
+        body = {"device_id": device_id, "acked": acked, "events": events}
+        return self.client.post("/api/sync/push", body, format="json")
+
+    def _expense(self, event_id=None):
+        return {
+            "event_id": str(event_id or uuid4()),
+            "entity_type": "expense",
+            "entity_id": str(uuid4()),
+            "operation": "CREATE",
+            "payload_json": {"amount": "5", "category": "taxi"},
+        }
+
+    def _age(self, days=40):
+        SyncEventLog.objects.update(created_at=timezone.now() - timedelta(days=days))
+
+    def test_only_acknowledged_old_events_are_compacted(self):
+        first = self._expense()
+        ack = self._push([first, self._expense()]).json()["ack"]
+        self.assertEqual(ack, SyncEventLog.objects.order_by("-id").values_list("id", flat=True).first())
+        self._age()
+        # Not acknowledged yet: the device may not have stored these results.
+        self.assertEqual(compact_events(days=30)["events"], 0)
+
+        later = self._push([self._expense()], acked=ack).json()["ack"]
+        self.assertEqual(SyncDevice.objects.get(device_id="device-1").acked_log_id, ack)
+        self._push([], acked=ack - 1)
+        self.assertEqual(SyncDevice.objects.get(device_id="device-1").acked_log_id, ack)
+        SyncEventLog.objects.filter(id=later).update(created_at=timezone.now())
+
+        self.assertEqual(compact_events(days=30), {"events": 2, "devices": 1, "files": 0})
+        self.assertEqual(list(SyncEventLog.objects.values_list("id", flat=True)), [later])
+        self.assertEqual(SyncEventFingerprint.objects.count(), 2)
+
+        resp = self._push([first, self._expense()], acked=later)
+        self.assertEqual([item["status"] for item in resp.json()["results"]], ["duplicate", "applied"])
+        self.assertEqual(Expense.objects.count(), 4)
+
+    def test_ack_is_clamped_and_tied_to_the_device_owner(self):
+        ack = self._push([self._expense()]).json()["ack"]
+        # Acking past the device's newest logged event can't cover events it was never answered for.
+        self._push([], acked=ack + 1000)
+        self.assertEqual(SyncDevice.objects.get(device_id="device-1").acked_log_id, ack)
+
+        other = get_user_model().objects.create_user(username="other", password="pass1234")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(other).access_token}")
+        resp = self._push([self._expense()], acked=ack)
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(SyncEventLog.objects.count(), 1)
+        self.assertEqual(self._push([], acked=0, device_id="device-2").status_code, 200)
+        self.assertEqual(SyncDevice.objects.get(device_id="device-2").user, other)
+
+    def test_archive_in_batches(self):
+        events = [self._expense() for _ in range(5)]
+        ack = self._push(events).json()["ack"]
+        self._push([], acked=ack)
+        self._age()
+        archive_root = os.path.join(self.media_root, "private")
+        with override_settings(SYNC_EVENT_ARCHIVE_ROOT=archive_root):
+            stats = compact_events(days=30, batch_size=2, archive=True)
+        self.assertEqual(stats, {"events": 5, "devices": 1, "files": 3})
+        self.assertFalse(SyncEventLog.objects.exists())
+        archived = []
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "sync")))
+        for root, _dirs, files in os.walk(archive_root):
+            for name in files:
+                with gzip.open(os.path.join(root, name), "rt") as handle:
+                    archived.extend(json.loads(line) for line in handle)
+        self.assertEqual(sorted(row["event_id"] for row in archived), sorted(event["event_id"] for event in events))
+        self.assertEqual(archived[0]["payload_json"]["category"], "taxi")
@@ -5,4 +5,6 @@ from . import views
 urlpatterns = [
     path("sync/push", views.sync_push, name="sync_push"),
     path("sync/pull", views.sync_pull, name="sync_pull"),
+    path("sync/bootstrap", views.sync_bootstrap, name="sync_bootstrap"),
+    path("sync/snapshot/<int:snapshot_id>/<str:sha256>", views.sync_snapshot, name="sync_snapshot"),
 ]
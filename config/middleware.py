@@ -7,6 +7,8 @@ EXEMPT_PREFIXES = (
     "/accounts/logout/",
     "/static/",
     "/media/",
+    # Offline tills authenticate with JWT; every sync view requires it and answers 401, not a login redirect.
+    "/api/sync/",
 )
 
 
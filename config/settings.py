@@ -141,6 +141,42 @@ WHITENOISE_MAX_AGE = 0 if DEBUG else 31536000
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# --- Export jobs (python manage.py run_export_jobs) ---
+EXPORT_JOB_WORKERS = int(os.getenv("EXPORT_JOB_WORKERS", "2"))
+EXPORT_JOB_TTL_HOURS = int(os.getenv("EXPORT_JOB_TTL_HOURS", "24"))
+# A job running longer than this is taken to have lost its worker and is marked failed.
+EXPORT_JOB_STALE_MINUTES = int(os.getenv("EXPORT_JOB_STALE_MINUTES", "60"))
+
+# --- Catalog import (python manage.py import_catalog --queue) ---
+# Files up to this size may be loaded from the CRM inside the request; larger ones are left to the queue.
+CATALOG_IMPORT_INLINE_MAX_KB = int(os.getenv("CATALOG_IMPORT_INLINE_MAX_KB", "256"))
+
+# --- Related books (python manage.py build_recommendations, nightly) ---
+RECOMMENDATION_TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", "8"))
+
+# --- Image derivatives (apps.catalog.images; backfill: python manage.py build_image_variants) ---
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", "2"))
+# Off renders inline after commit (tests, single-process setups).
+IMAGE_VARIANTS_ASYNC = os.getenv("IMAGE_VARIANTS_ASYNC", "True").lower() == "true"
+
+# --- Reorder forecast (python manage.py refresh_sales_velocity) ---
+REORDER_HISTORY_DAYS = int(os.getenv("REORDER_HISTORY_DAYS", "90"))
+REORDER_LEAD_TIME_DAYS = int(os.getenv("REORDER_LEAD_TIME_DAYS", "7"))
+REORDER_COVER_DAYS = int(os.getenv("REORDER_COVER_DAYS", "30"))
+
+# --- Offline sync (apps.sync; python manage.py build_sync_snapshot, compact_sync_events) ---
+# Clients poll with If-None-Match (304 when nothing changed). A pull asking for ?wait= is held open at
+# most this many seconds, by at most SYNC_PULL_MAX_WAITERS requests at once across all processes (each
+# holds a worker) and only with a shared cache (Redis); otherwise it is answered at once.
+SYNC_PULL_MAX_WAIT = float(os.getenv("SYNC_PULL_MAX_WAIT", "10"))
+SYNC_PULL_MAX_WAITERS = int(os.getenv("SYNC_PULL_MAX_WAITERS", "2"))
+# Acknowledged push events older than this are compacted (python manage.py compact_sync_events).
+SYNC_EVENT_RETENTION_DAYS = int(os.getenv("SYNC_EVENT_RETENTION_DAYS", "30"))
+# compact_sync_events --archive writes payloads here; keep it outside MEDIA_ROOT (not web-served).
+SYNC_EVENT_ARCHIVE_ROOT = Path(os.getenv("SYNC_EVENT_ARCHIVE_ROOT", str(BASE_DIR / "private" / "sync_archive")))
+# build_sync_snapshot writes here; like the archive it holds the whole synced dataset, so not MEDIA_ROOT.
+SYNC_SNAPSHOT_ROOT = Path(os.getenv("SYNC_SNAPSHOT_ROOT", str(BASE_DIR / "private" / "sync_snapshots")))
+
 # --- Cache ---
 def _env_bool(name: str, default: bool = False) -> bool:
     raw = os.getenv(name)
@@ -184,6 +220,8 @@ else:
             "LOCATION": "bilim-cache",
         }
     }
+# LocMemCache is per process: values published by one worker are invisible to the others.
+CACHE_IS_SHARED = CACHES["default"]["BACKEND"] != "django.core.cache.backends.locmem.LocMemCache"
 
 # --- Security ---
 _secure_ssl_redirect = os.getenv("DJANGO_SECURE_SSL_REDIRECT", "True").lower() == "true"
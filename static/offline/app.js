@@ -37,24 +37,50 @@ async function renderProducts() {
     `;
     row.addEventListener("click", async (event) => {
       if (!event.target.dataset.action) return;
+      const previousStock = Number(p.stock_qty || 0);
       const inputs = row.querySelectorAll("input[data-field]");
+      let edited = false;
       inputs.forEach((input) => {
-        p[input.dataset.field] = input.value;
+        const field = input.dataset.field;
+        if (field !== "stock_qty" && String(p[field] ?? "") !== input.value) edited = true;
+        p[field] = input.value;
       });
-      p.version = (p.version || 1) + 1;
-      p.updated_at = new Date().toISOString();
+      p.stock_qty = Number(p.stock_qty || 0);
+      if (!edited && p.stock_qty === previousStock) return;
+      if (edited) {
+        p.version = (p.version || 1) + 1;
+        p.updated_at = new Date().toISOString();
+      }
       await upsertEntity("products", p);
-      await addOutboxEvent({
-        event_id: uuid(),
-        entity_type: "product",
-        entity_id: p.id,
-        operation: "UPDATE",
-        payload_json: p,
-        device_id: getDeviceId(),
-        created_at: new Date().toISOString(),
-        status: "PENDING",
-        retry_count: 0,
-      });
+      // Stock travels as a delta the server merges with other tills; the product event carries the rest,
+      // and only when something else changed (a bumped version would overwrite other tills' edits).
+      if (edited) {
+        const { stock_qty: _stock, ...fields } = p;
+        await addOutboxEvent({
+          event_id: uuid(),
+          entity_type: "product",
+          entity_id: p.id,
+          operation: "UPDATE",
+          payload_json: fields,
+          device_id: getDeviceId(),
+          created_at: new Date().toISOString(),
+          status: "PENDING",
+          retry_count: 0,
+        });
+      }
+      if (p.stock_qty !== previousStock) {
+        await addOutboxEvent({
+          event_id: uuid(),
+          entity_type: "stock",
+          entity_id: p.id,
+          operation: "DELTA",
+          payload_json: { delta: p.stock_qty - previousStock },
+          device_id: getDeviceId(),
+          created_at: new Date().toISOString(),
+          status: "PENDING",
+          retry_count: 0,
+        });
+      }
     });
     list.appendChild(row);
   });
@@ -169,6 +195,12 @@ async function setupForms() {
         ],
       };
       await upsertEntity("sales", sale);
+      // The server takes the same quantity off its stock when the sale arrives.
+      const sold = (await listEntities("products")).find((p) => p.id === formData.get("product_id"));
+      if (sold) {
+        sold.stock_qty = Number(sold.stock_qty || 0) - quantity;
+        await upsertEntity("products", sold);
+      }
       await addOutboxEvent({
         event_id: uuid(),
         entity_type: "sale",
@@ -268,7 +300,5 @@ document.addEventListener("DOMContentLoaded", async () => {
   await renderSales();
   await renderExpenses();
   await setupStatusPage();
-  setInterval(() => {
-    if (navigator.onLine) runSync().then(updateSyncStatus);
-  }, 15000);
+  syncLoop(updateSyncStatus);
 });
@@ -1,22 +1,20 @@
 const DB_NAME = "offline-crm";
-const DB_VERSION = 1;
+const DB_VERSION = 2;
+const ENTITY_STORES = ["products", "customers", "sales", "expenses"];
+
+// One connection for the page's lifetime; opening IndexedDB per call costs more than the work itself.
+let dbPromise = null;
 
 function dbInit() {
-  return new Promise((resolve, reject) => {
+  if (dbPromise) return dbPromise;
+  dbPromise = new Promise((resolve, reject) => {
     const request = indexedDB.open(DB_NAME, DB_VERSION);
     request.onupgradeneeded = (event) => {
       const db = event.target.result;
-      if (!db.objectStoreNames.contains("products")) {
-        db.createObjectStore("products", { keyPath: "id" });
-      }
-      if (!db.objectStoreNames.contains("sales")) {
-        db.createObjectStore("sales", { keyPath: "id" });
-      }
-      if (!db.objectStoreNames.contains("expenses")) {
-        db.createObjectStore("expenses", { keyPath: "id" });
-      }
-      if (!db.objectStoreNames.contains("customers")) {
-        db.createObjectStore("customers", { keyPath: "id" });
+      for (const name of ENTITY_STORES) {
+        if (!db.objectStoreNames.contains(name)) {
+          db.createObjectStore(name, { keyPath: "id" });
+        }
       }
       if (!db.objectStoreNames.contains("outbox")) {
         db.createObjectStore("outbox", { keyPath: "event_id" });
@@ -24,20 +22,52 @@ function dbInit() {
       if (!db.objectStoreNames.contains("meta")) {
         db.createObjectStore("meta", { keyPath: "key" });
       }
+      const outbox = event.target.transaction.objectStore("outbox");
+      if (!outbox.indexNames.contains("status")) {
+        outbox.createIndex("status", "status");
+      }
+    };
+    request.onerror = () => {
+      dbPromise = null;
+      reject(request.error);
+    };
+    request.onsuccess = () => {
+      const db = request.result;
+      // Another tab is upgrading the schema: let go so it can, and reopen on next use.
+      db.onversionchange = () => {
+        db.close();
+        dbPromise = null;
+      };
+      db.onclose = () => {
+        dbPromise = null;
+      };
+      resolve(db);
     };
-    request.onerror = () => reject(request.error);
-    request.onsuccess = () => resolve(request.result);
   });
+  return dbPromise;
 }
 
-async function withStore(storeName, mode, callback) {
+// One transaction over several stores; callback gets {storeName: store}. Resolves on commit.
+async function withStores(storeNames, mode, callback) {
   const db = await dbInit();
   return new Promise((resolve, reject) => {
-    const tx = db.transaction(storeName, mode);
-    const store = tx.objectStore(storeName);
-    const result = callback(store);
+    const tx = db.transaction(storeNames, mode);
+    const stores = Object.fromEntries(storeNames.map((name) => [name, tx.objectStore(name)]));
+    const result = callback(stores);
     tx.oncomplete = () => resolve(result);
     tx.onerror = () => reject(tx.error);
+    tx.onabort = () => reject(tx.error);
+  });
+}
+
+function withStore(storeName, mode, callback) {
+  return withStores([storeName], mode, (stores) => callback(stores[storeName]));
+}
+
+function requestResult(req) {
+  return new Promise((resolve, reject) => {
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => reject(req.error);
   });
 }
 
@@ -45,69 +75,95 @@ function upsertEntity(storeName, value) {
   return withStore(storeName, "readwrite", (store) => store.put(value));
 }
 
+// All values in one readwrite transaction instead of one transaction per row.
+function putMany(storeName, values) {
+  if (!values.length) return Promise.resolve();
+  return withStore(storeName, "readwrite", (store) => {
+    for (const value of values) store.put(value);
+  });
+}
+
+/*
+ * Apply a pulled page in a single transaction: upserts per store, deletions, and meta values
+ * (e.g. the new pull_seq), so the seq never advances past data that was not stored.
+ */
+function applyChanges(upserts, deletions = {}, meta = {}) {
+  const names = [...ENTITY_STORES, "meta"];
+  return withStores(names, "readwrite", (stores) => {
+    for (const [storeName, values] of Object.entries(upserts)) {
+      for (const value of values || []) stores[storeName].put(value);
+    }
+    for (const [storeName, ids] of Object.entries(deletions)) {
+      for (const id of ids || []) stores[storeName].delete(id);
+    }
+    for (const [key, value] of Object.entries(meta)) {
+      stores.meta.put({ key, value });
+    }
+  });
+}
+
 function deleteEntity(storeName, id) {
   return withStore(storeName, "readwrite", (store) => store.delete(id));
 }
 
-function listEntities(storeName) {
-  return withStore(storeName, "readonly", (store) => {
-    return new Promise((resolve, reject) => {
-      const req = store.getAll();
-      req.onsuccess = () => resolve(req.result || []);
-      req.onerror = () => reject(req.error);
-    });
-  });
+async function listEntities(storeName) {
+  const db = await dbInit();
+  const rows = await requestResult(db.transaction(storeName, "readonly").objectStore(storeName).getAll());
+  return rows || [];
 }
 
-function getEntity(storeName, id) {
-  return withStore(storeName, "readonly", (store) => {
-    return new Promise((resolve, reject) => {
-      const req = store.get(id);
-      req.onsuccess = () => resolve(req.result || null);
-      req.onerror = () => reject(req.error);
-    });
-  });
+async function getEntity(storeName, id) {
+  const db = await dbInit();
+  const row = await requestResult(db.transaction(storeName, "readonly").objectStore(storeName).get(id));
+  return row || null;
 }
 
 function setMeta(key, value) {
   return withStore("meta", "readwrite", (store) => store.put({ key, value }));
 }
 
-function getMeta(key) {
-  return withStore("meta", "readonly", (store) => {
-    return new Promise((resolve, reject) => {
-      const req = store.get(key);
-      req.onsuccess = () => resolve(req.result ? req.result.value : null);
-      req.onerror = () => reject(req.error);
-    });
-  });
+async function getMeta(key) {
+  const row = await getEntity("meta", key);
+  return row ? row.value : null;
 }
 
 function listOutbox() {
   return listEntities("outbox");
 }
 
-function addOutboxEvent(event) {
-  return upsertEntity("outbox", event);
+// Pending events through the status index, without reading everything already sent.
+async function listPendingOutbox() {
+  const db = await dbInit();
+  const index = db.transaction("outbox", "readonly").objectStore("outbox").index("status");
+  return (await requestResult(index.getAll("PENDING"))) || [];
 }
 
-function updateOutboxStatus(event_id, status, retry_count) {
+async function addOutboxEvent(event) {
+  await upsertEntity("outbox", event);
+  // Wakes a waiting long-poll (sync.js) so the event is pushed right away.
+  window.dispatchEvent(new Event("outbox-changed"));
+}
+
+// updates: [{event_id, status, retry_count}], written in one transaction.
+function updateOutboxStatuses(updates) {
+  if (!updates.length) return Promise.resolve();
   return withStore("outbox", "readwrite", (store) => {
-    return new Promise((resolve, reject) => {
-      const req = store.get(event_id);
-      req.onsuccess = () => {
-        const item = req.result;
-        if (!item) return resolve();
-        item.status = status;
-        item.retry_count = retry_count;
+    for (const update of updates) {
+      store.get(update.event_id).onsuccess = (event) => {
+        const item = event.target.result;
+        if (!item) return;
+        item.status = update.status;
+        item.retry_count = update.retry_count;
         store.put(item);
-        resolve();
       };
-      req.onerror = () => reject(req.error);
-    });
+    }
   });
 }
 
+function updateOutboxStatus(event_id, status, retry_count) {
+  return updateOutboxStatuses([{ event_id, status, retry_count }]);
+}
+
 function clearOutbox(event_id) {
   return deleteEntity("outbox", event_id);
 }
@@ -1,4 +1,4 @@
-const CACHE_NAME = "offline-crm-v1";
+const CACHE_NAME = "offline-crm-v5";
 const ASSETS = [
   "/offline/products/",
   "/offline/sales/",
@@ -50,78 +50,239 @@ async function fetchToken(username, password) {
   return data;
 }
 
+const COLUMNAR_TYPE = "application/vnd.sync.columnar+json";
+
+// Columnar pages (field lists once, money in tiyin, times in epoch ms) back to the stored row shape.
+function decodeColumnar(data) {
+  const schema = data.schema || {};
+  const toObject = (key, row) => {
+    const spec = schema[key];
+    const obj = {};
+    spec.fields.forEach((field, index) => {
+      obj[field] = row[index];
+    });
+    for (const field of spec.money) {
+      if (obj[field] !== null && obj[field] !== undefined) obj[field] = (obj[field] / 100).toFixed(2);
+    }
+    for (const field of spec.time) {
+      if (obj[field] !== null && obj[field] !== undefined) obj[field] = new Date(obj[field]).toISOString();
+    }
+    if (key === "sales") obj.items = (obj.items || []).map((item) => toObject("sale_items", item));
+    return obj;
+  };
+  for (const key of ["products", "customers", "sales", "expenses"]) {
+    data[key] = (data[key] || []).map((row) => toObject(key, row));
+  }
+  return data;
+}
+
+async function gzipBody(text) {
+  if (typeof CompressionStream === "undefined") return { body: text, headers: {} };
+  const stream = new Blob([text]).stream().pipeThrough(new CompressionStream("gzip"));
+  return { body: await new Response(stream).blob(), headers: { "Content-Encoding": "gzip" } };
+}
+
+// Push requests stay under these limits: a slow link finishes each one, and a failure resends only one chunk.
+const PUSH_BUDGET_BYTES = 256 * 1024;
+const PUSH_MAX_EVENTS = 500;
+const encoder = new TextEncoder();
+
+function wireEvent(event) {
+  return {
+    event_id: event.event_id,
+    entity_type: event.entity_type,
+    entity_id: event.entity_id,
+    operation: event.operation,
+    payload_json: event.payload_json,
+  };
+}
+
+// Outbox events split into chunks by serialized size (an oversized event goes alone).
+function chunkEvents(events) {
+  const chunks = [];
+  let chunk = [];
+  let size = 0;
+  for (const event of events) {
+    const text = JSON.stringify(wireEvent(event));
+    const bytes = encoder.encode(text).length + 1;
+    if (chunk.length && (size + bytes > PUSH_BUDGET_BYTES || chunk.length >= PUSH_MAX_EVENTS)) {
+      chunks.push(chunk);
+      chunk = [];
+      size = 0;
+    }
+    chunk.push({ event, text });
+    size += bytes;
+  }
+  if (chunk.length) chunks.push(chunk);
+  return chunks;
+}
+
 async function pushOutbox() {
   const token = getToken();
   if (!token || tokenExpired(token)) {
     return { ok: false, reason: "token" };
   }
-  const events = (await listOutbox()).filter((e) => e.status === "PENDING");
+  const events = (await listPendingOutbox()).sort((a, b) => (a.created_at || "").localeCompare(b.created_at || ""));
   if (!events.length) return { ok: true, count: 0 };
-  const payload = {
-    device_id: getDeviceId(),
-    events: events.map((event) => ({
-      event_id: event.event_id,
-      entity_type: event.entity_type,
-      entity_id: event.entity_id,
-      operation: event.operation,
-      payload_json: event.payload_json,
-    })),
-  };
 
-  const response = await fetch("/api/sync/push", {
-    method: "POST",
-    headers: {
-      "Content-Type": "application/json",
-      "Authorization": `Bearer ${token}`,
-    },
-    body: JSON.stringify(payload),
-  });
-  if (!response.ok) {
-    return { ok: false, reason: "network" };
-  }
-  const data = await response.json();
-  for (const item of data.results || []) {
-    if (item.status === "applied" || item.status === "duplicate") {
-      await updateOutboxStatus(item.event_id, "SENT", 0);
-    } else {
-      const current = events.find((e) => e.event_id === item.event_id);
-      const retries = current ? (current.retry_count || 0) + 1 : 1;
-      await updateOutboxStatus(item.event_id, "FAILED", retries);
+  let sent = 0;
+  // The server's last ack, returned once the results it covers are stored: it may then compact those events.
+  let acked = Number(await getMeta("push_ack")) || 0;
+  for (const chunk of chunkEvents(events)) {
+    // Events are already serialized for sizing; splice them in instead of stringifying twice.
+    const text = `{"device_id":${JSON.stringify(getDeviceId())},"acked":${acked},"events":[${chunk.map((item) => item.text).join(",")}]}`;
+    const { body, headers } = await gzipBody(text);
+    const response = await fetch("/api/sync/push", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        "Authorization": `Bearer ${token}`,
+        ...headers,
+      },
+      body,
+    });
+    if (!response.ok) {
+      return { ok: false, reason: "network", count: sent };
+    }
+    const data = await response.json();
+    const byId = Object.fromEntries(chunk.map((item) => [item.event.event_id, item.event]));
+    const updates = (data.results || []).map((item) => {
+      if (item.status === "applied" || item.status === "duplicate") {
+        return { event_id: item.event_id, status: "SENT", retry_count: 0 };
+      }
+      const current = byId[item.event_id];
+      return { event_id: item.event_id, status: "FAILED", retry_count: current ? (current.retry_count || 0) + 1 : 1 };
+    });
+    await updateOutboxStatuses(updates);
+    await setMeta("last_sync", data.server_time || new Date().toISOString());
+    if (data.ack) {
+      acked = data.ack;
+      await setMeta("push_ack", acked);
     }
+    sent += chunk.length;
   }
-  await setMeta("last_sync", data.server_time || new Date().toISOString());
-  return { ok: true, count: events.length };
+  return { ok: true, count: sent };
 }
 
-async function pullChanges() {
+// First sync: load the server's bootstrap snapshot (one file, bulk writes), then pull only after its seq.
+async function loadSnapshot(token) {
+  const headers = { "Authorization": `Bearer ${token}` };
+  const manifestResponse = await fetch("/api/sync/bootstrap", { headers });
+  if (manifestResponse.status === 404) return { ok: true };
+  if (!manifestResponse.ok) return { ok: false, reason: "network" };
+  const manifest = await manifestResponse.json();
+  const response = await fetch(manifest.url, { headers });
+  if (!response.ok) return { ok: false, reason: "network" };
+  const data = decodeColumnar(await response.json());
+  await applyChanges(
+    { products: data.products, customers: data.customers, sales: data.sales, expenses: data.expenses },
+    {},
+    { pull_seq: manifest.seq },
+  );
+  return { ok: true };
+}
+
+// Aborted by requestSync() so local changes are pushed at once instead of after the poll times out.
+let pollController = null;
+let syncRequested = false;
+let wakeIdle = null;
+
+function requestSync() {
+  syncRequested = true;
+  if (pollController) pollController.abort();
+  if (wakeIdle) wakeIdle();
+}
+
+// The first request is conditional: with nothing new the server answers 304 from the cache. With
+// wait > 0 (opt-in) it may also hold the request until something changes, at most `wait` seconds.
+async function pullChanges(wait = 0) {
   const token = getToken();
   if (!token || tokenExpired(token)) {
     return { ok: false, reason: "token" };
   }
-  const since = (await getMeta("last_sync")) || "";
-  const response = await fetch(`/api/sync/pull?since=${encodeURIComponent(since)}`, {
-    headers: { "Authorization": `Bearer ${token}` },
-  });
-  if (!response.ok) return { ok: false, reason: "network" };
-  const data = await response.json();
-  for (const product of data.products || []) {
-    await upsertEntity("products", product);
+  if ((await getMeta("pull_seq")) === null) {
+    const boot = await loadSnapshot(token);
+    if (!boot.ok) return boot;
   }
-  for (const customer of data.customers || []) {
-    await upsertEntity("customers", customer);
-  }
-  for (const sale of data.sales || []) {
-    await upsertEntity("sales", sale);
-  }
-  for (const expense of data.expenses || []) {
-    await upsertEntity("expenses", expense);
+  // Pages resume from the stored seq, so an interrupted first sync continues where it stopped.
+  let after = Number(await getMeta("pull_seq")) || 0;
+  let hasMore = true;
+  let first = true;
+  while (hasMore) {
+    const headers = { "Authorization": `Bearer ${token}`, "Accept": COLUMNAR_TYPE };
+    let query = `after=${after}`;
+    let response;
+    if (first) headers["If-None-Match"] = `"seq-${after}"`;
+    if (first && wait > 0 && !syncRequested) {
+      query += `&wait=${wait}`;
+      pollController = new AbortController();
+      try {
+        response = await fetch(`/api/sync/pull?${query}`, { headers, signal: pollController.signal, cache: "no-store" });
+      } catch (err) {
+        if (err.name === "AbortError") return { ok: true, changed: false };
+        throw err;
+      } finally {
+        pollController = null;
+      }
+    } else {
+      response = await fetch(`/api/sync/pull?${query}`, { headers, cache: "no-store" });
+    }
+    first = false;
+    if (response.status === 304) return { ok: true, changed: false };
+    if (!response.ok) return { ok: false, reason: "network" };
+    const data = decodeColumnar(await response.json());
+    // The page and its seq commit together: an interrupted sync resumes exactly where it stopped.
+    await applyChanges(
+      { products: data.products, customers: data.customers, sales: data.sales, expenses: data.expenses },
+      data.deleted || {},
+      { pull_seq: data.seq, last_sync: data.server_time || new Date().toISOString() },
+    );
+    after = data.seq;
+    hasMore = Boolean(data.has_more);
   }
-  await setMeta("last_sync", data.server_time || new Date().toISOString());
-  return { ok: true };
+  return { ok: true, changed: true };
 }
 
-async function runSync() {
+async function runSync(wait = 0) {
+  syncRequested = false;
   const push = await pushOutbox();
   if (!push.ok) return push;
-  return pullChanges();
+  return pullChanges(wait);
+}
+
+const POLL_INTERVAL_MS = 10000;
+const RETRY_DELAY_MS = 15000;
+
+// Resolves after ms, or as soon as requestSync() is called (new outbox events, back online).
+function idle(ms) {
+  if (syncRequested) return Promise.resolve();
+  return new Promise((resolve) => {
+    const timer = setTimeout(done, ms);
+    function done() {
+      clearTimeout(timer);
+      wakeIdle = null;
+      resolve();
+    }
+    wakeIdle = done;
+  });
+}
+
+// Push, then a conditional pull every POLL_INTERVAL_MS: an idle check is one 304 that never holds a
+// server worker. Long-poll is opt-in (options.wait seconds); the server caps it or answers at once.
+async function syncLoop(onSynced, { wait = 0, interval = POLL_INTERVAL_MS } = {}) {
+  window.addEventListener("outbox-changed", requestSync);
+  window.addEventListener("online", requestSync);
+  for (;;) {
+    if (!navigator.onLine) {
+      await new Promise((resolve) => window.addEventListener("online", resolve, { once: true }));
+    }
+    let result;
+    try {
+      result = await runSync(wait);
+    } catch (err) {
+      result = { ok: false, reason: "network" };
+    }
+    if (onSynced) await onSynced(result);
+    await idle(result.ok ? interval : RETRY_DELAY_MS);
+  }
 }